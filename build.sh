@@ -13,3 +13,7 @@ python manage.py collectstatic --no-input
 # Apply any outstanding database migrations
 python manage.py makemigrations
 python manage.py migrate
+
+# Retrain the intent model from the seed labels and conversation history; the
+# agent loads it from the package data directory (see train_intent_model)
+python manage.py train_intent_model --output delapp/agent/core/data/intent_model.npy
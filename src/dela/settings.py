@@ -74,11 +74,12 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed drop-ins for JSONRenderer and JSONParser, see delapp/renderers.py
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'delapp.renderers.ORJSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'delapp.parsers.ORJSONParser',
     ),
     'DEFAULT_METADATA_CLASS': None,
 }
@@ -142,9 +143,10 @@ SIMPLE_JWT = {
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    'delapp.middleware.TracingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     "corsheaders.middleware.CorsMiddleware",
-    'delapp.middleware.DRFNoCacheMiddleware',
+    'delapp.middleware.HTTPCacheMiddleware',
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -360,6 +362,98 @@ if not DEBUG:
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+###### CACHING
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Conversational LLM responses, see delapp/agent/core/llm_cache.py
+    "llm": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "llm-responses",
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+LLM_CACHE = {
+    "BACKEND": os.getenv("LLM_CACHE_BACKEND", "django"),
+    "CACHE_ALIAS": "llm",
+    "PATH": os.path.join(BASE_DIR, "llm_cache.sqlite3"),
+    "TTL": 60 * 60,
+    "MAX_ENTRIES": 10000,
+    "MAX_TEMPERATURE": 0.3,
+}
+
+# Per-conversation chat history kept in memory by the agent, see delapp/agent/memory/chat_window.py
+AGENT_CHAT_MEMORY = {
+    "MAX_MESSAGES": 20,
+    "MAX_CONVERSATIONS": 1000,
+    "MAX_BYTES": 8 * 1024 * 1024,
+    "IDLE_SECONDS": 30 * 60,
+}
+
+# Chat model backends the agent routes over, in order of preference, see
+# delapp/agent/core/llm_router.py. Backends without an API key are skipped.
+LLM_ROUTER = {
+    "BACKENDS": [
+        {"NAME": "groq", "PROVIDER": "groq", "MODEL": "llama3-8b-8192", "TIMEOUT": 20},
+        {"NAME": "openai", "PROVIDER": "openai", "MODEL": "gpt-3.5-turbo-0125", "TIMEOUT": 30},
+    ],
+    "TEMPERATURE": 0.2,
+    "MAX_TOKENS": 1024,
+    "HEDGE": True,
+    "HEDGE_DEFAULT_DELAY": 2.0,
+    "HEDGE_MIN_DELAY": 0.3,
+    "HEDGE_MAX_DELAY": 5.0,
+    "FAILURE_THRESHOLD": 3,
+    "RESET_SECONDS": 30,
+    "EWMA_ALPHA": 0.2,
+}
+
+# Template replies for product results, with optional polish by a slower reasoning
+# model, per endpoint, see delapp/agent/response_generator/response_formatter.py.
+# POLISH is 'off', 'background' (cache the polish for the next request showing the
+# same products) or 'inline' (wait up to BUDGET_MS, then answer from the template).
+RESPONSE_FORMATTER = {
+    "BACKENDS": [
+        {"NAME": "groq-r1", "PROVIDER": "groq", "MODEL": "deepseek-r1-distill-llama-70b", "TIMEOUT": 60},
+    ],
+    "TEMPERATURE": 0.4,
+    "CACHE_ALIAS": "llm",
+    "CACHE_TTL": 24 * 60 * 60,
+    "ENDPOINTS": {
+        "default": {"POLISH": "off"},
+        "agent_query": {"POLISH": "inline", "BUDGET_MS": 1500, "PAID_ONLY": True},
+        "agent_stream": {"POLISH": "background", "PAID_ONLY": True},
+        "user_query": {"POLISH": "inline", "BUDGET_MS": 1500, "PAID_ONLY": True},
+    },
+}
+
+# Token budget for the conversational prompt, see delapp/agent/core/prompt_builder.py.
+# Tokens are counted with cl100k_base, which runs close to the Llama 3 tokenizer, so
+# MAX_TOKENS stays below the 8192-token context of llama3-8b-8192 as a margin.
+AGENT_PROMPT = {
+    "MAX_TOKENS": 7000,
+    "RESPONSE_TOKENS": 1024,
+    "PRODUCT_TOKENS": 1000,
+    "SUMMARY_TOKENS": 300,
+    "SUMMARY_EVERY": 4,
+    "ENCODING": "cl100k_base",
+}
+
+# Per-stage tracing of agent requests, see delapp/tracing.py. Outside development
+# only slow requests are logged; every request still feeds the histograms and
+# the Server-Timing header.
+TRACING = {
+    "ENABLED": True,
+    "LOG_TRACES": True,
+    "LOG_MIN_MS": 0 if DEBUG else 750,
+    "PATH_PREFIXES": ["/api/"],
+}
+
+
 
 
 
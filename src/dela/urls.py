@@ -5,6 +5,7 @@ from django.conf import settings
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('', include("delapp.urls")),
+    path('', include("products.urls")),
     path('api-auth/', include('rest_framework.urls')),
 
 ]
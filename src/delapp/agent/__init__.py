@@ -14,7 +14,7 @@ from .shop_agent_factory import ShopAgentFactory
 from .core.agent_core import ShopAgent
 from .tools.base_tool import BaseTool
 from .memory.base_memory import BaseMemory
-from .api import process_query, add_to_cart, view_cart, remove_from_cart
+from .api import process_query, stream_query, add_to_cart, view_cart, remove_from_cart
 
 __all__ = [
     'ShopAgentFactory',
@@ -22,6 +22,7 @@ __all__ = [
     'BaseTool',
     'BaseMemory',
     'process_query',
+    'stream_query',
     'add_to_cart',
     'view_cart',
     'remove_from_cart'
@@ -4,21 +4,23 @@ ShopAgent API Interface
 This module provides API functions that integrate the ShopAgent with Django views
 and existing application components.
 """
-from typing import Dict, Any, Optional, List
+from typing import AsyncIterator, Dict, Any, Optional, List
 import logging
 import json
 import asyncio
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse, HttpRequest
 from django.conf import settings
 
+from ..models import Conversation
 from .shop_agent_factory import ShopAgentFactory
-from .response_generator.response_formatter import ResponseFormatter
+from .response_generator.response_formatter import get_response_formatter
+from ..tracing import traced, stage_stats
 
 logger = logging.getLogger(__name__)
 
 # Create singleton instances
 _agent = None
-_formatter = None
 
 def get_agent(use_llm: bool = True):
     """Get or create the ShopAgent singleton instance"""
@@ -28,16 +30,64 @@ def get_agent(use_llm: bool = True):
     return _agent
 
 def get_formatter():
-    """Get or create the ResponseFormatter singleton instance"""
-    global _formatter
-    if _formatter is None:
-        _formatter = ShopAgentFactory.create_response_formatter()
-    return _formatter
+    """Get the ResponseFormatter singleton instance"""
+    return get_response_formatter()
 
+def get_agent_metrics() -> Dict[str, Any]:
+    """Collect in-process agent metrics without creating the agent"""
+    from .core.llm_cache import get_llm_cache
+    from .tools.product_search_tool import catalog_writer_stats
+    
+    llm_cache = get_llm_cache()
+    return {
+        'llm_cache': llm_cache.stats() if llm_cache is not None else None,
+        'speculative_search': _agent.speculation_stats() if _agent is not None else None,
+        'chat_windows': _agent.chat_windows.stats() if _agent is not None else None,
+        'llm_router': _agent.llm_stats() if _agent is not None else None,
+        'response_formatter': get_response_formatter().stats(),
+        'catalog_writer': catalog_writer_stats(),
+        'stages': stage_stats()
+    }
+
+@sync_to_async
+def _owned_conversation_id(conversation_id: Optional[str], user_id: Optional[str],
+                           session_id: Optional[str]) -> Optional[str]:
+    """
+    The conversation_id when it belongs to the caller, otherwise None.
+
+    A user's conversation belongs to that user, an anonymous one to the
+    session that started it. The views taking a conversation_id allow
+    anonymous callers, so an id from a request is never trusted as is.
+
+    Anonymous conversations started before sessions were recorded have no
+    session; the first session to present one claims it.
+    """
+    if not conversation_id or not str(conversation_id).isdigit():
+        return None
+    owner = Conversation.objects.filter(id=conversation_id).values_list('user_id', 'session_id').first()
+    if owner is None:
+        return None
+    owner_id, owner_session = owner
+    if owner_id is not None:
+        return conversation_id if user_id and str(owner_id) == str(user_id) else None
+    if not session_id:
+        return None
+    if owner_session is None:
+        # Conditional, so two sessions racing for the same conversation cannot both claim it
+        claimed = Conversation.objects.filter(
+            id=conversation_id, user__isnull=True, session_id__isnull=True
+        ).update(session_id=session_id)
+        if claimed:
+            return conversation_id
+        owner_session = Conversation.objects.filter(id=conversation_id).values_list('session_id', flat=True).first()
+    return conversation_id if owner_session == session_id else None
+
+@traced('api.process_query')
 async def process_query(query: str, 
                       conversation_id: Optional[str] = None, 
                       user_id: Optional[str] = None,
-                      session_id: Optional[str] = None) -> Dict[str, Any]:
+                      session_id: Optional[str] = None,
+                      endpoint: str = 'default') -> Dict[str, Any]:
     """
     Process a user query using the ShopAgent.
     
@@ -46,13 +96,21 @@ async def process_query(query: str,
         conversation_id: Optional conversation ID
         user_id: Optional user ID
         session_id: Optional session ID
+        endpoint: Name of the calling endpoint, which picks its RESPONSE_FORMATTER policy
         
     Returns:
         Dict with agent response and relevant data
     """
+    owned_id = None
     try:
         logger.info(f"Processing query: '{query}' for conversation: {conversation_id}")
         
+        # Before any conversation state is read or written
+        owned_id = await _owned_conversation_id(conversation_id, user_id, session_id)
+        if owned_id != conversation_id:
+            logger.warning(f"Ignoring conversation {conversation_id}, which does not belong to the caller")
+            conversation_id = owned_id
+        
         # Get agent instance
         agent = get_agent(use_llm=True)
         
@@ -61,7 +119,7 @@ async def process_query(query: str,
             query=query,
             conversation_id=conversation_id,
             user_id=user_id,
-            context={"session_id": session_id} if session_id else None
+            context={"session_id": session_id, "endpoint": endpoint}
         )
         
         return result
@@ -70,10 +128,112 @@ async def process_query(query: str,
         logger.error(f"Error processing query: {str(e)}", exc_info=True)
         return {
             'response': "I encountered an error while processing your request. Please try again.",
-            'conversation_id': conversation_id,
+            'conversation_id': owned_id,
             'error': str(e)
         }
 
+async def stream_query(query: str,
+                       conversation_id: Optional[str] = None,
+                       user_id: Optional[str] = None,
+                       session_id: Optional[str] = None,
+                       endpoint: str = 'default') -> AsyncIterator[Dict[str, Any]]:
+    """
+    Process a user query using the ShopAgent, yielding progress events.
+    
+    Args:
+        query: The user's query
+        conversation_id: Optional conversation ID
+        user_id: Optional user ID
+        session_id: Optional session ID
+        endpoint: Name of the calling endpoint, which picks its RESPONSE_FORMATTER policy
+        
+    Yields:
+        Event dicts with 'event' and 'data' keys, ending with a 'final' event
+    """
+    owned_id = None
+    try:
+        logger.info(f"Streaming query: '{query}' for conversation: {conversation_id}")
+        
+        # Before any conversation state is read or written
+        owned_id = await _owned_conversation_id(conversation_id, user_id, session_id)
+        if owned_id != conversation_id:
+            logger.warning(f"Ignoring conversation {conversation_id}, which does not belong to the caller")
+            conversation_id = owned_id
+        
+        agent = get_agent(use_llm=True)
+        
+        async for event in agent.stream_query(
+            query=query,
+            conversation_id=conversation_id,
+            user_id=user_id,
+            context={"session_id": session_id, "endpoint": endpoint}
+        ):
+            yield event
+    
+    except Exception as e:
+        logger.error(f"Error streaming query: {str(e)}", exc_info=True)
+        yield {'event': 'final', 'data': {
+            'response': "I encountered an error while processing your request. Please try again.",
+            'conversation_id': owned_id,
+            'error': str(e)
+        }}
+
+async def clear_conversation(conversation_id: str,
+                             user_id: Optional[str] = None,
+                             session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Delete a conversation's messages and reset its state.
+    
+    Args:
+        conversation_id: ID of the conversation
+        user_id: Optional user ID
+        session_id: Optional session ID
+        
+    Returns:
+        Dict with 'success', and 'error' when the conversation is not the caller's
+    """
+    try:
+        conversation_id = await _owned_conversation_id(conversation_id, user_id, session_id)
+        if conversation_id is None:
+            return {'success': False, 'error': 'Conversation not found'}
+        
+        agent = get_agent()
+        cleared = await agent.memory_components['conversation_memory'].clear(conversation_id)
+        # Other workers notice the change when they next revalidate their window
+        agent.chat_windows.discard(conversation_id)
+        return {'success': cleared}
+    
+    except Exception as e:
+        logger.error(f"Error clearing conversation: {str(e)}", exc_info=True)
+        return {'success': False, 'error': str(e)}
+
+async def archive_conversation(conversation_id: str,
+                               user_id: Optional[str] = None,
+                               session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Archive a conversation, which hides it from the conversation list.
+    
+    Args:
+        conversation_id: ID of the conversation
+        user_id: Optional user ID
+        session_id: Optional session ID
+        
+    Returns:
+        Dict with 'success', and 'error' when the conversation is not the caller's
+    """
+    try:
+        conversation_id = await _owned_conversation_id(conversation_id, user_id, session_id)
+        if conversation_id is None:
+            return {'success': False, 'error': 'Conversation not found'}
+        
+        await sync_to_async(Conversation.objects.filter(id=conversation_id).update)(active=False)
+        get_agent().chat_windows.discard(conversation_id)
+        return {'success': True}
+    
+    except Exception as e:
+        logger.error(f"Error archiving conversation: {str(e)}", exc_info=True)
+        return {'success': False, 'error': str(e)}
+
 async def add_to_cart(product_data: Dict[str, Any], 
                     user_id: Optional[str] = None,
                     session_id: Optional[str] = None,
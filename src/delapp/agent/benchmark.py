@@ -0,0 +1,522 @@
+"""
+Offline Agent Benchmark
+
+Replays a corpus of multi-turn conversations through a ShopAgent built by
+ShopAgentFactory, with a scripted FakeChatModel behind the LLM router and
+LocalSearchProvider standing in for SearchAPI.io. Runs need no API keys or
+network and give the same answers every time, so their reports can be
+compared between commits.
+
+Each turn runs inside a 'benchmark.turn' span, so per-stage latencies come
+from the same delapp.tracing spans production requests report. A separate
+pass under tracemalloc measures the memory each turn allocates. The cost of
+building product cards, of the JSON round trip search results no longer
+make, and of rendering and parsing the replayed conversations as API
+responses with DRF's JSONRenderer/JSONParser and their orjson replacements,
+are timed on their own.
+
+The corpus is a JSON file:
+
+    {
+        "catalog": [{"product_id": "hp-1", "title": "...", "price": 89.99, "retailer": "Walmart", ...}],
+        "conversations": [
+            {"name": "headphones", "turns": [
+                {"query": "show me noise cancelling headphones"},
+                {"query": "how long does the battery last?", "llm": "Scripted LLM answer"}
+            ]}
+        ]
+    }
+
+Run it with `python manage.py benchmark_agent`.
+"""
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Sequence
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import re
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .core.intent_classifier import DATA_DIR
+from .core.llm_router import FakeChatModel, LLMBackend, LLMRouter
+from .core.reference_resolver import STOPWORDS
+from .response_generator.response_formatter import ResponseFormatter
+from .shop_agent_factory import ShopAgentFactory
+from .tools.langchain_tools import ProductSearchLangChainTool
+from .tools.product_cards import product_card
+from .tools.product_search_tool import ProductSearchTool
+from ..models import Conversation, ConversationMessage, ConversationState
+from ..parsers import ORJSONParser
+from ..renderers import ORJSONRenderer
+from ..searchapi_io import ProductDeal
+from ..tracing import span
+
+DEFAULT_CORPUS_PATH = os.path.join(DATA_DIR, 'benchmark_conversations.json')
+# Answer for turns the corpus does not script
+DEFAULT_LLM_ANSWER = "Happy to help! Tell me what you are shopping for and your budget."
+# Fixed so catalog rows and answers are identical between runs
+CATALOG_TIMESTAMP = datetime(2024, 1, 1)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def load_corpus(path: Optional[str] = None) -> Dict[str, Any]:
+    """Read a benchmark corpus, the bundled one by default"""
+    with open(path or DEFAULT_CORPUS_PATH, encoding='utf-8') as handle:
+        corpus = json.load(handle)
+    if not corpus.get('conversations'):
+        raise ValueError(f"Benchmark corpus {path or DEFAULT_CORPUS_PATH} has no conversations")
+    return corpus
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q between 0 and 100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, Any]:
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 3) if values else None,
+        'p50': round(percentile(values, 50), 3) if values else None,
+        'p95': round(percentile(values, 95), 3) if values else None,
+        'p99': round(percentile(values, 99), 3) if values else None,
+        'max': round(max(values), 3) if values else None,
+    }
+
+
+class LocalSearchProvider:
+    """Deterministic stand-in for DealAggregator that searches a fixed catalog"""
+
+    def __init__(self, catalog: Sequence[Dict[str, Any]], latency: float = 0.0):
+        """
+        Args:
+            catalog: Product dicts with ProductDeal's fields
+            latency: Seconds each search takes, to mimic the SearchAPI.io round trip
+        """
+        self.catalog = list(catalog)
+        self.latency = latency
+        self.calls = 0
+        self._tokens = [set(_TOKEN_RE.findall(item['title'].lower())) - STOPWORDS for item in self.catalog]
+
+    async def search_deals_async(self, query: str, min_price: Optional[float] = None,
+                                 max_price: Optional[float] = None, max_results: int = 10) -> Dict[str, List[ProductDeal]]:
+        """Rank catalog items by the query words their titles share, DealAggregator style"""
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        query_tokens = set(_TOKEN_RE.findall(query.lower()))
+        scored = []
+        for i, item in enumerate(self.catalog):
+            if min_price is not None and item['price'] < min_price:
+                continue
+            if max_price is not None and item['price'] > max_price:
+                continue
+            score = len(query_tokens & self._tokens[i])
+            if score:
+                scored.append((-score, i))
+        return {'searchapi': [self._deal(self.catalog[i]) for _, i in sorted(scored)[:min(max_results, 10)]]}
+
+    @staticmethod
+    def _deal(item: Dict[str, Any]) -> ProductDeal:
+        return ProductDeal(
+            product_id=item['product_id'],
+            title=item['title'],
+            price=item['price'],
+            original_price=item.get('original_price'),
+            url=item.get('url', '#'),
+            image_url=item.get('image_url', ''),
+            retailer=item.get('retailer', 'Unknown retailer'),
+            description=item.get('description', ''),
+            available=True,
+            rating=item.get('rating'),
+            seller=item.get('retailer'),
+            review_count=item.get('review_count', 0),
+            timestamp=CATALOG_TIMESTAMP,
+            condition='New',
+            shipping_info='Free shipping',
+            discount=None,
+            coupon=None,
+            trending=False,
+            sold_count=0,
+            watchers=0,
+            return_policy='30 day returns',
+            location=None
+        )
+
+
+def build_benchmark_agent(corpus: Dict[str, Any], llm_latency: float = 0.0, search_latency: float = 0.0):
+    """
+    Create the agent under test through ShopAgentFactory.
+
+    Returns:
+        (agent, model, provider): the agent, its scripted chat model and its search stand-in
+    """
+    # Every query is scripted, so a turn never picks up the answer scripted for an earlier one in its history
+    script = {
+        turn['query']: turn.get('llm', DEFAULT_LLM_ANSWER)
+        for conversation in corpus['conversations'] for turn in conversation['turns']
+    }
+    model = FakeChatModel(responses=[DEFAULT_LLM_ANSWER], script=script, latency=llm_latency)
+    llm = LLMRouter([LLMBackend('fake', model)], temperature=0.2, hedge=False)
+    provider = LocalSearchProvider(corpus.get('catalog', []), latency=search_latency)
+
+    # The local catalog is made up, so its products must not reach the real product catalog
+    agent = ShopAgentFactory.create_agent(use_llm=True, llm=llm, search_provider=provider,
+                                          persist_search_results=False)
+    # A persistent response cache would make a run depend on the runs before it
+    agent.llm_cache = None
+    # Replies stay template replies; polishing would call a real model
+    agent.response_formatter = ResponseFormatter()
+    return agent, model, provider
+
+
+class AgentBenchmark:
+    """Replay a corpus through an agent and measure it"""
+
+    def __init__(self, corpus: Dict[str, Any], passes: int = 3, warmup: int = 1, concurrency: int = 1,
+                 measure_memory: bool = True, llm_latency: float = 0.0, search_latency: float = 0.0):
+        """
+        Args:
+            corpus: Catalog and conversations, see load_corpus
+            passes: Timed replays of the whole corpus
+            warmup: Untimed replays first, so lazy initialization is not measured
+            concurrency: Conversations replayed at once
+            measure_memory: Run one more replay under tracemalloc
+            llm_latency: Seconds the fake LLM waits before answering
+            search_latency: Seconds each local search takes
+        """
+        self.corpus = corpus
+        self.passes = passes
+        self.warmup = warmup
+        self.concurrency = max(concurrency, 1)
+        self.measure_memory = measure_memory
+        self.agent, self.model, self.provider = build_benchmark_agent(corpus, llm_latency, search_latency)
+        self._session = 0
+
+    @sync_to_async
+    def _new_conversation(self) -> str:
+        conversation = Conversation.objects.create()
+        ConversationState.objects.create(conversation=conversation)
+        return str(conversation.id)
+
+    async def _replay_conversation(self, conversation: Dict[str, Any], turns: List[Dict[str, Any]],
+                                   track_memory: bool = False) -> None:
+        conversation_id = await self._new_conversation()
+        self._session += 1
+        context = {'session_id': f"benchmark-{self._session}"}
+        for index, turn in enumerate(conversation['turns']):
+            if track_memory:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+
+            with span('benchmark.turn', conversation=conversation.get('name'), turn=index) as root:
+                result = await self.agent.process_query(
+                    turn['query'], conversation_id=conversation_id, context=context
+                )
+
+            record = {
+                'conversation': conversation.get('name'),
+                'turn': index,
+                'products': len((result or {}).get('products') or []),
+                'root': root,
+            }
+            if track_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record['allocated_kb'] = (peak - before) / 1024
+                record['retained_kb'] = (current - before) / 1024
+            turns.append(record)
+
+    @sync_to_async
+    def _conversation_payloads(self) -> List[Dict[str, Any]]:
+        """The last replay's conversations, shaped like the conversation messages API responses"""
+        conversations = Conversation.objects.order_by('-id')[:len(self.corpus['conversations'])]
+        states = {
+            state.conversation_id: state.current_products
+            for state in ConversationState.objects.filter(conversation__in=list(conversations))
+        }
+        payloads = []
+        for conversation in conversations:
+            messages = ConversationMessage.objects.filter(conversation=conversation).order_by('created_at')
+            payloads.append({
+                'success': True,
+                'conversation_id': conversation.id,
+                'messages': [
+                    {
+                        'id': message.id,
+                        'role': message.role,
+                        'content': message.content,
+                        'created_at': message.created_at,
+                        'has_products': message.has_products,
+                        'search_results': message.search_results,
+                    }
+                    for message in messages
+                ],
+                'current_products': states.get(conversation.id, []),
+            })
+        return payloads
+
+    async def _replay(self, track_memory: bool = False) -> List[Dict[str, Any]]:
+        """Replay every conversation once, `concurrency` at a time (one at a time under tracemalloc)"""
+        # ProductSearchTool falls back to random mock products when a search finds nothing
+        random.seed(0)
+        turns: List[Dict[str, Any]] = []
+        semaphore = asyncio.Semaphore(1 if track_memory else self.concurrency)
+
+        async def run(conversation):
+            async with semaphore:
+                await self._replay_conversation(conversation, turns, track_memory)
+
+        await asyncio.gather(*(run(conversation) for conversation in self.corpus['conversations']))
+        return turns
+
+    async def run(self) -> Dict[str, Any]:
+        """Run the benchmark and return its report"""
+        for _ in range(self.warmup):
+            await self._replay()
+
+        llm_calls, search_calls = self.model.calls, self.provider.calls
+        turns = []
+        start = time.perf_counter()
+        for _ in range(self.passes):
+            turns.extend(await self._replay())
+        elapsed = time.perf_counter() - start
+
+        stages: Dict[str, List[float]] = {}
+        for turn in turns:
+            for item in turn['root'].walk():
+                if item.end is not None:
+                    stages.setdefault(item.name, []).append(item.duration_ms)
+        turn_latencies = stages.pop('benchmark.turn', [])
+
+        report = {
+            'corpus': {
+                'conversations': len(self.corpus['conversations']),
+                'turns': sum(len(conversation['turns']) for conversation in self.corpus['conversations']),
+                'catalog': len(self.corpus.get('catalog', [])),
+            },
+            'config': {
+                'passes': self.passes,
+                'warmup': self.warmup,
+                'concurrency': self.concurrency,
+                'llm_latency_s': self.model.latency,
+                'search_latency_s': self.provider.latency,
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+            'throughput': {
+                'turns': len(turns),
+                'seconds': round(elapsed, 3),
+                'turns_per_second': round(len(turns) / elapsed, 2) if elapsed else None,
+            },
+            'latency_ms': {
+                'turn': summarize(turn_latencies),
+                'stages': {name: summarize(values) for name, values in sorted(stages.items())},
+            },
+            'calls_per_pass': {
+                'llm': (self.model.calls - llm_calls) / self.passes if self.passes else 0,
+                'search': (self.provider.calls - search_calls) / self.passes if self.passes else 0,
+            },
+        }
+
+        if self.measure_memory:
+            tracemalloc.start()
+            try:
+                memory_turns = await self._replay(track_memory=True)
+            finally:
+                tracemalloc.stop()
+            report['memory_kb_per_turn'] = {
+                'allocated': summarize([turn['allocated_kb'] for turn in memory_turns]),
+                'retained': summarize([turn['retained_kb'] for turn in memory_turns]),
+            }
+
+        report['product_cards'] = await time_product_cards(self.corpus.get('catalog', []))
+        report['search_result_serialization'] = await time_search_result_serialization(
+            self.corpus.get('catalog', [])
+        )
+        report['api_json'] = time_api_json(await self._conversation_payloads())
+
+        # Let summaries started by the last turns finish before the caller tears down
+        if self.agent._summary_tasks:
+            await asyncio.gather(*self.agent._summary_tasks, return_exceptions=True)
+        return report
+
+
+class _StaticSearchTool:
+    """ProductSearchTool stand-in returning fixed products"""
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        self.products = products
+
+    async def execute(self, query: str, **kwargs) -> Dict[str, Any]:
+        return {'success': True, 'products': self.products}
+
+
+async def time_product_cards(catalog: Sequence[Dict[str, Any]], count: int = 50,
+                             repeat: int = 200) -> Dict[str, Any]:
+    """
+    Time turning `count` provider results into product cards, per product.
+
+    Covers everything a result goes through before a view returns it: the
+    search tool builds the cards and the LangChain wrapper writes the reply
+    text around them.
+    """
+    if not catalog:
+        return {}
+    deals = {'searchapi': [
+        LocalSearchProvider._deal(dict(catalog[i % len(catalog)], product_id=f"{catalog[i % len(catalog)]['product_id']}-{i}"))
+        for i in range(count)
+    ]}
+    search_tool = ProductSearchTool(provider=LocalSearchProvider(catalog))
+    static_tool = _StaticSearchTool([])
+    wrapper = ProductSearchLangChainTool(static_tool)
+
+    async def build():
+        static_tool.products = search_tool._format_search_results(deals)
+        return await wrapper.search('benchmark')
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await build()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        await build()
+        allocated = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'products': count,
+        'us_per_product': round(elapsed / repeat / count * 1e6, 2),
+        'allocated_bytes_per_product': round(allocated / count),
+    }
+
+
+async def time_search_result_serialization(catalog: Sequence[Dict[str, Any]], count: int = 50,
+                                           repeat: int = 200) -> Dict[str, Any]:
+    """
+    Time the JSON round trip search results used to make between the search tool and the agent.
+
+    The tool now hands the agent a SearchResult; this measures what the removed
+    json.dumps/json.loads pair cost for `count` product cards.
+    """
+    if not catalog:
+        return {}
+    products = [product_card(dict(catalog[i % len(catalog)], product_id=f"{catalog[i % len(catalog)]['product_id']}-{i}"))
+                for i in range(count)]
+    result = await ProductSearchLangChainTool(_StaticSearchTool(products)).search('benchmark')
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decoded = json.loads(result.to_json())
+        decoded['text'], decoded['products']
+    round_trip = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result.text, result.products
+    in_process = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        json.loads(result.to_json())
+        allocated = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'products': len(result.products),
+        'json_round_trip_us': round(round_trip / repeat * 1e6, 2),
+        'in_process_us': round(in_process / repeat * 1e6, 3),
+        'json_round_trip_allocated_kb': round(allocated / 1024, 1),
+    }
+
+
+def time_api_json(payloads: Sequence[Dict[str, Any]], repeat: int = 200) -> Dict[str, Any]:
+    """
+    Time rendering and parsing API response payloads, per payload, with DRF's
+    JSONRenderer/JSONParser and with the orjson ones the API is configured to use.
+    """
+    if not payloads:
+        return {}
+    bodies = [JSONRenderer().render(payload) for payload in payloads]
+    report = {
+        'payloads': len(payloads),
+        'mean_kb': round(sum(len(body) for body in bodies) / len(bodies) / 1024, 1),
+    }
+    for name, renderer, parser in (('json', JSONRenderer(), JSONParser()),
+                                   ('orjson', ORJSONRenderer(), ORJSONParser())):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for payload in payloads:
+                renderer.render(payload)
+        render = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for body in bodies:
+                parser.parse(BytesIO(body))
+        parse = time.perf_counter() - start
+
+        report[name] = {
+            'render_us': round(render / repeat / len(payloads) * 1e6, 1),
+            'parse_us': round(parse / repeat / len(payloads) * 1e6, 1),
+        }
+    return report
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Lines describing how the current report differs from a baseline report"""
+    lines = []
+    before, after = baseline['throughput']['turns_per_second'], current['throughput']['turns_per_second']
+    if before and after:
+        lines.append(f"throughput: {before} -> {after} turns/s ({(after - before) / before:+.1%})")
+
+    rows = [('turn', baseline['latency_ms']['turn'], current['latency_ms']['turn'])]
+    for name, stats in current['latency_ms']['stages'].items():
+        rows.append((name, baseline['latency_ms']['stages'].get(name), stats))
+    for name, old, new in rows:
+        if not old or old.get('p50') is None or new.get('p50') is None:
+            lines.append(f"{name}: new stage, p50 {new.get('p50')} ms")
+            continue
+        changes = ', '.join(
+            f"{key} {old[key]} -> {new[key]} ms" for key in ('p50', 'p95', 'p99') if old.get(key) is not None
+        )
+        lines.append(f"{name}: {changes}")
+
+    if 'memory_kb_per_turn' in baseline and 'memory_kb_per_turn' in current:
+        old = baseline['memory_kb_per_turn']['allocated']['mean']
+        new = current['memory_kb_per_turn']['allocated']['mean']
+        lines.append(f"allocated per turn: {old} -> {new} KB")
+
+    if baseline.get('product_cards') and current.get('product_cards'):
+        old, new = baseline['product_cards'], current['product_cards']
+        lines.append(
+            f"product cards: {old['us_per_product']} -> {new['us_per_product']} us and "
+            f"{old['allocated_bytes_per_product']} -> {new['allocated_bytes_per_product']} bytes per product"
+        )
+
+    if baseline.get('api_json') and current.get('api_json'):
+        old, new = baseline['api_json']['orjson'], current['api_json']['orjson']
+        lines.append(
+            f"API JSON: render {old['render_us']} -> {new['render_us']} us, "
+            f"parse {old['parse_us']} -> {new['parse_us']} us per payload"
+        )
+    return lines
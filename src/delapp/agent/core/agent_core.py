@@ -7,23 +7,60 @@ agent framework. It coordinates tool usage, memory management, and response gene
 import logging
 import os
 import asyncio
-import json
-from typing import Dict, List, Any, Optional, Tuple, Callable, Union
+import re
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple, Callable, Union
 
 from langchain.agents import AgentExecutor
 from langchain.agents import create_react_agent
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema.messages import SystemMessage, HumanMessage, AIMessage
 from langchain.schema.runnable import RunnablePassthrough
-from langchain.memory import ConversationBufferMemory
-from langchain.chat_models import ChatOpenAI
-from langchain_groq import ChatGroq
 
 from delapp.searchapi_io import DealAggregator
 from ..tools.langchain_tools import ProductSearchLangChainTool, ProductDetailsLangChainTool, CartManagementLangChainTool
+from ..tools.cart_management_tool import CartManagementTool
+from ..tools.product_cards import format_price, product_card
+from ..tools.results import SearchResult
+from .intent_classifier import get_intent_classifier
+from .intent_model import get_intent_model
+from .llm_cache import get_llm_cache
+from .llm_router import LLMRouter, build_llm_router
+from .prompt_builder import ConversationSummarizer, PromptBuilder
+from .reference_resolver import get_reference_resolver
+from ..response_generator.response_formatter import get_response_formatter
+from ..memory.chat_window import ChatWindowStore
+from ...tracing import record_span, span
 
 logger = logging.getLogger(__name__)
 
+# Keyword results at or above this confidence skip the intent model
+KEYWORD_CONFIDENCE = 0.6
+# Intent model predictions below this probability are ignored
+MODEL_CONFIDENCE = 0.7
+# Turns sent to the LLM start a product search alongside it when search is at least this likely
+SPECULATION_THRESHOLD = 0.3
+# How the LLM asks for a product search: the tool name, optionally after a
+# ReAct "Action:", opens its answer. A mention later on is not a call.
+SEARCH_TOOL_CALL = re.compile(r'\s*(?:Action:\s*)?product_search\b', re.IGNORECASE)
+_SEARCH_TOOL_CALL_PREFIXES = ('product_search', 'action: product_search')
+
+
+def tool_call_decided(text: str) -> Optional[bool]:
+    """
+    Whether an answer starting with text is a product_search call, or None
+    while the first line could still turn out either way.
+    """
+    match = SEARCH_TOOL_CALL.match(text)
+    if match:
+        # "product_search" may still be the start of "product_searches"
+        return True if match.end() < len(text) else None
+    head = ' '.join(text.lower().split())
+    if '\n' not in text.lstrip() and any(prefix.startswith(head) for prefix in _SEARCH_TOOL_CALL_PREFIXES):
+        return None
+    return False
+
 # System prompt for the ReAct agent with detailed instructions
 SYSTEM_PROMPT = """
 You are ShopAgent, an advanced AI shopping assistant that helps users find products, compare options, and make purchasing decisions.
@@ -60,31 +97,11 @@ class ShopAgent:
             llm: The language model to use (optional, will create a default one if not provided)
             tools: List of LangChain tools to use (optional, will create default ones if not provided)
         """
-        # Set up the LLM - use provided one or create a default
+        # Set up the LLM - use provided one or route over the LLM_ROUTER backends
         if llm is None:
-            # Try to use ChatGroq if API key is available, otherwise fall back to OpenAI
-            groq_api_key = os.environ.get('GROQ_API_KEY')
-            openai_api_key = os.environ.get('OPENAI_API_KEY')
-            
-            if groq_api_key:
-                self.llm = ChatGroq(
-                    api_key=groq_api_key,
-                    model_name="llama3-8b-8192",
-                    temperature=0.2,
-                    max_tokens=1024
-                )
-                logger.info("Using Groq LLM with llama3-8b-8192 model")
-            elif openai_api_key:
-                self.llm = ChatOpenAI(
-                    api_key=openai_api_key,
-                    model_name="gpt-3.5-turbo-0125",
-                    temperature=0.2,
-                    max_tokens=1024
-                )
-                logger.info("Using OpenAI LLM with gpt-3.5-turbo model")
-            else:
+            self.llm = build_llm_router()
+            if self.llm is None:
                 logger.warning("No LLM API keys found. Agent will not be fully functional.")
-                self.llm = None
         else:
             self.llm = llm
             logger.info(f"Using provided LLM: {type(llm).__name__}")
@@ -92,7 +109,21 @@ class ShopAgent:
         # Initialize memory and agent components
         self.agent_executor = None
         self.memory_components = {}
-        self.memory = ConversationBufferMemory(return_messages=True, memory_key="chat_history")
+        # Bounded per-conversation history shared by every request this agent serves
+        self.chat_windows = ChatWindowStore.from_settings()
+        self.prompt_builder = PromptBuilder.from_settings()
+        self.summarizer = ConversationSummarizer.from_settings(
+            self.prompt_builder.counter, keep_messages=self.chat_windows.max_messages
+        )
+        self._summary_tasks = set()
+        self.intent_classifier = get_intent_classifier()
+        self.intent_model = get_intent_model()
+        self.llm_cache = get_llm_cache()
+        self.reference_resolver = get_reference_resolver()
+        self.response_formatter = get_response_formatter()
+        self.cart_tool = CartManagementTool()
+        self._speculation_lock = threading.Lock()
+        self._speculation = {'launched': 0, 'used': 0, 'cancelled': 0, 'completed_unused': 0, 'cold': 0}
         
         # Use provided tools or initialize default ones
         if tools is not None and len(tools) > 0:
@@ -239,54 +270,182 @@ Use a tool by providing its name followed by the input parameters.
             self.agent_executor = None
     
     def _detect_intent(self, query: str) -> str:
-        """Simple method to detect basic intents from query text"""
-        # Simple keyword-based detection for common intents
-        if any(kw in query for kw in ['find', 'search for', 'looking for', 'show me', 'get me']):
-            return 'search'
+        """Detect the basic intent of a query without calling the LLM"""
+        return self._classify_intent(query)[0]
+
+    def _classify_intent(self, query: str) -> Tuple[str, float, str, float]:
+        """
+        Classify a query with the fast local classifiers.
+
+        The keyword classifier decides when it is confident. Otherwise the
+        trained intent model, when one is available, gets a say before the
+        query falls through to the LLM path.
+
+        Returns:
+            (intent, confidence, source, search_probability) where source is
+            'keywords' or 'model' and search_probability is the highest share
+            either classifier gives to the search intent
+        """
+        result = self.intent_classifier.classify(query)
+        search_probability = result.scores.get('search', 0.0) / sum(result.scores.values()) if result.scores else 0.0
+        if self.intent_model is None or (
+            result.intent != self.intent_classifier.default_intent and result.confidence >= KEYWORD_CONFIDENCE
+        ):
+            return result.intent, result.confidence, 'keywords', search_probability
+
+        probabilities = self.intent_model.predict_proba(query)
+        best = int(probabilities.argmax())
+        if 'search' in self.intent_model.classes:
+            search_probability = max(search_probability, float(probabilities[self.intent_model.classes.index('search')]))
+        if probabilities[best] >= MODEL_CONFIDENCE:
+            return self.intent_model.classes[best], float(probabilities[best]), 'model', search_probability
+        return result.intent, result.confidence, 'keywords', search_probability
+
+    def _count_speculation(self, outcome: str) -> None:
+        with self._speculation_lock:
+            self._speculation[outcome] += 1
+
+    def _discard_speculation(self, task: asyncio.Task) -> None:
+        """Cancel a speculative search the LLM did not need"""
+        if task.done() and not task.cancelled():
+            # The search finished, so its provider call was spent for nothing.
+            # Retrieve any error so a failed search is not reported as unhandled.
+            task.exception()
+            self._count_speculation('completed_unused')
+        else:
+            task.cancel()
+            self._count_speculation('cancelled')
+
+    def llm_stats(self) -> Optional[Dict[str, Any]]:
+        """Per-backend LLM health when the agent routes over several backends"""
+        return self.llm.stats() if isinstance(self.llm, LLMRouter) else None
+    
+    def speculation_stats(self) -> Dict[str, Any]:
+        """
+        Speculative search counters.
+
+        hit_rate is the share of speculative searches the LLM ended up using.
+        Completed unused searches certainly spent provider quota; cancelled ones
+        may have, if the request was already on the wire.
+        """
+        with self._speculation_lock:
+            stats = dict(self._speculation)
+        stats['hit_rate'] = round(stats['used'] / stats['launched'], 3) if stats['launched'] else None
+        stats['wasted_quota_min'] = stats['completed_unused']
+        stats['wasted_quota_max'] = stats['completed_unused'] + stats['cancelled']
+        return stats
+
+    def _search_response(self, query: str, result: SearchResult) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Take the response text and product cards from the search tool's result.
         
-        if any(kw in query for kw in ['tell me about', 'more info', 'details about', 'describe']):
-            return 'details'
-            
-        if any(kw in query for kw in ['add to cart', 'buy', 'purchase', 'get it']):
-            return 'cart_add'
-            
-        if any(kw in query for kw in ['view cart', 'show cart', 'what\'s in my cart']):
-            return 'cart_view'
+        The tool already built the cards; they are passed on as they are.
+
+        Returns:
+            (response, products)
+        """
+        try:
+            response = result.text
+            products = result.products
             
-        if any(kw in query for kw in ['remove from cart', 'delete', 'take out']):
-            return 'cart_remove'
+            logger.info(f"Search successful: {result.success}")
+            logger.info(f"Found {len(products)} products from search tool result")
             
-        # Check for product category keywords that indicate a product search
-        product_categories = [
-            'shoe', 'shoes', 'shirt', 'shirts', 'pants', 'jeans', 'dress', 'dresses',
-            'jacket', 'jackets', 'coat', 'coats', 'hat', 'hats', 'gloves', 'socks',
-            'phone', 'phones', 'laptop', 'laptops', 'computer', 'computers', 'tv', 'television', 
-            'headphone', 'headphones', 'earbuds', 'speaker', 'speakers', 'camera', 'cameras',
-            'watch', 'watches', 'jewelry', 'ring', 'rings', 'necklace', 'necklaces', 'bracelet', 'bracelets',
-            'book', 'books', 'games', 'game', 'toy', 'toys', 'puzzle', 'puzzles',
-            'furniture', 'chair', 'chairs', 'table', 'tables', 'desk', 'desks', 'sofa', 'sofas',
-            'kitchen', 'appliance', 'appliances', 'mixer', 'mixers', 'blender', 'blenders',
-            'coffee maker', 'coffee makers', 'toaster', 'toasters', 'microwave', 'microwaves',
-            'refrigerator', 'refrigerators', 'fridge', 'freezer', 'freezers',
-            'beauty', 'skincare', 'makeup', 'haircare', 'perfume', 'cologne',
-            'tool', 'tools', 'drill', 'drills', 'saw', 'saws', 'screwdriver', 'screwdrivers',
-            'car', 'cars', 'bike', 'bikes', 'bicycle', 'bicycles', 'motorcycle', 'motorcycles'
-        ]
-        
-        # Check if query contains price references (e.g., "under $100")
-        price_indicators = ['price', 'cost', 'cheap', '$', 'under', 'less than', 'maximum', 'budget', 'affordable']
+            # Log one product for debugging
+            if products:
+                logger.debug(f"Sample product: {products[0]}")
+            return response, products
+        except Exception as e:
+            logger.error(f"Error processing search tool result: {str(e)}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return f"I tried to search for '{query}' but encountered an error while processing the results.", []
+    
+    async def _format_search_reply(self, query: str, response: str, products: List[Dict[str, Any]],
+                                   user_id: Optional[str], context: Optional[Dict[str, Any]]) -> str:
+        """
+        Let the response formatter replace the template reply, as the endpoint's policy allows.
+
+        The products event has already gone out, so an inline polish only delays the text.
+        """
+        if self.response_formatter is None:
+            return response
+        endpoint = (context or {}).get('endpoint', 'default')
+        with span('agent.format', endpoint=endpoint):
+            return await self.response_formatter.format_product_search_response(
+                query, products, endpoint=endpoint, user_id=user_id, text=response
+            )
+    
+    async def _answer_reference(self, query: str, intent: str, product: Dict[str, Any],
+                                products: List[Dict[str, Any]], conversation_id: Optional[str],
+                                user_id: Optional[str], session_id: Optional[str]) -> str:
+        """Answer a follow-up about a product already shown, without searching again"""
+        card = product_card(product)
+        if intent == 'cart_add':
+            result = await self.cart_tool.execute(
+                'add',
+                user_id=user_id,
+                session_id=session_id,
+                product_reference=query,
+                products=products,
+                conversation_id=conversation_id
+            )
+            if result.get('success'):
+                return result.get('message', f"Added {card['name']} to your cart")
+            return f"I couldn't add {card['name']} to your cart: {result.get('error', 'unknown error')}"
         
-        # If query contains a product category OR price indicator, it's likely a product search
-        if any(category in query.lower() for category in product_categories) or \
-           any(indicator in query.lower() for indicator in price_indicators):
-            return 'search'
-            
-        # Default to search for question-like queries
-        if any(kw in query for kw in ['what', 'how', 'where', 'when', 'who', 'which']):
-            return 'search'
-            
-        # Default to conversation for everything else
-        return 'conversation'
+        details_tool = next((tool for tool in self.tools if getattr(tool, 'name', None) == 'product_details'), None)
+        if details_tool is not None:
+            return await details_tool._arun(query, products=products)
+        return f"{card['name']} is {format_price(card['currentPrice'])} at {card['retailer']}."
+    
+    def _schedule_summary_refresh(self, conversation_id: int) -> None:
+        """Refresh the running summary in the background so the reply is not held up"""
+        async def refresh():
+            try:
+                await self.summarizer.refresh(conversation_id, self.llm)
+            except Exception as e:
+                logger.error(f"Error refreshing conversation summary: {str(e)}", exc_info=True)
+
+        task = asyncio.create_task(refresh())
+        # Keep a reference until the task finishes so it is not garbage collected
+        self._summary_tasks.add(task)
+        task.add_done_callback(self._summary_tasks.discard)
+    
+    async def _stream_chain(self, query: str, chat_history: str = "") -> AsyncIterator[str]:
+        """
+        Stream the conversational chain's answer token by token.
+
+        Repeated impersonal prompts are answered from the LLM cache in one piece.
+        """
+        cache_key = None
+        if self.llm_cache is not None:
+            cache_key = self.llm_cache.cache_key(
+                model=getattr(self.llm, 'model_name', None) or type(self.llm).__name__,
+                temperature=getattr(self.llm, 'temperature', None),
+                prompt=query,
+                chat_history=chat_history
+            )
+            cached = await self.llm_cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM response served from cache")
+                yield cached
+                return
+
+        prompt_text = self.agent_executor.prompt.format(
+            input=query,
+            chat_history=chat_history,
+            agent_scratchpad=""
+        )
+        parts = []
+        async for chunk in self.llm.astream(prompt_text):
+            token = getattr(chunk, 'content', chunk)
+            if token:
+                parts.append(token)
+                yield token
+
+        if self.llm_cache is not None:
+            await self.llm_cache.set(cache_key, ''.join(parts))
     
     async def process_query(self, 
                            query: str, 
@@ -294,34 +453,69 @@ Use a tool by providing its name followed by the input parameters.
                            user_id: Optional[str] = None,
                            **kwargs) -> Dict[str, Any]:
         """Process a user query and return the agent's response"""
+        result = None
+        async for event in self.stream_query(query, conversation_id=conversation_id, user_id=user_id, **kwargs):
+            if event['event'] == 'final':
+                result = event['data']
+        return result
+
+    async def stream_query(self,
+                           query: str,
+                           conversation_id: Optional[str] = None,
+                           user_id: Optional[str] = None,
+                           **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a user query, yielding progress events as soon as they are known.
+
+        Events are dicts with an 'event' name and a 'data' payload, in order:
+        - intent: the detected intent and its confidence
+        - products: product cards, as soon as a search returns
+        - token: pieces of the LLM answer as they arrive
+        - final: the same result dict process_query returns
+        """
         logger.info(f"Processing query: '{query[:50]}...'" if len(query) > 50 else f"Processing query: '{query}'")
         
         # Check if the agent is initialized
         if not self.agent_executor:
             logger.error("Agent executor not initialized. Cannot process query.")
-            return {
+            yield {'event': 'final', 'data': {
                 "response": "I'm sorry, but the shopping assistant is not properly initialized. Please try again later.",
                 "products": [],
                 "conversation_id": conversation_id
-            }
+            }}
+            return
         
         # Initialize/retrieve products from conversation memory
         products = []
+        history_summary = ""
         
         # If we have a conversation ID, try to retrieve the state
         if conversation_id and 'conversation_memory' in self.memory_components:
             try:
                 # Get the current products from the conversation memory if available
-                state = await self.memory_components['conversation_memory'].get_state(conversation_id)
+                with span('agent.state_load'):
+                    state = await self.memory_components['conversation_memory'].get_state(conversation_id)
                 if state and 'current_products' in state:
                     products = state['current_products']
                     logger.info(f"Retrieved {len(products)} products from conversation state")
+                if state:
+                    history_summary = state.get('history_summary', "")
             except Exception as e:
                 logger.error(f"Error retrieving conversation state: {str(e)}")
         
         # Basic intent detection
-        intent = self._detect_intent(query.lower())
-        logger.info(f"Detected intent: {intent}")
+        with span('agent.intent') as intent_span:
+            intent, confidence, intent_source, search_probability = self._classify_intent(query)
+            if intent_span is not None:
+                intent_span.attributes.update(intent=intent, source=intent_source)
+        logger.info(f"Detected intent: {intent} (confidence {confidence:.2f} from {intent_source})")
+        yield {'event': 'intent', 'data': {'intent': intent, 'confidence': confidence, 'source': intent_source}}
+        
+        # Answer references like "the second one" from the products already shown
+        reference = None
+        if products:
+            with span('agent.reference'):
+                reference = self.reference_resolver.resolve(query, products)
         
         # Check for follow-up questions about previous products
         is_follow_up = False
@@ -331,7 +525,7 @@ Use a tool by providing its name followed by the input parameters.
             'more info', 'would like', 'want to know'
         ]
         
-        if products and any(kw in query.lower() for kw in follow_up_keywords):
+        if reference is None and products and any(kw in query.lower() for kw in follow_up_keywords):
             logger.info(f"Detected follow-up question about products: '{query}'")
             is_follow_up = True
             
@@ -342,81 +536,120 @@ Use a tool by providing its name followed by the input parameters.
                     "Great! Here are the products I found earlier. You can ask me for more details about any specific one, "
                     "or we can continue your shopping journey. Which product would you like to know more about?"
                 )
-                return {
+                yield {'event': 'final', 'data': {
                     "response": response,
                     "products": products,
                     "conversation_id": conversation_id
-                }
+                }}
+                return
                 
+        if reference is not None:
+            logger.info(f"Resolved follow-up to product {reference.index + 1} by {reference.reason}")
+            with span('agent.reference_answer', intent=intent):
+                response = await self._answer_reference(query, intent, reference.product, products,
+                                                        conversation_id, user_id, (kwargs.get('context') or {}).get('session_id'))
+            yield {'event': 'products', 'data': {'products': [reference.product]}}
         # Handle search intent with product search tool
-        if (intent == 'search' or is_follow_up) and len(self.tools) > 0:
+        elif (intent == 'search' or is_follow_up) and len(self.tools) > 0:
             try:
                 # Find product search tool
                 search_tool = self.tools[0]  # Assuming first tool is product search
                 
                 # Call the tool directly
                 logger.info(f"Executing product search tool directly for query: {query}")
-                search_result_json = await search_tool._arun(query)
-                
-                # Process JSON result
-                try:
-                    import json
-                    result_obj = json.loads(search_result_json)
-                    
-                    # Extract the text response and actual product data
-                    response = result_obj.get('text', '')
-                    products = result_obj.get('products', [])
-                    
-                    logger.info(f"Search successful: {result_obj.get('success', False)}")
-                    logger.info(f"Found {len(products)} products from search tool result")
-                    
-                    # Ensure products have necessary fields for the frontend
-                    for i, product in enumerate(products):
-                        # Make sure each product has a unique ID
-                        if 'id' not in product:
-                            product['id'] = f"product_{i}"
-                            
-                        # Ensure there's a currency field if missing
-                        if 'currency' not in product and 'price' in product:
-                            product['currency'] = 'USD'
-                            
-                    # Log one product for debugging
-                    if products:
-                        logger.debug(f"Sample product: {products[0]}")
-                except json.JSONDecodeError:
-                    # If not JSON, use the raw text response
-                    logger.error("Failed to parse JSON from search tool response")
-                    response = search_result_json
-                    products = []
-                except Exception as e:
-                    logger.error(f"Error processing search tool result: {str(e)}")
-                    import traceback
-                    logger.error(traceback.format_exc())
-                    response = f"I tried to search for '{query}' but encountered an error while processing the results."
-                    products = []
+                with span('agent.search'):
+                    search_result = await search_tool.search(query)
+                with span('agent.search_result'):
+                    response, products = self._search_response(query, search_result)
+                if products:
+                    yield {'event': 'products', 'data': {'products': products}}
+                    response = await self._format_search_reply(query, response, products, user_id, kwargs.get('context'))
             except Exception as e:
                 logger.error(f"Error executing product search: {str(e)}")
                 import traceback
                 logger.error(traceback.format_exc())
                 response = f"I tried to search for '{query}' but encountered an error: {str(e)}"
         else:
-            # Use the LLM Chain for conversation
+            # Use the LLM Chain for conversation. When search is plausible, start it
+            # alongside so the results are warm if the LLM asks for them.
+            speculative_search = None
+            if search_probability >= SPECULATION_THRESHOLD and len(self.tools) > 0:
+                logger.info(f"Starting speculative product search (search probability {search_probability:.2f})")
+                speculative_search = asyncio.create_task(self.tools[0].search(query))
+                self._count_speculation('launched')
             try:
-                # Execute the LLM chain as a fallback
-                chain_result = await self.agent_executor.acall({
-                    "input": query,
-                    "chat_history": "",
-                    "agent_scratchpad": ""
-                })
-                response = chain_result.get('text', '')
+                with span('agent.prompt_build'):
+                    history = []
+                    if conversation_id and str(conversation_id).isdigit():
+                        history = await self.chat_windows.get_history(str(conversation_id))
+                    built = self.prompt_builder.build(
+                        self.agent_executor.prompt, query,
+                        history=history, summary=history_summary, products=products
+                    )
+                chat_history = built.chat_history
+                logger.info(
+                    f"Prompt uses {built.tokens}/{built.budget} tokens: {built.messages} messages "
+                    f"({built.dropped_messages} trimmed), {built.products} products"
+                )
+
+                # Execute the LLM chain as a fallback, streaming tokens as they arrive.
+                # The stream spans yields, so it is recorded once done rather than opened as a span.
+                parts = []
+                llm_start = time.perf_counter()
+                first_token_ms = None
+                # Tokens are held back until the first line shows the answer is not a
+                # product_search call, so the raw call never reaches the client
+                held = []
+                tool_call = None if len(self.tools) > 0 else False
+                async for token in self._stream_chain(query, chat_history):
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - llm_start) * 1000, 2)
+                    parts.append(token)
+                    if tool_call is None:
+                        held.append(token)
+                        tool_call = tool_call_decided(''.join(held))
+                        if tool_call is False:
+                            yield {'event': 'token', 'data': {'text': ''.join(held)}}
+                    elif not tool_call:
+                        yield {'event': 'token', 'data': {'text': token}}
+                record_span('agent.llm', llm_start, first_token_ms=first_token_ms, tokens=len(parts))
+                response = ''.join(parts)
                 logger.info(f"LLM response: {response[:100]}..." if len(response) > 100 else f"LLM response: {response}")
+                if tool_call is None:
+                    # The answer ended before the first line decided it, e.g. a bare "product"
+                    tool_call = bool(SEARCH_TOOL_CALL.match(response))
+                    if not tool_call and held:
+                        yield {'event': 'token', 'data': {'text': ''.join(held)}}
+
+                if tool_call:
+                    if speculative_search is not None:
+                        logger.info("LLM asked for a product search; using the speculative results")
+                        self._count_speculation('used')
+                        with span('agent.search', speculative=True):
+                            search_result = await speculative_search
+                        speculative_search = None
+                    else:
+                        logger.info("LLM asked for a product search; running it now")
+                        self._count_speculation('cold')
+                        with span('agent.search'):
+                            search_result = await self.tools[0].search(query)
+                    with span('agent.search_result'):
+                        response, products = self._search_response(query, search_result)
+                    if products:
+                        yield {'event': 'products', 'data': {'products': products}}
+                        response = await self._format_search_reply(query, response, products, user_id,
+                                                                    kwargs.get('context'))
             except Exception as e:
                 logger.error(f"Error executing LLM chain: {str(e)}")
                 import traceback
                 logger.error(traceback.format_exc())
                 response = f"I'm sorry, but I encountered an error while processing your request: {str(e)}"
+            finally:
+                if speculative_search is not None:
+                    self._discard_speculation(speculative_search)
         
         # Save to conversation memory if available
+        message_id = None
         if conversation_id and 'conversation_memory' in self.memory_components:
             try:
                 # Check if conversation_id is a string and convert it to int if possible
@@ -440,25 +673,26 @@ Use a tool by providing its name followed by the input parameters.
                 if conv_id is not None:
                     memory = self.memory_components['conversation_memory']
                     
-                    # Save the assistant response with product metadata
-                    await memory.save({
+                    # The turn's only write: both messages, the answer with the products it
+                    # showed, and new search results as the conversation's current products
+                    message_id = await memory.save_turn({
                         'conversation_id': conv_id,
                         'user_id': user_id,
-                        'role': 'assistant',
-                        'content': response,
-                        'metadata': {
-                            'products': products if products else []
-                        }
+                        'session_id': (kwargs.get('context') or {}).get('session_id'),
+                        'query': query,
+                        'response': response,
+                        'products': [reference.product] if reference is not None else products,
+                        'current_products': products if reference is None else None
                     })
                     
-                    # If we have products, update the conversation state
-                    if products:
-                        await memory.update({
-                            'conversation_id': conv_id,
-                            'state': {
-                                'current_products': products
-                            }
-                        })
+                    if message_id is not None:
+                        self.chat_windows.append(conv_id, 'user', query)
+                        self.chat_windows.append(conv_id, 'assistant', response, message_id=message_id)
+                    else:
+                        # The turn was not saved, so the window no longer matches the database
+                        self.chat_windows.discard(conv_id)
+                    if isinstance(conv_id, int) and self.llm is not None:
+                        self._schedule_summary_refresh(conv_id)
                         
                     logger.info(f"Added response to conversation {conv_id}")
             except Exception as e:
@@ -482,6 +716,18 @@ Use a tool by providing its name followed by the input parameters.
             except Exception as e:
                 logger.error(f"Error retrieving previous product context: {str(e)}")
         
+        # A resolved reference shows just that product; the conversation keeps its full list
+        if reference is not None:
+            yield {'event': 'final', 'data': {
+                'response': response,
+                'products': [reference.product],
+                'reference': {'index': reference.index, 'reason': reference.reason},
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'followup_questions': []
+            }}
+            return
+        
         # Generate follow-up questions if we have products
         followup_questions = []
         if products:
@@ -494,7 +740,7 @@ Use a tool by providing its name followed by the input parameters.
             # If there are specific product categories in the results, add a targeted question
             product_types = set()
             for product in products:
-                title = product.get('title', '').lower()
+                title = product['name'].lower()
                 for category in ['coffee maker', 'blender', 'toaster', 'microwave']:
                     if category in title:
                         product_types.add(category)
@@ -504,9 +750,10 @@ Use a tool by providing its name followed by the input parameters.
                 followup_questions.append(f"Would you like to see more {category}s?")
         
         # Return the response and product data in the structure the frontend expects
-        return {
+        yield {'event': 'final', 'data': {
             'response': response,
             'products': products,
             'conversation_id': conversation_id,
+            'message_id': message_id,
             'followup_questions': followup_questions
-        }
+        }}
@@ -0,0 +1,193 @@
+"""
+Intent Classifier for ShopAgent
+
+This module implements a compiled keyword classifier for user queries. Every
+phrase from the intent vocabulary is compiled into a single alternation regex,
+so a query is scanned once, and each matched phrase adds its weight to its
+intent. The highest scoring intent wins and its share of the total score is
+reported as confidence, together with the matched spans.
+
+Vocabularies live in data files (see data/intent_vocabulary.json) so they can
+be tuned without touching code.
+"""
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+DEFAULT_VOCABULARY_PATH = os.path.join(DATA_DIR, 'intent_vocabulary.json')
+
+
+@dataclass
+class IntentSpan:
+    """A vocabulary phrase found in the query"""
+    start: int
+    end: int
+    phrase: str
+    intent: str
+    weight: float
+
+
+@dataclass
+class IntentResult:
+    """Outcome of classifying one query"""
+    intent: str
+    confidence: float
+    spans: List[IntentSpan] = field(default_factory=list)
+    scores: Dict[str, float] = field(default_factory=dict)
+
+
+def _trie_pattern(node: Dict) -> str:
+    """
+    Render a character trie as a regex. Shared prefixes are matched once, so
+    the engine branches per character instead of trying every phrase in turn.
+    Longer continuations are tried before a phrase ends, giving longest match.
+    """
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if '' in node:
+        branches.append(node[''])
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:' + '|'.join(branches) + ')'
+
+
+def _compile_phrases(phrases: List[str]) -> 're.Pattern':
+    """
+    Compile phrases into a single alternation automaton.
+
+    Phrases are anchored on word boundaries where they start or end with a
+    word character, so "tv" does not fire inside "activity" while "$" still
+    matches in "$100".
+    """
+    tries = {True: {}, False: {}}
+    for phrase in phrases:
+        node = tries[bool(re.match(r'\w', phrase))]
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = r'\b' if re.search(r'\w$', phrase) else ''
+
+    branches = []
+    if tries[True]:
+        branches.append(r'\b' + _trie_pattern(tries[True]))
+    if tries[False]:
+        branches.append(_trie_pattern(tries[False]))
+    return re.compile('|'.join(branches))
+
+
+def _read_phrase_file(path: str, default_weight: float) -> Dict[str, float]:
+    """Read a phrase file: one phrase per line, optionally followed by a tab and a weight"""
+    phrases = {}
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            phrase, _, weight = line.partition('\t')
+            phrases[phrase.strip().lower()] = float(weight) if weight.strip() else default_weight
+    return phrases
+
+
+class IntentClassifier:
+    """Single-pass weighted keyword classifier"""
+
+    def __init__(self, vocabulary: Dict[str, Dict[str, float]],
+                 default_intent: str = 'conversation', default_confidence: float = 0.5):
+        """
+        Compile a classifier from a vocabulary.
+
+        Args:
+            vocabulary: Mapping of intent name to {phrase: weight}. Intents are
+                listed in priority order, which breaks ties between equal scores.
+            default_intent: Intent returned when nothing matches
+            default_confidence: Confidence reported for the default intent
+        """
+        self.default_intent = default_intent
+        self.default_confidence = default_confidence
+        self.vocabulary = {intent: dict(phrases) for intent, phrases in vocabulary.items()}
+        self.intents = list(vocabulary)
+        self._priority = {intent: index for index, intent in enumerate(self.intents)}
+
+        # A phrase may contribute to several intents
+        self._features: Dict[str, List[Tuple[str, float]]] = {}
+        for intent, phrases in vocabulary.items():
+            for phrase, weight in phrases.items():
+                self._features.setdefault(phrase.lower(), []).append((intent, float(weight)))
+
+        self._pattern = _compile_phrases(list(self._features)) if self._features else None
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> 'IntentClassifier':
+        """
+        Load a classifier from a vocabulary JSON file.
+
+        The file maps each intent to inline "phrases" ({phrase: weight}) and
+        optional "phrase_files" ({file name: default weight}) resolved relative
+        to the vocabulary file.
+        """
+        path = path or DEFAULT_VOCABULARY_PATH
+        with open(path, encoding='utf-8') as handle:
+            config = json.load(handle)
+
+        base_dir = os.path.dirname(os.path.abspath(path))
+        vocabulary = {}
+        for intent, spec in config.get('intents', {}).items():
+            phrases = {phrase.lower(): float(weight) for phrase, weight in spec.get('phrases', {}).items()}
+            for file_name, weight in spec.get('phrase_files', {}).items():
+                phrases.update(_read_phrase_file(os.path.join(base_dir, file_name), float(weight)))
+            vocabulary[intent] = phrases
+
+        return cls(
+            vocabulary,
+            default_intent=config.get('default_intent', 'conversation'),
+            default_confidence=float(config.get('default_confidence', 0.5))
+        )
+
+    def classify(self, query: str) -> IntentResult:
+        """
+        Classify a query in a single scan.
+
+        Returns:
+            IntentResult with the winning intent, its share of the total score
+            as confidence, the matched spans and the per-intent scores
+        """
+        if not query or self._pattern is None:
+            return IntentResult(self.default_intent, self.default_confidence)
+
+        text = query.lower().replace('\u2019', "'")
+        spans = []
+        scores: Dict[str, float] = {}
+        for match in self._pattern.finditer(text):
+            phrase = match.group(0)
+            for intent, weight in self._features[phrase]:
+                spans.append(IntentSpan(match.start(), match.end(), phrase, intent, weight))
+                scores[intent] = scores.get(intent, 0.0) + weight
+
+        if not scores:
+            return IntentResult(self.default_intent, self.default_confidence)
+
+        intent = min(scores, key=lambda name: (-scores[name], self._priority[name]))
+        confidence = round(scores[intent] / sum(scores.values()), 3)
+        return IntentResult(intent, confidence, spans, scores)
+
+
+_default_classifier: Optional[IntentClassifier] = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """
+    Get the process-wide classifier, compiled on first use.
+
+    The vocabulary path can be overridden with the INTENT_VOCABULARY_PATH setting.
+    """
+    global _default_classifier
+    if _default_classifier is None:
+        from django.conf import settings
+        path = getattr(settings, 'INTENT_VOCABULARY_PATH', None) or DEFAULT_VOCABULARY_PATH
+        _default_classifier = IntentClassifier.from_file(path)
+        logger.info(f"Compiled intent classifier with {len(_default_classifier._features)} phrases from {path}")
+    return _default_classifier
@@ -0,0 +1,207 @@
+"""
+Intent Model for ShopAgent
+
+A small CPU-only intent model: hashed word and character n-gram features fed
+into a multinomial logistic regression implemented in NumPy. It is trained
+from hand-labelled seeds and conversation history by `manage.py
+train_intent_model`, which build.sh runs on every deploy, and stored as a
+single float16 .npy array (weights with the bias as the last row) plus a JSON
+sidecar naming the classes. The array is memory-mapped on load, so worker
+processes share the pages and startup does not read the whole file.
+
+Prediction touches only the weight rows of the features present in the
+query, which keeps it well under a millisecond; `manage.py evaluate_intents`
+measures it.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import re
+import zlib
+
+import numpy as np
+
+from .intent_classifier import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(DATA_DIR, 'intent_model.npy')
+DEFAULT_N_FEATURES = 2 ** 16
+
+_TOKEN_RE = re.compile(r"[\w']+|\$")
+
+
+def _metadata_path(path: str) -> str:
+    return os.path.splitext(path)[0] + '.json'
+
+
+def featurize(query: str, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash a query into sparse features: word unigrams, word bigrams and
+    character trigrams of each word, L2-normalized.
+
+    Returns:
+        (indices, values) arrays with unique indices
+    """
+    tokens = _TOKEN_RE.findall(query.lower().replace('\u2019', "'"))
+    grams = ['w:' + token for token in tokens]
+    grams.extend(f'b:{first} {second}' for first, second in zip(tokens, tokens[1:]))
+    for token in tokens:
+        padded = f'<{token}>'
+        grams.extend('c:' + padded[i:i + 3] for i in range(len(padded) - 2))
+
+    counts: Dict[int, float] = {}
+    for gram in grams:
+        index = zlib.crc32(gram.encode('utf-8')) % n_features
+        counts[index] = counts.get(index, 0.0) + 1.0
+
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = np.sqrt(np.dot(values, values))
+    if norm:
+        values /= norm
+    return indices, values
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentModel:
+    """Hashed n-gram multinomial logistic regression"""
+
+    def __init__(self, weights: np.ndarray, classes: Sequence[str]):
+        """
+        Args:
+            weights: (n_features + 1, n_classes) array; the last row is the bias
+            classes: Intent name for each column
+        """
+        self.weights = weights
+        self.classes = list(classes)
+        self.n_features = weights.shape[0] - 1
+
+    def predict_proba(self, query: str) -> np.ndarray:
+        """Class probabilities for one query"""
+        indices, values = featurize(query, self.n_features)
+        logits = values @ self.weights[indices].astype(np.float32) + self.weights[-1].astype(np.float32)
+        return _softmax(logits)
+
+    def predict(self, query: str) -> Tuple[str, float]:
+        """
+        Returns:
+            (intent, probability) of the most likely class
+        """
+        probabilities = self.predict_proba(query)
+        best = int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best])
+
+    def save(self, path: str) -> None:
+        """Write the float16 weight array and its JSON sidecar"""
+        np.save(path, self.weights.astype(np.float16))
+        with open(_metadata_path(path), 'w', encoding='utf-8') as handle:
+            json.dump({'classes': self.classes, 'n_features': self.n_features}, handle)
+
+    @classmethod
+    def load(cls, path: str) -> 'IntentModel':
+        """Memory-map a saved model"""
+        with open(_metadata_path(path), encoding='utf-8') as handle:
+            metadata = json.load(handle)
+        weights = np.load(path, mmap_mode='r')
+        if weights.shape != (metadata['n_features'] + 1, len(metadata['classes'])):
+            raise ValueError(f"Intent model {path} does not match its metadata")
+        return cls(weights, metadata['classes'])
+
+
+def train_intent_model(samples: Iterable[Tuple[str, str]], n_features: int = DEFAULT_N_FEATURES,
+                       epochs: int = 30, learning_rate: float = 2.0, l2: float = 1e-5,
+                       batch_size: int = 16, seed: int = 0) -> IntentModel:
+    """
+    Fit the model with minibatch SGD on the softmax cross-entropy.
+
+    Args:
+        samples: (query, intent) pairs
+        n_features: Size of the hashed feature space
+        epochs: Passes over the data
+        learning_rate: Initial step size, decayed linearly to a tenth
+        l2: L2 penalty applied to the weight rows touched by each batch
+        batch_size: Samples per update
+        seed: Shuffling seed
+
+    Returns:
+        The trained IntentModel
+    """
+    samples = list(samples)
+    if not samples:
+        raise ValueError("Cannot train an intent model without samples")
+
+    classes = sorted({intent for _, intent in samples})
+    class_index = {intent: i for i, intent in enumerate(classes)}
+    features = [featurize(query, n_features) for query, _ in samples]
+    labels = np.array([class_index[intent] for _, intent in samples])
+
+    rng = np.random.default_rng(seed)
+    weights = np.zeros((n_features + 1, len(classes)), dtype=np.float32)
+    steps = max(epochs * -(-len(samples) // batch_size), 1)
+    step = 0
+
+    for _ in range(epochs):
+        order = rng.permutation(len(samples))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            lr = learning_rate * (1.0 - 0.9 * step / steps)
+            step += 1
+
+            indices = np.concatenate([features[i][0] for i in batch])
+            values = np.concatenate([features[i][1] for i in batch])
+            rows = np.repeat(np.arange(len(batch)), [len(features[i][0]) for i in batch])
+
+            logits = np.tile(weights[-1], (len(batch), 1))
+            np.add.at(logits, rows, values[:, None] * weights[indices])
+            gradient = _softmax(logits)
+            gradient[np.arange(len(batch)), labels[batch]] -= 1.0
+            gradient /= len(batch)
+
+            touched = np.unique(indices)
+            weights[touched] *= (1.0 - lr * l2)
+            np.add.at(weights, indices, -lr * values[:, None] * gradient[rows])
+            weights[-1] -= lr * gradient.sum(axis=0)
+
+    return IntentModel(weights, classes)
+
+
+def accuracy(model: IntentModel, samples: List[Tuple[str, str]]) -> Optional[float]:
+    """Share of samples whose intent the model predicts correctly"""
+    if not samples:
+        return None
+    return sum(model.predict(query)[0] == intent for query, intent in samples) / len(samples)
+
+
+_default_model = None
+_default_model_loaded = False
+
+
+def get_intent_model() -> Optional[IntentModel]:
+    """
+    Get the process-wide intent model, memory-mapped on first use.
+
+    The path can be overridden with the INTENT_MODEL_PATH setting. Returns
+    None when no model has been trained yet, so callers fall back to the
+    keyword classifier alone.
+    """
+    global _default_model, _default_model_loaded
+    if not _default_model_loaded:
+        from django.conf import settings
+        path = getattr(settings, 'INTENT_MODEL_PATH', None) or DEFAULT_MODEL_PATH
+        _default_model_loaded = True
+        if os.path.exists(path):
+            try:
+                _default_model = IntentModel.load(path)
+                logger.info(f"Loaded intent model with classes {_default_model.classes} from {path}")
+            except Exception as e:
+                logger.error(f"Failed to load intent model from {path}: {str(e)}", exc_info=True)
+        else:
+            logger.info(f"No intent model at {path}; using the keyword classifier only")
+    return _default_model
@@ -0,0 +1,235 @@
+"""
+LLM Response Cache for ShopAgent
+
+Caches the text the conversational chain returns, keyed on the model name,
+the sampling temperature and a hash of the normalized prompt, so repeated
+small talk ("hi", "thanks", "what can you do") does not wait on Groq/OpenAI.
+
+Only deterministic, impersonal turns are cached: prompts sampled above
+MAX_TEMPERATURE, prompts that carry chat history, and prompts that mention
+the user's own data are passed straight through. Entries expire after a TTL
+and each backend bounds its size.
+
+Configured through the LLM_CACHE setting:
+
+    LLM_CACHE = {
+        'BACKEND': 'django',      # 'django', 'sqlite' or 'none' to disable
+        'CACHE_ALIAS': 'default', # Django cache alias for the django backend
+        'PATH': '/tmp/llm_cache.sqlite3',  # Database file for the sqlite backend
+        'TTL': 3600,
+        'MAX_ENTRIES': 10000,
+        'MAX_TEMPERATURE': 0.3,
+    }
+"""
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_TEMPERATURE = 0.3
+
+# Longer prompts are unlikely to repeat and not worth storing
+MAX_PROMPT_CHARS = 500
+MAX_RESPONSE_CHARS = 20000
+
+# Prompts that carry the user's own details (their things, order numbers, emails)
+PERSONAL_PATTERNS = re.compile(
+    r"\b(?:my|mine|i'm|i am|i've|order|orders|account|address)\b|@|\d{4,}"
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r'\s+', ' ', prompt.lower().replace('\u2019', "'")).strip().rstrip('.!?')
+
+
+class DjangoCacheBackend:
+    """Store entries in a Django cache; size is bounded by the cache's own MAX_ENTRIES"""
+
+    def __init__(self, alias: str = 'default', prefix: str = 'llm-cache:'):
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._cache.aget(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self._cache.aset(self.prefix + key, value, ttl)
+
+
+class SQLiteCacheBackend:
+    """Store entries in a local SQLite file, evicting the least recently used beyond max_entries"""
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_used_at ON llm_cache (used_at)")
+        self._connection.commit()
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            else:
+                self._connection.execute("UPDATE llm_cache SET used_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+        return row[0] if row[1] > now else None
+
+    def _set(self, key: str, value: str, ttl: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            self._connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            self._connection.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._connection.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+
+class LLMResponseCache:
+    """Decide what is cacheable, key it, and count hits, misses and bypasses"""
+
+    def __init__(self, backend, ttl: int = DEFAULT_TTL, max_temperature: float = DEFAULT_MAX_TEMPERATURE):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stored': 0, 'errors': 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def cache_key(self, model: str, temperature: Optional[float], prompt: str,
+                  chat_history: str = '') -> Optional[str]:
+        """
+        Build the cache key for a call, or None when the call must bypass the cache.
+
+        Args:
+            model: Model name
+            temperature: Sampling temperature; None counts as non-deterministic
+            prompt: The user input sent to the chain
+            chat_history: Conversation context sent with the prompt
+        """
+        if temperature is None or temperature > self.max_temperature:
+            return None
+        if chat_history:
+            return None
+
+        normalized = normalize_prompt(prompt)
+        if not normalized or len(normalized) > MAX_PROMPT_CHARS:
+            return None
+        if PERSONAL_PATTERNS.search(normalized):
+            return None
+
+        return hashlib.sha256(f"{model}|{temperature:.2f}|{normalized}".encode('utf-8')).hexdigest()
+
+    async def get(self, key: Optional[str]) -> Optional[str]:
+        """Look up a key from cache_key. A None key counts as a bypass."""
+        if key is None:
+            self._count('bypassed')
+            return None
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"LLM cache lookup failed: {str(e)}", exc_info=True)
+            self._count('errors')
+            return None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    async def set(self, key: Optional[str], value: str) -> None:
+        """Store a response under a key from cache_key; None keys and empty or huge responses are skipped"""
+        if key is None or not value or len(value) > MAX_RESPONSE_CHARS:
+            return
+        try:
+            await self.backend.set(key, value, self.ttl)
+            self._count('stored')
+        except Exception as e:
+            logger.error(f"LLM cache store failed: {str(e)}", exc_info=True)
+            self._count('errors')
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus the hit rate over cacheable lookups"""
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        return stats
+
+
+_default_cache = None
+_default_cache_built = False
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    Get the process-wide LLM cache configured by the LLM_CACHE setting.
+
+    Defaults to the Django cache backend; returns None when the cache is
+    disabled.
+    """
+    global _default_cache, _default_cache_built
+    if not _default_cache_built:
+        from django.conf import settings
+        config = getattr(settings, 'LLM_CACHE', {})
+        backend_name = config.get('BACKEND', 'django')
+        _default_cache_built = True
+
+        if backend_name in (None, '', 'none'):
+            logger.info("LLM response cache disabled")
+            return None
+        if backend_name == 'django':
+            backend = DjangoCacheBackend(config.get('CACHE_ALIAS', 'default'))
+        elif backend_name == 'sqlite':
+            backend = SQLiteCacheBackend(
+                config.get('PATH', 'llm_cache.sqlite3'),
+                max_entries=config.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+            )
+        else:
+            logger.error(f"Unknown LLM_CACHE backend '{backend_name}'; LLM response cache disabled")
+            return None
+
+        _default_cache = LLMResponseCache(
+            backend,
+            ttl=config.get('TTL', DEFAULT_TTL),
+            max_temperature=config.get('MAX_TEMPERATURE', DEFAULT_MAX_TEMPERATURE)
+        )
+        logger.info(f"LLM response cache using the {backend_name} backend")
+    return _default_cache
@@ -0,0 +1,442 @@
+"""
+LLM Router for ShopAgent
+
+Spreads conversational calls over several chat model backends instead of the
+single Groq or OpenAI model picked at startup. Every call gets a deadline; if
+the first backend has not answered (or, when streaming, sent its first token)
+by its p95 latency, the same request is hedged to the next backend and the
+first answer wins. Failed or timed-out calls fail over to the next backend,
+and a backend that keeps failing is skipped by a circuit breaker until it has
+had time to recover.
+
+Each backend tracks an EWMA of its latency and error rate for the metrics
+endpoint. The router is itself a LangChain chat model, so it drops into
+LLMChain and anything else that takes an LLM; any LangChain chat model can be
+a backend. FakeChatModel is a local backend for tests.
+
+Configured through the LLM_ROUTER setting:
+
+    LLM_ROUTER = {
+        'BACKENDS': [
+            {'NAME': 'groq', 'PROVIDER': 'groq', 'MODEL': 'llama3-8b-8192', 'TIMEOUT': 20},
+            {'NAME': 'openai', 'PROVIDER': 'openai', 'MODEL': 'gpt-3.5-turbo-0125', 'TIMEOUT': 30},
+        ],
+        'TEMPERATURE': 0.2,
+        'MAX_TOKENS': 1024,
+        'HEDGE': True,
+        'HEDGE_DEFAULT_DELAY': 2.0,  # Used until a backend has enough latency samples
+        'HEDGE_MIN_DELAY': 0.3,
+        'HEDGE_MAX_DELAY': 5.0,
+        'FAILURE_THRESHOLD': 3,      # Consecutive failures that open a backend's circuit
+        'RESET_SECONDS': 30,         # How long an open circuit stays open
+        'EWMA_ALPHA': 0.2,
+    }
+"""
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_HEDGE_DELAY = 2.0
+DEFAULT_HEDGE_MIN_DELAY = 0.3
+DEFAULT_HEDGE_MAX_DELAY = 5.0
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_SECONDS = 30.0
+DEFAULT_EWMA_ALPHA = 0.2
+
+# Latency samples kept per backend and call kind for the p95
+LATENCY_WINDOW = 200
+# Samples needed before the p95 replaces the default hedge delay
+MIN_LATENCY_SAMPLES = 20
+
+# Latencies are tracked separately for whole answers and for the first streamed token
+INVOKE = 'invoke'
+FIRST_TOKEN = 'first_token'
+
+
+class LLMUnavailableError(Exception):
+    """Every backend failed or timed out"""
+
+
+class LLMBackend:
+    """One chat model with its deadline, circuit breaker and health statistics"""
+
+    def __init__(self, name: str, model: BaseChatModel, timeout: float = DEFAULT_TIMEOUT,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_seconds: float = DEFAULT_RESET_SECONDS,
+                 ewma_alpha: float = DEFAULT_EWMA_ALPHA):
+        """
+        Args:
+            name: Name used in logs and metrics
+            model: Any LangChain chat model
+            timeout: Seconds a call may take (for streams, until the first token)
+            failure_threshold: Consecutive failures that open the circuit
+            reset_seconds: Seconds the circuit stays open before a trial call
+            ewma_alpha: Weight of the newest sample in the latency and error EWMAs
+        """
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.ewma_alpha = ewma_alpha
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._latencies: Dict[str, Deque[float]] = {
+            INVOKE: deque(maxlen=LATENCY_WINDOW), FIRST_TOKEN: deque(maxlen=LATENCY_WINDOW)
+        }
+        self._counters = {'calls': 0, 'failures': 0, 'timeouts': 0, 'hedged_wins': 0, 'cancelled': 0}
+        self._lock = threading.Lock()
+
+    def available(self, now: float) -> bool:
+        """Closed circuits are available, and open ones once reset_seconds have passed"""
+        return self.opened_at is None or now - self.opened_at >= self.reset_seconds
+
+    def p95(self, kind: str) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies[kind])
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+
+    def record_success(self, kind: str, latency: float) -> None:
+        with self._lock:
+            self._counters['calls'] += 1
+            self._latencies[kind].append(latency)
+            if kind == INVOKE or self.latency_ewma is None:
+                self.latency_ewma = latency if self.latency_ewma is None else (
+                    self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.latency_ewma
+                )
+            self.error_rate *= 1 - self.ewma_alpha
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self, timed_out: bool = False) -> None:
+        with self._lock:
+            self._counters['calls'] += 1
+            self._counters['timeouts' if timed_out else 'failures'] += 1
+            self.error_rate = self.ewma_alpha + (1 - self.ewma_alpha) * self.error_rate
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"LLM backend {self.name} failed {self.consecutive_failures} times; opening circuit")
+                self.opened_at = time.monotonic()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['latency_ewma'] = round(self.latency_ewma, 3) if self.latency_ewma is not None else None
+            stats['error_rate'] = round(self.error_rate, 3)
+            stats['circuit'] = 'closed' if self.opened_at is None else 'open'
+        for kind in (INVOKE, FIRST_TOKEN):
+            p95 = self.p95(kind)
+            stats[f'{kind}_p95'] = round(p95, 3) if p95 is not None else None
+        return stats
+
+
+class LLMRouter(BaseChatModel):
+    """Chat model that routes each call over a pool of backends with hedging and failover"""
+
+    model_name: str = 'llm-router'
+    temperature: Optional[float] = None
+    hedge: bool = True
+    hedge_default_delay: float = DEFAULT_HEDGE_DELAY
+    hedge_min_delay: float = DEFAULT_HEDGE_MIN_DELAY
+    hedge_max_delay: float = DEFAULT_HEDGE_MAX_DELAY
+
+    _backends: List[LLMBackend] = PrivateAttr(default_factory=list)
+    _hedges: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, backends: List[LLMBackend], **kwargs):
+        """
+        Args:
+            backends: Backends in order of preference
+            **kwargs: model_name, temperature and the hedge_* fields
+        """
+        super().__init__(**kwargs)
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self._backends = list(backends)
+
+    @property
+    def _llm_type(self) -> str:
+        return 'llm-router'
+
+    @property
+    def backends(self) -> List[LLMBackend]:
+        return list(self._backends)
+
+    def _candidates(self) -> List[LLMBackend]:
+        """Backends to try, in order; if every circuit is open, try them all anyway"""
+        now = time.monotonic()
+        candidates = [backend for backend in self._backends if backend.available(now)]
+        if not candidates:
+            logger.warning("Every LLM backend circuit is open; trying all backends")
+            candidates = list(self._backends)
+        return candidates
+
+    def _hedge_delay(self, backend: LLMBackend, kind: str) -> float:
+        p95 = backend.p95(kind)
+        delay = self.hedge_default_delay if p95 is None else p95
+        return min(max(delay, self.hedge_min_delay), self.hedge_max_delay, backend.timeout)
+
+    async def _race(self, kind: str, start: Callable[[LLMBackend], Awaitable[Any]]) -> Tuple[LLMBackend, Any]:
+        """
+        Run start(backend) on the first candidate, hedging to the next one after the
+        first's p95 latency and failing over when a call fails or times out.
+
+        Returns:
+            (backend, result) of the first call to succeed
+        """
+        candidates = self._candidates()
+        pending: Dict[asyncio.Task, Tuple[LLMBackend, float, bool]] = {}
+        errors = []
+        next_index = 0
+
+        def launch(hedged: bool) -> LLMBackend:
+            nonlocal next_index
+            backend = candidates[next_index]
+            next_index += 1
+            task = asyncio.create_task(asyncio.wait_for(start(backend), backend.timeout))
+            pending[task] = (backend, time.monotonic(), hedged)
+            return backend
+
+        current = launch(hedged=False)
+        hedged_once = False
+        try:
+            while pending:
+                can_hedge = self.hedge and not hedged_once and next_index < len(candidates)
+                timeout = self._hedge_delay(current, kind) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedged_once = True
+                    with self._lock:
+                        self._hedges += 1
+                    slow = current
+                    current = launch(hedged=True)
+                    logger.info(f"LLM backend {slow.name} is slow; hedging to {current.name}")
+                    continue
+
+                for task in done:
+                    backend, started, hedged = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        timed_out = isinstance(e, asyncio.TimeoutError)
+                        backend.record_failure(timed_out=timed_out)
+                        errors.append(f"{backend.name}: {'timed out' if timed_out else str(e)}")
+                        logger.warning(f"LLM backend {backend.name} failed: {errors[-1]}")
+                        continue
+                    backend.record_success(kind, time.monotonic() - started)
+                    if hedged:
+                        backend.count('hedged_wins')
+                    return backend, result
+
+                if not pending and next_index < len(candidates):
+                    current = launch(hedged=False)
+                    logger.info(f"Failing over to LLM backend {current.name}")
+        finally:
+            for task, (backend, _, _) in pending.items():
+                task.cancel()
+                backend.count('cancelled')
+
+        raise LLMUnavailableError("All LLM backends failed: " + "; ".join(errors))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        async def start(backend: LLMBackend):
+            return await backend.model.ainvoke(messages, stop=stop, **kwargs)
+
+        backend, message = await self._race(INVOKE, start)
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={'backend': backend.name})
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async def start(backend: LLMBackend):
+            stream = backend.model.astream(messages, stop=stop, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+
+        backend, (stream, first) = await self._race(FIRST_TOKEN, start)
+        if first is None:
+            return
+        # Once tokens have been sent the call cannot move to another backend
+        yield self._chunk(first)
+        if run_manager:
+            await run_manager.on_llm_new_token(first.content)
+        async for chunk in stream:
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content)
+            yield self._chunk(chunk)
+
+    @staticmethod
+    def _chunk(chunk: BaseMessage) -> ChatGenerationChunk:
+        if not isinstance(chunk, AIMessageChunk):
+            chunk = AIMessageChunk(content=chunk.content)
+        return ChatGenerationChunk(message=chunk)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        """Blocking calls fail over in order, without hedging, under each model's own request timeout"""
+        errors = []
+        for backend in self._candidates():
+            started = time.monotonic()
+            try:
+                message = backend.model.invoke(messages, stop=stop, **kwargs)
+            except Exception as e:
+                backend.record_failure()
+                errors.append(f"{backend.name}: {str(e)}")
+                logger.warning(f"LLM backend {backend.name} failed: {errors[-1]}")
+                continue
+            backend.record_success(INVOKE, time.monotonic() - started)
+            return ChatResult(generations=[ChatGeneration(message=message)], llm_output={'backend': backend.name})
+        raise LLMUnavailableError("All LLM backends failed: " + "; ".join(errors))
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-backend health and the number of hedged calls"""
+        with self._lock:
+            hedges = self._hedges
+        return {
+            'hedged_calls': hedges,
+            'backends': {backend.name: backend.stats() for backend in self._backends}
+        }
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local chat model for tests and benchmarks: canned answers after a delay, or an error.
+
+    Answers come from `script` when one of its keys appears in the prompt (the
+    key found furthest into the prompt wins, so the current query beats the
+    history before it), otherwise from `responses` in turn.
+    """
+
+    responses: List[str] = ['This is a test response.']
+    script: Dict[str, str] = {}
+    latency: float = 0.0
+    error: Optional[str] = None
+    model_name: str = 'fake'
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake'
+
+    def _next_response(self, messages) -> str:
+        self.calls += 1
+        if self.script:
+            prompt = '\n'.join(str(message.content) for message in messages)
+            position, response = max((prompt.rfind(key), answer) for key, answer in self.script.items())
+            if position >= 0:
+                return response
+        return self.responses[(self.calls - 1) % len(self.responses)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        if self.error:
+            raise RuntimeError(self.error)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._next_response(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        if self.error:
+            raise RuntimeError(self.error)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._next_response(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        if self.error:
+            raise RuntimeError(self.error)
+        words = self._next_response(messages).split(' ')
+        for i, word in enumerate(words):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else ' ' + word))
+
+
+def _build_model(backend: Dict[str, Any], temperature: float, max_tokens: int) -> Optional[BaseChatModel]:
+    """Create the chat model for one LLM_ROUTER backend, or None when its API key is missing"""
+    provider = backend.get('PROVIDER', backend.get('NAME'))
+    timeout = backend.get('TIMEOUT', DEFAULT_TIMEOUT)
+
+    if provider == 'groq':
+        api_key = os.environ.get(backend.get('API_KEY_ENV', 'GROQ_API_KEY'))
+        if not api_key:
+            return None
+        from langchain_groq import ChatGroq
+        return ChatGroq(api_key=api_key, model_name=backend.get('MODEL', 'llama3-8b-8192'),
+                        temperature=temperature, max_tokens=max_tokens, request_timeout=timeout, max_retries=0)
+    if provider == 'openai':
+        api_key = os.environ.get(backend.get('API_KEY_ENV', 'OPENAI_API_KEY'))
+        if not api_key:
+            return None
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(api_key=api_key, model_name=backend.get('MODEL', 'gpt-3.5-turbo-0125'),
+                          temperature=temperature, max_tokens=max_tokens, request_timeout=timeout, max_retries=0)
+    if provider == 'fake':
+        return FakeChatModel(latency=backend.get('LATENCY', 0.0))
+    raise ValueError(f"Unknown LLM provider '{provider}'")
+
+
+def build_llm_router(config: Optional[Dict[str, Any]] = None) -> Optional[LLMRouter]:
+    """
+    Build a router from the LLM_ROUTER setting.
+
+    Backends without an API key are skipped. Returns None when no backend is
+    usable, so callers can run without an LLM as before.
+    """
+    if config is None:
+        from django.conf import settings
+        config = getattr(settings, 'LLM_ROUTER', {})
+
+    temperature = config.get('TEMPERATURE', 0.2)
+    max_tokens = config.get('MAX_TOKENS', 1024)
+    backends = []
+    for backend_config in config.get('BACKENDS', []):
+        name = backend_config.get('NAME', backend_config.get('PROVIDER'))
+        try:
+            model = _build_model(backend_config, temperature, max_tokens)
+        except Exception as e:
+            logger.error(f"Failed to create LLM backend {name}: {str(e)}", exc_info=True)
+            continue
+        if model is None:
+            logger.info(f"Skipping LLM backend {name}: no API key")
+            continue
+        backends.append(LLMBackend(
+            name, model,
+            timeout=backend_config.get('TIMEOUT', DEFAULT_TIMEOUT),
+            failure_threshold=config.get('FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD),
+            reset_seconds=config.get('RESET_SECONDS', DEFAULT_RESET_SECONDS),
+            ewma_alpha=config.get('EWMA_ALPHA', DEFAULT_EWMA_ALPHA)
+        ))
+
+    if not backends:
+        return None
+    logger.info(f"LLM router using backends: {', '.join(backend.name for backend in backends)}")
+    return LLMRouter(
+        backends,
+        temperature=temperature,
+        hedge=config.get('HEDGE', True),
+        hedge_default_delay=config.get('HEDGE_DEFAULT_DELAY', DEFAULT_HEDGE_DELAY),
+        hedge_min_delay=config.get('HEDGE_MIN_DELAY', DEFAULT_HEDGE_MIN_DELAY),
+        hedge_max_delay=config.get('HEDGE_MAX_DELAY', DEFAULT_HEDGE_MAX_DELAY)
+    )
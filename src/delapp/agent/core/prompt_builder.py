@@ -0,0 +1,302 @@
+"""
+Prompt Builder for ShopAgent
+
+Fits everything the conversational chain sends to the LLM into a token
+budget. The fixed part of the prompt (system prompt, tool descriptions and the
+user's query) is always kept; what is left of the budget goes, in order, to
+the products shown so far, the running summary of older turns, and as many of
+the most recent turns as fit, newest first.
+
+Tokens are counted with tiktoken. The running summary is stored on
+ConversationState and refreshed by the LLM only every few turns, so most
+requests pay nothing for it.
+
+Configured through the AGENT_PROMPT setting:
+
+    AGENT_PROMPT = {
+        'MAX_TOKENS': 7000,       # Context window available to the prompt and the answer
+        'RESPONSE_TOKENS': 1024,  # Reserved for the answer
+        'PRODUCT_TOKENS': 1000,   # Cap for the product context
+        'SUMMARY_TOKENS': 300,    # Cap for the running summary
+        'SUMMARY_EVERY': 4,       # Turns between summary refreshes
+        'ENCODING': 'cl100k_base',
+    }
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from asgiref.sync import sync_to_async
+
+from ...models import ConversationMessage, ConversationState
+from ..tools.product_cards import format_price
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TOKENS = 7000
+DEFAULT_RESPONSE_TOKENS = 1024
+DEFAULT_PRODUCT_TOKENS = 1000
+DEFAULT_SUMMARY_TOKENS = 300
+DEFAULT_SUMMARY_EVERY = 4
+DEFAULT_KEEP_MESSAGES = 20
+DEFAULT_ENCODING = 'cl100k_base'
+
+# Used when the tiktoken encoding cannot be loaded; English averages about four characters a token
+CHARS_PER_TOKEN = 4
+
+ROLE_LABELS = {'user': 'Human', 'assistant': 'Assistant'}
+
+SUMMARY_PROMPT = """Summarize this shopping conversation for the assistant's own reference.
+Keep what the user wants (products, budget, preferences, constraints) and which products were discussed.
+Write at most {max_words} words of plain prose.
+
+Summary so far:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+
+class TokenCounter:
+    """Count and truncate text in tokens of a tiktoken encoding"""
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        # The fixed prompt template is recounted on every request otherwise
+        self.count_cached = lru_cache(maxsize=32)(self.count)
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            self._loaded = True
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.warning(f"Could not load tiktoken encoding {self.encoding_name}, estimating tokens: {str(e)}")
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text down to at most max_tokens"""
+        if max_tokens <= 0:
+            return ''
+        if self.encoding is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+
+@dataclass
+class BuiltPrompt:
+    """The chat_history text for the prompt and what went into it"""
+    chat_history: str
+    tokens: int
+    budget: int
+    messages: int
+    dropped_messages: int
+    products: int
+
+
+def format_product(index: int, product: Dict[str, Any]) -> str:
+    """One line of product context"""
+    line = f"{index}. {product.get('name') or product.get('title') or 'Untitled product'}"
+    price = product.get('currentPrice', product.get('price'))
+    if price:
+        line += f" - {format_price(price)}"
+    retailer = product.get('retailer') or product.get('source')
+    if retailer:
+        line += f" ({retailer})"
+    return line
+
+
+def format_messages(messages: Sequence[Tuple[str, str]]) -> str:
+    return "\n".join(f"{ROLE_LABELS.get(role, role.title())}: {content}" for role, content in messages)
+
+
+class PromptBuilder:
+    """Assemble the conversational context within a token budget"""
+
+    def __init__(self, counter: Optional[TokenCounter] = None,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 response_tokens: int = DEFAULT_RESPONSE_TOKENS,
+                 product_tokens: int = DEFAULT_PRODUCT_TOKENS,
+                 summary_tokens: int = DEFAULT_SUMMARY_TOKENS):
+        """
+        Args:
+            counter: Token counter, tiktoken's cl100k_base by default
+            max_tokens: Context window shared by the prompt and the answer
+            response_tokens: Tokens reserved for the answer
+            product_tokens: Most tokens the product context may use
+            summary_tokens: Most tokens the running summary may use
+        """
+        self.counter = counter or TokenCounter()
+        self.max_tokens = max_tokens
+        self.response_tokens = response_tokens
+        self.product_tokens = product_tokens
+        self.summary_tokens = summary_tokens
+
+    @classmethod
+    def from_settings(cls) -> 'PromptBuilder':
+        """Build a prompt builder from the AGENT_PROMPT setting"""
+        from django.conf import settings
+        config = getattr(settings, 'AGENT_PROMPT', {})
+        return cls(
+            counter=TokenCounter(config.get('ENCODING', DEFAULT_ENCODING)),
+            max_tokens=config.get('MAX_TOKENS', DEFAULT_MAX_TOKENS),
+            response_tokens=config.get('RESPONSE_TOKENS', DEFAULT_RESPONSE_TOKENS),
+            product_tokens=config.get('PRODUCT_TOKENS', DEFAULT_PRODUCT_TOKENS),
+            summary_tokens=config.get('SUMMARY_TOKENS', DEFAULT_SUMMARY_TOKENS)
+        )
+
+    def build(self, prompt, query: str, history: Sequence[Tuple[str, str]] = (),
+              summary: str = '', products: Sequence[Dict[str, Any]] = ()) -> BuiltPrompt:
+        """
+        Build the chat_history for a prompt template.
+
+        Args:
+            prompt: PromptTemplate with input, chat_history and agent_scratchpad variables
+            query: The user's message
+            history: Recent (role, content) messages, oldest first
+            summary: Running summary of older messages
+            products: Products shown so far in the conversation
+
+        Returns:
+            BuiltPrompt whose chat_history fills the template's chat_history slot
+        """
+        fixed = self.counter.count_cached(prompt.format(input='', chat_history='', agent_scratchpad=''))
+        fixed += self.counter.count(query)
+        budget = self.max_tokens - self.response_tokens - fixed
+        remaining = budget
+        sections = []
+
+        product_lines = []
+        product_budget = min(self.product_tokens, remaining)
+        for index, product in enumerate(products, 1):
+            line = format_product(index, product)
+            cost = self.counter.count(line) + 1
+            if cost > product_budget:
+                break
+            product_lines.append(line)
+            product_budget -= cost
+        if product_lines:
+            section = "Products shown so far:\n" + "\n".join(product_lines)
+            sections.append(section)
+            remaining -= self.counter.count(section) + 1
+
+        if summary and remaining > 0:
+            section = "Summary of the earlier conversation: " + self.counter.truncate(
+                summary, min(self.summary_tokens, remaining)
+            )
+            sections.append(section)
+            remaining -= self.counter.count(section) + 1
+
+        kept = []
+        for role, content in reversed(history):
+            line = f"{ROLE_LABELS.get(role, role.title())}: {content}"
+            cost = self.counter.count(line) + 1
+            if cost > remaining:
+                break
+            kept.append(line)
+            remaining -= cost
+        if kept:
+            sections.append("\n".join(reversed(kept)))
+
+        return BuiltPrompt(
+            chat_history="\n\n".join(sections),
+            tokens=self.max_tokens - self.response_tokens - remaining,
+            budget=self.max_tokens - self.response_tokens,
+            messages=len(kept),
+            dropped_messages=len(history) - len(kept),
+            products=len(product_lines)
+        )
+
+
+class ConversationSummarizer:
+    """Fold messages older than the recent window into ConversationState.history_summary"""
+
+    def __init__(self, counter: Optional[TokenCounter] = None,
+                 every: int = DEFAULT_SUMMARY_EVERY,
+                 keep_messages: int = DEFAULT_KEEP_MESSAGES,
+                 summary_tokens: int = DEFAULT_SUMMARY_TOKENS):
+        """
+        Args:
+            counter: Token counter used to bound the summary
+            every: Turns (a user message and its reply) between refreshes
+            keep_messages: Most recent messages that stay out of the summary
+            summary_tokens: Most tokens a summary may use
+        """
+        self.counter = counter or TokenCounter()
+        self.every = every
+        self.keep_messages = keep_messages
+        self.summary_tokens = summary_tokens
+
+    @classmethod
+    def from_settings(cls, counter: Optional[TokenCounter] = None,
+                      keep_messages: int = DEFAULT_KEEP_MESSAGES) -> 'ConversationSummarizer':
+        """Build a summarizer from the AGENT_PROMPT setting, leaving the chat window's messages out"""
+        from django.conf import settings
+        config = getattr(settings, 'AGENT_PROMPT', {})
+        return cls(
+            counter=counter or TokenCounter(config.get('ENCODING', DEFAULT_ENCODING)),
+            every=config.get('SUMMARY_EVERY', DEFAULT_SUMMARY_EVERY),
+            keep_messages=keep_messages,
+            summary_tokens=config.get('SUMMARY_TOKENS', DEFAULT_SUMMARY_TOKENS)
+        )
+
+    @sync_to_async
+    def _pending_messages(self, conversation_id: int) -> Tuple[str, List[Tuple[int, str, str]]]:
+        """The current summary and the unsummarized messages older than the recent window"""
+        state = ConversationState.objects.filter(conversation_id=conversation_id).values(
+            'history_summary', 'summary_message_id'
+        ).first()
+        if state is None:
+            return '', []
+        messages = list(ConversationMessage.objects.filter(
+            conversation_id=conversation_id, id__gt=state['summary_message_id']
+        ).order_by('id').values_list('id', 'role', 'content'))
+        return state['history_summary'], messages[:max(len(messages) - self.keep_messages, 0)]
+
+    @sync_to_async
+    def _save_summary(self, conversation_id: int, summary: str, message_id: int) -> None:
+        ConversationState.objects.filter(conversation_id=conversation_id).update(
+            history_summary=summary, summary_message_id=message_id
+        )
+
+    async def refresh(self, conversation_id: int, llm) -> bool:
+        """
+        Refresh the summary once enough turns have left the recent window.
+
+        Returns:
+            True when a new summary was stored
+        """
+        summary, pending = await self._pending_messages(conversation_id)
+        if len(pending) < self.every * 2:
+            return False
+
+        messages = format_messages([(role, content) for _, role, content in pending])
+        prompt = SUMMARY_PROMPT.format(
+            max_words=int(self.summary_tokens * 0.75),
+            summary=summary or "(none yet)",
+            messages=self.counter.truncate(messages, self.summary_tokens * 8)
+        )
+        result = await llm.ainvoke(prompt)
+        new_summary = self.counter.truncate(
+            str(getattr(result, 'content', result)).strip(), self.summary_tokens
+        )
+        await self._save_summary(conversation_id, new_summary, pending[-1][0])
+        logger.info(f"Summarized {len(pending)} older messages of conversation {conversation_id}")
+        return True
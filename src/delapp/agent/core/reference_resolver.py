@@ -0,0 +1,282 @@
+"""
+Reference Resolver for ShopAgent
+
+Resolves follow-ups such as "tell me about the second one", "add the last one
+to my cart" or "the cheaper black one" to a single product among the ones
+already shown in the conversation (ConversationState.current_products), so
+they can be answered without another product search.
+
+The products of a turn are indexed once by ordinal, price rank, retailer and
+title tokens (which carry color and brand). A query only resolves when it
+actually points at one product: it must contain an ordinal used as a
+reference ("the second one", "first product", "#2"), a price superlative, or
+a singular reference word ("one", "it", "that") together with attributes that
+leave exactly one candidate. Whatever else the query says must be words the
+products themselves carry or common follow-up words, and a price constraint
+such as "under 200" always starts a new search, so "the last generation iPad"
+or "a cheaper one under 200" are not taken for references. Resolution is a
+handful of regex and set operations and takes well under a millisecond.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+ORDINALS = {
+    'first': 1, '1st': 1, 'second': 2, '2nd': 2, 'third': 3, '3rd': 3, 'fourth': 4, '4th': 4,
+    'fifth': 5, '5th': 5, 'sixth': 6, '6th': 6, 'seventh': 7, '7th': 7, 'eighth': 8, '8th': 8,
+    'ninth': 9, '9th': 9, 'tenth': 10, '10th': 10, 'last': -1, 'final': -1,
+}
+
+COLORS = frozenset({
+    'black', 'white', 'gray', 'grey', 'silver', 'gold', 'red', 'blue', 'navy', 'green', 'yellow',
+    'orange', 'pink', 'purple', 'brown', 'beige', 'tan', 'rose', 'graphite', 'titanium', 'midnight',
+})
+
+# Nouns that make an ordinal point at a listed product: "the second one", "first product"
+REFERENCE_NOUNS = frozenset({'one', 'product', 'item', 'option', 'result', 'listing', 'deal', 'choice'})
+
+# An ordinal word counts only when a reference noun follows it, past at most two
+# attributes ("the second black one"), or when it ends the sentence ("the last")
+_ORDINAL_RE = re.compile(
+    r'\b(' + '|'.join(sorted(ORDINALS, key=len, reverse=True)) + r')\b'
+    r'(?=(?:\s+[a-z0-9-]+){0,2}?\s+(?:' + '|'.join(sorted(REFERENCE_NOUNS)) + r')\b|\s*(?:[.,!?]|$)|\s+please\b)'
+    r'|(?:#|\bnumber\s+|\bno\.?\s*|\boption\s+|\bitem\s+|\bproduct\s+)(\d{1,2})\b'
+)
+_CHEAPEST_RE = re.compile(
+    r'\b(?:cheap(?:er|est)|lowest[- ]priced?|least expensive|less expensive|most affordable|more affordable|lowest price)\b'
+)
+_PRICIEST_RE = re.compile(
+    r'\b(?:pric(?:ier|iest)|most expensive|more expensive|highest[- ]priced?|highest price|premium)\b'
+)
+# Words that point at a single product already on screen
+_SINGULAR_RE = re.compile(r'\b(?:one|it|that|this)\b')
+# Plural references mean the user wants several products, which is a new search
+_PLURAL_RE = re.compile(r'\b(?:ones|those|these|them|others)\b')
+# A price limit asks for other products than the ones shown
+_CONSTRAINT_RE = re.compile(
+    r'\b(?:under|below|over|above|less than|more than|cheaper than|up to|within|between|max(?:imum)?)\s+\$?\d'
+)
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'+-]*")
+_PRICE_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+# Common words that should never count as a brand or retailer match
+STOPWORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'for', 'with', 'of', 'in', 'on', 'to', 'me', 'my', 'about', 'more',
+    'tell', 'show', 'add', 'cart', 'one', 'it', 'that', 'this', 'is', 'what', 'which', 'how', 'much',
+    'details', 'detail', 'info', 'buy', 'get', 'want', 'like', 'please', 'from', 'at', 'new', 'pack',
+})
+
+# Words a follow-up about a shown product may use besides the products' own words
+FOLLOW_UP_WORDS = frozenset({
+    'does', 'do', 'have', 'has', 'can', 'could', 'you', 'are', 'was', 'compare', 'specs', 'review',
+    'reviews', 'rating', 'ratings', 'warranty', 'shipping', 'ship', 'available', 'availability', 'stock',
+    'size', 'sizes', 'color', 'colors', 'cost', 'costs', 'good', 'worth', 'remove', 'delete', 'save',
+    'describe', 'explain', 'know', 'link', 'see', 'look',
+})
+
+# Words of the price superlatives, ignored when checking what else a query names
+PRICE_WORDS = frozenset({
+    'cheap', 'cheaper', 'cheapest', 'lowest', 'highest', 'priced', 'price', 'least', 'less', 'most',
+    'expensive', 'affordable', 'pricier', 'priciest', 'premium', 'lowest-priced', 'highest-priced',
+    'about', 'which', 'what', 'give', 'i', "i'll", 'take', 'go', 'option', 'one', 'is', 'the',
+})
+
+
+def parse_price(price: Any) -> Optional[float]:
+    """Read a numeric price from a number or a string like '$1,299.99'"""
+    if isinstance(price, (int, float)):
+        return float(price)
+    if isinstance(price, str):
+        match = _PRICE_RE.search(price)
+        if match:
+            return float(match.group().replace(',', ''))
+    return None
+
+
+def _tokens(text: str) -> Set[str]:
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+def _title(product: Dict[str, Any]) -> str:
+    # Product cards sent to the frontend carry 'name' and 'currentPrice' instead
+    return product.get('title') or product.get('name') or ''
+
+
+def _price(product: Dict[str, Any]) -> Any:
+    price = product.get('price')
+    return price if price is not None else product.get('currentPrice')
+
+
+@dataclass
+class ResolvedReference:
+    """The product a follow-up points at"""
+    product: Dict[str, Any]
+    index: int
+    reason: str
+
+
+class ProductIndex:
+    """Lookup tables over one turn's products"""
+
+    def __init__(self, products: Sequence[Dict[str, Any]]):
+        self.products = list(products)
+        self.prices: List[Optional[float]] = [parse_price(_price(product)) for product in self.products]
+        self.title_tokens: List[FrozenSet[str]] = []
+        self.retailers: Dict[str, Set[int]] = {}
+        self.brands: Dict[str, Set[int]] = {}
+        self.retailer_pattern = None
+        # Every word the products carry, for telling references from new searches
+        self.vocabulary: Set[str] = set()
+
+        for i, product in enumerate(self.products):
+            title_tokens = frozenset(_tokens(_title(product)))
+            self.title_tokens.append(title_tokens)
+            retailer = ' '.join(_TOKEN_RE.findall((product.get('retailer') or product.get('source')
+                                                   or product.get('seller') or '').lower()))
+            if retailer and retailer != 'unknown':
+                self.retailers.setdefault(retailer, set()).add(i)
+                self.vocabulary.update(retailer.split())
+            self.vocabulary.update(title_tokens)
+            brand = product.get('brand') or _title(product).split(' ', 1)[0]
+            for token in _tokens(brand) - STOPWORDS:
+                self.brands.setdefault(token, set()).add(i)
+
+        # Retailer names can be several words ("best buy"), so they are matched as phrases
+        if self.retailers:
+            self.retailer_pattern = re.compile(
+                r'\b(' + '|'.join(re.escape(name) for name in sorted(self.retailers, key=len, reverse=True)) + r')\b'
+            )
+
+    def filter(self, text: str, query_tokens: Set[str]) -> Tuple[Optional[Set[int]], List[str]]:
+        """
+        Narrow the products by the colors, retailers and brands named in the lowercased query.
+
+        Returns:
+            (indices, attributes) where indices is None when the query names no attribute
+        """
+        candidates = None
+        attributes = []
+
+        colors = query_tokens & COLORS
+        if colors:
+            matches = {i for i, tokens in enumerate(self.title_tokens) if colors <= tokens}
+            candidates = matches
+            attributes.extend(sorted(colors))
+
+        retailers = set(self.retailer_pattern.findall(text)) if self.retailer_pattern else set()
+        if retailers:
+            matches = set.intersection(*(self.retailers[name] for name in retailers))
+            candidates = matches if candidates is None else candidates & matches
+            attributes.extend(sorted(retailers))
+
+        retailer_tokens = {token for name in retailers for token in name.split()}
+        brands = sorted(token for token in query_tokens - STOPWORDS - COLORS - retailer_tokens if token in self.brands)
+        if brands:
+            matches = set.intersection(*(self.brands[token] for token in brands))
+            candidates = matches if candidates is None else candidates & matches
+            attributes.extend(brands)
+
+        return candidates, attributes
+
+
+class ReferenceResolver:
+    """Resolve follow-up references to one of the conversation's current products"""
+
+    def __init__(self, max_cached: int = 256):
+        self._indexes: Dict[Tuple, ProductIndex] = {}
+        self.max_cached = max_cached
+
+    def _index(self, products: Sequence[Dict[str, Any]]) -> ProductIndex:
+        key = tuple((product.get('id'), _title(product), str(_price(product))) for product in products)
+        index = self._indexes.get(key)
+        if index is None:
+            if len(self._indexes) >= self.max_cached:
+                self._indexes.clear()
+            index = self._indexes[key] = ProductIndex(products)
+        return index
+
+    def resolve(self, query: str, products: Sequence[Dict[str, Any]]) -> Optional[ResolvedReference]:
+        """
+        Find the single product a query refers to.
+
+        Args:
+            query: The user's message
+            products: Products shown so far, in display order
+
+        Returns:
+            ResolvedReference, or None when the query does not point at exactly one product
+        """
+        if not products or not query:
+            return None
+        text = query.lower()
+        if _PLURAL_RE.search(text):
+            return None
+
+        ordinal_match = _ORDINAL_RE.search(text)
+        cheapest = _CHEAPEST_RE.search(text) is not None
+        priciest = _PRICIEST_RE.search(text) is not None
+        singular = _SINGULAR_RE.search(text) is not None
+        if not (ordinal_match or cheapest or priciest or singular):
+            return None
+
+        if _CONSTRAINT_RE.search(text):
+            # "a cheaper one under 200" asks for products that may not have been shown
+            return None
+
+        index = self._index(products)
+        query_tokens = _tokens(text)
+        # "the cheapest laptop" or "the last generation ipad" after showing
+        # headphones is a new search, not a reference
+        other_words = query_tokens - STOPWORDS - PRICE_WORDS - FOLLOW_UP_WORDS - REFERENCE_NOUNS - ORDINALS.keys()
+        if ordinal_match and ordinal_match.group(2):
+            other_words.discard(ordinal_match.group(2))
+        if any(token not in index.vocabulary for token in other_words):
+            return None
+
+        candidates, attributes = index.filter(text, query_tokens)
+        ordered = sorted(candidates) if candidates is not None else list(range(len(index.products)))
+        if not ordered:
+            return None
+
+        if ordinal_match:
+            position = ORDINALS.get(ordinal_match.group(1)) if ordinal_match.group(1) else int(ordinal_match.group(2))
+            if position == -1:
+                chosen = ordered[-1]
+            elif 1 <= position <= len(ordered):
+                chosen = ordered[position - 1]
+            else:
+                return None
+            reason = f"ordinal {ordinal_match.group().strip()}"
+        elif cheapest or priciest:
+            priced = [i for i in ordered if index.prices[i] is not None]
+            if not priced:
+                return None
+            pick = min if cheapest else max
+            chosen = pick(priced, key=lambda i: index.prices[i])
+            reason = 'cheapest' if cheapest else 'most expensive'
+        elif candidates is not None and len(ordered) == 1:
+            chosen = ordered[0]
+            reason = 'only match'
+        elif len(index.products) == 1:
+            chosen = 0
+            reason = 'only product'
+        else:
+            return None
+
+        if attributes:
+            reason += f" ({', '.join(attributes)})"
+        return ResolvedReference(product=index.products[chosen], index=chosen, reason=reason)
+
+
+_default_resolver = None
+
+
+def get_reference_resolver() -> ReferenceResolver:
+    """Get the process-wide reference resolver"""
+    global _default_resolver
+    if _default_resolver is None:
+        _default_resolver = ReferenceResolver()
+    return _default_resolver
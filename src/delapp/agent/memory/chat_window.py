@@ -0,0 +1,200 @@
+"""
+Chat Window Store for ShopAgent
+
+Keeps a short, bounded window of recent messages per conversation so the LLM
+sees real history without the agent holding every conversation it has ever
+served. The store is shared by all requests in a process and is bounded three
+ways: messages per conversation, total conversations (least recently used are
+evicted first, idle ones expire) and a total byte budget.
+
+Windows are hydrated lazily from ConversationMessage the first time a
+conversation is seen, so an evicted conversation simply reloads on its next
+turn. Every process keeps its own store, and another worker may have answered
+the last turn or the conversation may have been cleared since, so a window
+remembers the id of the newest message it holds and is reloaded when the
+conversation's newest message is a different one. That check is one query on
+the (conversation, created_at, id) index per turn.
+"""
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+from ...models import ConversationMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MESSAGES = 20
+DEFAULT_MAX_CONVERSATIONS = 1000
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_IDLE_SECONDS = 30 * 60
+# Longer messages are cut down before they enter a window
+MAX_MESSAGE_CHARS = 2000
+
+
+def _message_size(content: str) -> int:
+    return len(content.encode('utf-8'))
+
+
+class ChatWindow:
+    """The most recent messages of one conversation"""
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[Tuple[str, str]] = deque()
+        self.max_messages = max_messages
+        self.size = 0
+        self.last_used = time.monotonic()
+        # Newest saved message the window is known to hold
+        self.last_message_id: Optional[int] = None
+
+    def append(self, role: str, content: str) -> int:
+        """Add a message, dropping the oldest beyond max_messages. Returns the change in size."""
+        content = content[:MAX_MESSAGE_CHARS]
+        self.messages.append((role, content))
+        delta = _message_size(content)
+        while len(self.messages) > self.max_messages:
+            delta -= _message_size(self.messages.popleft()[1])
+        self.size += delta
+        return delta
+
+
+class ChatWindowStore:
+    """Process-wide LRU store of per-conversation chat windows"""
+
+    def __init__(self, max_messages: int = DEFAULT_MAX_MESSAGES,
+                 max_conversations: int = DEFAULT_MAX_CONVERSATIONS,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 idle_seconds: float = DEFAULT_IDLE_SECONDS):
+        """
+        Args:
+            max_messages: Messages kept per conversation
+            max_conversations: Conversations kept in memory at once
+            max_bytes: Budget for message text across all conversations
+            idle_seconds: Conversations untouched for this long are dropped
+        """
+        self.max_messages = max_messages
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._windows: 'OrderedDict[str, ChatWindow]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'hydrations': 0, 'evictions': 0, 'stale': 0}
+
+    @classmethod
+    def from_settings(cls) -> 'ChatWindowStore':
+        """Build a store from the AGENT_CHAT_MEMORY setting"""
+        from django.conf import settings
+        config = getattr(settings, 'AGENT_CHAT_MEMORY', {})
+        return cls(
+            max_messages=config.get('MAX_MESSAGES', DEFAULT_MAX_MESSAGES),
+            max_conversations=config.get('MAX_CONVERSATIONS', DEFAULT_MAX_CONVERSATIONS),
+            max_bytes=config.get('MAX_BYTES', DEFAULT_MAX_BYTES),
+            idle_seconds=config.get('IDLE_SECONDS', DEFAULT_IDLE_SECONDS)
+        )
+
+    def _evict(self, now: float) -> None:
+        """Drop idle windows, then least recently used ones until within bounds. Caller holds the lock."""
+        while self._windows:
+            conversation_id, window = next(iter(self._windows.items()))
+            over_budget = len(self._windows) > self.max_conversations or self._bytes > self.max_bytes
+            if not over_budget and now - window.last_used < self.idle_seconds:
+                break
+            del self._windows[conversation_id]
+            self._bytes -= window.size
+            self._counters['evictions'] += 1
+
+    @sync_to_async
+    def _load_recent_messages(self, conversation_id: str) -> List[Tuple[int, str, str]]:
+        rows = ConversationMessage.objects.filter(
+            conversation_id=conversation_id
+        ).order_by('-created_at', '-id').values_list('id', 'role', 'content')[:self.max_messages]
+        return list(reversed(rows))
+
+    @sync_to_async
+    def _latest_message_id(self, conversation_id: str) -> Optional[int]:
+        return ConversationMessage.objects.filter(
+            conversation_id=conversation_id
+        ).order_by('-created_at', '-id').values_list('id', flat=True).first()
+
+    def _drop(self, conversation_id: str) -> None:
+        """Remove a window. Caller holds the lock."""
+        window = self._windows.pop(conversation_id, None)
+        if window is not None:
+            self._bytes -= window.size
+
+    async def get_history(self, conversation_id: str) -> List[Tuple[str, str]]:
+        """
+        Get the window for a conversation, hydrating it from the database on a
+        miss or when the conversation changed since the window was filled.
+
+        Returns:
+            (role, content) pairs, oldest first
+        """
+        conversation_id = str(conversation_id)
+        with self._lock:
+            cached = conversation_id in self._windows
+
+        if cached:
+            latest_id = await self._latest_message_id(conversation_id)
+            now = time.monotonic()
+            with self._lock:
+                window = self._windows.get(conversation_id)
+                if window is not None and window.last_message_id == latest_id:
+                    window.last_used = now
+                    self._windows.move_to_end(conversation_id)
+                    self._counters['hits'] += 1
+                    return list(window.messages)
+                if window is not None:
+                    self._drop(conversation_id)
+                    self._counters['stale'] += 1
+
+        rows = await self._load_recent_messages(conversation_id)
+
+        now = time.monotonic()
+        with self._lock:
+            self._drop(conversation_id)
+            window = ChatWindow(self.max_messages)
+            for _, role, content in rows:
+                self._bytes += window.append(role, content)
+            window.last_message_id = rows[-1][0] if rows else None
+            self._windows[conversation_id] = window
+            self._counters['hydrations'] += 1
+            history = list(window.messages)
+            self._evict(now)
+        return history
+
+    def append(self, conversation_id: str, role: str, content: str, message_id: Optional[int] = None) -> None:
+        """
+        Record a new message in a conversation's window.
+
+        Messages for conversations that are not in memory are ignored; they are
+        persisted elsewhere and come back with the next hydration. message_id
+        is the saved message's id, so the next turn finds the window current.
+        """
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(str(conversation_id))
+            if window is None:
+                return
+            self._bytes += window.append(role, content or '')
+            if message_id is not None:
+                window.last_message_id = message_id
+            window.last_used = now
+            self._windows.move_to_end(str(conversation_id))
+            self._evict(now)
+
+    def discard(self, conversation_id: str) -> None:
+        """Forget a conversation, e.g. after its messages were cleared"""
+        with self._lock:
+            self._drop(str(conversation_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['conversations'] = len(self._windows)
+            stats['bytes'] = self._bytes
+        return stats
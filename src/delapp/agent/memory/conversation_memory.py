@@ -10,6 +10,7 @@ from asgiref.sync import sync_to_async
 import json
 
 from .base_memory import BaseMemory
+from ...tracing import traced
 from ...models import Conversation, ConversationMessage, ConversationState
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,7 @@ class ConversationMemory(BaseMemory):
         """Initialize the conversation memory component"""
         super().__init__(name="conversation_memory")
     
+    @traced('memory.save')
     async def save(self, data: Dict[str, Any]) -> bool:
         """
         Save conversation data.
@@ -29,6 +31,7 @@ class ConversationMemory(BaseMemory):
             data: Dict containing conversation data to save:
                 - conversation_id: ID of existing conversation or None for new
                 - user_id: Optional user ID
+                - session_id: Optional session that owns a new anonymous conversation
                 - role: Message role ('user' or 'assistant')
                 - content: Message content
                 - search_results: Optional search results
@@ -48,7 +51,7 @@ class ConversationMemory(BaseMemory):
             products = data.get('products', [])
             
             # Get or create conversation
-            conversation = await self._get_or_create_conversation(conversation_id, user_id)
+            conversation = await self._get_or_create_conversation(conversation_id, user_id, data.get('session_id'))
             
             # Save message
             await self._save_message(conversation, role, content, search_results, len(products) > 0)
@@ -66,6 +69,42 @@ class ConversationMemory(BaseMemory):
             logger.error(f"Error saving to conversation memory: {str(e)}", exc_info=True)
             return False
     
+    @traced('memory.save')
+    async def save_turn(self, data: Dict[str, Any]) -> Optional[int]:
+        """
+        Save one exchange: the user's message and the assistant's answer.
+        
+        This is the only place a turn's messages are written; both go in
+        one INSERT, and the answer keeps the products it showed.
+        
+        Args:
+            data: Dict containing:
+                - conversation_id: ID of existing conversation or None for new
+                - user_id: Optional user ID
+                - session_id: Optional session that owns a new anonymous conversation
+                - query: The user's message
+                - response: The assistant's answer
+                - products: Optional product cards shown with the answer
+                - current_products: Optional products that become the conversation's current ones
+            
+        Returns:
+            The assistant message's ID, or None when saving failed
+        """
+        try:
+            conversation = await self._get_or_create_conversation(
+                data.get('conversation_id'), data.get('user_id'), data.get('session_id')
+            )
+            assistant_message = await self._save_turn(conversation, data.get('query', ''),
+                                                      data.get('response', ''), data.get('products') or [])
+            if data.get('current_products'):
+                await self._update_products_in_state(conversation, data['current_products'])
+            return assistant_message.id
+        
+        except Exception as e:
+            logger.error(f"Error saving turn to conversation memory: {str(e)}", exc_info=True)
+            return None
+    
+    @traced('memory.load')
     async def load(self, conversation_id: Optional[str] = None, 
                  message_limit: int = 10, 
                  include_state: bool = True,
@@ -125,6 +164,7 @@ class ConversationMemory(BaseMemory):
                 "state": {}
             }
     
+    @traced('memory.update')
     async def update(self, data: Dict[str, Any], **kwargs) -> bool:
         """
         Update conversation state.
@@ -151,7 +191,8 @@ class ConversationMemory(BaseMemory):
                 return False
             
             # Update state
-            await self._update_conversation_state(conversation, state_data, data.get('products', []))
+            products = data.get('products') or state_data.get('current_products', [])
+            await self._update_conversation_state(conversation, state_data, products)
             
             return True
         
@@ -159,6 +200,22 @@ class ConversationMemory(BaseMemory):
             logger.error(f"Error updating conversation memory: {str(e)}", exc_info=True)
             return False
     
+    @traced('memory.get_state')
+    async def get_state(self, conversation_id: Optional[str]) -> Dict[str, Any]:
+        """
+        Get a conversation's state without its messages.
+        
+        Args:
+            conversation_id: ID of the conversation
+            
+        Returns:
+            Dict of state fields (current_products, history_summary, ...), empty if there is none
+        """
+        conversation = await self._get_conversation(conversation_id)
+        if not conversation:
+            return {}
+        return await self._get_conversation_state(conversation)
+    
     async def clear(self, conversation_id: Optional[str] = None, **kwargs) -> bool:
         """
         Clear conversation data.
@@ -189,7 +246,8 @@ class ConversationMemory(BaseMemory):
             return False
     
     @sync_to_async
-    def _get_or_create_conversation(self, conversation_id: Optional[str], user_id: Optional[str]) -> Conversation:
+    def _get_or_create_conversation(self, conversation_id: Optional[str], user_id: Optional[str],
+                                    session_id: Optional[str] = None) -> Conversation:
         """Get an existing conversation or create a new one"""
         from django.contrib.auth import get_user_model
         User = get_user_model()
@@ -209,7 +267,8 @@ class ConversationMemory(BaseMemory):
             except User.DoesNotExist:
                 pass
         
-        conversation = Conversation.objects.create(user=user)
+        # An anonymous conversation belongs to the session that started it
+        conversation = Conversation.objects.create(user=user, session_id=None if user else session_id)
         
         # Create initial state
         ConversationState.objects.create(conversation=conversation)
@@ -236,6 +295,22 @@ class ConversationMemory(BaseMemory):
             has_products=has_products
         )
     
+    @sync_to_async
+    def _save_turn(self, conversation: Conversation, query: str, response: str,
+                   products: List[Dict[str, Any]]) -> ConversationMessage:
+        """Save the user's message and the assistant's answer together"""
+        _, assistant_message = ConversationMessage.objects.bulk_create([
+            ConversationMessage(conversation=conversation, role='user', content=query),
+            ConversationMessage(
+                conversation=conversation,
+                role='assistant',
+                content=response,
+                search_results=products or None,
+                has_products=bool(products)
+            ),
+        ])
+        return assistant_message
+    
     @sync_to_async
     def _get_messages(self, conversation: Conversation, limit: int) -> List[Dict[str, Any]]:
         """Get messages from the conversation"""
@@ -273,7 +348,8 @@ class ConversationMemory(BaseMemory):
                 'product_references': state.product_references,
                 'user_preferences': state.user_preferences,
                 'keywords': state.keywords,
-                'last_action': state.last_action
+                'last_action': state.last_action,
+                'history_summary': state.history_summary
             }
         except ConversationState.DoesNotExist:
             return {}
@@ -370,6 +446,8 @@ class ConversationMemory(BaseMemory):
             state.user_preferences = {}
             state.keywords = []
             state.last_action = None
+            state.history_summary = ""
+            state.summary_message_id = 0
             state.save()
         except ConversationState.DoesNotExist:
             pass
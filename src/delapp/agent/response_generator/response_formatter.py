@@ -1,200 +1,398 @@
 """
 Response Formatter for ShopAgent
 
-This module handles formatting responses from the agent into natural language
-that is appropriate for the user's query and context.
+Turns product results, comparisons and cart operations into the reply the
+user reads, in two tiers:
+
+- Templates render the reply straight from the data, in microseconds. Every
+  reply starts as a template reply.
+- An LLM can polish that reply into more conversational text. The polishing
+  model is a slow reasoning model, so each endpoint decides whether to use
+  it: not at all ('off'), after answering ('background': the template reply
+  is returned and the polished text is cached for the next request showing
+  the same products) or within a latency budget ('inline': the template
+  reply is returned when the budget runs out, and the polish still finishes
+  into the cache). Polishing can be limited to users with an active
+  subscription.
+
+Polished replies are cached by the kind of reply, the normalized query the
+polish prompt quotes and the data the reply describes (for product results:
+the products' names, prices and retailers), so a product set is polished
+once per TTL for each way of asking for it, however many users ask.
+
+Configured through the RESPONSE_FORMATTER setting:
+
+    RESPONSE_FORMATTER = {
+        'BACKENDS': [   # LLM_ROUTER-style backends used for polishing; none disables it
+            {'NAME': 'groq-r1', 'PROVIDER': 'groq', 'MODEL': 'deepseek-r1-distill-llama-70b', 'TIMEOUT': 60},
+        ],
+        'TEMPERATURE': 0.4,
+        'CACHE_ALIAS': 'llm',   # Django cache for polished replies; None disables caching
+        'CACHE_TTL': 86400,
+        'ENDPOINTS': {
+            'default': {'POLISH': 'off'},
+            'agent_query': {'POLISH': 'inline', 'BUDGET_MS': 1500, 'PAID_ONLY': True},
+            'agent_stream': {'POLISH': 'background', 'PAID_ONLY': True},
+        },
+    }
 """
-from typing import Dict, Any, Optional, List, Union
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List
+import asyncio
+import hashlib
 import logging
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
+import random
+import re
+import threading
+
+from ..core.llm_cache import DjangoCacheBackend
+from ..tools.product_cards import format_price
 
 logger = logging.getLogger(__name__)
 
+POLISH_OFF = 'off'
+POLISH_BACKGROUND = 'background'
+POLISH_INLINE = 'inline'
+
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# Products listed in a reply; the cards carry the rest
+MAX_LISTED_PRODUCTS = 5
+MAX_LISTED_CART_ITEMS = 3
+
+# Templates, bound once; rendering is a few str.format calls
+_PRODUCTS_HEADER = "I found {count} products matching '{query}':\n\n".format
+_PRODUCT_LINE = "{index}. {name} - {price}\n   Retailer: {retailer}\n\n".format
+_PRODUCTS_FOOTER = (
+    "You can ask for more details about any of these products.\n"
+    "\n\nYou can view these products in detail or ask me more specific questions about any of them."
+)
+_CART_COUNT = "Your cart has {count} item{plural}.\n".format
+_CART_ITEM = "- {name} ({price})\n".format
+_CART_MORE = "...and {count} more items\n".format
+
+# Reasoning models think out loud before answering
+_THINKING = re.compile(r'<think>.*?</think>', re.DOTALL)
+
+PRODUCT_POLISH_PROMPT = """You are a helpful shopping assistant. Rewrite the following product search results as a
+natural, conversational response that answers the user's query.
+
+User query: {query}
+
+Products found:
+{products}
+
+Guidelines:
+1. Be concise but informative
+2. Highlight key features, prices, and retailers
+3. Don't mention the exact number of products unless relevant
+4. Keep your tone friendly and conversational
+5. Don't say "here are the results" or similar phrases
+
+Your response:"""
+
+COMPARISON_POLISH_PROMPT = """You are a helpful shopping assistant. Rewrite the following product comparison as a
+natural, conversational response.
+
+User query: {query}
+
+Comparison results:
+{comparison}
+
+Guidelines:
+1. Focus on the key differences between products
+2. Highlight price-to-value considerations
+3. Be balanced and objective in your assessment
+4. Make a recommendation if appropriate
+5. Keep your tone friendly and conversational
+
+Your response:"""
+
+CART_POLISH_PROMPT = """You are a helpful shopping assistant. Rewrite the following cart operation result as a
+natural, conversational response.
+
+User query: {query}
+
+Cart operation: {operation}
+Result: {result}
+
+Guidelines:
+1. Be concise but clear about what happened
+2. Confirm what action was taken
+3. Mention the total number of items in the cart now
+4. For view operations, briefly summarize the cart contents
+5. Keep your tone friendly and conversational
+
+Your response:"""
+
+
+def render_product_search(query: str, products: List[Dict[str, Any]]) -> str:
+    """The template reply for product cards"""
+    parts = [_PRODUCTS_HEADER(count=len(products), query=query)]
+    for index, product in enumerate(products[:MAX_LISTED_PRODUCTS], 1):
+        parts.append(_PRODUCT_LINE(index=index, name=product['name'],
+                                   price=format_price(product['currentPrice']), retailer=product['retailer']))
+    parts.append(_PRODUCTS_FOOTER)
+    return ''.join(parts)
+
+
+def render_comparison(comparison_data: Dict[str, Any]) -> str:
+    """The template reply for a product comparison"""
+    text = comparison_data.get('comparison') or "I've compared these products for you."
+    differences = comparison_data.get('key_differences')
+    if differences:
+        text += "\n\nKey differences:\n" + "\n".join(f"- {diff}" for diff in differences)
+    if comparison_data.get('recommendation'):
+        text += f"\n\nRecommendation: {comparison_data['recommendation']}"
+    return text
+
+
+def render_cart(operation: str, result: Dict[str, Any]) -> str:
+    """The template reply for a cart operation"""
+    text = result.get('message') or f"I've processed your cart {operation} request."
+    text += "\n"
+    if 'cart_count' in result:
+        count = result['cart_count']
+        text += _CART_COUNT(count=count, plural='' if count == 1 else 's')
+    items = result.get('cart_items') or []
+    if operation == 'view' and items:
+        for item in items[:MAX_LISTED_CART_ITEMS]:
+            text += _CART_ITEM(name=item.get('title', 'Product'), price=format_price(item.get('price')))
+        if len(items) > MAX_LISTED_CART_ITEMS:
+            text += _CART_MORE(count=len(items) - MAX_LISTED_CART_ITEMS)
+    return text.rstrip()
+
+
+@dataclass
+class FormattingPolicy:
+    """How one endpoint's replies are formatted"""
+    polish: str = POLISH_OFF
+    budget_ms: int = 0
+    paid_only: bool = True
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'FormattingPolicy':
+        polish = config.get('POLISH', POLISH_OFF)
+        if polish not in (POLISH_OFF, POLISH_BACKGROUND, POLISH_INLINE):
+            logger.error(f"Unknown POLISH mode '{polish}'; not polishing")
+            polish = POLISH_OFF
+        return cls(polish=polish, budget_ms=config.get('BUDGET_MS', 0), paid_only=config.get('PAID_ONLY', True))
+
+
 class ResponseFormatter:
-    """Formats agent responses into natural language"""
-    
-    def __init__(self):
-        """Initialize the response formatter with an LLM for enhanced formatting"""
-        self.llm = ChatGroq(model="deepseek-r1-distill-llama-70b", temperature=0.4)
-        self.product_response_prompt = ChatPromptTemplate.from_template("""
-        You are a helpful shopping assistant. Format the following product search results into a 
-        natural, conversational response that answers the user's query.
-
-        User query: {query}
-
-        Products found:
-        {products}
-
-        Guidelines:
-        1. Be concise but informative
-        2. Highlight key features, prices, and retailers
-        3. Don't mention the exact number of products unless relevant
-        4. Keep your tone friendly and conversational
-        5. Don't say "here are the results" or similar phrases
-        6. If there are no products, suggest alternatives or ask for clarification
-
-        Your response:
-        """)
-        
-        self.comparison_response_prompt = ChatPromptTemplate.from_template("""
-        You are a helpful shopping assistant. Format the following product comparison into a 
-        natural, conversational response.
-
-        User query: {query}
-
-        Comparison results:
-        {comparison}
-
-        Guidelines:
-        1. Focus on the key differences between products
-        2. Highlight price-to-value considerations
-        3. Be balanced and objective in your assessment
-        4. Make a recommendation if appropriate
-        5. Keep your tone friendly and conversational
-
-        Your response:
-        """)
-        
-        self.cart_response_prompt = ChatPromptTemplate.from_template("""
-        You are a helpful shopping assistant. Format the following cart operation result into a 
-        natural, conversational response.
-
-        User query: {query}
-
-        Cart operation: {operation}
-        Result: {result}
-        
-        Guidelines:
-        1. Be concise but clear about what happened
-        2. Confirm what action was taken
-        3. Mention the total number of items in the cart now
-        4. For view operations, briefly summarize the cart contents
-        5. Keep your tone friendly and conversational
-
-        Your response:
-        """)
-    
-    async def format_product_search_response(self, query: str, products: List[Dict[str, Any]]) -> str:
+    """Formats agent responses into natural language, from templates and optionally an LLM"""
+
+    def __init__(self, llm: Optional[Any] = None, policies: Optional[Dict[str, FormattingPolicy]] = None,
+                 cache: Optional[Any] = None, cache_ttl: int = DEFAULT_CACHE_TTL):
+        """
+        Args:
+            llm: Chat model that polishes replies; None keeps every reply a template reply
+            policies: FormattingPolicy per endpoint name, with 'default' for the rest
+            cache: Backend with async get/set for polished replies, like llm_cache.DjangoCacheBackend
+            cache_ttl: Seconds a polished reply is kept
+        """
+        self.llm = llm
+        self.policies = policies or {}
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        # Polishes in flight by cache key, so a product set is only polished once at a time
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._counters = {'template': 0, 'cached': 0, 'polished': 0, 'over_budget': 0, 'deferred': 0, 'errors': 0}
+
+    @classmethod
+    def from_settings(cls) -> 'ResponseFormatter':
+        from django.conf import settings
+        from ..core.llm_router import build_llm_router
+        config = getattr(settings, 'RESPONSE_FORMATTER', {})
+
+        llm = None
+        if config.get('BACKENDS'):
+            llm = build_llm_router({
+                'BACKENDS': config['BACKENDS'],
+                'TEMPERATURE': config.get('TEMPERATURE', 0.4),
+                'MAX_TOKENS': config.get('MAX_TOKENS', 1024),
+                'HEDGE': False,
+            })
+            if llm is None:
+                logger.info("No response polishing backend has an API key; replies stay template replies")
+
+        alias = config.get('CACHE_ALIAS', 'default')
+        return cls(
+            llm=llm,
+            policies={name: FormattingPolicy.from_config(policy)
+                      for name, policy in config.get('ENDPOINTS', {}).items()},
+            cache=DjangoCacheBackend(alias, prefix='response-polish:') if alias else None,
+            cache_ttl=config.get('CACHE_TTL', DEFAULT_CACHE_TTL)
+        )
+
+    def policy(self, endpoint: str) -> FormattingPolicy:
+        return self.policies.get(endpoint) or self.policies.get('default') or FormattingPolicy()
+
+    async def format_product_search_response(self, query: str, products: List[Dict[str, Any]],
+                                             endpoint: str = 'default', user_id: Optional[str] = None,
+                                             text: Optional[str] = None) -> str:
         """
         Format a product search response.
-        
+
         Args:
             query: The user's query
-            products: List of products to format
-            
+            products: Product cards to describe
+            endpoint: Name of the endpoint answering, which picks the policy
+            user_id: The user asking, for paid-only polishing
+            text: The template reply when the caller already rendered it
+
         Returns:
             Formatted response string
         """
-        try:
-            # Handle empty results
-            if not products:
-                return self._get_empty_results_response(query)
-            
-            # Format product information
-            product_summaries = [
-                f"- {p.get('title', 'Product')} (${float(p.get('price', 0)):.2f} from {p.get('retailer', 'Unknown')})"
-                for p in products[:5]  # Limit to top 5 products for readability
-            ]
-            products_text = "\n".join(product_summaries)
-            
-            # Use LLM to generate natural response
-            response = await self.llm.ainvoke(
-                self.product_response_prompt.format(
-                    query=query,
-                    products=products_text
-                )
-            )
-            
-            return response.content
-        
-        except Exception as e:
-            logger.error(f"Error formatting product search response: {str(e)}", exc_info=True)
-            return f"I found {len(products)} products matching your search for '{query}'."
-    
-    async def format_comparison_response(self, query: str, comparison_data: Dict[str, Any]) -> str:
+        if not products:
+            return self._get_empty_results_response(query)
+        text = text or render_product_search(query, products)
+        listed = "\n".join(
+            f"- {p['name']} ({format_price(p['currentPrice'])} from {p['retailer']})"
+            for p in products[:MAX_LISTED_PRODUCTS]
+        )
+        return await self._format(
+            'products', query, text, listed, PRODUCT_POLISH_PROMPT.format(query=query, products=listed),
+            endpoint, user_id
+        )
+
+    async def format_comparison_response(self, query: str, comparison_data: Dict[str, Any],
+                                         endpoint: str = 'default', user_id: Optional[str] = None) -> str:
         """
         Format a product comparison response.
-        
+
         Args:
             query: The user's query
             comparison_data: Comparison data
-            
+            endpoint: Name of the endpoint answering, which picks the policy
+            user_id: The user asking, for paid-only polishing
+
         Returns:
             Formatted response string
         """
-        try:
-            comparison_text = f"Comparison: {comparison_data.get('comparison', '')}\n\n"
-            
-            if 'key_differences' in comparison_data:
-                differences = comparison_data['key_differences']
-                if differences:
-                    comparison_text += "Key differences:\n"
-                    comparison_text += "\n".join([f"- {diff}" for diff in differences])
-                    comparison_text += "\n\n"
-            
-            if 'recommendation' in comparison_data:
-                comparison_text += f"Recommendation: {comparison_data['recommendation']}"
-            
-            # Use LLM to generate natural response
-            response = await self.llm.ainvoke(
-                self.comparison_response_prompt.format(
-                    query=query,
-                    comparison=comparison_text
-                )
-            )
-            
-            return response.content
-        
-        except Exception as e:
-            logger.error(f"Error formatting comparison response: {str(e)}", exc_info=True)
-            return comparison_data.get('comparison', "I've compared these products for you.")
-    
-    async def format_cart_response(self, query: str, operation: str, result: Dict[str, Any]) -> str:
+        text = render_comparison(comparison_data)
+        return await self._format(
+            'comparison', query, text, text, COMPARISON_POLISH_PROMPT.format(query=query, comparison=text),
+            endpoint, user_id
+        )
+
+    async def format_cart_response(self, query: str, operation: str, result: Dict[str, Any],
+                                   endpoint: str = 'default', user_id: Optional[str] = None) -> str:
         """
         Format a cart operation response.
-        
+
         Args:
             query: The user's query
             operation: The cart operation performed
             result: The operation result
-            
+            endpoint: Name of the endpoint answering, which picks the policy
+            user_id: The user asking, for paid-only polishing
+
         Returns:
             Formatted response string
         """
+        text = render_cart(operation, result)
+        return await self._format(
+            'cart', query, text, f"{operation}\n{text}",
+            CART_POLISH_PROMPT.format(query=query, operation=operation, result=text),
+            endpoint, user_id
+        )
+
+    async def _format(self, kind: str, query: str, text: str, material: str, prompt: str,
+                      endpoint: str, user_id: Optional[str]) -> str:
+        """
+        Return the best reply the endpoint's policy allows.
+
+        Args:
+            kind: Kind of reply, part of the cache key
+            query: The user's query, which the prompt quotes; part of the cache key
+            text: The template reply
+            material: What the reply describes; part of the cache key
+            prompt: Prompt asking the LLM to polish the reply
+        """
+        policy = self.policy(endpoint)
+        if policy.polish == POLISH_OFF or self.llm is None:
+            self._count('template')
+            return text
+        if policy.paid_only and not await self._is_paid(user_id):
+            self._count('template')
+            return text
+
+        # The polished text answers the query, so it is only reused for the same question
+        normalized_query = ' '.join(query.lower().split())
+        key = hashlib.sha256(f"{kind}|{normalized_query}|{material}".encode('utf-8')).hexdigest()
+        if self.cache is not None:
+            try:
+                polished = await self.cache.get(key)
+            except Exception as e:
+                logger.error(f"Polished reply lookup failed: {str(e)}", exc_info=True)
+                polished = None
+            if polished:
+                self._count('cached')
+                return polished
+
+        task = self._polish(key, prompt)
+        if policy.polish == POLISH_INLINE and policy.budget_ms > 0:
+            try:
+                # Shielded so a missed budget leaves the polish running into the cache
+                polished = await asyncio.wait_for(asyncio.shield(task), policy.budget_ms / 1000)
+            except asyncio.TimeoutError:
+                self._count('over_budget')
+            else:
+                if polished:
+                    self._count('polished')
+                    return polished
+        else:
+            self._count('deferred')
+        return text
+
+    def _polish(self, key: str, prompt: str) -> asyncio.Task:
+        """Start polishing a reply, or join the polish already running for the same key"""
+        task = self._pending.get(key)
+        if task is not None:
+            return task
+
+        async def polish() -> Optional[str]:
+            try:
+                response = await self.llm.ainvoke(prompt)
+                polished = _THINKING.sub('', response.content).strip()
+                if polished and self.cache is not None:
+                    await self.cache.set(key, polished, self.cache_ttl)
+                return polished or None
+            except Exception as e:
+                logger.error(f"Error polishing reply: {str(e)}", exc_info=True)
+                self._count('errors')
+                return None
+
+        task = asyncio.create_task(polish())
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return task
+
+    @staticmethod
+    async def _is_paid(user_id: Optional[str]) -> bool:
+        """Whether the user has an active subscription"""
+        if not user_id or not str(user_id).isdigit():
+            return False
+        from ...models import UserSubscription
         try:
-            # Create a summary of the result
-            result_summary = ""
-            if 'message' in result:
-                result_summary += result['message'] + "\n"
-            
-            if 'cart_count' in result:
-                result_summary += f"Cart has {result['cart_count']} items total.\n"
-            
-            if operation == 'view' and 'cart_items' in result and result['cart_items']:
-                items = result['cart_items'][:3]  # Limit to first 3 for summary
-                result_summary += "Items in cart:\n"
-                for item in items:
-                    result_summary += f"- {item.get('title', 'Product')} (${float(item.get('price', 0)):.2f})\n"
-                
-                if len(result['cart_items']) > 3:
-                    result_summary += f"...and {len(result['cart_items']) - 3} more items\n"
-            
-            # Use LLM to generate natural response
-            response = await self.llm.ainvoke(
-                self.cart_response_prompt.format(
-                    query=query,
-                    operation=operation,
-                    result=result_summary
-                )
-            )
-            
-            return response.content
-        
+            return await UserSubscription.objects.filter(user_id=int(user_id), is_active=True).aexists()
         except Exception as e:
-            logger.error(f"Error formatting cart response: {str(e)}", exc_info=True)
-            return result.get('message', f"I've processed your cart {operation} request.")
-    
+            logger.error(f"Error checking subscription: {str(e)}", exc_info=True)
+            return False
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """How replies were formatted: template, cached or inline polish, deferred, over budget"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['pending'] = len(self._pending)
+        return stats
+
     def _get_empty_results_response(self, query: str) -> str:
         """Generate a response for when no products are found"""
         suggestions = [
@@ -202,18 +400,17 @@ class ResponseFormatter:
             f"I searched for '{query}', but didn't find any matching products. Would you like to try a more general search?",
             f"No products found for '{query}'. Maybe try using different keywords or broaden your search?"
         ]
-        
-        import random
+
         return random.choice(suggestions)
-    
+
     def generate_followup_questions(self, query: str, products: List[Dict[str, Any]]) -> List[str]:
         """
         Generate follow-up questions based on search results.
-        
+
         Args:
             query: The user's query
-            products: List of found products
-            
+            products: List of found product cards
+
         Returns:
             List of follow-up question strings
         """
@@ -223,34 +420,44 @@ class ResponseFormatter:
                 "Can you tell me more about what you're looking for?",
                 "Would you prefer to browse by category instead?"
             ]
-        
+
         # Product-specific follow-ups
         followups = []
-        
+
         # Price-related
-        prices = [float(p.get('price', 0)) for p in products if p.get('price')]
+        prices = [p['currentPrice'] for p in products if p.get('currentPrice')]
         if prices:
             price_range = max(prices) - min(prices)
             if price_range > 50:
                 followups.append("Would you like to see more budget-friendly options?")
                 followups.append("Are you looking for something in a specific price range?")
-        
+
         # Feature-related
         if len(products) >= 2:
             followups.append("Would you like me to compare these products for you?")
-        
+
         # Cart-related
         followups.append("Would you like to add any of these to your cart?")
-        
+
         # Generic follow-ups
         generic_followups = [
             "Do you want more details about any of these products?",
             "Is there a specific feature you're most interested in?",
             "Would you like to see more options like these?"
         ]
-        
+
         # Combine and limit
         followups.extend(generic_followups)
-        
-        import random
+
         return random.sample(followups, min(3, len(followups)))
+
+
+_default_formatter = None
+
+
+def get_response_formatter() -> ResponseFormatter:
+    """Get the process-wide formatter configured by the RESPONSE_FORMATTER setting"""
+    global _default_formatter
+    if _default_formatter is None:
+        _default_formatter = ResponseFormatter.from_settings()
+    return _default_formatter
@@ -9,6 +9,7 @@ import logging
 
 # Import agent core
 from .core.agent_core import ShopAgent
+from .core.llm_router import build_llm_router
 
 # Import tools
 from .tools.product_search_tool import ProductSearchTool
@@ -27,54 +28,30 @@ class ShopAgentFactory:
     """Factory for creating fully configured ShopAgent instances"""
     
     @staticmethod
-    def create_agent(use_llm: bool = True) -> ShopAgent:
+    def create_agent(use_llm: bool = True, llm: Optional[Any] = None,
+                     search_provider: Optional[Any] = None, persist_search_results: bool = True) -> ShopAgent:
         """
         Create and configure a ShopAgent with all required components.
         
         Args:
             use_llm: Whether to initialize with a language model (if False, uses a mock)
+            llm: Chat model to use instead of the LLM_ROUTER backends
+            search_provider: Product search provider to use instead of SearchAPI.io
+            persist_search_results: Whether search results are upserted into the product catalog
             
         Returns:
             Fully configured ShopAgent instance
         """
         logger.info("Creating agentic ShopAgent instance")
         
-        # Create LLM if requested
-        llm = None
-        if use_llm:
+        # Create the LLM router if requested
+        if not use_llm:
+            llm = None
+        elif llm is None:
             try:
-                # Try to import a language model
-                try:
-                    from langchain_groq import ChatGroq
-                    import os
-                    
-                    api_key = os.environ.get('GROQ_API_KEY')
-                    if api_key:
-                        llm = ChatGroq(
-                            api_key=api_key,
-                            model_name="llama3-8b-8192",  # or any other available model
-                            temperature=0.2,
-                            max_tokens=1024
-                        )
-                        logger.info("Using Groq LLM")
-                except (ImportError, Exception) as e:
-                    logger.warning(f"Failed to initialize Groq LLM: {str(e)}")
-                    
-                    # Try OpenAI as fallback
-                    try:
-                        from langchain.chat_models import ChatOpenAI
-                        
-                        api_key = os.environ.get('OPENAI_API_KEY')
-                        if api_key:
-                            llm = ChatOpenAI(
-                                api_key=api_key,
-                                model_name="gpt-3.5-turbo",
-                                temperature=0.2,
-                                max_tokens=1024
-                            )
-                            logger.info("Using OpenAI LLM")
-                    except (ImportError, Exception) as e:
-                        logger.warning(f"Failed to initialize OpenAI LLM: {str(e)}")
+                llm = build_llm_router()
+                if llm is None:
+                    logger.warning("No LLM backends configured with API keys")
             except Exception as e:
                 logger.error(f"Error initializing LLM: {str(e)}")
         
@@ -88,8 +65,11 @@ class ShopAgentFactory:
             )
             
             # Create tool instances without provider parameter
+            search_tool = None
+            if search_provider or not persist_search_results:
+                search_tool = ProductSearchTool(search_provider, persist_results=persist_search_results)
             langchain_tools = [
-                ProductSearchLangChainTool(),
+                ProductSearchLangChainTool(search_tool),
                 ProductDetailsLangChainTool(),
                 # Skip cart tool for now until we fix the import
                 # CartManagementLangChainTool()
@@ -122,4 +102,4 @@ class ShopAgentFactory:
         Returns:
             ResponseFormatter instance
         """
-        return ResponseFormatter()
+        return ResponseFormatter.from_settings()
@@ -11,6 +11,8 @@ from django.utils import timezone
 import uuid
 
 from .base_tool import BaseTool
+from .product_cards import product_card
+from ..core.reference_resolver import get_reference_resolver
 from ...models import Cart, SavedItem, Conversation
 
 logger = logging.getLogger(__name__)
@@ -32,6 +34,8 @@ class CartManagementTool(BaseTool):
                      product_data: Optional[Dict[str, Any]] = None,
                      product_indices: Optional[List[int]] = None,
                      conversation_id: Optional[str] = None,
+                     product_reference: Optional[str] = None,
+                     products: Optional[List[Dict[str, Any]]] = None,
                      **kwargs) -> Dict[str, Any]:
         """
         Execute a cart management operation.
@@ -43,6 +47,8 @@ class CartManagementTool(BaseTool):
             product_data: Product data to add to cart (required for 'add' action)
             product_indices: Indices of products to remove (required for 'remove' action)
             conversation_id: ID of the conversation (optional)
+            product_reference: Reference like "the cheaper one", used for 'add' when product_data is missing
+            products: Products already shown in the conversation, used to resolve product_reference
             **kwargs: Additional parameters
             
         Returns:
@@ -58,6 +64,12 @@ class CartManagementTool(BaseTool):
                 session_id = str(uuid.uuid4())
                 logger.info(f"Generated new session ID: {session_id}")
             
+            if action.lower() == 'add' and not product_data and product_reference:
+                reference = get_reference_resolver().resolve(product_reference, products or [])
+                if reference is not None:
+                    logger.info(f"Resolved '{product_reference}' to product {reference.index + 1} by {reference.reason}")
+                    product_data = reference.product
+            
             # Handle the requested action
             if action.lower() == 'add':
                 return await self._add_to_cart(user_id, session_id, product_data, conversation_id)
@@ -94,18 +106,21 @@ class CartManagementTool(BaseTool):
                     "cart_items": []
                 }
             
+            # Whatever shape the product arrived in, the cart stores its card
+            card = product_card(product_data)
+            
             # Get or create cart
             cart, new_session_id = await self._get_or_create_cart(user_id, session_id)
             
             # Add product to cart
-            saved_item = await self._create_saved_item(cart, product_data, conversation_id)
+            saved_item = await self._create_saved_item(cart, card, conversation_id)
             
             # Get updated cart item count
             item_count = await self._get_cart_item_count(cart)
             
             return {
                 "success": True,
-                "message": f"Added {product_data.get('title', 'product')} to your cart",
+                "message": f"Added {card['name']} to your cart",
                 "cart_items": [self._format_saved_item(saved_item)],
                 "cart_count": item_count,
                 "session_id": new_session_id
@@ -280,9 +295,9 @@ class CartManagementTool(BaseTool):
         return None
     
     @sync_to_async
-    def _create_saved_item(self, cart: Cart, product_data: Dict[str, Any], 
+    def _create_saved_item(self, cart: Cart, card: Dict[str, Any], 
                          conversation_id: Optional[str]) -> SavedItem:
-        """Create a saved item in the cart"""
+        """Create a saved item in the cart from a product card"""
         conversation = None
         if conversation_id:
             try:
@@ -291,7 +306,7 @@ class CartManagementTool(BaseTool):
                 pass
         
         # Check if this product is already in the cart
-        product_id = product_data.get('product_id', '')
+        product_id = card['id']
         existing_item = SavedItem.objects.filter(
             cart=cart,
             product_id=product_id
@@ -303,34 +318,18 @@ class CartManagementTool(BaseTool):
             existing_item.save()
             return existing_item
         
-        # Create new saved item
-        price = product_data.get('price', 0)
-        if not isinstance(price, (int, float)):
-            try:
-                # Try to convert string price to float
-                price = float(str(price).replace('$', '').replace(',', ''))
-            except (ValueError, AttributeError):
-                price = 0
-        
-        original_price = product_data.get('original_price')
-        if original_price and not isinstance(original_price, (int, float)):
-            try:
-                original_price = float(str(original_price).replace('$', '').replace(',', ''))
-            except (ValueError, AttributeError):
-                original_price = None
-        
         return SavedItem.objects.create(
             cart=cart,
             product_id=product_id,
-            title=product_data.get('title', 'Product'),
-            price=price,
-            original_price=original_price,
-            image_url=product_data.get('image_url', ''),
-            product_url=product_data.get('url', ''),
-            retailer=product_data.get('retailer', 'Unknown'),
-            description=product_data.get('description', ''),
+            title=card['name'],
+            price=card['currentPrice'],
+            original_price=card['originalPrice'],
+            image_url=card['image_url'],
+            product_url=card['productLink'],
+            retailer=card['retailer'],
+            description=card['description'],
             conversation=conversation,
-            metadata=product_data  # Store the full product data
+            metadata=card  # Store the full product card
         )
     
     @sync_to_async
@@ -345,27 +344,9 @@ class CartManagementTool(BaseTool):
         
         item_dicts = []
         for item in saved_items:
-            # Try to use stored metadata first
-            if item.metadata and isinstance(item.metadata, dict):
-                item_dict = item.metadata.copy()
-            else:
-                # Otherwise build a basic dictionary
-                item_dict = {
-                    'product_id': item.product_id,
-                    'title': item.title,
-                    'price': item.price,
-                    'image_url': item.image_url,
-                    'url': item.product_url,
-                    'retailer': item.retailer,
-                    'description': item.description
-                }
-            
-            # Ensure key fields are present
-            if 'id' not in item_dict:
-                item_dict['id'] = item.product_id
-            if 'saved_item_id' not in item_dict:
-                item_dict['saved_item_id'] = item.id
-                
+            # The stored card, with the saved item's own fields on top
+            item_dict = self._format_saved_item(item)
+            item_dict.setdefault('id', item.product_id)
             item_dicts.append(item_dict)
             
         return item_dicts
@@ -444,6 +425,14 @@ class CartManagementTool(BaseTool):
                 "conversation_id": {
                     "type": ["string", "null"],
                     "description": "ID of the conversation (optional)"
+                },
+                "product_reference": {
+                    "type": ["string", "null"],
+                    "description": "Reference to a product already shown, like 'the second one' (for 'add')"
+                },
+                "products": {
+                    "type": ["array", "null"],
+                    "description": "Products already shown in the conversation"
                 }
             },
             "required": ["action"]
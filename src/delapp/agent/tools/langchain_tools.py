@@ -5,13 +5,15 @@ This module provides wrappers that convert our native tool classes into proper L
 that can be used with LangChain's agent framework.
 """
 import json
-import uuid
 import logging
 from typing import Dict, Any, Optional, List, Union
-from datetime import datetime
 from langchain.tools import BaseTool
 from langchain.callbacks.manager import CallbackManagerForToolRun, AsyncCallbackManagerForToolRun
 
+from .product_cards import format_price, product_card
+from ..response_generator.response_formatter import render_product_search
+from .results import SearchResult
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
@@ -26,10 +28,14 @@ class ProductSearchLangChainTool(BaseTool):
     """
     search_tool: Any = None
     
-    def __init__(self):
-        """Initialize with our native search tool"""
+    def __init__(self, search_tool: Optional[Any] = None):
+        """Initialize with our native search tool, or the given one"""
         super().__init__()
         
+        if search_tool is not None:
+            self.search_tool = search_tool
+            return
+        
         try:
             # Try to import and create the native tool
             from ..tools.product_search_tool import ProductSearchTool
@@ -43,136 +49,59 @@ class ProductSearchLangChainTool(BaseTool):
     async def _arun(
         self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
-        """Use the product search tool asynchronously."""
+        """Use the product search tool asynchronously, as JSON for the LLM."""
+        return (await self.search(query)).to_json()
+    
+    async def search(self, query: str) -> SearchResult:
+        """
+        Search for products and format them as frontend product cards.
+        
+        The agent calls this directly; only the LLM-facing _arun turns the result into a string.
+        """
         logger.info(f"ProductSearchLangChainTool executing for query: {query}")
         try:
             # Handle case where search_tool wasn't initialized properly
             if self.search_tool is None:
-                return json.dumps({
-                    "text": "I'm sorry, but the product search functionality is currently unavailable. Our team is working on it.",
-                    "products": [],
-                    "success": False
-                })
+                return SearchResult(
+                    text="I'm sorry, but the product search functionality is currently unavailable. Our team is working on it.",
+                    success=False
+                )
                 
             result = await self.search_tool.execute(query)
             products = result.get('products', [])
             is_mock_data = result.get('mock_data', False)
             
             if not products and not is_mock_data:
-                return json.dumps({
-                    "text": f"I couldn't find any products matching '{query}'. Please try a different search term.",
-                    "products": [],
-                    "success": False
-                })
-            
-            # Format the response for the human readable part
-            response = f"I found {len(products)} products matching '{query}':\n\n"
-            
-            # Format the products to match the frontend DealCard component expectations
-            formatted_products = []
-            
-            for product in products:
-                # Format product for response text
-                price = product.get('price', 'Price not available')
-                price_display = f"${price:.2f}" if isinstance(price, (int, float)) else price
-                
-                # Add to text response
-                if len(formatted_products) < 5:  # Only show first 5 in text
-                    response += f"{len(formatted_products)+1}. {product.get('title', 'Unknown product')} - {price_display}\n"
-                    # Add retailer if available
-                    if retailer := product.get('retailer'):
-                        response += f"   Retailer: {retailer}\n"
-                    # Add a blank line between products
-                    response += "\n"
-                
-                # Create frontend-compatible product object
-                formatted_product = {
-                    'id': product.get('id', str(uuid.uuid4())),
-                    'name': product.get('title', 'Product'),  # Frontend expects 'name'
-                    'currentPrice': float(price) if isinstance(price, (int, float)) else 0,
-                    'originalPrice': float(product.get('original_price', 0)) if product.get('original_price') else None,
-                    'image_url': product.get('image_url', '') or 'https://via.placeholder.com/300x300.png?text=Product+Image',
-                    'productLink': product.get('url', '#'),  # Frontend expects 'productLink'
-                    'retailer': product.get('retailer', 'Online retailer'),
-                    'description': product.get('description', '')
-                }
-                
-                # Calculate savings if possible
-                if formatted_product['originalPrice'] and formatted_product['currentPrice'] < formatted_product['originalPrice']:
-                    formatted_product['savings'] = {
-                        'amount': formatted_product['originalPrice'] - formatted_product['currentPrice'],
-                        'percent': int((formatted_product['originalPrice'] - formatted_product['currentPrice']) / 
-                                      formatted_product['originalPrice'] * 100)
-                    }
-                
-                formatted_products.append(formatted_product)
+                return SearchResult(
+                    text=f"I couldn't find any products matching '{query}'. Please try a different search term.",
+                    success=False
+                )
             
-            # Add hint about follow-up capability
-            response += "You can ask for more details about any of these products.\n"
+            # The products are already cards; only the template reply is built here
+            response = render_product_search(query, products)
             
-            # Handle datetime objects for proper serialization
-            def json_serial(obj):
-                if isinstance(obj, datetime) or isinstance(obj, datetime.date):
-                    return obj.isoformat()
-                raise TypeError(f"Type {type(obj)} not serializable")
-            
-            # Ensure all products have required fields for frontend
-            for product in formatted_products:
-                # Ensure every product has a name
-                if 'name' not in product or not product['name']:
-                    product['name'] = 'Product'
-                    
-                # Ensure image_url exists
-                if 'image_url' not in product or not product['image_url']:
-                    product['image_url'] = 'https://via.placeholder.com/300x300.png?text=Product+Image'
-                    
-                # Ensure productLink exists
-                if 'productLink' not in product or not product['productLink']:
-                    product['productLink'] = '#'
-                    
-                # Ensure price fields are numbers
-                if 'currentPrice' not in product or not isinstance(product['currentPrice'], (int, float)):
-                    product['currentPrice'] = 0.0
-                    
-            # Add a hint that these products can be shown on frontend
-            response += "\n\nYou can view these products in detail or ask me more specific questions about any of them."
-                
-            # Log the products being sent to ensure they're properly formatted
-            logger.info(f"Sending {len(formatted_products)} formatted products to frontend")
-            if formatted_products:
-                logger.info(f"Sample formatted product: {formatted_products[0]['name']} - ${formatted_products[0]['currentPrice']}")
+            logger.info(f"Sending {len(products)} product cards to frontend")
             
             # Always include specific mock_data flag when this is a mock response
-            return json.dumps({
-                "text": response,
-                "products": formatted_products,  # Use the frontend-formatted products
-                "success": True,
-                "has_products": len(formatted_products) > 0,  # Explicit flag for frontend to show products
-                "mock_data": result.get('mock_data', False),  # Pass through mock_data flag
-                "product_count": len(formatted_products)  # Explicit count for debugging
-            }, default=json_serial)
+            return SearchResult(
+                text=response,
+                products=products,
+                mock_data=is_mock_data
+            )
             
         except Exception as e:
             logger.error(f"Error executing ProductSearchLangChainTool: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
-            # Return a JSON error message
-            return json.dumps({
-                "text": f"I encountered an error while searching for products: {str(e)}",
-                "products": [],
-                "success": False
-            })
+            return SearchResult(
+                text=f"I encountered an error while searching for products: {str(e)}",
+                success=False
+            )
     
     def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         """Synchronous version (required but not used)"""
         raise NotImplementedError("This tool only supports async execution")
         
-    def _json_serializer(self, obj):
-        """Helper method to properly serialize datetime objects to JSON"""
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        raise TypeError(f"Type {type(obj)} is not JSON serializable")
-
 
 class ProductDetailsLangChainTool(BaseTool):
     """LangChain tool wrapper for product details"""
@@ -199,33 +128,26 @@ class ProductDetailsLangChainTool(BaseTool):
             # Set to None as a fallback
             self.details_tool = None
         
-    async def _arun(self, product_identifier: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
-        """Async run the tool with the given product identifier"""
+    async def _arun(self, product_identifier: str, products: Optional[List[Dict[str, Any]]] = None,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
+        """Async run the tool with the given product identifier and the conversation's products"""
         try:
             # Handle case where details_tool wasn't initialized
             if self.details_tool is None:
                 return f"I'm sorry, but the product details functionality is currently unavailable. Our team is working on it."
             
-            # The identifier could be a product ID or a name reference
-            result = await self.details_tool.execute(product_id=product_identifier)
+            # The identifier could be a product ID or a reference to a product already shown
+            result = await self.details_tool.execute(product_id=product_identifier, products=products)
             product = result.get('product', {})
             
             if not product:
                 return f"I couldn't find details for the product '{product_identifier}'."
             
             # Format the detailed response
-            response = f"## {product.get('title', 'Product Details')}\n\n"
-            
-            # Format price
-            price = product.get('price')
-            if price is not None:
-                if isinstance(price, (int, float)):
-                    price = f"${price:.2f}"
-                response += f"**Price:** {price}\n\n"
-            
-            # Add retailer
-            if retailer := product.get('retailer'):
-                response += f"**Retailer:** {retailer}\n\n"
+            product = product_card(product)
+            response = f"## {product['name']}\n\n"
+            response += f"**Price:** {format_price(product['currentPrice'])}\n\n"
+            response += f"**Retailer:** {product['retailer']}\n\n"
             
             # Add description
             if description := product.get('description'):
@@ -240,8 +162,8 @@ class ProductDetailsLangChainTool(BaseTool):
                 response += f"**Reviews:** {review_count}\n\n"
             
             # Add URL if available
-            if url := product.get('url'):
-                response += f"**Product Link:** {url}\n\n"
+            if product['productLink'] != '#':
+                response += f"**Product Link:** {product['productLink']}\n\n"
             
             return response
         except Exception as e:
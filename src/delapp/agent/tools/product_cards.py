@@ -0,0 +1,113 @@
+"""
+Product Cards for ShopAgent
+
+The one shape a product takes once it leaves the search provider. A
+ProductDeal, or a product dict in any of the older shapes (title/price/url,
+product_id, imageUrl, ...), is turned into a card by product_card exactly
+once; the search tool, the agent, the query and agent views, conversation
+state and the cart then pass the card along as it is.
+
+    {
+        'id': 'B0C1XYZ',                   # Provider product ID
+        'name': 'Sony WH-1000XM5',
+        'currentPrice': 348.0,
+        'originalPrice': 399.99,           # None when not discounted
+        'currency': 'USD',
+        'image_url': 'https://...',
+        'productLink': 'https://...',
+        'retailer': 'Best Buy',
+        'description': '...',
+        'rating': 4.7,                     # None when unknown
+        'review_count': 1250,              # None when unknown
+        'savings': {'amount': 51.99, 'percent': 12},  # Only when discounted
+        'priceContext': {...},             # Only when the catalog has price statistics
+    }
+
+The keys are the ones the frontend's DealCard component reads.
+"""
+from typing import Any, Dict, Optional
+import uuid
+
+from ..core.reference_resolver import parse_price
+
+PLACEHOLDER_IMAGE = 'https://via.placeholder.com/300x300.png?text=Product+Image'
+
+
+def _first(product: Dict[str, Any], *keys: str) -> Any:
+    """The first non-empty value among a dict's alternative keys"""
+    for key in keys:
+        value = product.get(key)
+        if value is not None and value != '':
+            return value
+    return None
+
+
+def _card(product_id: Any, name: Any, price: Any, original_price: Any, image_url: Any, url: Any,
+          retailer: Any, description: Any, rating: Any, review_count: Any, currency: Any,
+          price_context: Any) -> Dict[str, Any]:
+    current = parse_price(price)
+    if current is None:
+        current = 0.0
+    original = parse_price(original_price)
+
+    card = {
+        'id': str(product_id) if product_id else uuid.uuid4().hex,
+        'name': name or 'Product',
+        'currentPrice': current,
+        'originalPrice': original,
+        'currency': currency or 'USD',
+        'image_url': image_url or PLACEHOLDER_IMAGE,
+        'productLink': url or '#',
+        'retailer': retailer or 'Online retailer',
+        'description': description or '',
+        'rating': rating,
+        'review_count': review_count,
+    }
+    if original and original > current:
+        card['savings'] = {
+            'amount': round(original - current, 2),
+            'percent': int((original - current) / original * 100)
+        }
+    if price_context:
+        card['priceContext'] = price_context
+    return card
+
+
+def product_card(product: Any, price_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the card for a product.
+
+    Args:
+        product: A ProductDeal, a product dict in any of the older shapes, or a card
+        price_context: Catalog price statistics for the product, if known
+
+    Returns:
+        The product card
+    """
+    if isinstance(product, dict):
+        return _card(
+            _first(product, 'product_id', 'id'),
+            _first(product, 'name', 'title'),
+            _first(product, 'currentPrice', 'price'),
+            _first(product, 'originalPrice', 'original_price'),
+            _first(product, 'image_url', 'imageUrl', 'thumbnail'),
+            _first(product, 'productLink', 'url', 'link'),
+            _first(product, 'retailer', 'seller'),
+            product.get('description'),
+            _first(product, 'rating', 'product_star_rating'),
+            _first(product, 'review_count', 'reviewCount'),
+            product.get('currency'),
+            price_context or _first(product, 'priceContext', 'price_context'),
+        )
+    return _card(
+        product.product_id, product.title, product.price, product.original_price, product.image_url,
+        product.url, product.retailer, product.description, product.rating, product.review_count,
+        None, price_context,
+    )
+
+
+def format_price(price: Any) -> str:
+    """A price for display: '$19.99' for numbers, strings as they are"""
+    if isinstance(price, (int, float)):
+        return f"${price:.2f}"
+    return str(price) if price else 'Price not available'
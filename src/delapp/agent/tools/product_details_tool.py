@@ -8,6 +8,7 @@ from typing import Dict, Any, Optional, List, Union
 import logging
 
 from .base_tool import BaseTool
+from ..core.reference_resolver import get_reference_resolver
 from ...searchapi_io import DealAggregator
 
 logger = logging.getLogger(__name__)
@@ -21,16 +22,25 @@ class ProductDetailsTool(BaseTool):
             name="product_details",
             description="Retrieve detailed information about a specific product"
         )
-        self.provider = DealAggregator()
+        self._provider = None
+    
+    @property
+    def provider(self) -> DealAggregator:
+        """Created on first use, so products already in the conversation can be described without API keys"""
+        if self._provider is None:
+            self._provider = DealAggregator()
+        return self._provider
     
     async def execute(self,
                      product_id: str,
+                     products: Optional[List[Dict[str, Any]]] = None,
                      **kwargs) -> Dict[str, Any]:
         """
         Execute a product details request.
         
         Args:
-            product_id: ID of the product to retrieve details for
+            product_id: ID of the product, or a reference like "the second one"
+            products: Products already shown in the conversation, used to resolve references
             **kwargs: Additional parameters
             
         Returns:
@@ -39,6 +49,18 @@ class ProductDetailsTool(BaseTool):
         try:
             logger.info(f"Retrieving details for product: {product_id}")
             
+            # A product already shown in the conversation needs no new lookup
+            product = self._find_product(product_id, products or [])
+            if product is not None:
+                return {
+                    "success": True,
+                    "product": product,
+                    "product_details": {
+                        "product_id": product.get('product_id') or product.get('id'),
+                        "direct_url": product.get('productLink') or product.get('url') or product.get('link')
+                    }
+                }
+            
             # Get the direct retailer URL for the product
             retailer_url = await self.provider.provider.get_direct_retailer_url_async(product_id)
             
@@ -61,6 +83,17 @@ class ProductDetailsTool(BaseTool):
                 "product_details": None
             }
     
+    def _find_product(self, identifier: str, products: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Match an identifier against the products' IDs, then as a reference"""
+        for product in products:
+            if identifier in (product.get('product_id'), product.get('id')):
+                return product
+        reference = get_reference_resolver().resolve(identifier, products)
+        if reference is not None:
+            logger.info(f"Resolved '{identifier}' to product {reference.index + 1} by {reference.reason}")
+            return reference.product
+        return None
+    
     def _get_parameters_schema(self) -> Dict[str, Any]:
         """Define the parameters schema for the product details tool"""
         return {
@@ -68,7 +101,11 @@ class ProductDetailsTool(BaseTool):
             "properties": {
                 "product_id": {
                     "type": "string",
-                    "description": "ID of the product to retrieve details for"
+                    "description": "ID of the product, or a reference like 'the second one'"
+                },
+                "products": {
+                    "type": "array",
+                    "description": "Products already shown in the conversation"
                 }
             },
             "required": ["product_id"]
@@ -83,6 +120,10 @@ class ProductDetailsTool(BaseTool):
                     "type": "boolean",
                     "description": "Whether the details retrieval was successful"
                 },
+                "product": {
+                    "type": ["object", "null"],
+                    "description": "The conversation product the request resolved to"
+                },
                 "product_details": {
                     "type": ["object", "null"],
                     "description": "Detailed product information",
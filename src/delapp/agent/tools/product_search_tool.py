@@ -4,26 +4,151 @@ Product Search Tool for ShopAgent
 This tool handles searching for products based on natural language queries.
 It extracts relevant search parameters and uses SearchAPI.io to find products.
 """
-from typing import Dict, Any, Optional, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Any, Optional, List, Tuple, Union
+import atexit
 import json
 import logging
 import re
+import threading
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
 
 from .base_tool import BaseTool
+from .product_cards import product_card
 from ...searchapi_io import DealAggregator
+from products.services import ProductStorageService, product_key
+from ...tracing import span
 
 logger = logging.getLogger(__name__)
 
+
+def store_search_results(deals: List[Any]) -> bool:
+    """Upsert search results into the product catalog, on the catalog writer thread"""
+    close_old_connections()
+    try:
+        ProductStorageService.store_products(deals)
+        return True
+    except Exception as e:
+        # Catalog persistence must never break a user's search
+        logger.error(f"Error storing search results: {str(e)}", exc_info=True)
+        return False
+    finally:
+        close_old_connections()
+
+
+class CatalogWriter:
+    """
+    Upserts search results into the product catalog on one background thread.
+
+    Searches never wait for the catalog, and identical searches in one process
+    never race to insert the same product. Waiting deals are coalesced by
+    product, so a product found by many searches before the writer gets to it
+    is written once, with its latest deal. At most max_pending products wait;
+    while the writer is that far behind, deals for other products are dropped
+    and counted, and a later search finds them again.
+    """
+
+    def __init__(self, max_pending: int = 2000, batch_size: int = 200):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending: Dict[Tuple[str, str], Any] = {}
+        self._draining = False
+        self._full = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-writer')
+        self._counters = {'queued': 0, 'coalesced': 0, 'dropped': 0, 'written': 0, 'failed': 0}
+        atexit.register(self._report_unwritten)
+
+    def submit(self, deals: List[Any]) -> None:
+        """Queue deals for the catalog without waiting for the write"""
+        dropped = 0
+        with self._lock:
+            for deal in deals:
+                key = (str(deal.product_id), str(deal.retailer))
+                if key in self._pending:
+                    self._counters['coalesced'] += 1
+                elif len(self._pending) >= self.max_pending:
+                    dropped += 1
+                    continue
+                else:
+                    self._counters['queued'] += 1
+                self._pending[key] = deal
+            self._counters['dropped'] += dropped
+            # Warn once each time the backlog fills up, not on every search while it is full
+            warn = dropped and not self._full
+            if dropped:
+                self._full = True
+            start = bool(self._pending) and not self._draining
+            if start:
+                self._draining = True
+
+        if warn:
+            logger.warning(f"Catalog writer has {self.max_pending} products waiting; "
+                           f"dropping search results until it catches up")
+        if start:
+            try:
+                self._executor.submit(self._drain)
+            except RuntimeError:
+                # The interpreter is shutting down; _report_unwritten logs what is left
+                with self._lock:
+                    self._draining = False
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._draining = False
+                    self._full = False
+                    return
+                batch = [self._pending.pop(key) for key in list(islice(self._pending, self.batch_size))]
+                if len(self._pending) < self.max_pending:
+                    self._full = False
+            stored = store_search_results(batch)
+            with self._lock:
+                self._counters['written' if stored else 'failed'] += len(batch)
+
+    def _report_unwritten(self) -> None:
+        # Runs after the executor has finished its queue at interpreter exit
+        with self._lock:
+            unwritten = len(self._pending)
+        if unwritten:
+            logger.warning(f"Catalog writer stopped with {unwritten} products not written")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._pending)
+            stats['max_pending'] = self.max_pending
+        return stats
+
+
+_catalog_writer = CatalogWriter()
+
+
+def catalog_writer_stats() -> Dict[str, Any]:
+    """Counters and backlog of the catalog writer, for the agent metrics endpoint"""
+    return _catalog_writer.stats()
+
+
 class ProductSearchTool(BaseTool):
     """Tool for searching products based on various criteria"""
     
-    def __init__(self):
-        """Initialize the product search tool with the DealAggregator"""
+    def __init__(self, provider: Optional[Any] = None, persist_results: bool = True):
+        """
+        Initialize the product search tool.
+        
+        Args:
+            provider: Anything with DealAggregator's search_deals_async, a DealAggregator by default
+            persist_results: Whether to upsert the results into the product catalog
+        """
         super().__init__(
             name="product_search",
             description="Search for products based on natural language queries and specific criteria"
         )
-        self.provider = DealAggregator()
+        self.provider = provider or DealAggregator()
+        self.persist_results = persist_results
     
     async def execute(self, 
                      query: str, 
@@ -55,26 +180,38 @@ class ProductSearchTool(BaseTool):
                     logger.info(f"Extracted max price from query: ${max_price}")
             
             # Execute the search
-            results = await self.provider.search_deals_async(
-                query=query,
-                min_price=min_price,
-                max_price=max_price,
-                max_results=max_results
-            )
+            with span('search.provider'):
+                results = await self.provider.search_deals_async(
+                    query=query,
+                    min_price=min_price,
+                    max_price=max_price,
+                    max_results=max_results
+                )
             
             # Log the raw results structure to debug
             logger.debug(f"Raw search results keys: {list(results.keys()) if isinstance(results, dict) else 'Not a dict'}") 
             if isinstance(results, dict) and 'searchapi' in results:
                 logger.debug(f"Number of raw products in searchapi: {len(results['searchapi'])}")            
             
-            # Format the search results
-            products = self._format_search_results(results)
+            # One indexed read of the catalog's price statistics; the upsert runs in the background
+            deals = self._catalog_deals(results)
+            with span('search.price_context'):
+                price_context = await self._price_context(deals)
+            if deals and self.persist_results:
+                _catalog_writer.submit(deals)
+            
+            # Build the product cards, once
+            with span('search.format'):
+                products = self._format_search_results(results, price_context)
             logger.info(f"Formatted {len(products)} products from search results")
             
             # If the API returned no products (e.g., due to quota limits), provide mock data for testing
             if not products:
                 logger.warning("No products returned from API, using mock data for testing")
-                products = self._generate_mock_products(query, min_price, max_price, max_results)
+                products = [
+                    product_card(product)
+                    for product in self._generate_mock_products(query, min_price, max_price, max_results)
+                ]
                 logger.info(f"Generated {len(products)} mock products for testing")
                 return {
                     "success": True,
@@ -91,7 +228,7 @@ class ProductSearchTool(BaseTool):
             
             # Log a sample product if available
             if products and len(products) > 0:
-                logger.debug(f"Sample product after formatting: {products[0]['title']} - ${products[0]['price']}")
+                logger.debug(f"Sample product after formatting: {products[0]['name']} - ${products[0]['currentPrice']}")
             
             return {
                 "success": True,
@@ -114,6 +251,25 @@ class ProductSearchTool(BaseTool):
                 "count": 0
             }
             
+    async def _price_context(self, deals: List[Any]) -> Dict[str, Dict[str, Any]]:
+        """Catalog price statistics for the deals, keyed by product_key"""
+        if not deals:
+            return {}
+        try:
+            return await sync_to_async(ProductStorageService.get_price_contexts)(deals)
+        except Exception as e:
+            # Price context is a bonus; the search result stands without it
+            logger.error(f"Error reading price statistics: {str(e)}")
+            return {}
+
+    @staticmethod
+    def _catalog_deals(results: Dict[str, Any]) -> List[Any]:
+        """The provider results that can be kept in the product catalog"""
+        return [
+            deal for deal in (results.get('searchapi', []) if isinstance(results, dict) else [])
+            if not isinstance(deal, dict) and getattr(deal, 'product_id', None)
+        ]
+    
     def _generate_mock_products(self, query: str, min_price: Optional[float] = None,
                               max_price: Optional[float] = None, max_results: int = 10) -> List[Dict[str, Any]]:
         """
@@ -284,19 +440,19 @@ class ProductSearchTool(BaseTool):
         
         return None
     
-    def _format_search_results(self, results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _format_search_results(self, results: Dict[str, Any],
+                               price_context: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """
-        Format the search results into a standardized product list.
+        Turn the search results into product cards.
         
         Args:
             results: Raw search results from the provider
+            price_context: product_key(product_id, retailer) to catalog price statistics
             
         Returns:
-            List of standardized product dictionaries
+            List of product cards
         """
-        formatted_products = []
-        
-        # Handle different possible data structures
+        price_context = price_context or {}
         raw_products = []
         
         # Check for searchapi key (the actual key used by DealAggregator)
@@ -304,75 +460,33 @@ class ProductSearchTool(BaseTool):
             if 'searchapi' in results:
                 # This is the primary format from DealAggregator
                 raw_products = results['searchapi']
-                logger.debug(f"Found {len(raw_products)} products in 'searchapi' key")
             elif 'products' in results:
                 # Alternative format
                 raw_products = results['products']
-                logger.debug(f"Found {len(raw_products)} products in 'products' key")
-            elif len(results) > 0:
+            else:
                 # Maybe it's a direct list of products in a dict?
                 logger.debug(f"No standard keys found, available keys: {list(results.keys())}")
-                # Try to use all values as potential products
-                for key, value in results.items():
+                for value in results.values():
                     if isinstance(value, list):
                         raw_products.extend(value)
         elif isinstance(results, list):
             # Direct list of products
             raw_products = results
-            logger.debug(f"Results was a direct list with {len(raw_products)} items")
         
-        # Process each product, handling different object types
+        cards = []
         for product in raw_products:
             try:
-                # Handle both dictionary and ProductDeal object formats
-                if isinstance(product, dict):
-                    # Convert dict to our standard format
-                    formatted_product = {
-                        'product_id': product.get('product_id', product.get('id', '')),
-                        'title': product.get('title', ''),
-                        'price': product.get('price', 0),
-                        'original_price': product.get('original_price', product.get('originalPrice')),
-                        'url': product.get('url', product.get('link', '')),
-                        'image_url': product.get('image_url', product.get('imageUrl', '')),
-                        'retailer': product.get('retailer', product.get('seller', 'Unknown')),
-                        'description': product.get('description', ''),
-                        'rating': product.get('rating', product.get('product_star_rating')),
-                        'review_count': product.get('review_count', product.get('reviewCount')),
-                        'condition': product.get('condition', 'New'),
-                        'shipping_info': product.get('shipping_info', '')
-                    }
-                else:
-                    # Try to handle ProductDeal objects by extracting attributes
-                    try:
-                        # Using getattr to be safe with different object types
-                        formatted_product = {
-                            'product_id': getattr(product, 'product_id', ''),
-                            'title': getattr(product, 'title', ''),
-                            'price': getattr(product, 'price', 0),
-                            'original_price': getattr(product, 'original_price', None),
-                            'url': getattr(product, 'url', ''),
-                            'image_url': getattr(product, 'image_url', ''),
-                            'retailer': getattr(product, 'retailer', 'Unknown'),
-                            'description': getattr(product, 'description', ''),
-                            'rating': getattr(product, 'rating', None),
-                            'review_count': getattr(product, 'review_count', None),
-                            'condition': getattr(product, 'condition', 'New'),
-                            'shipping_info': getattr(product, 'shipping_info', '')
-                        }
-                    except AttributeError:
-                        # Skip objects we can't process
-                        logger.warning(f"Couldn't extract attributes from product object: {type(product)}")
-                        continue
-                
-                # Add to our formatted products list
-                formatted_products.append(formatted_product)
-                
+                context = None
+                if price_context and not isinstance(product, dict):
+                    context = price_context.get(product_key(product.product_id, product.retailer))
+                cards.append(product_card(product, context))
             except Exception as e:
-                logger.error(f"Error formatting product: {str(e)}")
+                # Skip objects we can't process
+                logger.error(f"Error formatting product {type(product)}: {str(e)}")
                 continue
             
-        logger.info(f"Successfully formatted {len(formatted_products)} products out of {len(raw_products)} raw products")
-        return formatted_products
+        logger.info(f"Successfully formatted {len(cards)} products out of {len(raw_products)} raw products")
+        return cards
     
     def _get_parameters_schema(self) -> Dict[str, Any]:
         """Define the parameters schema for the product search tool"""
@@ -411,22 +525,23 @@ class ProductSearchTool(BaseTool):
                 },
                 "products": {
                     "type": "array",
-                    "description": "List of product results",
+                    "description": "Product cards, see product_cards.product_card",
                     "items": {
                         "type": "object",
                         "properties": {
-                            "product_id": {"type": "string"},
-                            "title": {"type": "string"},
-                            "price": {"type": ["number", "string"]},
-                            "original_price": {"type": ["number", "string", "null"]},
-                            "url": {"type": "string"},
+                            "id": {"type": "string"},
+                            "name": {"type": "string"},
+                            "currentPrice": {"type": "number"},
+                            "originalPrice": {"type": ["number", "null"]},
+                            "currency": {"type": "string"},
                             "image_url": {"type": "string"},
+                            "productLink": {"type": "string"},
                             "retailer": {"type": "string"},
                             "description": {"type": "string"},
                             "rating": {"type": ["number", "null"]},
                             "review_count": {"type": ["integer", "null"]},
-                            "condition": {"type": "string"},
-                            "shipping_info": {"type": "string"}
+                            "savings": {"type": "object"},
+                            "priceContext": {"type": "object"}
                         }
                     }
                 },
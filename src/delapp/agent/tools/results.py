@@ -0,0 +1,35 @@
+"""
+Tool Results for ShopAgent
+
+Typed results the tools hand back to the agent in-process. The agent reads
+them as objects; they only become JSON where a string is required, which is
+LangChain's LLM-facing tool interface (`to_json`). The HTTP views serialize
+the products along with the rest of their response.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from ...renderers import dumps
+
+
+@dataclass
+class SearchResult:
+    """Outcome of a product search: the reply text and the product cards"""
+    text: str
+    products: List[Dict[str, Any]] = field(default_factory=list)
+    success: bool = True
+    mock_data: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'text': self.text,
+            'products': self.products,
+            'success': self.success,
+            'has_products': bool(self.products),  # Explicit flag for frontend to show products
+            'mock_data': self.mock_data,
+            'product_count': len(self.products),
+        }
+
+    def to_json(self) -> str:
+        """The string form LangChain hands to the LLM"""
+        return dumps(self.to_dict()).decode()
@@ -12,9 +12,17 @@ from . import cart_endpoints
 urlpatterns = [
     # Conversation API
     path('api/agent/query/', agent_views.agent_query_view, name='agent_query'),
+    path('api/agent/query/stream/', agent_views.agent_query_stream_view, name='agent_query_stream'),
+    path('api/agent/metrics/', agent_views.agent_metrics_view, name='agent_metrics'),
     path('api/conversations/', agent_views.get_conversations_view, name='get_conversations'),
     path('api/conversations/<str:conversation_id>/messages/', 
          agent_views.get_conversation_messages_view, name='get_conversation_messages'),
+    path('api/conversations/<str:conversation_id>/messages/<int:message_id>/products/',
+         agent_views.get_conversation_message_products_view, name='get_conversation_message_products'),
+    path('api/conversations/<str:conversation_id>/clear/',
+         agent_views.clear_conversation_view, name='clear_conversation'),
+    path('api/conversations/<str:conversation_id>/archive/',
+         agent_views.archive_conversation_view, name='archive_conversation'),
     
     # Cart API
     path('api/cart/add/', cart_endpoints.add_to_cart_view, name='add_to_cart'),
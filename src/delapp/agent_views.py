@@ -6,22 +6,29 @@ handling user queries and conversation management.
 """
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework import status
-import json
 import logging
-import asyncio
+import orjson
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.conf import settings
+from django.db.models import Count, Max
 
+from .async_views import async_api_view
+from .http_cache import cache_policy, etag_matches, make_etag, not_modified
 from .models import Conversation, ConversationMessage, ConversationState
-from .agent.api import process_query
+from .pagination import keyset_page, parse_page_size
+from .agent.api import (
+    process_query, stream_query, get_agent_metrics, clear_conversation, archive_conversation
+)
+from .tracing import span
 
 logger = logging.getLogger(__name__)
 
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([AllowAny])
-def agent_query_view(request):
+async def agent_query_view(request):
     """
     Process a user query using the agent-based architecture
     
@@ -48,18 +55,19 @@ def agent_query_view(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Process the query
-        result = asyncio.run(process_query(
+        result = await process_query(
             query=query,
             conversation_id=conversation_id,
             user_id=user_id,
-            session_id=session_id
-        ))
+            session_id=session_id,
+            endpoint='agent_query'
+        )
         
         # Extract response data
         response_data = {
             'success': True,
             'message': result.get('response', ''),
-            'conversation_id': result.get('conversation_id') or conversation_id,
+            'conversation_id': result.get('conversation_id'),
             'products': result.get('products', []),
             'followup_questions': result.get('followup_questions', []),
         }
@@ -88,11 +96,88 @@ def agent_query_view(request):
             'conversation_id': conversation_id
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _sse_event(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
+
+async def _agent_event_stream(query, conversation_id, user_id, session_id):
+    """Turn agent events into server-sent events, ending with the final state"""
+    # Open the stream straight away so proxies and browsers start rendering
+    yield ": stream open\n\n"
+    # The request's own trace ended when the response started, so the stream is traced on its own
+    with span('request.stream', conversation_id=conversation_id):
+        async for event in stream_query(
+            query=query,
+            conversation_id=conversation_id,
+            user_id=user_id,
+            session_id=session_id,
+            endpoint='agent_stream'
+        ):
+            if event['event'] == 'final':
+                result = event['data']
+                yield _sse_event('final', {
+                    'success': 'error' not in result,
+                    'message': result.get('response', ''),
+                    'conversation_id': result.get('conversation_id'),
+                    'products': result.get('products', []),
+                    'followup_questions': result.get('followup_questions', []),
+                })
+            else:
+                yield _sse_event(event['event'], event['data'])
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def agent_query_stream_view(request):
+    """
+    Process a user query and stream the answer as server-sent events
+    
+    Events, in order: intent, products (when a search ran), token (pieces of
+    the LLM answer), final (the same payload agent_query_view returns).
+    
+    POST parameters:
+    - query: User's natural language query
+    - conversation_id: (Optional) ID of the conversation
+    - session_id: (Optional) Session ID for anonymous users
+    """
+    data = request.data
+    query = data.get('query', '').strip()
+    conversation_id = data.get('conversation_id')
+    session_id = data.get('session_id') or request.COOKIES.get('sessionid')
+    user_id = str(request.user.id) if request.user.is_authenticated else None
+    
+    if not query:
+        return Response({
+            'success': False,
+            'error': 'No query provided'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(
+        _agent_event_stream(query, conversation_id, user_id, session_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    
+    if session_id and not request.user.is_authenticated:
+        response.set_cookie('sessionid', session_id, max_age=86400*30)
+    
+    return response
+
+@cache_policy()
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_conversations_view(request):
     """
-    Get the user's conversation history
+    Get one page of the user's conversation history, most recently updated first
+    
+    GET parameters:
+    - cursor: (Optional) next_cursor of the previous page; omit for the first page
+    - limit: (Optional) Conversations per page, at most 100
+    
+    The response carries an ETag derived from the user's latest update, so
+    polling clients sending If-None-Match get 304 Not Modified after a
+    single indexed aggregate query.
     """
     try:
         # Only return conversations for authenticated users
@@ -103,24 +188,45 @@ def get_conversations_view(request):
                 'conversations': []
             }, status=status.HTTP_401_UNAUTHORIZED)
         
-        # Get all active conversations for the user
-        conversations = Conversation.objects.filter(user=request.user, active=True).order_by('-updated_at')
+        conversations = Conversation.objects.filter(user=request.user, active=True)
+        
+        # Any new, updated or archived conversation changes the latest update or the count
+        latest = conversations.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+        etag = make_etag('conversations', request.user.id, latest['updated_at'], latest['count'],
+                         request.GET.urlencode())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        
+        try:
+            limit = parse_page_size(request.query_params.get('limit'))
+            page, next_cursor = keyset_page(
+                conversations.only('id', 'title', 'created_at', 'updated_at'),
+                request.query_params.get('cursor'), limit, field='updated_at'
+            )
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e),
+                'conversations': []
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Format the conversations
         formatted_conversations = [
             {
                 'id': str(conversation.id),
-                'title': conversation.title or f"Conversation {idx+1}",
+                'title': conversation.title or f"Conversation {conversation.id}",
                 'created_at': conversation.created_at.isoformat(),
                 'updated_at': conversation.updated_at.isoformat()
             }
-            for idx, conversation in enumerate(conversations)
+            for conversation in page
         ]
         
         return Response({
             'success': True,
-            'conversations': formatted_conversations
-        })
+            'conversations': formatted_conversations,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }, headers={'ETag': etag})
     
     except Exception as e:
         logger.error(f"Error in get_conversations_view: {str(e)}", exc_info=True)
@@ -130,20 +236,30 @@ def get_conversations_view(request):
             'conversations': []
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _get_conversation(request, conversation_id):
+    """The conversation, restricted to the requesting user when authenticated"""
+    if request.user.is_authenticated:
+        return Conversation.objects.get(id=conversation_id, user=request.user)
+    return Conversation.objects.get(id=conversation_id)
+
+@cache_policy()
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_conversation_messages_view(request, conversation_id):
     """
-    Get messages for a specific conversation
+    Get one page of messages for a specific conversation, newest page first
+    
+    GET parameters:
+    - cursor: (Optional) next_cursor of the previous page; omit for the newest page
+    - limit: (Optional) Messages per page, at most 100
+    
+    Messages within a page are oldest first. Their search results are left
+    out; fetch them per message from get_conversation_message_products_view.
     """
     try:
         # Find the conversation
         try:
-            # For authenticated users, ensure the conversation belongs to them
-            if request.user.is_authenticated:
-                conversation = Conversation.objects.get(id=conversation_id, user=request.user)
-            else:
-                conversation = Conversation.objects.get(id=conversation_id)
+            conversation = _get_conversation(request, conversation_id)
         except Conversation.DoesNotExist:
             return Response({
                 'success': False,
@@ -151,8 +267,19 @@ def get_conversation_messages_view(request, conversation_id):
                 'messages': []
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Get all messages for the conversation
-        messages = ConversationMessage.objects.filter(conversation=conversation).order_by('created_at')
+        cursor = request.query_params.get('cursor')
+        try:
+            limit = parse_page_size(request.query_params.get('limit'))
+            messages, next_cursor = keyset_page(
+                ConversationMessage.objects.filter(conversation=conversation).defer('search_results'),
+                cursor, limit
+            )
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e),
+                'messages': []
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Format the messages
         formatted_messages = [
@@ -161,25 +288,25 @@ def get_conversation_messages_view(request, conversation_id):
                 'role': message.role,
                 'content': message.content,
                 'created_at': message.created_at.isoformat(),
-                'has_products': message.has_products,
-                'search_results': message.search_results
+                'has_products': message.has_products
             }
-            for message in messages
+            for message in reversed(messages)
         ]
         
-        # Get conversation state
-        try:
-            state = ConversationState.objects.get(conversation=conversation)
-            current_products = state.current_products
-        except ConversationState.DoesNotExist:
-            current_products = []
-        
-        return Response({
+        response = {
             'success': True,
             'conversation_id': conversation_id,
             'messages': formatted_messages,
-            'current_products': current_products
-        })
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }
+        
+        # The products currently on screen only matter when opening the conversation
+        if not cursor:
+            state = ConversationState.objects.filter(conversation=conversation).only('current_products').first()
+            response['current_products'] = state.current_products if state else []
+        
+        return Response(response)
     
     except Exception as e:
         logger.error(f"Error in get_conversation_messages_view: {str(e)}", exc_info=True)
@@ -188,3 +315,83 @@ def get_conversation_messages_view(request, conversation_id):
             'error': str(e),
             'messages': []
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# A message's products never change once it is saved
+@cache_policy(max_age=3600)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_conversation_message_products_view(request, conversation_id, message_id):
+    """
+    Get the search results stored with one message of a conversation
+    """
+    try:
+        try:
+            conversation = _get_conversation(request, conversation_id)
+            message = ConversationMessage.objects.only('id', 'search_results').get(
+                id=message_id, conversation=conversation
+            )
+        except (Conversation.DoesNotExist, ConversationMessage.DoesNotExist):
+            return Response({
+                'success': False,
+                'error': 'Message not found',
+                'products': []
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'success': True,
+            'message_id': str(message.id),
+            'products': message.search_results or []
+        })
+    
+    except Exception as e:
+        logger.error(f"Error in get_conversation_message_products_view: {str(e)}", exc_info=True)
+        return Response({
+            'success': False,
+            'error': str(e),
+            'products': []
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+async def _change_conversation(request, conversation_id, change):
+    """Apply clear_conversation or archive_conversation for the requesting user or session"""
+    user_id = str(request.user.id) if request.user.is_authenticated else None
+    session_id = request.data.get('session_id') or request.COOKIES.get('sessionid')
+    result = await change(conversation_id, user_id=user_id, session_id=session_id)
+    if result['success']:
+        return Response({'success': True, 'conversation_id': conversation_id})
+    if result.get('error') == 'Conversation not found':
+        return Response(result, status=status.HTTP_404_NOT_FOUND)
+    return Response(result, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@async_api_view(['POST'])
+@permission_classes([AllowAny])
+async def clear_conversation_view(request, conversation_id):
+    """
+    Delete a conversation's messages and reset what the agent remembers about it
+    
+    POST parameters:
+    - session_id: (Optional) Session ID for anonymous users
+    """
+    return await _change_conversation(request, conversation_id, clear_conversation)
+
+@async_api_view(['POST'])
+@permission_classes([AllowAny])
+async def archive_conversation_view(request, conversation_id):
+    """
+    Archive a conversation so it no longer appears in the conversation list
+    
+    POST parameters:
+    - session_id: (Optional) Session ID for anonymous users
+    """
+    return await _change_conversation(request, conversation_id, archive_conversation)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def agent_metrics_view(request):
+    """
+    Report in-process agent metrics: LLM response cache and speculative search hit
+    rates, chat windows, LLM backends and per-stage latency histograms
+    """
+    return Response({
+        'success': True,
+        **get_agent_metrics()
+    })
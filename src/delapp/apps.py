@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class DelappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "delapp"
+
+    def ready(self):
+        from products.events import change_bus
+        from .cart_updates import apply_product_change
+
+        # Saved cart items follow catalog price and availability changes
+        change_bus.subscribe(apply_product_change)
@@ -0,0 +1,102 @@
+"""
+Async DRF Views
+
+DRF's APIView dispatches synchronously, so under the ASGI server every DRF
+view runs in a worker thread, and views that call the agent had to start an
+event loop of their own (asyncio.run) for each request. That loop dies with
+the request, taking the connections of the aiohttp sessions bound to it.
+
+AsyncAPIView dispatches as a coroutine on the server's event loop instead.
+Authentication, permission and throttle checks, which can hit the database,
+run in a worker thread through sync_to_async; the handler itself is awaited
+in place. Handlers must offload their own ORM work the same way.
+
+Function views use async_api_view exactly like DRF's api_view:
+
+    @async_api_view(['POST'])
+    @permission_classes([AllowAny])
+    async def agent_query_view(request):
+        result = await process_query(...)
+        return Response(result)
+
+and viewsets subclass AsyncViewSet and declare their actions `async def`.
+"""
+from typing import Callable, List, Optional
+import types
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.utils.decorators import classonlymethod
+from rest_framework.views import APIView
+from rest_framework.viewsets import ViewSetMixin
+
+
+class AsyncAPIView(APIView):
+    """APIView whose handlers are coroutines, dispatched on the server's event loop"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        """APIView.dispatch with the handler awaited and the sync checks in a worker thread"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if isinstance(response, types.CoroutineType):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncViewSet(ViewSetMixin, AsyncAPIView):
+    """ViewSet whose actions are coroutines"""
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        # ViewSetMixin binds the actions per request, so Django cannot tell the view is async
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
+
+
+def async_api_view(http_method_names: Optional[List[str]] = None) -> Callable:
+    """
+    DRF's api_view for `async def` function views.
+
+    Reads the renderer, parser, authentication, throttle and permission
+    classes set by DRF's decorators, like api_view does.
+    """
+    http_method_names = ['GET'] if http_method_names is None else http_method_names
+
+    def decorator(func):
+        assert isinstance(http_method_names, (list, tuple)), \
+            f"@async_api_view expected a list of strings, received {type(http_method_names).__name__}"
+
+        WrappedAPIView = type('WrappedAPIView', (AsyncAPIView,), {'__doc__': func.__doc__})
+        WrappedAPIView.http_method_names = [method.lower() for method in set(http_method_names) | {'options'}]
+
+        async def handler(self, *args, **kwargs):
+            return await func(*args, **kwargs)
+
+        for method in http_method_names:
+            setattr(WrappedAPIView, method.lower(), handler)
+
+        WrappedAPIView.__name__ = func.__name__
+        WrappedAPIView.__module__ = func.__module__
+        for attribute in ('renderer_classes', 'parser_classes', 'authentication_classes',
+                          'throttle_classes', 'permission_classes', 'schema'):
+            setattr(WrappedAPIView, attribute, getattr(func, attribute, getattr(APIView, attribute)))
+
+        return WrappedAPIView.as_view()
+
+    return decorator
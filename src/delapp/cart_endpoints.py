@@ -4,21 +4,21 @@ Cart API Endpoints
 This module provides RESTful API endpoints for cart operations, including adding, viewing,
 and removing items from the shopping cart.
 """
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework import status
 import json
 import logging
-import asyncio
 
 from .agent.api import add_to_cart, view_cart, remove_from_cart
+from .async_views import async_api_view
 
 logger = logging.getLogger(__name__)
 
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([AllowAny])
-def add_to_cart_view(request):
+async def add_to_cart_view(request):
     """
     Add a product to the cart
     
@@ -52,12 +52,12 @@ def add_to_cart_view(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Add to cart
-        result = asyncio.run(add_to_cart(
+        result = await add_to_cart(
             product_data=product_data,
             user_id=user_id,
             session_id=session_id,
             conversation_id=conversation_id
-        ))
+        )
         
         # Create response with session ID if provided
         response = Response(result)
@@ -75,9 +75,9 @@ def add_to_cart_view(request):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['GET', 'POST'])
+@async_api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
-def view_cart_view(request):
+async def view_cart_view(request):
     """
     View the current cart contents
     
@@ -107,10 +107,10 @@ def view_cart_view(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # View cart
-        result = asyncio.run(view_cart(
+        result = await view_cart(
             user_id=user_id,
             session_id=session_id
-        ))
+        )
         
         return Response(result)
     
@@ -122,9 +122,9 @@ def view_cart_view(request):
             'cart_items': []
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([AllowAny])
-def remove_from_cart_view(request):
+async def remove_from_cart_view(request):
     """
     Remove item(s) from the cart
     
@@ -156,11 +156,11 @@ def remove_from_cart_view(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Remove from cart
-        result = asyncio.run(remove_from_cart(
+        result = await remove_from_cart(
             product_indices=product_indices,
             user_id=user_id,
             session_id=session_id
-        ))
+        )
         
         return Response(result)
     
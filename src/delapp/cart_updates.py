@@ -0,0 +1,36 @@
+"""
+Cart Updates
+
+Keeps saved cart items in step with the product catalog. DelappConfig.ready
+subscribes apply_product_change to the products app's change bus, so when a
+search or a re-pricing run records a new price or a change in availability,
+every cart holding that product shows it on its next view without polling.
+
+The bus only reaches the process that wrote the change; saved items for
+products written by other workers are updated by those workers.
+"""
+from typing import Any, Dict
+
+from products.events import PRICE_CHANGED
+
+from .models import SavedItem
+
+
+def apply_product_change(event: Dict[str, Any]) -> None:
+    """Copy one price or availability change onto the saved items for its product"""
+    items = SavedItem.objects.filter(product_id=event['product_id'])
+
+    if event['type'] == PRICE_CHANGED:
+        if event['price'] is not None:
+            items.update(price=event['price'])
+        return
+
+    # Availability lives with the stored product card; only rows that disagree are rewritten
+    changed = []
+    for item in items.only('id', 'metadata'):
+        metadata = item.metadata if isinstance(item.metadata, dict) else {}
+        if metadata.get('available') != event['available']:
+            item.metadata = {**metadata, 'available': event['available']}
+            changed.append(item)
+    if changed:
+        SavedItem.objects.bulk_update(changed, ['metadata'])
@@ -1,21 +1,25 @@
-from rest_framework import viewsets, status
+from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
 from django.utils import timezone
 import logging
 import json
-import asyncio
+from asgiref.sync import sync_to_async
 
 from .models import Cart, SavedItem, Conversation
 # Import the agent-based cart operations
 from .agent.api import add_to_cart, view_cart, remove_from_cart
+from .async_views import AsyncViewSet
 
 logger = logging.getLogger(__name__)
 
-class CartViewSet(viewsets.ViewSet):
+class CartViewSet(AsyncViewSet):
     """
     ViewSet for cart operations - view, add, and remove items
+    
+    The actions run on the server's event loop; get_cart touches the session
+    and the database, so they call it through sync_to_async.
     """
     permission_classes = [AllowAny]  # Allow anonymous users
     
@@ -46,21 +50,21 @@ class CartViewSet(viewsets.ViewSet):
         return cart
     
     @action(detail=False, methods=['get'])
-    def view(self, request):
+    async def view(self, request):
         """View cart contents (using agent-based implementation)"""
         try:
             # Get cart for compatibility
-            cart = self.get_cart(request)
+            cart = await sync_to_async(self.get_cart)(request)
             
             # Get user ID or session ID
             user_id = str(request.user.id) if request.user.is_authenticated else None
             session_id = cart.session_id
             
             # Call agent-based implementation
-            result = asyncio.run(view_cart(
+            result = await view_cart(
                 user_id=user_id,
                 session_id=session_id
-            ))
+            )
             
             # Map agent response to legacy format for compatibility
             if result.get('success', False):
@@ -99,40 +103,24 @@ class CartViewSet(viewsets.ViewSet):
             return Response({'error': 'Failed to retrieve cart'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=False, methods=['post'])
-    def add_item(self, request):
+    async def add_item(self, request):
         """Add item to cart (using agent-based implementation)"""
         try:
             product_data = request.data
-            cart = self.get_cart(request)  # For compatibility
+            cart = await sync_to_async(self.get_cart)(request)  # For compatibility
             
             # Get user ID or session ID
             user_id = str(request.user.id) if request.user.is_authenticated else None
             session_id = cart.session_id
             conversation_id = request.data.get('conversation_id')
             
-            # Normalize product data for agent
-            normalized_product = {}
-            # Copy all fields from request data
-            for key, value in product_data.items():
-                normalized_product[key] = value
-            
-            # Ensure required fields are present with standard names
-            if 'product_id' not in normalized_product and 'id' in product_data:
-                normalized_product['product_id'] = product_data['id']
-            
-            if 'title' not in normalized_product and 'name' in product_data:
-                normalized_product['title'] = product_data['name']
-                
-            if 'price' not in normalized_product and 'currentPrice' in product_data:
-                normalized_product['price'] = product_data['currentPrice']
-                
-            # Call agent-based implementation
-            result = asyncio.run(add_to_cart(
-                product_data=normalized_product,
+            # Call agent-based implementation; the cart tool turns the posted product into a card
+            result = await add_to_cart(
+                product_data=dict(product_data),
                 user_id=user_id,
                 session_id=session_id,
                 conversation_id=conversation_id
-            ))
+            )
             
             # Map agent response to legacy format
             if result.get('success', False):
@@ -157,10 +145,10 @@ class CartViewSet(viewsets.ViewSet):
             return Response({'error': 'Failed to add item to cart'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=False, methods=['post'])
-    def remove_item(self, request):
+    async def remove_item(self, request):
         """Remove item from cart (using agent-based implementation)"""
         try:
-            cart = self.get_cart(request)  # For compatibility
+            cart = await sync_to_async(self.get_cart)(request)  # For compatibility
             item_id = request.data.get('item_id')
             remove_all = request.data.get('remove_all', False)
             
@@ -181,11 +169,11 @@ class CartViewSet(viewsets.ViewSet):
                 return Response({'error': 'Item ID is required'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Call agent-based implementation
-            result = asyncio.run(remove_from_cart(
+            result = await remove_from_cart(
                 product_indices=product_indices,
                 user_id=user_id,
                 session_id=session_id
-            ))
+            )
             
             # Map agent response to legacy format
             if result.get('success', False):
@@ -0,0 +1,108 @@
+"""
+HTTP Caching Policy
+
+Views declare how their responses may be cached, and HTTPCacheMiddleware
+(delapp/middleware.py) writes the headers. A function view is decorated
+above its api_view decorator, a class view sets a class attribute:
+
+    @cache_policy(max_age=3600)
+    @api_view(['GET'])
+    def get_conversation_message_products_view(request, conversation_id, message_id):
+        ...
+
+    class VerifyEmailView(APIView):
+        cache_policy = CachePolicy(no_store=True)
+
+Successful GET and HEAD responses get the view's Cache-Control and Vary
+headers and, unless the view set one, an ETag hashed from the content; a
+request whose If-None-Match names it gets an empty 304 instead of the body.
+DRF views without a declaration are private and revalidated every time.
+no-store is kept for what must never be stored: responses to other methods,
+errors, responses setting cookies and views that declare it.
+
+Views that can tell cheaply that nothing changed compute their ETag before
+building the response and skip the work altogether:
+
+    etag = make_etag(request.user.id, latest, count, request.GET.urlencode())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Tuple
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+NO_STORE = 'no-cache, no-store, must-revalidate, max-age=0'
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """How a view's successful responses may be cached"""
+    max_age: int = 0
+    private: bool = True
+    etag: bool = True
+    vary: Tuple[str, ...] = ('Authorization',)
+    no_store: bool = False
+
+    @property
+    def cache_control(self) -> str:
+        if self.no_store:
+            return NO_STORE
+        scope = 'private' if self.private else 'public'
+        # max-age=0 alone lets caches serve a stale copy when the origin is down; no-cache does not
+        return f"{scope}, max-age={self.max_age}" if self.max_age else f"{scope}, no-cache"
+
+
+DEFAULT_POLICY = CachePolicy()
+
+
+def cache_policy(**options: Any) -> Callable:
+    """Declare the view's CachePolicy; the options are CachePolicy's fields"""
+    policy = CachePolicy(**options)
+
+    def decorator(view):
+        view.cache_policy = policy
+        return view
+
+    return decorator
+
+
+def get_cache_policy(request) -> Optional[CachePolicy]:
+    """The policy declared by the view that handled request, if any"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view = match.func
+    policy = getattr(view, 'cache_policy', None)
+    if policy is None:
+        # Class-based views and viewsets declare it on the class
+        policy = getattr(getattr(view, 'cls', None), 'cache_policy', None)
+    return policy
+
+
+def make_etag(*parts: Any) -> str:
+    """Quoted strong ETag for the given values"""
+    digest = hashlib.blake2b('|'.join(str(part) for part in parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def content_etag(content: bytes) -> str:
+    """Quoted strong ETag for a response body"""
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(request, etag: str) -> bool:
+    """Whether the request's If-None-Match names etag, compared weakly as RFC 9110 asks for GET"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag.removeprefix('W/') in (tag.removeprefix('W/') for tag in etags)
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response for a client that already holds the current version"""
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
@@ -0,0 +1,186 @@
+"""
+User Query Load Test
+
+Sends concurrent requests to user_query_api_view through Django's in-process
+ASGI client and watches the database connections while they run. The agent
+is the offline benchmark agent (delapp/agent/benchmark.py), so SearchAPI.io
+and the LLM take a simulated, configurable time and no API keys are needed.
+
+TransactionMonitor records the transactions the requests hold open. An
+execute wrapper on every connection notes when a connection first queries
+inside an atomic block, and an on_commit callback notes when it commits. The
+report gives how many transactions were open at once, on average over the
+run and at peak, and how long they stayed open. A view that holds its
+transaction across the agent call keeps one connection busy per request in
+flight; with short transactions the average stays far below the concurrency.
+On SQLite, transactions waiting for the database lock count as open.
+
+The requests write real rows under a throwaway user, which is deleted along
+with its conversations at the end. The benchmark agent does not store its
+made-up search results in the product catalog.
+
+Run it with `python manage.py loadtest_user_query`.
+"""
+from collections import Counter
+from typing import Any, Dict, List
+import asyncio
+import functools
+import threading
+import time
+import uuid
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .agent import api
+from .agent.benchmark import build_benchmark_agent, load_corpus, summarize
+from .models import CustomUser
+
+
+class TransactionMonitor:
+    """Track the database transactions open across all threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Dict[int, float] = {}
+        self._wrapped: List[Any] = []
+        self.durations_ms: List[float] = []
+        self.peak_open = 0
+        self.connections_opened = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        key = id(connection)
+        if connection.in_atomic_block:
+            with self._lock:
+                started = key not in self._open
+                if started:
+                    self._open[key] = time.perf_counter()
+                    self.peak_open = max(self.peak_open, len(self._open))
+            if started:
+                connection.on_commit(functools.partial(self._ended, key))
+        elif key in self._open:
+            # Rolled back, so on_commit never ran; count it as ending now
+            self._ended(key)
+        return execute(sql, params, many, context)
+
+    def _ended(self, key: int) -> None:
+        with self._lock:
+            started = self._open.pop(key, None)
+            if started is not None:
+                self.durations_ms.append((time.perf_counter() - started) * 1000)
+
+    def _wrap(self, connection) -> None:
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+            self._wrapped.append(connection)
+
+    def _connected(self, sender, connection, **kwargs) -> None:
+        with self._lock:
+            self.connections_opened += 1
+        self._wrap(connection)
+
+    def install(self) -> None:
+        """Watch the connections opened from now on, and this thread's"""
+        connection_created.connect(self._connected)
+        for connection in connections.all():
+            self._wrap(connection)
+
+    def uninstall(self) -> None:
+        connection_created.disconnect(self._connected)
+        for connection in self._wrapped:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+        self._wrapped = []
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'peak_open': self.peak_open,
+                'connections_opened': self.connections_opened,
+                'still_open': len(self._open),
+                'held_seconds': round(sum(self.durations_ms) / 1000, 3),
+                'duration_ms': summarize(self.durations_ms),
+            }
+
+
+class UserQueryLoadTest:
+    """Fire concurrent user queries at the API and measure the transactions they hold"""
+
+    def __init__(self, requests: int = 50, concurrency: int = 10, llm_latency: float = 0.5,
+                 search_latency: float = 0.5, path: str = '/api/user-query/'):
+        """
+        Args:
+            requests: Requests to send in total
+            concurrency: Requests in flight at once
+            llm_latency: Seconds the fake LLM takes to answer
+            search_latency: Seconds each product search takes
+            path: URL of user_query_api_view
+        """
+        self.requests = requests
+        self.concurrency = max(concurrency, 1)
+        self.llm_latency = llm_latency
+        self.search_latency = search_latency
+        self.path = path
+
+    @sync_to_async
+    def _create_user(self) -> CustomUser:
+        return CustomUser.objects.create_user(email=f"loadtest-{uuid.uuid4().hex[:12]}@example.com", is_active=True)
+
+    async def run(self) -> Dict[str, Any]:
+        """Run the load test and return its report"""
+        corpus = load_corpus()
+        queries = [turn['query'] for conversation in corpus['conversations'] for turn in conversation['turns']]
+        agent, _, _ = build_benchmark_agent(corpus, self.llm_latency, self.search_latency)
+
+        user = await self._create_user()
+        client = AsyncClient()
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+
+        async def send(index):
+            # Like ASGIHandler, give each request its own thread for sync work; the test client does not
+            async with semaphore, ThreadSensitiveContext():
+                start = time.perf_counter()
+                response = await client.post(
+                    self.path, {'query': queries[index % len(queries)]}, content_type='application/json',
+                    headers=headers
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] += 1
+
+        previous_agent, api._agent = api._agent, agent
+        monitor = TransactionMonitor()
+        monitor.install()
+        try:
+            start = time.perf_counter()
+            await asyncio.gather(*(send(index) for index in range(self.requests)))
+            elapsed = time.perf_counter() - start
+        finally:
+            monitor.uninstall()
+            api._agent = previous_agent
+            await sync_to_async(user.delete)()
+
+        transactions = monitor.report()
+        # Time-weighted number of connections inside a transaction
+        transactions['mean_open'] = round(transactions['held_seconds'] / elapsed, 2) if elapsed else None
+        return {
+            'config': {
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'llm_latency_s': self.llm_latency,
+                'search_latency_s': self.search_latency,
+            },
+            'throughput': {
+                'seconds': round(elapsed, 3),
+                'requests_per_second': round(self.requests / elapsed, 2) if elapsed else None,
+            },
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'latency_ms': summarize(latencies),
+            'transactions': transactions,
+        }
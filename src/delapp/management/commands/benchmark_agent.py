@@ -0,0 +1,124 @@
+"""
+Offline benchmark for the ShopAgent pipeline.
+
+Replays the bundled multi-turn conversations (or --corpus) through an agent
+built by ShopAgentFactory with a scripted fake LLM and a local search
+provider, then reports throughput, p50/p95/p99 latency per stage, memory
+allocated per turn, the cost of building product cards and of rendering and
+parsing the replayed conversations as API JSON. Conversations are
+written inside a transaction that is rolled back, so the database is left as
+it was.
+
+Usage:
+    python manage.py benchmark_agent --output bench.json
+    python manage.py benchmark_agent --llm-latency 0.3 --concurrency 4 --compare bench.json
+"""
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from delapp.agent.benchmark import AgentBenchmark, compare_reports, load_corpus
+
+
+class Command(BaseCommand):
+    help = "Benchmark the agent offline on replayed conversations and write a JSON report"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=None, help="Conversation corpus JSON, the bundled one by default")
+        parser.add_argument('--output', default='agent_benchmark.json', help="Where to write the JSON report")
+        parser.add_argument('--compare', default=None, help="Earlier report to compare against")
+        parser.add_argument('--passes', type=int, default=3, help="Timed replays of the corpus")
+        parser.add_argument('--warmup', type=int, default=1, help="Untimed replays before measuring")
+        parser.add_argument('--concurrency', type=int, default=1, help="Conversations replayed at once")
+        parser.add_argument('--llm-latency', type=float, default=0.0, help="Seconds the fake LLM takes to answer")
+        parser.add_argument('--search-latency', type=float, default=0.0, help="Seconds each local search takes")
+        parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+        parser.add_argument('--verbose-logs', action='store_true', help="Keep the agent's INFO logging on")
+
+    def handle(self, *args, **options):
+        if options['passes'] <= 0 or options['warmup'] < 0 or options['concurrency'] <= 0:
+            raise CommandError("--passes and --concurrency must be positive and --warmup not negative")
+        try:
+            corpus = load_corpus(options['corpus'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not load corpus: {str(e)}")
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {str(e)}")
+
+        if not options['verbose_logs']:
+            # The agent logs every step at INFO, which would dominate the timings
+            logging.disable(logging.INFO)
+        try:
+            # async_to_sync keeps the agent's database calls on this thread, inside the transaction
+            with transaction.atomic():
+                benchmark = AgentBenchmark(
+                    corpus,
+                    passes=options['passes'],
+                    warmup=options['warmup'],
+                    concurrency=options['concurrency'],
+                    measure_memory=not options['no_memory'],
+                    llm_latency=options['llm_latency'],
+                    search_latency=options['search_latency']
+                )
+                report = async_to_sync(benchmark.run)()
+                transaction.set_rollback(True)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        with open(options['output'], 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+
+        self._print_report(report)
+        if baseline is not None:
+            self.stdout.write(f"Compared with {options['compare']}:")
+            for line in compare_reports(baseline, report):
+                self.stdout.write(f"  {line}")
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def _print_report(self, report):
+        throughput = report['throughput']
+        self.stdout.write(
+            f"{throughput['turns']} turns in {throughput['seconds']}s: {throughput['turns_per_second']} turns/s "
+            f"(LLM calls/pass {report['calls_per_pass']['llm']}, searches/pass {report['calls_per_pass']['search']})"
+        )
+        rows = [('turn', report['latency_ms']['turn'])] + list(report['latency_ms']['stages'].items())
+        self.stdout.write(f"  {'stage':<24} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, stats in rows:
+            self.stdout.write(
+                f"  {name:<24} {stats['count']:>6} {stats['p50']:>9} {stats['p95']:>9} {stats['p99']:>9}"
+            )
+        if 'memory_kb_per_turn' in report:
+            allocated = report['memory_kb_per_turn']['allocated']
+            retained = report['memory_kb_per_turn']['retained']
+            self.stdout.write(
+                f"  allocated per turn: mean {allocated['mean']} KB, p95 {allocated['p95']} KB; "
+                f"retained mean {retained['mean']} KB"
+            )
+        cards = report.get('product_cards')
+        if cards:
+            self.stdout.write(
+                f"  product cards: {cards['us_per_product']} us and {cards['allocated_bytes_per_product']} bytes "
+                f"allocated per product"
+            )
+        serialization = report.get('search_result_serialization')
+        if serialization:
+            self.stdout.write(
+                f"  search result JSON round trip avoided: {serialization['json_round_trip_us']} us and "
+                f"{serialization['json_round_trip_allocated_kb']} KB per {serialization['products']}-product result"
+            )
+        api_json = report.get('api_json')
+        if api_json:
+            self.stdout.write(
+                f"  API JSON ({api_json['payloads']} conversations, {api_json['mean_kb']} KB each): "
+                f"render {api_json['json']['render_us']} -> {api_json['orjson']['render_us']} us, "
+                f"parse {api_json['json']['parse_us']} -> {api_json['orjson']['parse_us']} us (json -> orjson)"
+            )
@@ -0,0 +1,166 @@
+"""
+Accuracy harness and benchmark for the ShopAgent intent classifier.
+
+Scores the classifier against a hand-labelled query file, reports how logged
+UserQuery rows are classified (including how many fall through to the LLM
+path), and times the compiled classifier against a naive per-phrase substring
+scan over the same vocabulary. When a trained intent model is available (the
+served one, or --model) its labelled accuracy and prediction time are
+reported as well.
+
+Usage:
+    python manage.py evaluate_intents --limit 5000 --repeat 5
+    python manage.py evaluate_intents --labels path/to/labels.tsv
+    python manage.py evaluate_intents --model path/to/intent_model.npy
+"""
+from collections import Counter
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delapp.models import UserQuery
+from delapp.agent.core.intent_classifier import IntentClassifier, DATA_DIR
+from delapp.agent.core.intent_model import IntentModel, accuracy, get_intent_model
+
+DEFAULT_LABELS_PATH = os.path.join(DATA_DIR, 'intent_samples.tsv')
+
+# Order in which the old keyword detector checked intents
+BASELINE_ORDER = ['search', 'details', 'cart_add', 'cart_view', 'cart_remove']
+
+LOW_CONFIDENCE = 0.6
+
+
+def keyword_baseline(classifier: IntentClassifier, query: str) -> str:
+    """The old detector: a substring scan per phrase list, first hit wins"""
+    query = query.lower()
+    for intent in BASELINE_ORDER:
+        if any(phrase in query for phrase in classifier.vocabulary.get(intent, ())):
+            return intent
+    return classifier.default_intent
+
+
+def load_labelled_queries(path):
+    """Read intent<TAB>query lines, skipping blanks and comments"""
+    rows = []
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            intent, _, query = line.partition('\t')
+            rows.append((intent.strip(), query.strip()))
+    return rows
+
+
+def time_per_query(func, queries, repeat):
+    """Best-of-`repeat` mean time per query, in microseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            func(query)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(queries) * 1e6
+
+
+class Command(BaseCommand):
+    help = "Measure intent classifier accuracy and speed on labelled and logged queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labels', default=DEFAULT_LABELS_PATH, help="TSV file of intent<TAB>query lines")
+        parser.add_argument('--vocabulary', default=None, help="Vocabulary JSON to evaluate instead of the default")
+        parser.add_argument('--limit', type=int, default=5000, help="Most recent UserQuery rows to classify")
+        parser.add_argument('--repeat', type=int, default=5, help="Benchmark repetitions")
+        parser.add_argument('--model', default=None,
+                            help="Trained intent model .npy to evaluate instead of the served one")
+
+    def handle(self, *args, **options):
+        if options['limit'] < 0 or options['repeat'] <= 0:
+            raise CommandError("--limit must not be negative and --repeat must be positive")
+
+        classifier = IntentClassifier.from_file(options['vocabulary'])
+
+        labelled = load_labelled_queries(options['labels']) if options['labels'] else []
+        if labelled:
+            self._report_accuracy(classifier, labelled)
+
+        logged = list(
+            UserQuery.objects.order_by('-date_created').values_list('query', flat=True)[:options['limit']]
+        )
+        if logged:
+            self._report_logged(classifier, logged)
+
+        queries = logged or [query for _, query in labelled]
+        if not queries:
+            raise CommandError("No labelled or logged queries to evaluate")
+
+        compiled_us = time_per_query(classifier.classify, queries, options['repeat'])
+        baseline_us = time_per_query(lambda query: keyword_baseline(classifier, query), queries, options['repeat'])
+        self.stdout.write(
+            f"Benchmark over {len(queries)} queries: compiled {compiled_us:.1f} us/query, "
+            f"keyword scan {baseline_us:.1f} us/query ({baseline_us / compiled_us:.1f}x)"
+        )
+
+        if options['model']:
+            try:
+                model = IntentModel.load(options['model'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not load {options['model']}: {str(e)}")
+        else:
+            model = get_intent_model()
+        if model is not None:
+            model_us = time_per_query(model.predict, queries, options['repeat'])
+            labelled_accuracy = accuracy(model, [(query, intent) for intent, query in labelled])
+            self.stdout.write(
+                f"Intent model {model.classes}: {model_us:.1f} us/query"
+                + (f", labelled accuracy {labelled_accuracy:.1%}" if labelled_accuracy is not None else "")
+            )
+
+    def _report_accuracy(self, classifier, labelled):
+        correct = Counter()
+        total = Counter()
+        baseline_correct = 0
+        misses = []
+        for expected, query in labelled:
+            result = classifier.classify(query)
+            total[expected] += 1
+            if result.intent == expected:
+                correct[expected] += 1
+            else:
+                misses.append((expected, result.intent, query))
+            if keyword_baseline(classifier, query) == expected:
+                baseline_correct += 1
+
+        count = sum(total.values())
+        self.stdout.write(
+            f"Labelled accuracy: {sum(correct.values()) / count:.1%} "
+            f"(keyword scan {baseline_correct / count:.1%}) over {count} queries"
+        )
+        for intent in sorted(total):
+            self.stdout.write(f"  {intent:<14} {correct[intent]}/{total[intent]}")
+        for expected, predicted, query in misses[:20]:
+            self.stdout.write(f"  expected {expected}, got {predicted}: {query}")
+
+    def _report_logged(self, classifier, queries):
+        intents = Counter()
+        low_confidence = 0
+        agreement = 0
+        for query in queries:
+            result = classifier.classify(query)
+            intents[result.intent] += 1
+            if result.confidence < LOW_CONFIDENCE:
+                low_confidence += 1
+            if keyword_baseline(classifier, query) == result.intent:
+                agreement += 1
+
+        count = len(queries)
+        self.stdout.write(f"Logged queries: {count}")
+        for intent, hits in intents.most_common():
+            self.stdout.write(f"  {intent:<14} {hits / count:.1%}")
+        self.stdout.write(
+            f"  falls through to LLM: {intents[classifier.default_intent] / count:.1%}, "
+            f"confidence below {LOW_CONFIDENCE}: {low_confidence / count:.1%}, "
+            f"agrees with keyword scan: {agreement / count:.1%}"
+        )
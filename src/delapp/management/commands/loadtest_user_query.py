@@ -0,0 +1,73 @@
+"""
+Load test for user_query_api_view.
+
+Sends --requests user queries, --concurrency at a time, through the
+in-process ASGI client with a simulated agent, and reports throughput,
+latency and the database transactions the requests held open; see
+delapp/loadtest.py. The test writes to the configured database under a
+throwaway user and deletes it afterwards.
+
+Usage:
+    python manage.py loadtest_user_query --concurrency 20 --llm-latency 1 --search-latency 1
+"""
+import asyncio
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delapp.loadtest import UserQueryLoadTest
+
+
+class Command(BaseCommand):
+    help = "Load test the user query API and report the database transactions it holds open"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Requests to send in total")
+        parser.add_argument('--concurrency', type=int, default=10, help="Requests in flight at once")
+        parser.add_argument('--llm-latency', type=float, default=0.5, help="Seconds the fake LLM takes to answer")
+        parser.add_argument('--search-latency', type=float, default=0.5, help="Seconds each product search takes")
+        parser.add_argument('--path', default='/api/user-query/', help="URL of the user query API")
+        parser.add_argument('--output', default=None, help="Where to write the JSON report")
+        parser.add_argument('--verbose-logs', action='store_true', help="Keep the views' INFO logging on")
+
+    def handle(self, *args, **options):
+        if options['requests'] <= 0 or options['concurrency'] <= 0:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        if not options['verbose_logs']:
+            # The view and the agent log every step at INFO
+            logging.disable(logging.INFO)
+        try:
+            # A fresh event loop rather than async_to_sync, so each request's database work gets a
+            # thread and connection of its own, as under the ASGI server, instead of this thread's
+            report = asyncio.run(UserQueryLoadTest(
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                llm_latency=options['llm_latency'],
+                search_latency=options['search_latency'],
+                path=options['path']
+            ).run())
+        finally:
+            logging.disable(logging.NOTSET)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+
+        throughput, latency, transactions = report['throughput'], report['latency_ms'], report['transactions']
+        self.stdout.write(
+            f"{report['config']['requests']} requests, {report['config']['concurrency']} at a time, in "
+            f"{throughput['seconds']}s: {throughput['requests_per_second']} requests/s, statuses {report['statuses']}"
+        )
+        self.stdout.write(f"  latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, max {latency['max']} ms")
+        durations = transactions['duration_ms']
+        self.stdout.write(
+            f"  transactions: {durations['count']}, {transactions['mean_open']} open on average and "
+            f"{transactions['peak_open']} at peak, "
+            f"held p50 {durations['p50']} ms, p95 {durations['p95']} ms, max {durations['max']} ms, "
+            f"{transactions['held_seconds']}s in total"
+        )
+        self.stdout.write(f"  connections opened: {transactions['connections_opened']}")
+        if options['output']:
+            self.stdout.write(f"Report written to {options['output']}")
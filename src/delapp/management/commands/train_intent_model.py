@@ -0,0 +1,184 @@
+"""
+Train the NumPy intent model from conversation history and hand-labelled seeds.
+
+Queries are labelled from two sources, never by the keyword classifier, so
+the model does not just learn to repeat it:
+- the hand-labelled seed file intent_seed.tsv, plus any --labels files;
+- user messages in ConversationMessage history, labelled by what followed
+  them: a cart save before the reply is cart_add, a reply with products the
+  conversation had not shown yet is search, and a reply showing one of the
+  products already shown is details. Messages with no such signal are skipped.
+
+UserQuery rows carry no outcome to label them by, so they are not used.
+
+Queries in the evaluation file (intent_samples.tsv, what evaluate_intents
+scores) are left out of training, and the model's accuracy on them is
+reported after training.
+
+The weights are written to --output. build.sh retrains the served model
+into the package data directory on every deploy, so it keeps up with
+history; INTENT_MODEL_PATH can point elsewhere.
+
+Usage:
+    python manage.py train_intent_model --output delapp/agent/core/data/intent_model.npy
+    python manage.py train_intent_model --labels more.tsv --output model.npy --holdout 0.1
+"""
+from collections import defaultdict
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delapp.models import ConversationMessage, SavedItem
+from delapp.agent.core.intent_classifier import DATA_DIR
+from delapp.agent.core.intent_model import DEFAULT_N_FEATURES, accuracy, train_intent_model
+from .evaluate_intents import DEFAULT_LABELS_PATH, load_labelled_queries
+
+DEFAULT_SEED_PATH = os.path.join(DATA_DIR, 'intent_seed.tsv')
+
+
+def _normalize(query):
+    return ' '.join(query.lower().split())
+
+
+def _product_ids(search_results):
+    return {card.get('id') for card in search_results or [] if isinstance(card, dict) and card.get('id')}
+
+
+def history_samples(limit=50000):
+    """
+    (query, intent) pairs for user messages whose outcome shows their intent.
+
+    Reads at most `limit` messages, oldest conversations first.
+    """
+    saves = defaultdict(list)
+    for conversation_id, created_at in SavedItem.objects.filter(
+            conversation__isnull=False
+    ).values_list('conversation_id', 'created_at'):
+        saves[conversation_id].append(created_at)
+
+    samples = []
+    conversation = pending = previous_reply_at = None
+    shown, current = set(), set()
+    for conversation_id, role, content, created_at, has_products, search_results in (
+            ConversationMessage.objects.order_by('conversation_id', 'created_at', 'id').values_list(
+                'conversation_id', 'role', 'content', 'created_at', 'has_products', 'search_results'
+            )[:limit]
+    ):
+        if conversation_id != conversation:
+            conversation, pending, previous_reply_at = conversation_id, None, None
+            shown, current = set(), set()
+
+        if role == 'user':
+            pending = content
+            continue
+        if role != 'assistant' or pending is None:
+            continue
+
+        # The agent saves both messages after the turn, so a cart save during the turn comes before the reply
+        ids = _product_ids(search_results) if has_products else set()
+        if any((previous_reply_at is None or saved_at > previous_reply_at) and saved_at <= created_at
+               for saved_at in saves.get(conversation_id, ())):
+            samples.append((pending, 'cart_add'))
+        elif ids and not ids & shown:
+            samples.append((pending, 'search'))
+            current = ids
+        elif len(ids) == 1 and ids <= current:
+            samples.append((pending, 'details'))
+
+        shown |= ids
+        pending, previous_reply_at = None, created_at
+    return samples
+
+
+def collect_samples(labels_paths, exclude=(), limit=50000):
+    """
+    Build (query, intent) training pairs, one per distinct normalized query.
+
+    Hand labels come first and win over history. Queries in `exclude` (the
+    evaluation set) are never used.
+
+    Returns:
+        (sources, samples) where sources counts the samples each source contributed
+    """
+    excluded = {_normalize(query) for query in exclude}
+    samples = {}
+    sources = {'labelled': 0, 'history': 0}
+
+    def add(query, intent, source):
+        key = _normalize(query)
+        if key and key not in samples and key not in excluded:
+            samples[key] = (query, intent)
+            sources[source] += 1
+
+    for path in labels_paths:
+        for intent, query in load_labelled_queries(path):
+            add(query, intent, 'labelled')
+    for query, intent in history_samples(limit):
+        add(query, intent, 'history')
+    return sources, list(samples.values())
+
+
+class Command(BaseCommand):
+    help = "Train the hashed n-gram intent model from ConversationMessage history and hand-labelled seeds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help="Where to write the .npy weights")
+        parser.add_argument('--labels', nargs='+', default=[DEFAULT_SEED_PATH],
+                            help="Hand-labelled intent<TAB>query files to train on")
+        parser.add_argument('--eval-labels', default=DEFAULT_LABELS_PATH,
+                            help="Hand-labelled file kept out of training and scored afterwards")
+        parser.add_argument('--n-features', type=int, default=DEFAULT_N_FEATURES)
+        parser.add_argument('--epochs', type=int, default=30)
+        parser.add_argument('--learning-rate', type=float, default=2.0)
+        parser.add_argument('--holdout', type=float, default=0.1, help="Fraction of samples kept for evaluation")
+        parser.add_argument('--limit', type=int, default=50000, help="Conversation messages read from history")
+
+    def handle(self, *args, **options):
+        if options['n_features'] <= 0 or options['epochs'] <= 0:
+            raise CommandError("--n-features and --epochs must be positive")
+        if not options['output'].endswith('.npy'):
+            raise CommandError("--output must be a .npy path")
+        if not 0 <= options['holdout'] < 1:
+            raise CommandError("--holdout must be in [0, 1)")
+        missing = [path for path in options['labels'] + [options['eval_labels']] if not os.path.exists(path)]
+        if missing:
+            raise CommandError(f"Labels file not found: {', '.join(missing)}")
+
+        evaluation = [(query, intent) for intent, query in load_labelled_queries(options['eval_labels'])]
+        sources, samples = collect_samples(
+            options['labels'],
+            exclude=[query for query, _ in evaluation],
+            limit=options['limit']
+        )
+        if len({intent for _, intent in samples}) < 2:
+            raise CommandError("Need samples from at least two intents to train a model")
+        self.stdout.write(f"Collected {len(samples)} samples: " + ', '.join(f"{k} {v}" for k, v in sources.items()))
+
+        random.Random(0).shuffle(samples)
+        holdout_size = int(len(samples) * options['holdout'])
+        holdout, training = samples[:holdout_size], samples[holdout_size:]
+
+        start = time.perf_counter()
+        model = train_intent_model(
+            training,
+            n_features=options['n_features'],
+            epochs=options['epochs'],
+            learning_rate=options['learning_rate']
+        )
+        self.stdout.write(f"Trained on {len(training)} samples in {time.perf_counter() - start:.1f}s")
+
+        train_accuracy = accuracy(model, training)
+        holdout_accuracy = accuracy(model, holdout)
+        evaluation_accuracy = accuracy(model, evaluation)
+        self.stdout.write(
+            f"Accuracy: training {train_accuracy:.1%}"
+            + (f", holdout {holdout_accuracy:.1%}" if holdout_accuracy is not None else "")
+            + (f", {os.path.basename(options['eval_labels'])} {evaluation_accuracy:.1%}"
+               if evaluation_accuracy is not None else "")
+        )
+
+        model.save(options['output'])
+        self.stdout.write(f"Wrote intent model with classes {model.classes} to {options['output']}")
+        self.stdout.write("Run evaluate_intents --model with this path to measure its speed")
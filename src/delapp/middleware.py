@@ -1,16 +1,121 @@
 # your_app/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from .http_cache import DEFAULT_POLICY, NO_STORE, content_etag, get_cache_policy
+
+
+class HTTPCacheMiddleware:
+    """
+    Apply the views' caching policies, see delapp/http_cache.py.
+
+    Successful GET and HEAD responses get the view's Cache-Control, Vary and
+    ETag headers and turn into 304 Not Modified when the client already has
+    them; everything else from a DRF view, or from a view declaring a policy,
+    is marked no-store. Other responses are left alone.
+
+    The policy is read from request.resolver_match after the view ran rather
+    than in process_view, which Django would call in a thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
 
-class DRFNoCacheMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
-        
-        # Only add headers for DRF responses
-        if hasattr(response, 'data'):
-            response['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.apply_policy(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.apply_policy(request, await self.get_response(request))
+
+    def apply_policy(self, request, response):
+        policy = get_cache_policy(request)
+        if policy is None:
+            # Only DRF responses get the default policy
+            if not hasattr(response, 'data'):
+                return response
+            policy = DEFAULT_POLICY
+
+        cacheable = (
+            not policy.no_store
+            and request.method in ('GET', 'HEAD')
+            and response.status_code in (200, 304)
+            and not response.cookies
+        )
+        if not cacheable:
+            response['Cache-Control'] = NO_STORE
             response['Pragma'] = 'no-cache'
             response['Expires'] = '0'
-        
-        return response
\ No newline at end of file
+            return response
+
+        response['Cache-Control'] = policy.cache_control
+        if policy.vary:
+            patch_vary_headers(response, policy.vary)
+        if response.status_code == 304:
+            return response
+
+        if policy.etag and not response.streaming and not response.has_header('ETag'):
+            response['ETag'] = content_etag(response.content)
+        if response.has_header('ETag'):
+            # A 304 that keeps the ETag, Cache-Control and Vary headers, or the response itself
+            return get_conditional_response(request, etag=response['ETag'], response=response)
+        return response
+
+class TracingMiddleware:
+    """
+    Trace API requests through the agent pipeline and report the stages in a
+    Server-Timing header, see delapp/tracing.py.
+
+    Streaming responses only carry the stages that ran before the stream
+    started; the stream itself is traced separately.
+
+    Works in both sync and async middleware chains, so async views are not
+    pushed into a thread on its account.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _traced(self, request):
+        from django.conf import settings
+
+        config = getattr(settings, 'TRACING', {})
+        prefixes = config.get('PATH_PREFIXES', ['/api/'])
+        return config.get('ENABLED', True) and request.path.startswith(tuple(prefixes))
+
+    def __call__(self, request):
+        from .tracing import span, server_timing
+
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._traced(request):
+            return self.get_response(request)
+
+        with span('request', method=request.method, path=request.path) as root:
+            response = self.get_response(request)
+            root.attributes['status'] = response.status_code
+
+        response['Server-Timing'] = server_timing(root)
+        return response
+
+    async def __acall__(self, request):
+        from .tracing import span, server_timing
+
+        if not self._traced(request):
+            return await self.get_response(request)
+
+        with span('request', method=request.method, path=request.path) as root:
+            response = await self.get_response(request)
+            root.attributes['status'] = response.status_code
+
+        response['Server-Timing'] = server_timing(root)
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delapp', '0014_conversationstate_history_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversationmessage',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='delapp_conv_convers_c2df79_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delapp', '0015_conversationmessage_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', 'active', '-updated_at', '-id'], name='delapp_conv_user_id_9c3e77_idx'),
+        ),
+    ]
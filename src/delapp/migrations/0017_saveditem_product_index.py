@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delapp', '0016_conversation_list_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='saveditem',
+            index=models.Index(fields=['product_id'], name='delapp_save_product_b68607_idx'),
+        ),
+    ]
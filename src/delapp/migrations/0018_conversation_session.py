@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delapp', '0017_saveditem_product_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='session_id',
+            field=models.CharField(blank=True, help_text='Owner of an anonymous conversation', max_length=255, null=True),
+        ),
+    ]
@@ -107,6 +107,7 @@ class UserQuery(models.Model):
 class Conversation(models.Model):
     """Model to represent a shopping conversation session"""
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="conversations", null=True, blank=True)
+    session_id = models.CharField(max_length=255, blank=True, null=True, help_text="Owner of an anonymous conversation")
     title = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -117,6 +118,10 @@ class Conversation(models.Model):
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # A user's conversation list, paged by (updated_at, id), see delapp/pagination.py
+            models.Index(fields=['user', 'active', '-updated_at', '-id']),
+        ]
 
 
 
@@ -149,6 +154,10 @@ class ConversationMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset pagination of a conversation's messages, see delapp/pagination.py
+            models.Index(fields=['conversation', 'created_at', 'id']),
+        ]
     
 
 class ConversationState(models.Model):
@@ -164,6 +173,10 @@ class ConversationState(models.Model):
     user_preferences = models.JSONField(default=dict)
     keywords = models.JSONField(default=list)
     last_action = models.CharField(max_length=50, blank=True, null=True)
+    # Running summary of the messages older than the agent's recent window
+    history_summary = models.TextField(blank=True, default='')
+    # Last ConversationMessage folded into history_summary
+    summary_message_id = models.BigIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -251,4 +264,8 @@ class SavedItem(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Saved Item"
-        verbose_name_plural = "Saved Items"
\ No newline at end of file
+        verbose_name_plural = "Saved Items"
+        indexes = [
+            # Catalog changes are applied to every saved copy of a product
+            models.Index(fields=['product_id']),
+        ]
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Keyset Pagination
+
+Pages through a queryset newest first on (timestamp, id) instead of with
+OFFSET. Each page starts strictly after the last row of the previous one, so
+with an index ending in (timestamp, id) any page costs the same however long
+the history is, and rows written while a client is paging neither shift nor
+repeat entries.
+
+Cursors are opaque to clients: the URL-safe base64 of the last row's
+timestamp and id.
+"""
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+import base64
+import binascii
+
+from django.db.models import Q, QuerySet
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(timestamp: datetime, pk: int) -> str:
+    """Encode the position of the last row handed out as an opaque cursor"""
+    raw = f"{timestamp.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Inverse of encode_cursor. An empty cursor starts from the newest row."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_page_size(value: Optional[str], default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    """Read a `limit` query parameter, capped at maximum"""
+    if value in (None, ''):
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid limit: {value}")
+    if size <= 0:
+        raise ValueError(f"Invalid limit: {value}")
+    return min(size, maximum)
+
+
+def keyset_page(queryset: QuerySet, cursor: Optional[str], limit: int,
+                field: str = 'created_at') -> Tuple[List[Any], Optional[str]]:
+    """
+    Fetch one page of a queryset, newest first.
+
+    Args:
+        queryset: Rows to page through, already filtered to their parent
+        cursor: Value returned with the previous page, or None for the newest page
+        limit: Rows per page
+        field: Timestamp the rows are ordered by; ties are broken by id
+
+    Returns:
+        (rows newest first, cursor for the next older page or None when there is none)
+    """
+    position = parse_cursor(cursor)
+    if position is not None:
+        timestamp, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk}))
+
+    # One row more than the page tells whether an older page exists without a COUNT
+    rows = list(queryset.order_by(f'-{field}', '-id')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field), last.pk)
@@ -0,0 +1,30 @@
+"""
+orjson Parser for the API
+
+Drop-in replacement for DRF's JSONParser, registered in
+REST_FRAMEWORK['DEFAULT_PARSER_CLASSES']. Bodies are decoded by orjson
+straight from bytes; like JSONParser it rejects NaN and Infinity and turns
+malformed JSON into a 400 ParseError.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+import orjson
+
+UTF8 = ('utf-8', 'utf8')
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser backed by orjson"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            data = stream.read()
+            if encoding.lower() not in UTF8:
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError(f"JSON parse error - {str(exc)}")
@@ -0,0 +1,72 @@
+"""
+orjson Renderer for the API
+
+Drop-in replacement for DRF's JSONRenderer, registered in
+REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']. orjson serializes datetimes,
+dates, UUIDs and dataclasses itself, so product payloads, conversation
+messages and their search_results are rendered without a Python callback
+per value; json_default covers what orjson leaves out (Decimal prices from
+StoredProduct, lazy translation strings, querysets, ...).
+
+The output matches JSONRenderer's: compact UTF-8, UTC datetimes ending in
+'Z', Decimal as a number, U+2028/U+2029 escaped, and two-space indentation
+when the client asks for it (`Accept: application/json; indent=4`).
+"""
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any
+
+from django.db.models.query import QuerySet
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.renderers import JSONRenderer
+import orjson
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+def json_default(obj: Any) -> Any:
+    """Serialize the types orjson does not handle natively, the way DRF's JSONEncoder does"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, QuerySet):
+        return tuple(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__iter__'):
+        return tuple(item for item in obj)
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def dumps(data: Any, option: int = 0) -> bytes:
+    """Serialize data to JSON bytes with the API's options"""
+    try:
+        return orjson.dumps(data, default=json_default, option=ORJSON_OPTIONS | option)
+    except orjson.JSONEncodeError as e:
+        if 'Dict key' not in str(e):
+            raise
+        # OPT_NON_STR_KEYS halves orjson's speed, so it is only used for the rare dict with int keys
+        return orjson.dumps(data, default=json_default, option=ORJSON_OPTIONS | orjson.OPT_NON_STR_KEYS | option)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        option = 0
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            # orjson only indents by two spaces
+            option = orjson.OPT_INDENT_2
+        ret = dumps(data, option)
+
+        # Keep the output a strict JavaScript subset, as JSONRenderer does
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -16,6 +16,8 @@ import asyncio
 import aiohttp
 import traceback
 
+from .tracing import traced
+
 # Force reload the .env file
 load_dotenv(find_dotenv(), override=True)
 
@@ -243,6 +245,7 @@ class SearchAPIProvider(BaseProvider):
             logger.error(f"Error searching products using SearchAPI.io: {str(e)}")
             return []
 
+    @traced('searchapi.search')
     async def search_products_async(self, query: str, min_price: Optional[float] = None, 
                                max_price: Optional[float] = None, condition: Optional[str] = None,
                                max_results: int = 20) -> List[ProductDeal]:
@@ -0,0 +1,53 @@
+"""
+Test doubles shared by the agent tests.
+"""
+
+
+def make_agent(answer):
+    """
+    ShopAgent with a fake LLM that answers `answer` and a search tool that
+    finds one desk lamp. A list answer is streamed as separate tokens.
+    """
+    import asyncio
+    import threading
+    from langchain.prompts import PromptTemplate
+    from delapp.agent.core.agent_core import ShopAgent
+    from delapp.agent.core.intent_classifier import get_intent_classifier
+    from delapp.agent.memory.chat_window import ChatWindowStore
+    from delapp.agent.core.prompt_builder import PromptBuilder
+    from delapp.agent.core.reference_resolver import get_reference_resolver
+    from delapp.agent.tools.product_cards import product_card
+    from delapp.agent.tools.results import SearchResult
+
+    class FakeLLM:
+        model_name = 'fake'
+        temperature = 0.2
+
+        async def astream(self, prompt):
+            await asyncio.sleep(0.02)
+            for token in [answer] if isinstance(answer, str) else answer:
+                yield token
+
+    class FakeChain:
+        prompt = PromptTemplate(template='{chat_history}{input}{agent_scratchpad}',
+                                input_variables=['input', 'chat_history', 'agent_scratchpad'])
+
+    class FakeSearchTool:
+        calls = 0
+
+        async def search(self, query):
+            FakeSearchTool.calls += 1
+            await asyncio.sleep(0.05)
+            return SearchResult(text='Found 1 product', products=[product_card({'title': 'Desk lamp'})])
+
+    agent = ShopAgent.__new__(ShopAgent)
+    agent.llm, agent.agent_executor, agent.llm_cache = FakeLLM(), FakeChain(), None
+    agent.tools, agent.memory_components = [FakeSearchTool()], {}
+    agent.intent_classifier, agent.intent_model = get_intent_classifier(), None
+    agent._speculation_lock = threading.Lock()
+    agent._speculation = {'launched': 0, 'used': 0, 'cancelled': 0, 'completed_unused': 0, 'cold': 0}
+    agent.chat_windows = ChatWindowStore()
+    agent.prompt_builder = PromptBuilder()
+    agent.reference_resolver = get_reference_resolver()
+    agent.response_formatter = None
+    return agent
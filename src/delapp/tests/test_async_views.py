@@ -0,0 +1,102 @@
+from django.test import TestCase
+
+
+class AsyncViewTests(TestCase):
+    """The agent and cart views run on the server's event loop instead of one of their own"""
+
+    class StubAgent:
+        def __init__(self):
+            from types import SimpleNamespace
+            self.loops = []
+            self.tools = [SimpleNamespace(name='cart_management', func=self.cart)]
+
+        async def process_query(self, query, **kwargs):
+            import asyncio
+            self.loops.append(asyncio.get_running_loop())
+            return {'response': f"About {query}", 'products': [], 'conversation_id': '7'}
+
+        async def cart(self, action, **kwargs):
+            import asyncio
+            self.loops.append(asyncio.get_running_loop())
+            return {'success': True, 'cart_items': [{'item_id': 3, 'name': 'Desk lamp'}], 'total_price': 19.99}
+
+    def setUp(self):
+        from delapp.agent import api
+        self.api = api
+        self.agent = self.StubAgent()
+        self.previous_agent, api._agent = api._agent, self.agent
+
+    def tearDown(self):
+        self.api._agent = self.previous_agent
+
+    async def test_agent_and_cart_endpoints_share_the_loop(self):
+        import asyncio
+        from django.test import AsyncClient
+
+        client = AsyncClient()
+        response = await client.post('/api/agent/query/', {'query': 'lamps'}, content_type='application/json')
+        self.assertEqual(response.json()['message'], 'About lamps')
+
+        response = await client.get('/api/cart/view/', {'session_id': 's1'})
+        self.assertEqual(response.json()['cart_items'][0]['name'], 'Desk lamp')
+
+        self.assertEqual(self.agent.loops, [asyncio.get_running_loop()] * 2)
+
+    async def test_cart_viewset_actions_are_async(self):
+        import asyncio
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.test import AsyncRequestFactory
+        from delapp.cart_views import CartViewSet
+
+        view = CartViewSet.as_view({'get': 'view'})
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+
+        request = AsyncRequestFactory().get('/api/cart/view/')
+        request.session = SessionStore()
+        response = await view(request)
+
+        self.assertEqual((response.data['item_count'], response.data['items'][0]['id']), (1, 3))
+        self.assertEqual(response.data['session_id'], request.session.session_key)
+        self.assertEqual(self.agent.loops, [asyncio.get_running_loop()])
+
+    async def test_async_api_view_keeps_drf_checks(self):
+        from rest_framework.decorators import authentication_classes, permission_classes
+        from rest_framework.permissions import AllowAny, IsAuthenticated
+        from rest_framework.response import Response
+        from django.test import AsyncRequestFactory
+        from delapp.async_views import async_api_view
+
+        # Without authenticators DRF answers 403 whatever DEFAULT_AUTHENTICATION_CLASSES says
+        @async_api_view(['POST'])
+        @authentication_classes([])
+        @permission_classes([IsAuthenticated])
+        async def private(request):
+            return Response({'ok': True})
+
+        @async_api_view(['POST'])
+        @permission_classes([AllowAny])
+        async def echo(request):
+            return Response(request.data)
+
+        factory = AsyncRequestFactory()
+        self.assertEqual((await private(factory.post('/'))).status_code, 403)
+        self.assertEqual((await echo(factory.get('/'))).status_code, 405)
+        response = await echo(factory.post('/', {'query': 'lamps'}, content_type='application/json'))
+        self.assertEqual(response.data, {'query': 'lamps'})
+
+    async def test_tracing_middleware_in_an_async_chain(self):
+        import asyncio
+        from django.http import HttpResponse
+        from django.test import AsyncRequestFactory
+        from delapp.middleware import HTTPCacheMiddleware, TracingMiddleware
+        from delapp.tracing import span
+
+        async def view(request):
+            with span('agent.intent'):
+                return HttpResponse('ok')
+
+        middleware = TracingMiddleware(HTTPCacheMiddleware(view))
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        response = await middleware(AsyncRequestFactory().get('/api/agent/query/'))
+        self.assertRegex(response['Server-Timing'], r'^agent\.intent;dur=[\d.]+, total;dur=[\d.]+$')
@@ -0,0 +1,49 @@
+from django.test import TestCase
+
+
+class AgentBenchmarkTests(TestCase):
+    CORPUS = {
+        'catalog': [
+            {'product_id': 'bl-1', 'title': 'Ninja Professional Blender Black', 'price': 89.99, 'retailer': 'Target'},
+            {'product_id': 'bl-2', 'title': 'Vitamix E310 Blender Red', 'price': 299.95, 'retailer': 'Amazon'},
+            {'product_id': 'hp-1', 'title': 'Sony Noise Cancelling Headphones Black', 'price': 89.99, 'retailer': 'Walmart'},
+        ],
+        'conversations': [{'name': 'blender', 'turns': [
+            {'query': 'show me blenders'},
+            {'query': 'tell me more about the second one'},
+            {'query': 'thanks, that is all', 'llm': 'You are welcome!'},
+        ]}],
+    }
+
+    async def test_local_search_ranks_and_filters_the_catalog(self):
+        from delapp.agent.benchmark import LocalSearchProvider
+        provider = LocalSearchProvider(self.CORPUS['catalog'])
+
+        results = await provider.search_deals_async('black blender', max_price=100)
+        self.assertEqual([deal.product_id for deal in results['searchapi']], ['bl-1', 'hp-1'])
+
+    async def test_replay_reports_latency_and_memory_per_stage(self):
+        from delapp.agent.benchmark import AgentBenchmark, compare_reports
+
+        report = await AgentBenchmark(self.CORPUS, passes=2, warmup=0).run()
+
+        self.assertEqual(report['throughput']['turns'], 6)
+        # The follow-up is answered from the products already shown, the thank-you by the scripted LLM
+        self.assertEqual(report['calls_per_pass'], {'llm': 1, 'search': 1})
+        self.assertEqual(report['latency_ms']['turn']['count'], 6)
+        for stage in ['agent.intent', 'agent.search', 'agent.reference', 'agent.llm', 'memory.save']:
+            self.assertIn(stage, report['latency_ms']['stages'])
+        self.assertEqual(report['memory_kb_per_turn']['allocated']['count'], 3)
+        self.assertEqual(report['search_result_serialization']['products'], 50)
+        self.assertTrue(compare_reports(report, report)[0].startswith('throughput:'))
+
+    async def test_benchmark_searches_stay_out_of_the_product_catalog(self):
+        from unittest.mock import patch
+        from delapp.agent.benchmark import build_benchmark_agent
+
+        agent, _, _ = build_benchmark_agent(self.CORPUS)
+        with patch('delapp.agent.tools.product_search_tool._catalog_writer') as writer:
+            result = await agent.tools[0].search('show me blenders')
+
+        self.assertTrue(result.products)
+        writer.submit.assert_not_called()
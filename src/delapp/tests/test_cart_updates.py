@@ -0,0 +1,42 @@
+from django.test import TestCase
+
+
+class CartUpdateTests(TestCase):
+    """Saved cart items follow price and availability changes published by the catalog"""
+
+    def setUp(self):
+        from delapp.models import Cart, SavedItem
+
+        cart = Cart.objects.create(session_id='cart-session')
+        self.item = SavedItem.objects.create(
+            cart=cart, product_id='p1', title='Lamp', price=30.0, retailer='Amazon',
+            metadata={'id': 'p1', 'name': 'Lamp', 'currentPrice': 30.0}
+        )
+        self.other = SavedItem.objects.create(cart=cart, product_id='p2', title='Desk', price=90.0)
+
+    def store(self, price, available):
+        from datetime import datetime
+        from delapp.models import ProductDeal
+        from products.services import ProductStorageService
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductStorageService.store_products([ProductDeal(
+                product_id='p1', title='Lamp', price=price, url='https://example.com/p1', image_url='',
+                retailer='Amazon', description='', available=available, timestamp=datetime.now()
+            )])
+
+    def test_price_and_availability_changes_reach_saved_items(self):
+        self.store(30.0, available=True)
+        self.store(25.0, available=False)
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.price, 25.0)
+        self.assertIs(self.item.metadata['available'], False)
+        self.assertEqual(self.item.metadata['name'], 'Lamp')
+
+        self.store(25.0, available=True)
+        self.item.refresh_from_db()
+        self.assertIs(self.item.metadata['available'], True)
+
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.price, self.other.metadata), (90.0, {}))
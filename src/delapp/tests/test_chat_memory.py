@@ -0,0 +1,151 @@
+from django.test import TestCase
+
+
+class ChatWindowStoreTests(TestCase):
+    """Per-conversation chat history for the LLM prompt"""
+
+    def make_conversation(self, messages):
+        from delapp.models import Conversation, ConversationMessage
+        conversation = Conversation.objects.create(title='Lamps')
+        for role, content in messages:
+            ConversationMessage.objects.create(conversation=conversation, role=role, content=content)
+        return str(conversation.id)
+
+    async def test_history_is_hydrated_from_saved_messages(self):
+        from asgiref.sync import sync_to_async
+        from delapp.agent.memory.chat_window import ChatWindowStore
+        conversation_id = await sync_to_async(self.make_conversation)(
+            [('user', f'question {i}') for i in range(5)]
+        )
+        store = ChatWindowStore(max_messages=3)
+
+        history = await store.get_history(conversation_id)
+        self.assertEqual([content for _, content in history], ['question 2', 'question 3', 'question 4'])
+
+        store.append(conversation_id, 'assistant', 'answer 4')
+        history = await store.get_history(conversation_id)
+        self.assertEqual(history[-1], ('assistant', 'answer 4'))
+        self.assertEqual(len(history), 3)
+        self.assertEqual(store.stats()['hydrations'], 1)
+
+    async def test_least_recently_used_conversations_are_evicted(self):
+        from asgiref.sync import sync_to_async
+        from delapp.agent.memory.chat_window import ChatWindowStore
+        ids = [await sync_to_async(self.make_conversation)([('user', 'x' * 100)]) for _ in range(3)]
+        store = ChatWindowStore(max_conversations=2)
+        for conversation_id in ids:
+            await store.get_history(conversation_id)
+        self.assertEqual(store.stats()['conversations'], 2)
+
+        # The first conversation was dropped, so appends to it are ignored until it reloads
+        store.append(ids[0], 'assistant', 'lost')
+        self.assertEqual(store.stats()['bytes'], 200)
+
+        byte_store = ChatWindowStore(max_bytes=150)
+        for conversation_id in ids:
+            await byte_store.get_history(conversation_id)
+        self.assertEqual(byte_store.stats()['conversations'], 1)
+        self.assertEqual(byte_store.stats()['evictions'], 2)
+
+    async def test_window_is_reloaded_when_another_worker_changed_the_conversation(self):
+        from asgiref.sync import sync_to_async
+        from delapp.agent.memory.chat_window import ChatWindowStore
+        from delapp.models import ConversationMessage
+        conversation_id = await sync_to_async(self.make_conversation)([('user', 'question 1')])
+        store = ChatWindowStore()
+        await store.get_history(conversation_id)
+
+        # A turn answered by another process
+        await sync_to_async(ConversationMessage.objects.create)(
+            conversation_id=conversation_id, role='assistant', content='answer 1'
+        )
+        history = await store.get_history(conversation_id)
+        self.assertEqual(history, [('user', 'question 1'), ('assistant', 'answer 1')])
+
+        # A turn answered here is recorded with its id, so the window stays current
+        message = await sync_to_async(ConversationMessage.objects.create)(
+            conversation_id=conversation_id, role='assistant', content='answer 2'
+        )
+        store.append(conversation_id, 'assistant', 'answer 2', message_id=message.id)
+        await store.get_history(conversation_id)
+        self.assertEqual((store.stats()['stale'], store.stats()['hydrations'], store.stats()['hits']), (1, 2, 1))
+
+        # Cleared elsewhere
+        await sync_to_async(ConversationMessage.objects.filter(conversation_id=conversation_id).delete)()
+        self.assertEqual(await store.get_history(conversation_id), [])
+
+
+class PromptBuilderTests(TestCase):
+    """Token-budgeted prompt assembly and the running summary"""
+
+    def setUp(self):
+        from langchain.prompts import PromptTemplate
+        from delapp.agent.core.prompt_builder import PromptBuilder
+        self.prompt = PromptTemplate(
+            template='You are a shopping assistant.\n\n{chat_history}\n\nHuman: {input}\n\n{agent_scratchpad}',
+            input_variables=['input', 'chat_history', 'agent_scratchpad']
+        )
+        self.builder = PromptBuilder(max_tokens=400, response_tokens=100, product_tokens=60, summary_tokens=40)
+
+    def test_recent_turns_fill_what_is_left_of_the_budget(self):
+        history = [('user' if i % 2 == 0 else 'assistant', f'message {i} ' + 'words ' * 20) for i in range(30)]
+        products = [{'title': f'Lamp {i}', 'price': '$20', 'source': 'Shop'} for i in range(20)]
+
+        built = self.builder.build(self.prompt, 'which is cheapest?', history=history,
+                                   summary='The user wants a desk lamp under $50. ' * 20, products=products)
+
+        prompt_text = self.prompt.format(input='which is cheapest?', chat_history=built.chat_history,
+                                         agent_scratchpad='')
+        self.assertLessEqual(self.builder.counter.count(prompt_text), 300)
+        self.assertEqual(built.budget, 300)
+        self.assertGreater(built.messages, 0)
+        self.assertEqual(built.messages + built.dropped_messages, 30)
+        # The newest message is kept and the product list is capped
+        self.assertIn('message 29', built.chat_history)
+        self.assertNotIn('message 0 ', built.chat_history)
+        self.assertTrue(0 < built.products < 20)
+        self.assertIn('Summary of the earlier conversation', built.chat_history)
+
+    def test_short_conversations_are_kept_whole(self):
+        built = self.builder.build(self.prompt, 'thanks', history=[('user', 'hi'), ('assistant', 'Hello!')])
+        self.assertEqual(built.chat_history, 'Human: hi\nAssistant: Hello!')
+        self.assertEqual(built.dropped_messages, 0)
+
+    async def test_summary_is_refreshed_every_few_turns(self):
+        from asgiref.sync import sync_to_async
+        from delapp.models import Conversation, ConversationMessage, ConversationState
+        from delapp.agent.core.prompt_builder import ConversationSummarizer
+
+        class FakeLLM:
+            calls = []
+
+            async def ainvoke(self, prompt):
+                FakeLLM.calls.append(prompt)
+                return 'The user wants a desk lamp.'
+
+        def make_conversation(count):
+            conversation = Conversation.objects.create(title='Lamps')
+            ConversationState.objects.create(conversation=conversation)
+            for i in range(count):
+                ConversationMessage.objects.create(conversation=conversation,
+                                                   role='user' if i % 2 == 0 else 'assistant',
+                                                   content=f'message {i}')
+            return conversation.id
+
+        summarizer = ConversationSummarizer(every=2, keep_messages=4)
+        conversation_id = await sync_to_async(make_conversation)(7)
+
+        # Three messages older than the window are fewer than two turns
+        self.assertFalse(await summarizer.refresh(conversation_id, FakeLLM()))
+
+        await sync_to_async(ConversationMessage.objects.create)(
+            conversation_id=conversation_id, role='assistant', content='message 7'
+        )
+        self.assertTrue(await summarizer.refresh(conversation_id, FakeLLM()))
+        self.assertIn('message 3', FakeLLM.calls[0])
+        self.assertNotIn('message 4', FakeLLM.calls[0])
+
+        state = await sync_to_async(ConversationState.objects.get)(conversation_id=conversation_id)
+        self.assertEqual(state.history_summary, 'The user wants a desk lamp.')
+        # Nothing new has left the window since
+        self.assertFalse(await summarizer.refresh(conversation_id, FakeLLM()))
@@ -0,0 +1,274 @@
+from django.test import TestCase
+
+
+class ConversationMessagePaginationTests(TestCase):
+    """Conversation messages are paged newest first by (created_at, id), without their products"""
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from delapp.models import Conversation, ConversationMessage
+
+        self.conversation = Conversation.objects.create(title='lamps')
+        ConversationMessage.objects.bulk_create([
+            ConversationMessage(conversation=self.conversation, role='user' if i % 2 == 0 else 'assistant',
+                                content=f"message {i}", has_products=i % 2 == 1,
+                                search_results=[{'title': f"Lamp {i}"}] if i % 2 == 1 else None)
+            for i in range(7)
+        ])
+        # Messages saved in one request share a timestamp, as 2, 3 and 4 do here; id breaks the tie
+        start = timezone.now()
+        for i, message in enumerate(ConversationMessage.objects.order_by('id')):
+            minutes = 2 if 2 <= i <= 4 else i
+            ConversationMessage.objects.filter(id=message.id).update(created_at=start + timedelta(minutes=minutes))
+        self.url = f"/api/conversations/{self.conversation.id}/messages/"
+
+    def test_pages_cover_every_message_once_newest_page_first(self):
+        pages, cursor = [], None
+        while True:
+            params = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+            body = self.client.get(self.url, params).json()
+            pages.append([message['content'] for message in body['messages']])
+            cursor = body['next_cursor']
+            self.assertEqual(body['has_more'], cursor is not None)
+            if not cursor:
+                break
+
+        self.assertEqual(pages, [
+            ['message 4', 'message 5', 'message 6'],
+            ['message 1', 'message 2', 'message 3'],
+            ['message 0'],
+        ])
+
+    def test_products_load_per_message(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get(self.url, {'limit': 2}).json()
+        message_query = next(query['sql'] for query in queries if 'delapp_conversationmessage' in query['sql'])
+        self.assertNotIn('search_results', message_query)
+        self.assertNotIn('search_results', body['messages'][0])
+
+        assistant = next(message for message in body['messages'] if message['has_products'])
+        response = self.client.get(f"{self.url}{assistant['id']}/products/")
+        self.assertEqual(response.json()['products'], [{'title': 'Lamp 5'}])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+
+class ConversationListTests(TestCase):
+    """The conversation list is paged and answers polling with 304 until something changes"""
+
+    def setUp(self):
+        from delapp.models import Conversation, CustomUser
+
+        self.user = CustomUser.objects.create_user(email='lists@example.com')
+        for title in ('lamps', 'desks', 'chairs'):
+            Conversation.objects.create(user=self.user, title=title)
+        Conversation.objects.create(user=self.user, title='archived', active=False)
+
+    def get(self, etag=None, **params):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from delapp.agent_views import get_conversations_view
+
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        request = APIRequestFactory().get('/api/conversations/', params, **headers)
+        force_authenticate(request, user=self.user)
+        response = get_conversations_view(request)
+        response.render()
+        return response
+
+    def test_pages_most_recently_updated_first(self):
+        first = self.get(limit=2)
+        second = self.get(limit=2, cursor=first.data['next_cursor'])
+
+        self.assertEqual([c['title'] for c in first.data['conversations']], ['chairs', 'desks'])
+        self.assertEqual([c['title'] for c in second.data['conversations']], ['lamps'])
+        self.assertFalse(second.data['has_more'])
+
+    def test_unchanged_list_is_not_modified(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from delapp.models import Conversation
+
+        etag = self.get()['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(etag=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(len(queries), 1)
+
+        Conversation.objects.filter(title='lamps').update(active=False)
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ConversationOwnershipTests(TestCase):
+    """The agent API drops a conversation_id that belongs to someone else"""
+
+    class StubAgent:
+        async def stream_query(self, query, conversation_id=None, **kwargs):
+            yield {'event': 'final', 'data': {'response': 'ok', 'products': [], 'conversation_id': conversation_id}}
+
+        async def process_query(self, query, conversation_id=None, **kwargs):
+            return {'response': 'ok', 'products': [], 'conversation_id': conversation_id}
+
+    def setUp(self):
+        from delapp.agent import api
+        from delapp.models import Conversation, CustomUser
+
+        self.api = api
+        self.previous_agent, api._agent = api._agent, self.StubAgent()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com')
+        self.other = CustomUser.objects.create_user(email='other@example.com')
+        self.mine = str(Conversation.objects.create(user=self.owner).id)
+        self.anonymous = str(Conversation.objects.create(session_id='s1').id)
+
+    def tearDown(self):
+        self.api._agent = self.previous_agent
+
+    def conversation_seen(self, conversation_id, user=None, session_id=None):
+        from asgiref.sync import async_to_sync
+        result = async_to_sync(self.api.process_query)(
+            'hello', conversation_id=conversation_id, user_id=str(user.id) if user else None, session_id=session_id
+        )
+        return result['conversation_id']
+
+    def test_owner_keeps_the_conversation(self):
+        self.assertEqual(self.conversation_seen(self.mine, user=self.owner), self.mine)
+        self.assertEqual(self.conversation_seen(self.anonymous, session_id='s1'), self.anonymous)
+
+    def test_other_callers_lose_the_conversation(self):
+        self.assertIsNone(self.conversation_seen(self.mine, user=self.other))
+        self.assertIsNone(self.conversation_seen(self.mine, session_id='s1'))
+        self.assertIsNone(self.conversation_seen(self.anonymous, session_id='s2'))
+        self.assertIsNone(self.conversation_seen(self.anonymous, user=self.other))
+        self.assertIsNone(self.conversation_seen('999999', user=self.owner))
+
+    def test_stream_checks_ownership_too(self):
+        from asgiref.sync import async_to_sync
+
+        async def final_conversation():
+            async for event in self.api.stream_query('hello', conversation_id=self.mine, user_id=str(self.other.id)):
+                return event['data']['conversation_id']
+
+        self.assertIsNone(async_to_sync(final_conversation)())
+
+    def test_first_session_claims_a_conversation_started_without_one(self):
+        from delapp.models import Conversation
+
+        unclaimed = str(Conversation.objects.create().id)
+        self.assertIsNone(self.conversation_seen(unclaimed))
+        self.assertEqual(self.conversation_seen(unclaimed, session_id='s2'), unclaimed)
+        self.assertEqual(self.conversation_seen(unclaimed, session_id='s2'), unclaimed)
+        self.assertIsNone(self.conversation_seen(unclaimed, session_id='s3'))
+        self.assertEqual(Conversation.objects.get(id=unclaimed).session_id, 's2')
+
+    async def read_stream(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    def test_views_do_not_echo_a_dropped_conversation(self):
+        from asgiref.sync import async_to_sync
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.post('/api/agent/query/', {'query': 'hello', 'conversation_id': self.mine}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['conversation_id'])
+
+        response = client.post('/api/agent/query/stream/', {'query': 'hello', 'conversation_id': self.mine},
+                               format='json')
+        body = async_to_sync(self.read_stream)(response)
+        self.assertIn('"conversation_id":null', body)
+
+
+class TurnPersistenceTests(TestCase):
+    """Each turn's messages are written once, by the agent"""
+
+    def test_agent_saves_both_messages_with_their_products(self):
+        from asgiref.sync import async_to_sync
+        from delapp.agent.memory.conversation_memory import ConversationMemory
+        from delapp.models import Conversation, ConversationMessage, ConversationState
+        from delapp.tests.fakes import make_agent
+
+        conversation = Conversation.objects.create()
+        ConversationState.objects.create(conversation=conversation)
+        agent = make_agent('product_search: desk lamp')
+        agent.memory_components = {'conversation_memory': ConversationMemory()}
+        agent.llm = None
+
+        result = async_to_sync(agent.process_query)('find me a desk lamp', conversation_id=str(conversation.id))
+
+        messages = list(ConversationMessage.objects.filter(conversation=conversation).order_by('id'))
+        self.assertEqual([message.role for message in messages], ['user', 'assistant'])
+        self.assertEqual(result['message_id'], messages[1].id)
+        self.assertTrue(messages[1].has_products)
+        self.assertEqual(messages[1].search_results[0]['name'], 'Desk lamp')
+        self.assertEqual(ConversationState.objects.get(conversation=conversation).current_products[0]['name'],
+                         'Desk lamp')
+
+
+class ConversationClearAndArchiveTests(TestCase):
+    """Clearing or archiving a conversation also drops the agent's chat window"""
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from delapp.agent import api
+        from delapp.agent.memory.chat_window import ChatWindowStore
+        from delapp.agent.memory.conversation_memory import ConversationMemory
+        from delapp.models import Conversation, ConversationMessage, CustomUser
+
+        class StubAgent:
+            memory_components = {'conversation_memory': ConversationMemory()}
+            chat_windows = ChatWindowStore()
+
+        self.api = api
+        self.previous_agent, api._agent = api._agent, StubAgent()
+        self.user = CustomUser.objects.create_user(email='clear@example.com')
+        self.conversation = Conversation.objects.create(user=self.user)
+        ConversationMessage.objects.create(conversation=self.conversation, role='user', content='hi')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.api._agent = self.previous_agent
+
+    def warm_window(self):
+        from asgiref.sync import async_to_sync
+        async_to_sync(self.api._agent.chat_windows.get_history)(str(self.conversation.id))
+        self.assertEqual(self.api._agent.chat_windows.stats()['conversations'], 1)
+
+    def test_clear(self):
+        from delapp.models import ConversationMessage
+        self.warm_window()
+
+        response = self.client.post(f'/api/conversations/{self.conversation.id}/clear/', {}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ConversationMessage.objects.filter(conversation=self.conversation).exists())
+        self.assertEqual(self.api._agent.chat_windows.stats()['conversations'], 0)
+
+    def test_archive(self):
+        self.warm_window()
+
+        response = self.client.post(f'/api/conversations/{self.conversation.id}/archive/', {}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.conversation.refresh_from_db()
+        self.assertFalse(self.conversation.active)
+        self.assertEqual(self.api._agent.chat_windows.stats()['conversations'], 0)
+
+    def test_other_users_get_404(self):
+        from delapp.models import CustomUser
+        self.client.force_authenticate(CustomUser.objects.create_user(email='stranger@example.com'))
+
+        response = self.client.post(f'/api/conversations/{self.conversation.id}/archive/', {}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.conversation.refresh_from_db()
+        self.assertTrue(self.conversation.active)
@@ -0,0 +1,39 @@
+from django.test import TestCase
+
+
+class HTTPCacheMiddlewareTests(TestCase):
+    """Views' caching policies become headers, ETags and 304s; no-store is kept where it is needed"""
+
+    def setUp(self):
+        from django.test import override_settings
+
+        override = override_settings(MIDDLEWARE=['delapp.middleware.HTTPCacheMiddleware'])
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_declared_policy_and_conditional_get(self):
+        response = self.client.get('/api/products/back-in-stock/')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertNotIn('Authorization', response.get('Vary', ''))
+
+        repeat = self.client.get('/api/products/back-in-stock/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((repeat.status_code, repeat.content), (304, b''))
+        self.assertEqual((repeat['ETag'], repeat['Cache-Control']), (response['ETag'], 'public, max-age=60'))
+
+    def test_undeclared_reads_are_private_and_revalidated(self):
+        from delapp.models import Conversation, ConversationMessage
+
+        conversation = Conversation.objects.create(title='lamps')
+        ConversationMessage.objects.create(conversation=conversation, role='user', content='lamps')
+        url = f"/api/conversations/{conversation.id}/messages/"
+
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+
+        ConversationMessage.objects.create(conversation=conversation, role='assistant', content='Here are lamps')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_errors_and_writes_are_not_stored(self):
+        self.assertIn('no-store', self.client.get('/api/conversations/1/messages/', {'cursor': 'x'})['Cache-Control'])
+        self.assertIn('no-store', self.client.post('/api/products/back-in-stock/')['Cache-Control'])
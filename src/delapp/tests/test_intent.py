@@ -0,0 +1,122 @@
+from django.test import TestCase
+
+
+class IntentClassifierTests(TestCase):
+    def setUp(self):
+        from delapp.agent.core.intent_classifier import IntentClassifier
+        self.classifier = IntentClassifier.from_file()
+
+    def test_weighted_phrases_pick_the_strongest_intent(self):
+        result = self.classifier.classify("Remove the laptop from my cart")
+        self.assertEqual(result.intent, 'cart_remove')
+        self.assertGreater(result.scores['cart_remove'], result.scores['search'])
+
+    def test_spans_point_into_the_query(self):
+        query = "Find a coffee maker under $50"
+        result = self.classifier.classify(query)
+        self.assertEqual(result.intent, 'search')
+        self.assertIn('coffee maker', [query.lower()[s.start:s.end] for s in result.spans])
+
+    def test_phrases_match_whole_words_only(self):
+        result = self.classifier.classify("that was quite an activity")
+        self.assertEqual(result.intent, 'conversation')
+        self.assertEqual(result.spans, [])
+
+    def test_labelled_samples(self):
+        from delapp.management.commands.evaluate_intents import DEFAULT_LABELS_PATH, load_labelled_queries
+        labelled = load_labelled_queries(DEFAULT_LABELS_PATH)
+        correct = sum(self.classifier.classify(query).intent == intent for intent, query in labelled)
+        self.assertGreaterEqual(correct / len(labelled), 0.9)
+
+
+class IntentModelTests(TestCase):
+    def setUp(self):
+        from delapp.agent.core.intent_model import train_intent_model
+        from delapp.management.commands.evaluate_intents import DEFAULT_LABELS_PATH, load_labelled_queries
+        self.samples = [(query, intent) for intent, query in load_labelled_queries(DEFAULT_LABELS_PATH)]
+        self.model = train_intent_model(self.samples, n_features=2 ** 12)
+
+    def test_fits_the_labelled_samples(self):
+        from delapp.agent.core.intent_model import accuracy
+        self.assertGreaterEqual(accuracy(self.model, self.samples), 0.9)
+
+    def test_saved_model_is_memory_mapped(self):
+        import os
+        import tempfile
+        import numpy as np
+        from delapp.agent.core.intent_model import IntentModel
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'intent_model.npy')
+            self.model.save(path)
+            loaded = IntentModel.load(path)
+
+            self.assertIsInstance(loaded.weights, np.memmap)
+            self.assertEqual(loaded.classes, self.model.classes)
+            self.assertEqual(loaded.predict("show my cart")[0], self.model.predict("show my cart")[0])
+
+
+class TrainIntentModelCommandTests(TestCase):
+    def test_requires_an_output_path(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        with self.assertRaises(CommandError):
+            call_command('train_intent_model')
+
+    def test_history_is_labelled_by_what_followed_each_message(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from delapp.management.commands.train_intent_model import history_samples
+        from delapp.models import Cart, Conversation, ConversationMessage, SavedItem
+
+        conversation = Conversation.objects.create()
+        lamps = [{'id': 'l1', 'name': 'Desk lamp'}, {'id': 'l2', 'name': 'Floor lamp'}]
+        turns = [
+            ('lamps for my office', lamps),
+            ('how tall is the second one', [lamps[1]]),
+            ('hmm not sure', None),
+            ('grab the floor lamp', [lamps[1]]),
+        ]
+        start = timezone.now()
+        for i, (query, products) in enumerate(turns):
+            at = start + timedelta(minutes=i)
+            for role, content in (('user', query), ('assistant', 'reply')):
+                message = ConversationMessage.objects.create(
+                    conversation=conversation, role=role, content=content,
+                    has_products=role == 'assistant' and bool(products),
+                    search_results=products if role == 'assistant' else None
+                )
+                ConversationMessage.objects.filter(id=message.id).update(created_at=at)
+        item = SavedItem.objects.create(cart=Cart.objects.create(session_id='train'), product_id='l2',
+                                        title='Floor lamp', conversation=conversation)
+        SavedItem.objects.filter(id=item.id).update(created_at=start + timedelta(minutes=2, seconds=30))
+
+        self.assertEqual(history_samples(), [
+            ('lamps for my office', 'search'),
+            ('how tall is the second one', 'details'),
+            ('grab the floor lamp', 'cart_add'),
+        ])
+
+    def test_trains_without_the_evaluation_queries(self):
+        import io
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from delapp.agent.core.intent_model import IntentModel, accuracy
+        from delapp.management.commands.evaluate_intents import DEFAULT_LABELS_PATH, load_labelled_queries
+        from delapp.management.commands.train_intent_model import DEFAULT_SEED_PATH, collect_samples
+
+        evaluation = [query for _, query in load_labelled_queries(DEFAULT_LABELS_PATH)]
+        _, samples = collect_samples([DEFAULT_SEED_PATH, DEFAULT_LABELS_PATH], exclude=evaluation)
+        self.assertFalse({query for query, _ in samples} & set(evaluation))
+
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'intent_model.npy')
+            call_command('train_intent_model', output=path, holdout=0, n_features=2 ** 12, stdout=output)
+            model = IntentModel.load(path)
+
+        seed = [(query, intent) for intent, query in load_labelled_queries(DEFAULT_SEED_PATH)]
+        self.assertGreaterEqual(accuracy(model, seed), 0.9)
+        self.assertIn('intent_samples.tsv', output.getvalue())
@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+
+class LLMResponseCacheTests(TestCase):
+    def make_cache(self):
+        import os
+        import tempfile
+        from delapp.agent.core.llm_cache import LLMResponseCache, SQLiteCacheBackend
+
+        directory = tempfile.mkdtemp()
+        backend = SQLiteCacheBackend(os.path.join(directory, 'llm.sqlite3'), max_entries=2)
+        return LLMResponseCache(backend, ttl=60, max_temperature=0.3)
+
+    def test_keys_normalize_prompts_and_bypass_personal_turns(self):
+        cache = self.make_cache()
+        key = cache.cache_key('llama3', 0.2, 'Hi there!')
+
+        self.assertEqual(key, cache.cache_key('llama3', 0.2, '  hi   THERE '))
+        self.assertNotEqual(key, cache.cache_key('gpt-3.5', 0.2, 'hi there'))
+        self.assertIsNone(cache.cache_key('llama3', 0.9, 'hi there'))
+        self.assertIsNone(cache.cache_key('llama3', 0.2, 'hi there', chat_history='Human: hello'))
+        self.assertIsNone(cache.cache_key('llama3', 0.2, 'where is my order 123456'))
+
+    async def test_hits_misses_and_eviction(self):
+        cache = self.make_cache()
+        keys = [cache.cache_key('llama3', 0.2, prompt) for prompt in ['hi', 'thanks', 'what can you do']]
+
+        self.assertIsNone(await cache.get(keys[0]))
+        for key in keys:
+            await cache.set(key, f"answer {key[:6]}")
+        await cache.get(None)
+
+        self.assertIsNone(await cache.get(keys[0]))
+        self.assertEqual(await cache.get(keys[2]), f"answer {keys[2][:6]}")
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['bypassed']), (1, 2, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 0.333)
@@ -0,0 +1,57 @@
+from django.test import TestCase
+
+
+class LLMRouterTests(TestCase):
+    """Hedging, failover and circuit breaking across LLM backends"""
+
+    def make_backend(self, name, latency=0.0, error=None, **kwargs):
+        from delapp.agent.core.llm_router import FakeChatModel, LLMBackend
+        return LLMBackend(name, FakeChatModel(responses=[f'{name} answer'], latency=latency, error=error), **kwargs)
+
+    async def test_slow_backend_is_hedged(self):
+        from delapp.agent.core.llm_router import LLMRouter
+        slow, fast = self.make_backend('slow', latency=1.0), self.make_backend('fast', latency=0.01)
+        router = LLMRouter([slow, fast], hedge_default_delay=0.05, hedge_min_delay=0.01)
+
+        message = await router.ainvoke('hello')
+        tokens = [chunk.content async for chunk in router.astream('hello')]
+
+        self.assertEqual(message.content, 'fast answer')
+        self.assertEqual(''.join(tokens), 'fast answer')
+        stats = router.stats()
+        self.assertEqual(stats['hedged_calls'], 2)
+        self.assertEqual(stats['backends']['fast']['hedged_wins'], 2)
+        self.assertEqual(stats['backends']['slow']['cancelled'], 2)
+
+    async def test_failing_backend_fails_over_and_opens_its_circuit(self):
+        from delapp.agent.core.llm_router import LLMRouter
+        broken = self.make_backend('broken', error='503 Service Unavailable', failure_threshold=2)
+        spare = self.make_backend('spare')
+        router = LLMRouter([broken, spare], hedge=False)
+
+        for _ in range(3):
+            self.assertEqual((await router.ainvoke('hello')).content, 'spare answer')
+
+        stats = router.stats()['backends']['broken']
+        # The third call skipped the open circuit
+        self.assertEqual((stats['failures'], stats['circuit']), (2, 'open'))
+        self.assertGreater(stats['error_rate'], 0)
+
+    async def test_timeouts_count_against_the_backend(self):
+        from delapp.agent.core.llm_router import LLMRouter, LLMUnavailableError
+        hung = self.make_backend('hung', latency=1.0, timeout=0.05)
+        router = LLMRouter([hung])
+
+        with self.assertRaises(LLMUnavailableError):
+            await router.ainvoke('hello')
+        self.assertEqual(router.stats()['backends']['hung']['timeouts'], 1)
+
+    def test_backends_without_api_keys_are_skipped(self):
+        from delapp.agent.core.llm_router import build_llm_router
+        config = {'BACKENDS': [
+            {'NAME': 'groq', 'PROVIDER': 'groq', 'API_KEY_ENV': 'DEALA_TEST_MISSING_KEY'},
+            {'NAME': 'local', 'PROVIDER': 'fake'},
+        ]}
+        router = build_llm_router(config)
+        self.assertEqual([backend.name for backend in router.backends], ['local'])
+        self.assertIsNone(build_llm_router({'BACKENDS': config['BACKENDS'][:1]}))
@@ -0,0 +1,31 @@
+from django.test import TestCase, TransactionTestCase
+
+
+class TransactionMonitorTests(TransactionTestCase):
+    """The load test's monitor counts transactions from first query to commit"""
+
+    def test_counts_committed_and_rolled_back_transactions(self):
+        from django.db import transaction
+        from delapp.loadtest import TransactionMonitor
+        from delapp.models import Conversation
+
+        monitor = TransactionMonitor()
+        monitor.install()
+        try:
+            Conversation.objects.count()
+            with transaction.atomic():
+                Conversation.objects.create(title='lamps')
+                Conversation.objects.count()
+            try:
+                with transaction.atomic():
+                    Conversation.objects.create(title='desks')
+                    raise ValueError('rolled back')
+            except ValueError:
+                pass
+            Conversation.objects.count()
+        finally:
+            monitor.uninstall()
+
+        report = monitor.report()
+        self.assertEqual((report['duration_ms']['count'], report['peak_open'], report['still_open']), (2, 1, 0))
+        self.assertEqual(Conversation.objects.count(), 1)
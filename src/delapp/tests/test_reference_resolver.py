@@ -0,0 +1,126 @@
+from django.test import TestCase
+
+
+class ReferenceResolverTests(TestCase):
+    """Follow-ups that point at a product already shown"""
+
+    PRODUCTS = [
+        {'id': 'a', 'title': 'Sony WH-1000XM5 Wireless Headphones Black', 'price': '$348.00', 'retailer': 'Best Buy'},
+        {'id': 'b', 'title': 'Bose QuietComfort 45 Headphones White', 'price': '$279.00', 'retailer': 'Amazon'},
+        {'id': 'c', 'title': 'Sony WH-CH720N Headphones Black', 'price': 99.99, 'retailer': 'Amazon'},
+    ]
+
+    def resolve(self, query):
+        from delapp.agent.core.reference_resolver import ReferenceResolver
+        reference = ReferenceResolver().resolve(query, self.PRODUCTS)
+        return reference.product['id'] if reference else None
+
+    def test_ordinals_price_ranks_and_attributes(self):
+        self.assertEqual(self.resolve('tell me about the second one'), 'b')
+        self.assertEqual(self.resolve('add the last one to my cart'), 'c')
+        self.assertEqual(self.resolve('#1 please'), 'a')
+        self.assertEqual(self.resolve('the cheaper black one'), 'c')
+        self.assertEqual(self.resolve('which is the most expensive?'), 'a')
+        self.assertEqual(self.resolve('the one from best buy'), 'a')
+        self.assertEqual(self.resolve('the bose one'), 'b')
+        self.assertEqual(self.resolve('the second black one'), 'c')
+
+    def test_new_searches_and_ambiguous_references_are_not_resolved(self):
+        self.assertIsNone(self.resolve('show me cheaper ones'))
+        self.assertIsNone(self.resolve('the cheapest laptop'))
+        self.assertIsNone(self.resolve('black headphones under 100'))
+        self.assertIsNone(self.resolve('the black sony one'))
+        self.assertIsNone(self.resolve('what is the best one'))
+
+    def test_words_that_only_look_like_references_are_not_resolved(self):
+        self.assertIsNone(self.resolve('show me laptops for a first time gamer'))
+        self.assertIsNone(self.resolve('I want the last generation iPad'))
+        self.assertIsNone(self.resolve('find a cheaper one under 200'))
+        self.assertIsNone(self.resolve('is the second one compatible with my ps5'))
+        self.assertEqual(self.resolve('does the first one have good reviews?'), 'a')
+        self.assertEqual(self.resolve('the first product'), 'a')
+        self.assertEqual(self.resolve("I'll take the last"), 'c')
+
+    def test_resolution_is_fast(self):
+        import time
+        from delapp.agent.core.reference_resolver import ReferenceResolver
+        resolver = ReferenceResolver()
+        start = time.perf_counter()
+        for _ in range(1000):
+            resolver.resolve('the cheaper black one', self.PRODUCTS)
+        self.assertLess((time.perf_counter() - start) / 1000, 0.001)
+
+    def test_product_cards_resolve_like_products(self):
+        from delapp.agent.core.reference_resolver import ReferenceResolver
+        cards = [{'id': product['id'], 'name': product['title'], 'currentPrice': product['price'],
+                  'retailer': product['retailer']} for product in self.PRODUCTS]
+        reference = ReferenceResolver().resolve('the cheaper black one', cards)
+        self.assertEqual(reference.product['id'], 'c')
+
+    def test_conversation_memory_keeps_current_products(self):
+        from asgiref.sync import async_to_sync
+        from delapp.agent.memory.conversation_memory import ConversationMemory
+        from delapp.models import Conversation, ConversationState
+
+        conversation = Conversation.objects.create()
+        ConversationState.objects.create(conversation=conversation)
+        memory = ConversationMemory()
+
+        async_to_sync(memory.update)({'conversation_id': conversation.id,
+                                      'state': {'current_products': self.PRODUCTS}})
+        state = async_to_sync(memory.get_state)(str(conversation.id))
+        self.assertEqual(state['current_products'], self.PRODUCTS)
+        self.assertEqual(async_to_sync(memory.get_state)('999999'), {})
+
+    async def test_agent_answers_references_without_searching(self):
+        from delapp.agent.tools.langchain_tools import ProductDetailsLangChainTool
+        from delapp.tests.fakes import make_agent
+
+        class FakeMemory:
+            async def get_state(self, conversation_id):
+                return {'current_products': ReferenceResolverTests.PRODUCTS}
+
+        agent = make_agent('unused')
+        agent.tools.append(ProductDetailsLangChainTool())
+        agent.memory_components = {'conversation_memory': FakeMemory()}
+        search_tool = agent.tools[0]
+        calls_before = search_tool.calls
+
+        result = await agent.process_query('tell me more about the cheaper black one',
+                                           conversation_id='test_conversation')
+
+        self.assertEqual(search_tool.calls, calls_before)
+        self.assertEqual([product['id'] for product in result['products']], ['c'])
+        self.assertIn('Sony WH-CH720N', result['response'])
+
+    def test_follow_ups_through_the_user_query_endpoint_keep_the_shown_products(self):
+        from rest_framework.test import APIClient
+        from delapp.agent import api
+        from delapp.agent.memory.conversation_memory import ConversationMemory
+        from delapp.agent.tools.product_cards import product_card
+        from delapp.models import Conversation, ConversationState, CustomUser
+        from delapp.tests.fakes import make_agent
+
+        agent = make_agent('unused')
+        agent.memory_components = {'conversation_memory': ConversationMemory()}
+        agent.llm = None
+        previous_agent, api._agent = api._agent, agent
+        self.addCleanup(setattr, api, '_agent', previous_agent)
+
+        user = CustomUser.objects.create_user(email='follow-up@example.com')
+        conversation = Conversation.objects.create(user=user)
+        ConversationState.objects.create(conversation=conversation,
+                                         current_products=[product_card(product) for product in self.PRODUCTS])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        shown = []
+        for query in ['tell me about the second one', 'and the third one?']:
+            response = client.post('/api/user-query/', {'query': query, 'conversation_id': conversation.id},
+                                   format='json')
+            self.assertEqual(response.status_code, 200)
+            shown.append([deal['id'] for deal in response.json()['deals']])
+
+        self.assertEqual(shown, [['b'], ['c']])
+        state = ConversationState.objects.get(conversation=conversation)
+        self.assertEqual([product['id'] for product in state.current_products], ['a', 'b', 'c'])
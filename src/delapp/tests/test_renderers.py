@@ -0,0 +1,52 @@
+from django.test import TestCase
+import json
+
+
+class ORJSONRendererTests(TestCase):
+    """The orjson renderer and parser are drop-ins for DRF's JSONRenderer and JSONParser"""
+
+    def test_renders_what_json_renderer_renders(self):
+        import uuid
+        from datetime import date, datetime, timezone
+        from decimal import Decimal
+        from rest_framework.renderers import JSONRenderer
+        from delapp.renderers import ORJSONRenderer
+
+        payload = {
+            'id': uuid.uuid4(),
+            'created_at': datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=timezone.utc),
+            'day': date(2024, 5, 1),
+            'price': Decimal('19.99'),
+            'content': 'Desk lamp\u2028caf\u00e9',
+            'search_results': [{'name': 'Desk lamp', 'currentPrice': 19.99, 'rating': None}],
+            7: 'int key',
+        }
+
+        self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertEqual(ORJSONRenderer().render({'a': 1}, 'application/json; indent=4'), b'{\n  "a": 1\n}')
+
+    def test_renders_dataclasses(self):
+        from datetime import datetime
+        from delapp.models import ProductDeal
+        from delapp.renderers import ORJSONRenderer
+
+        deal = ProductDeal(product_id='lamp-1', title='Desk lamp', price=19.99, url='https://example.com/lamp',
+                           image_url='', retailer='Target', description='', available=True,
+                           timestamp=datetime(2024, 5, 1, 12, 30))
+
+        rendered = json.loads(ORJSONRenderer().render([deal]))[0]
+        self.assertEqual((rendered['title'], rendered['timestamp']), ('Desk lamp', '2024-05-01T12:30:00'))
+
+    def test_parser_matches_json_parser(self):
+        from io import BytesIO
+        from rest_framework.exceptions import ParseError
+        from delapp.parsers import ORJSONParser
+
+        body = '{"query": "lampe de bureau à 20 €", "conversation_id": null}'.encode()
+        self.assertEqual(ORJSONParser().parse(BytesIO(body)), json.loads(body))
+        latin1 = BytesIO('{"query": "lampe à 20"}'.encode('latin-1'))
+        self.assertEqual(ORJSONParser().parse(latin1, parser_context={'encoding': 'latin-1'}), {'query': 'lampe à 20'})
+        for bad in (b'{"query": ', b'{"price": NaN}'):
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(BytesIO(bad))
@@ -0,0 +1,111 @@
+from django.test import TestCase
+
+
+class ResponseFormatterTests(TestCase):
+    """Template replies straight away, LLM polish only where the endpoint's policy allows"""
+
+    CARDS = [
+        {'id': 'a', 'name': 'Desk lamp', 'currentPrice': 19.99, 'retailer': 'Target'},
+        {'id': 'b', 'name': 'Floor lamp', 'currentPrice': 49.0, 'retailer': 'IKEA'},
+    ]
+
+    class SlowLLM:
+        def __init__(self, delay):
+            self.delay = delay
+            self.calls = 0
+            self.prompts = []
+
+        async def ainvoke(self, prompt):
+            import asyncio
+            from langchain.schema import AIMessage
+            self.calls += 1
+            self.prompts.append(prompt)
+            await asyncio.sleep(self.delay)
+            return AIMessage(content='<think>two lamps</think>Two lamps worth a look.')
+
+    class DictCache:
+        def __init__(self):
+            self.entries = {}
+
+        async def get(self, key):
+            return self.entries.get(key)
+
+        async def set(self, key, value, ttl):
+            self.entries[key] = value
+
+    def make_formatter(self, delay=0.0, **policy):
+        from delapp.agent.response_generator.response_formatter import FormattingPolicy, ResponseFormatter
+        policy.setdefault('paid_only', False)
+        return ResponseFormatter(llm=self.SlowLLM(delay), cache=self.DictCache(),
+                                 policies={'default': FormattingPolicy(), 'chat': FormattingPolicy(**policy)})
+
+    async def test_template_reply_without_polish(self):
+        formatter = self.make_formatter(polish='inline', budget_ms=1000)
+
+        text = await formatter.format_product_search_response('lamp', self.CARDS, endpoint='other')
+
+        self.assertIn('1. Desk lamp - $19.99', text)
+        self.assertIn('Retailer: IKEA', text)
+        self.assertEqual(formatter.llm.calls, 0)
+        self.assertEqual(formatter.stats()['template'], 1)
+
+    async def test_inline_polish_within_budget_is_cached_by_query_and_product_set(self):
+        formatter = self.make_formatter(polish='inline', budget_ms=1000)
+
+        first = await formatter.format_product_search_response('lamp', self.CARDS, endpoint='chat')
+        second = await formatter.format_product_search_response('  Lamp ', self.CARDS, endpoint='chat')
+
+        self.assertEqual(first, 'Two lamps worth a look.')
+        self.assertEqual(second, first)
+        self.assertEqual(formatter.llm.calls, 1)
+        self.assertEqual((formatter.stats()['polished'], formatter.stats()['cached']), (1, 1))
+
+    async def test_other_queries_over_the_same_products_are_polished_for_their_own_question(self):
+        formatter = self.make_formatter(polish='inline', budget_ms=1000)
+
+        await formatter.format_product_search_response('lamp', self.CARDS, endpoint='chat')
+        await formatter.format_product_search_response('cheap reading light', self.CARDS, endpoint='chat')
+
+        self.assertEqual(formatter.llm.calls, 2)
+        self.assertIn('lamp', formatter.llm.prompts[0])
+        self.assertIn('cheap reading light', formatter.llm.prompts[1])
+        self.assertEqual(formatter.stats()['cached'], 0)
+
+    async def test_over_budget_answers_from_the_template_and_polishes_for_next_time(self):
+        import asyncio
+        formatter = self.make_formatter(delay=0.05, polish='inline', budget_ms=5)
+
+        text = await formatter.format_product_search_response('lamp', self.CARDS, endpoint='chat')
+        self.assertTrue(text.startswith("I found 2 products matching 'lamp'"))
+        self.assertEqual(formatter.stats()['over_budget'], 1)
+
+        await asyncio.sleep(0.1)
+        text = await formatter.format_product_search_response('lamp', self.CARDS, endpoint='chat')
+        self.assertEqual(text, 'Two lamps worth a look.')
+        self.assertEqual(formatter.llm.calls, 1)
+
+    async def test_background_polish_runs_once_per_product_set(self):
+        import asyncio
+        formatter = self.make_formatter(delay=0.02, polish='background')
+
+        texts = await asyncio.gather(*[
+            formatter.format_product_search_response('lamp', self.CARDS, endpoint='chat') for _ in range(3)
+        ])
+        self.assertTrue(all(text.startswith('I found 2 products') for text in texts))
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(formatter.llm.calls, 1)
+        self.assertEqual(formatter.stats()['pending'], 0)
+
+    def test_paid_only_polish_needs_an_active_subscription(self):
+        from asgiref.sync import async_to_sync
+        from delapp.models import CustomUser, UserSubscription
+
+        formatter = self.make_formatter(polish='inline', budget_ms=1000, paid_only=True)
+        user = CustomUser.objects.create(email='lamps@example.com')
+        format_reply = async_to_sync(formatter.format_product_search_response)
+
+        self.assertTrue(format_reply('lamp', self.CARDS, endpoint='chat', user_id=str(user.id)).startswith('I found'))
+        UserSubscription.objects.create(user=user, is_active=True, variant_id='pro')
+        self.assertEqual(format_reply('lamp', self.CARDS, endpoint='chat', user_id=str(user.id)),
+                         'Two lamps worth a look.')
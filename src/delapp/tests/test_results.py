@@ -0,0 +1,160 @@
+from django.test import TestCase
+import json
+
+
+class SearchResultTests(TestCase):
+    class StaticSearchTool:
+        async def execute(self, query, **kwargs):
+            from delapp.agent.tools.product_cards import product_card
+            return {'success': True, 'products': [product_card(
+                {'product_id': 'p1', 'title': 'Desk lamp', 'price': 19.99, 'original_price': 29.99,
+                 'retailer': 'Target', 'url': 'https://example.com/p1'},
+                price_context={'as_of': __import__('datetime').date(2024, 1, 1)}
+            )]}
+
+    async def test_search_returns_cards_in_process(self):
+        from delapp.agent.tools.langchain_tools import ProductSearchLangChainTool
+        from delapp.agent.tools.results import SearchResult
+
+        result = await ProductSearchLangChainTool(self.StaticSearchTool()).search('desk lamp')
+
+        self.assertIsInstance(result, SearchResult)
+        self.assertTrue(result.success)
+        self.assertEqual(result.products[0]['name'], 'Desk lamp')
+        self.assertEqual(result.products[0]['savings']['percent'], 33)
+        self.assertIn('Desk lamp - $19.99', result.text)
+
+    async def test_llm_facing_tool_still_returns_json(self):
+        from delapp.agent.tools.langchain_tools import ProductSearchLangChainTool
+
+        output = await ProductSearchLangChainTool(self.StaticSearchTool()).ainvoke('desk lamp')
+
+        data = json.loads(output)
+        self.assertEqual((data['success'], data['product_count'], data['has_products']), (True, 1, True))
+        self.assertEqual(data['products'][0]['productLink'], 'https://example.com/p1')
+
+    def test_failed_search_is_a_result_not_an_exception(self):
+        from asgiref.sync import async_to_sync
+        from delapp.agent.tools.langchain_tools import ProductSearchLangChainTool
+
+        class EmptySearchTool:
+            async def execute(self, query, **kwargs):
+                return {'success': True, 'products': []}
+
+        result = async_to_sync(ProductSearchLangChainTool(EmptySearchTool()).search)('unicorn')
+        self.assertFalse(result.success)
+        self.assertEqual(result.products, [])
+
+
+class ProductCardTests(TestCase):
+    """One product shape from the search provider to the frontend and the cart"""
+
+    def make_deal(self, **overrides):
+        from datetime import datetime
+        from delapp.searchapi_io import ProductDeal
+        fields = dict(
+            product_id='B01', title='Desk lamp', price=19.99, original_price=29.99,
+            url='https://example.com/b01', image_url='', retailer='Target', description='LED',
+            available=True, rating=4.5, seller=None, review_count=120, timestamp=datetime(2024, 1, 1),
+            condition='New', shipping_info=None, discount=None, coupon=None, trending=None,
+            sold_count=None, watchers=None, return_policy=None, location=None
+        )
+        fields.update(overrides)
+        return ProductDeal(**fields)
+
+    def test_deals_and_older_product_shapes_give_the_same_card(self):
+        from delapp.agent.tools.product_cards import PLACEHOLDER_IMAGE, product_card
+
+        card = product_card(self.make_deal())
+        older = product_card({'product_id': 'B01', 'title': 'Desk lamp', 'price': '$19.99',
+                              'original_price': '29.99', 'link': 'https://example.com/b01',
+                              'retailer': 'Target', 'description': 'LED', 'rating': 4.5,
+                              'reviewCount': 120})
+
+        self.assertEqual(card, older)
+        self.assertEqual((card['id'], card['name'], card['currentPrice']), ('B01', 'Desk lamp', 19.99))
+        self.assertEqual((card['productLink'], card['image_url']), ('https://example.com/b01', PLACEHOLDER_IMAGE))
+        self.assertEqual(card['savings'], {'amount': 10.0, 'percent': 33})
+        # A card is already in its final shape
+        self.assertEqual(product_card(card), card)
+
+    def test_search_tool_builds_cards_once_with_price_context(self):
+        from asgiref.sync import async_to_sync
+        from delapp.agent.tools.product_search_tool import ProductSearchTool
+        from products.models import PriceHistory
+        from products.services import ProductStorageService
+
+        ProductStorageService.store_products([self.make_deal(price=29.99)])
+        deal = self.make_deal(original_price=None)
+
+        class Provider:
+            async def search_deals_async(self, **kwargs):
+                return {'searchapi': [deal]}
+
+        with self.assertNumQueries(1):
+            result = async_to_sync(ProductSearchTool(provider=Provider(), persist_results=False).execute)('desk lamp')
+
+        card = result['products'][0]
+        self.assertEqual((card['id'], card['name'], card['retailer']), ('B01', 'Desk lamp', 'Target'))
+        self.assertNotIn('savings', card)
+        self.assertEqual((card['priceContext']['current'], card['priceContext']['min']), (19.99, 19.99))
+        self.assertEqual(PriceHistory.objects.count(), 1)
+
+    def test_search_results_are_stored_off_the_request_path(self):
+        from delapp.agent.tools.product_search_tool import store_search_results
+        from products.models import StoredProduct
+
+        store_search_results([self.make_deal()])
+        store_search_results([self.make_deal(price=17.5)])
+
+        product = StoredProduct.objects.get(product_id='B01')
+        self.assertEqual((float(product.price), product.price_samples), (17.5, 2))
+
+    def test_catalog_writer_backlog_is_coalesced_and_bounded(self):
+        from delapp.agent.tools.product_search_tool import CatalogWriter
+        from products.models import StoredProduct
+
+        class ManualExecutor:
+            def __init__(self):
+                self.jobs = []
+
+            def submit(self, job):
+                self.jobs.append(job)
+
+        writer = CatalogWriter(max_pending=2)
+        writer._executor = executor = ManualExecutor()
+
+        with self.assertLogs('delapp.agent.tools.product_search_tool', level='WARNING') as logs:
+            writer.submit([self.make_deal(), self.make_deal(product_id='B02')])
+            writer.submit([self.make_deal(price=17.5), self.make_deal(product_id='B03')])
+            writer.submit([self.make_deal(product_id='B04')])
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(len(executor.jobs), 1)
+        self.assertEqual({key: writer.stats()[key] for key in ('pending', 'queued', 'coalesced', 'dropped')},
+                         {'pending': 2, 'queued': 2, 'coalesced': 1, 'dropped': 2})
+
+        executor.jobs[0]()
+
+        self.assertEqual(sorted(StoredProduct.objects.values_list('product_id', 'price_samples')),
+                         [('B01', 1), ('B02', 1)])
+        self.assertEqual(float(StoredProduct.objects.get(product_id='B01').price), 17.5)
+        self.assertEqual((writer.stats()['pending'], writer.stats()['written']), (0, 2))
+
+    def test_catalog_writer_backlog_is_in_the_agent_metrics(self):
+        from delapp.agent.api import get_agent_metrics
+        self.assertIn('pending', get_agent_metrics()['catalog_writer'])
+
+    def test_cart_stores_the_card(self):
+        from asgiref.sync import async_to_sync
+        from delapp.agent.tools.cart_management_tool import CartManagementTool
+        from delapp.agent.tools.product_cards import product_card
+        from delapp.models import SavedItem
+
+        card = product_card(self.make_deal())
+        result = async_to_sync(CartManagementTool().execute)('add', session_id='cards', product_data=card)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['message'], 'Added Desk lamp to your cart')
+        item = SavedItem.objects.get(product_id='B01')
+        self.assertEqual((item.title, item.price, item.product_url), ('Desk lamp', 19.99, 'https://example.com/b01'))
+        self.assertEqual(item.metadata['name'], 'Desk lamp')
@@ -0,0 +1,95 @@
+from django.test import TestCase
+import json
+
+
+class AgentStreamTests(TestCase):
+    class StubAgent:
+        async def stream_query(self, query, **kwargs):
+            yield {'event': 'intent', 'data': {'intent': 'conversation', 'confidence': 0.5, 'source': 'keywords'}}
+            for token in ['Hi', ' there']:
+                yield {'event': 'token', 'data': {'text': token}}
+            yield {'event': 'final', 'data': {'response': 'Hi there', 'products': [], 'conversation_id': '7'}}
+
+    def setUp(self):
+        from delapp.agent import api
+        self.api = api
+        self.previous_agent, api._agent = api._agent, self.StubAgent()
+
+    def tearDown(self):
+        self.api._agent = self.previous_agent
+
+    async def test_events_arrive_in_order(self):
+        from django.test import AsyncClient
+
+        response = await AsyncClient().post(
+            '/api/agent/query/stream/', {'query': 'hello'}, content_type='application/json'
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        events = [line.split(': ', 1)[1] for line in body.splitlines() if line.startswith('event: ')]
+        self.assertEqual(events, ['intent', 'token', 'token', 'final'])
+        final = json.loads(body.rstrip().rsplit('data: ', 1)[1])
+        self.assertEqual(final['message'], 'Hi there')
+        self.assertTrue(final['success'])
+
+
+class SpeculativeSearchTests(TestCase):
+    def make_agent(self, answer):
+        from delapp.tests.fakes import make_agent
+        return make_agent(answer)
+
+    async def test_warm_results_are_used_when_the_llm_asks_for_search(self):
+        agent = self.make_agent('product_search: desk lamp')
+        # Mostly a details request, but the price cue makes a search plausible
+        result = await agent.process_query('describe what is affordable')
+
+        self.assertEqual(result['products'][0]['name'], 'Desk lamp')
+        self.assertEqual(result['response'], 'Found 1 product')
+        stats = agent.speculation_stats()
+        self.assertEqual((stats['launched'], stats['used'], stats['hit_rate']), (1, 1, 1.0))
+
+    async def test_unused_search_is_cancelled(self):
+        agent = self.make_agent('Happy to help with that!')
+        result = await agent.process_query('describe what is affordable')
+
+        self.assertEqual(result['products'], [])
+        stats = agent.speculation_stats()
+        self.assertEqual((stats['launched'], stats['cancelled'], stats['wasted_quota_min']), (1, 1, 0))
+
+
+class ToolCallStreamingTests(TestCase):
+    """A product_search call from the LLM runs the search without streaming the call itself"""
+
+    async def stream(self, answer, query='describe what is affordable'):
+        from delapp.tests.fakes import make_agent
+        agent = make_agent(answer)
+        events = [event async for event in agent.stream_query(query)]
+        tokens = ''.join(event['data']['text'] for event in events if event['event'] == 'token')
+        searched = any(event['event'] == 'products' for event in events)
+        return tokens, searched
+
+    async def test_split_tool_call_is_not_streamed(self):
+        tokens, searched = await self.stream(['prod', 'uct_sea', 'rch: desk', ' lamp'])
+        self.assertEqual((tokens, searched), ('', True))
+
+    async def test_react_action_is_a_tool_call(self):
+        tokens, searched = await self.stream(['Action: ', 'product_search\n', 'Action Input: desk lamp'])
+        self.assertEqual((tokens, searched), ('', True))
+
+    async def test_mentioning_the_tool_is_not_a_call(self):
+        answer = ['I can run ', 'product_search', ' for you if you like.']
+        tokens, searched = await self.stream(answer)
+        self.assertEqual((tokens, searched), (''.join(answer), False))
+
+    async def test_prose_streams_once_the_first_line_rules_out_a_call(self):
+        tokens, searched = await self.stream(['product', 's like these', ' are popular'])
+        self.assertEqual((tokens, searched), ('products like these are popular', False))
+
+    def test_tool_call_decided(self):
+        from delapp.agent.core.agent_core import tool_call_decided
+        self.assertIsNone(tool_call_decided('  product_sea'))
+        self.assertIsNone(tool_call_decided('product_search'))
+        self.assertTrue(tool_call_decided('product_search: lamps'))
+        self.assertFalse(tool_call_decided('product_searches are'))
+        self.assertFalse(tool_call_decided('Sure'))
@@ -0,0 +1,115 @@
+from django.test import TestCase
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        from delapp.tracing import reset_stage_stats
+        reset_stage_stats()
+
+    def test_spans_nest_and_format_as_server_timing(self):
+        import time
+        from delapp.tracing import span, record_span, server_timing
+
+        with span('request') as root:
+            with span('agent.intent'):
+                pass
+            with span('agent.search') as search:
+                with span('search.provider'):
+                    pass
+            record_span('agent.llm', time.perf_counter() - 0.01, tokens=3)
+
+        self.assertEqual([child.name for child in root.children], ['agent.intent', 'agent.search', 'agent.llm'])
+        self.assertEqual(search.children[0].name, 'search.provider')
+        self.assertGreaterEqual(root.children[2].duration_ms, 10)
+        header = server_timing(root)
+        self.assertRegex(header, r'^agent\.intent;dur=[\d.]+, agent\.search;dur=[\d.]+, search\.provider;dur=[\d.]+, '
+                                 r'agent\.llm;dur=[\d.]+, total;dur=[\d.]+$')
+
+    async def test_spans_follow_tasks_and_threads(self):
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from delapp.tracing import span, traced
+
+        @traced('memory.save')
+        def save():
+            pass
+
+        async def search():
+            with span('search.provider'):
+                await asyncio.sleep(0)
+
+        with span('request') as root:
+            await asyncio.gather(asyncio.create_task(search()), sync_to_async(save)())
+
+        self.assertCountEqual([child.name for child in root.children], ['search.provider', 'memory.save'])
+
+    def test_finished_traces_feed_stage_histograms(self):
+        from delapp.tracing import span, stage_stats
+
+        for _ in range(3):
+            with span('request'):
+                with span('agent.intent'):
+                    pass
+        with self.assertRaises(ValueError):
+            with span('request'):
+                raise ValueError('boom')
+
+        stats = stage_stats()
+        self.assertEqual(stats['agent.intent']['count'], 3)
+        self.assertEqual(stats['request']['count'], 4)
+        self.assertEqual(stats['agent.intent']['p50_ms'], 1)
+
+    def test_disabled_tracing_records_nothing(self):
+        from django.test import override_settings
+        from delapp.tracing import span, stage_stats
+
+        with override_settings(TRACING={'ENABLED': False}):
+            with span('request') as root:
+                pass
+        self.assertIsNone(root)
+        self.assertEqual(stage_stats(), {})
+
+    def test_only_slow_traces_are_logged(self):
+        from django.test import override_settings
+        from delapp.tracing import span, stage_stats
+
+        with override_settings(TRACING={'ENABLED': True}):
+            with self.assertNoLogs('delapp.tracing', level='INFO'):
+                with span('request'):
+                    pass
+        self.assertEqual(stage_stats()['request']['count'], 1)
+
+        with override_settings(TRACING={'ENABLED': True, 'LOG_MIN_MS': 0}):
+            with self.assertLogs('delapp.tracing', level='INFO') as logs:
+                with span('request'):
+                    pass
+        self.assertIn('"name": "request"', logs.output[0])
+
+    def test_middleware_sets_server_timing_header(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from delapp.middleware import TracingMiddleware
+        from delapp.tracing import span
+
+        def view(request):
+            with span('agent.intent'):
+                return HttpResponse('ok')
+
+        middleware = TracingMiddleware(view)
+        response = middleware(RequestFactory().get('/api/agent/metrics/'))
+        self.assertRegex(response['Server-Timing'], r'^agent\.intent;dur=[\d.]+, total;dur=[\d.]+$')
+
+        response = middleware(RequestFactory().get('/admin/'))
+        self.assertNotIn('Server-Timing', response)
+
+    async def test_agent_stages_are_traced(self):
+        from delapp.tests.fakes import make_agent
+        from delapp.tracing import span
+
+        agent = make_agent('Happy to help with that!')
+        with span('request') as root:
+            await agent.process_query('hello there')
+
+        names = [item.name for item in root.walk()]
+        for stage in ['agent.intent', 'agent.prompt_build', 'agent.llm']:
+            self.assertIn(stage, names)
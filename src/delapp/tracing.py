@@ -0,0 +1,258 @@
+"""
+Request Tracing
+
+Lightweight spans for the agent pipeline. A span times one stage (intent
+detection, the SearchAPI.io request, the LLM call, a memory write, ...) and
+nests under whichever span is current, tracked with contextvars so nesting
+follows the request through threads started by asgiref and asyncio tasks.
+
+When the outermost span of a trace ends, the trace is:
+- written to the 'delapp.tracing' logger as one JSON line;
+- added to a per-stage latency histogram, reported on the agent metrics endpoint;
+- available to TracingMiddleware, which turns it into a Server-Timing header.
+
+Usage:
+
+    with span('search.provider', query=query):
+        results = await provider.search_deals_async(query)
+
+    @traced('memory.save')
+    async def save(...): ...
+
+Configured through the TRACING setting:
+
+    TRACING = {
+        'ENABLED': True,
+        'LOG_TRACES': True,    # Write finished traces to the delapp.tracing logger
+        'LOG_MIN_MS': 750,     # Only log traces at least this slow (0 logs every request)
+        'PATH_PREFIXES': ['/api/'],  # Requests TracingMiddleware traces
+    }
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is unbounded
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('delapp_trace_span', default=None)
+
+
+def _config() -> Dict[str, Any]:
+    from django.conf import settings
+    return getattr(settings, 'TRACING', {})
+
+
+class Span:
+    """One timed stage of a trace"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent', 'start', 'end', 'attributes', 'children', 'error')
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, start: Optional[float] = None,
+                 **attributes):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.start = time.perf_counter() if start is None else start
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.children: List['Span'] = []
+        self.error: Optional[str] = None
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def walk(self):
+        """This span and all of its descendants, depth first"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        data = {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'start_ms': round((self.start - origin) * 1000, 2),
+            'duration_ms': round(self.duration_ms, 2),
+        }
+        if self.attributes:
+            data['attributes'] = self.attributes
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class LatencyHistogram:
+    """Bucketed latencies of one stage"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, duration_ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 2) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': round(self.max_ms, 2),
+            'buckets': {f"le_{bound}": count for bound, count in zip(BUCKETS_MS, self.counts)},
+        }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _finish_trace(root: Span) -> None:
+    """Record a finished trace in the histograms and the structured log"""
+    with _histograms_lock:
+        for item in root.walk():
+            if item.end is not None:
+                _histograms.setdefault(item.name, LatencyHistogram()).add(item.duration_ms)
+
+    config = _config()
+    if config.get('LOG_TRACES', True) and root.duration_ms >= config.get('LOG_MIN_MS', 750):
+        logger.info(json.dumps({
+            'trace_id': root.trace_id,
+            'name': root.name,
+            'duration_ms': round(root.duration_ms, 2),
+            'spans': [item.to_dict(root.start) for item in root.walk()],
+        }, default=str))
+
+
+class span:
+    """Context manager timing a block as a child of the current span"""
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span: Optional[Span] = None
+        self._token = None
+
+    def __enter__(self) -> Optional[Span]:
+        if not _config().get('ENABLED', True):
+            return None
+        self.span = Span(self.name, parent=_current_span.get(), **self.attributes)
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.span is None:
+            return
+        self.span.end = time.perf_counter()
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited in a different context than it was entered in (e.g. a generator closed elsewhere)
+            _current_span.set(self.span.parent)
+        if self.span.parent is None:
+            _finish_trace(self.span)
+
+
+def traced(name: str) -> Callable:
+    """Decorator running a sync or async function inside a span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_span(name: str, start: float, end: Optional[float] = None, **attributes) -> Optional[Span]:
+    """
+    Record an already finished stage under the current span without making it current.
+
+    For stages that cannot be wrapped in a with block, such as an LLM stream
+    consumed across yields.
+
+    Args:
+        name: Stage name
+        start: time.perf_counter() when the stage started
+        end: time.perf_counter() when it ended; now by default
+    """
+    parent = _current_span.get()
+    if not _config().get('ENABLED', True):
+        return None
+    item = Span(name, parent=parent, start=start, **attributes)
+    item.end = time.perf_counter() if end is None else end
+    if parent is None:
+        _finish_trace(item)
+    return item
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def server_timing(root: Span) -> str:
+    """
+    Format a trace as a Server-Timing header value.
+
+    Stages that ran several times are summed; the root is reported as 'total'.
+    """
+    durations: Dict[str, float] = {}
+    for item in root.walk():
+        if item is not root and item.end is not None:
+            durations[item.name] = durations.get(item.name, 0.0) + item.duration_ms
+    entries = [f"{name};dur={duration:.1f}" for name, duration in durations.items()]
+    entries.append(f"total;dur={root.duration_ms:.1f}")
+    return ', '.join(entries)
+
+
+def stage_stats() -> Dict[str, Dict[str, Any]]:
+    """Latency histogram summary for every stage seen so far"""
+    with _histograms_lock:
+        return {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+
+
+def reset_stage_stats() -> None:
+    with _histograms_lock:
+        _histograms.clear()
@@ -13,6 +13,7 @@ from rest_framework.views import APIView
 import hmac
 from  .models import *
 from django.db import transaction
+from django.db.models import Count, F, Max
 from rest_framework import serializers
 from rest_framework_simplejwt.views import TokenObtainPairView
 import hashlib
@@ -26,6 +27,8 @@ import requests
 import re
 import base64
 from .utils import sanitize_input, validate_query
+from .pagination import keyset_page, parse_page_size
+from .http_cache import CachePolicy, cache_policy, etag_matches, make_etag, not_modified
 from django.core.cache import cache
 import traceback
 from django.views.decorators.http import require_POST
@@ -47,6 +50,8 @@ from django.http import JsonResponse
 
 from django.views.decorators.csrf import csrf_exempt
 from .llm_engine import ConversationalDealFinder
+from .agent.tools.product_cards import product_card
+from .async_views import async_api_view
 from dotenv import load_dotenv
 from django_ratelimit.decorators import ratelimit
 from django.utils.timezone import now, timedelta
@@ -67,25 +72,19 @@ from django.http import JsonResponse
 from rest_framework.decorators import api_view
 import asyncio
 
-@api_view(['POST'])
-def find_deals(request):
+@async_api_view(['POST'])
+async def find_deals(request):
     """
-    Wrapper to handle async find_deals in sync Django view
+    Run ConversationalDealFinder.find_deals on the server's event loop
     """
     try:
         query = request.data.get('query', '')
         context = request.data.get('context', '')
         user_id = request.data.get('user_id', None)
         
-        # Create event loop for async call
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
         # Initialize and call async function
         finder = ConversationalDealFinder()
-        result = loop.run_until_complete(
-            finder.find_deals(query, context, user_id)
-        )
+        result = await finder.find_deals(query, context, user_id)
         
         return JsonResponse(result)
     except Exception as e:
@@ -172,9 +171,74 @@ def product_description_view(request):
  
 
 
-@api_view(['POST'])
+def _start_user_query(user, query_text, conversation_id):
+    """
+    Resolve the conversation a user query belongs to, creating it and its state when new.
+    
+    One short transaction, committed before the agent runs.
+    
+    Returns:
+        The Conversation
+    """
+    with transaction.atomic():
+        # Get or create conversation
+        if conversation_id:
+            conversation = Conversation.objects.get(id=conversation_id, user=user)
+        else:
+            conversation = Conversation.objects.create(
+                user=user,
+                title=f"Search: {query_text[:50]}..."
+            )
+        
+        # Get or create conversation state for this conversation
+        ConversationState.objects.get_or_create(conversation=conversation)
+    
+    return conversation
+
+
+def _conversation_state_fields(query_text, result):
+    """The ConversationState fields an agent result updates"""
+    # Map agent state to conversation state
+    # The agent will handle most state internally through its memory components
+    if 'agent_state' in result:
+        agent_state = result['agent_state']
+        return {
+            'current_products': agent_state.get('current_products', []),
+            'last_query': agent_state.get('last_query', query_text),
+            'last_category': agent_state.get('last_category', ''),
+            'applied_filters': agent_state.get('applied_filters', {}),
+            'last_intent': agent_state.get('last_intent', None),
+            'conversation_turn': agent_state.get('conversation_turn', F('conversation_turn') + 1),
+            'product_references': agent_state.get('product_references', {}),
+            'user_preferences': agent_state.get('user_preferences', {}),
+            'keywords': agent_state.get('keywords', []),
+            'last_action': agent_state.get('last_action', None),
+        }
+    
+    # If no agent state is returned, increment conversation turn at minimum
+    fields = {'conversation_turn': F('conversation_turn') + 1, 'last_query': query_text}
+    # Use products from agent response if available; a resolved reference shows one of
+    # the current products, which stay the list the next follow-up resolves against
+    if 'products' in result and not result.get('reference'):
+        fields['current_products'] = result['products']
+    return fields
+
+
+def _record_user_query(conversation, query_text, result):
+    """
+    Write the conversation state a user query leaves behind.
+    
+    The agent has already saved the user and assistant messages, so this is
+    a single UPDATE of the state, after the agent has answered.
+    """
+    ConversationState.objects.filter(conversation=conversation).update(
+        updated_at=timezone.now(), **_conversation_state_fields(query_text, result)
+    )
+
+
+@async_api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def user_query_api_view(request):
+async def user_query_api_view(request):
     logger.info(f"Received request data: {request.data}")
     
     serializer = QuerySerializer(data=request.data, context={'request': request})
@@ -186,225 +250,110 @@ def user_query_api_view(request):
         previous_deals = request.data.get('previous_deals', [])
         
         try:
-            with transaction.atomic():
-                # Get or create conversation
-                if conversation_id:
-                    conversation = Conversation.objects.get(id=conversation_id, user=user)
-                else:
-                    conversation = Conversation.objects.create(
-                        user=user,
-                        title=f"Search: {query_text[:50]}..."
-                    )
-                
-                # Get or create conversation state for this conversation
-                from .models import ConversationState
-                try:
-                    conv_state = ConversationState.objects.get(conversation=conversation)
-                except ConversationState.DoesNotExist:
-                    conv_state = ConversationState.objects.create(conversation=conversation)
-                
-                # Create event loop for async call
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                # AGENT-BASED IMPLEMENTATION - Use the new agent instead of ConversationalDealFinder
-                from .agent.api import process_query
-                
-                # Run the agent-based search
-                result = loop.run_until_complete(
-                    process_query(
-                        query=query_text,
-                        conversation_id=str(conversation.id),
-                        user_id=str(user.id)
-                    )
-                )
-                
-                # Map agent state to conversation state
-                # The agent will handle most state internally through its memory components
-                if 'agent_state' in result:
-                    agent_state = result['agent_state']
-                    conv_state.current_products = agent_state.get('current_products', [])
-                    conv_state.last_query = agent_state.get('last_query', query_text)
-                    conv_state.last_category = agent_state.get('last_category', '')
-                    conv_state.applied_filters = agent_state.get('applied_filters', {})
-                    conv_state.last_intent = agent_state.get('last_intent', None)
-                    conv_state.conversation_turn = agent_state.get('conversation_turn', conv_state.conversation_turn + 1)
-                    conv_state.product_references = agent_state.get('product_references', {})
-                    conv_state.user_preferences = agent_state.get('user_preferences', {})
-                    conv_state.keywords = agent_state.get('keywords', [])
-                    conv_state.last_action = agent_state.get('last_action', None)
-                else:
-                    # If no agent state is returned, increment conversation turn at minimum
-                    conv_state.conversation_turn += 1
-                    conv_state.last_query = query_text
-                    # Use products from agent response if available
-                    if 'products' in result:
-                        conv_state.current_products = result['products']
-                
-                conv_state.save()
-                
-                # Process the response from the agent
-                structured_deals = result.get('products', [])
-                is_mock_data = result.get('mock_data', False)
-                
-                # Add extra debug logging
-                logger.info(f"Agent result: products={len(structured_deals)}, is_mock_data={is_mock_data}, result_keys={list(result.keys())}")
-                
-                # If we have no products but response text mentions products, try to extract them from elsewhere
-                if not structured_deals and ('I found' in result.get('response', '') and 'product' in result.get('response', '')):
-                    logger.warning(f"Response mentions products but no 'products' in result, trying to find mock data")
-                    
-                    # See if there's a raw_products field we can use
-                    if 'raw_products' in result and isinstance(result['raw_products'], list) and result['raw_products']:
-                        structured_deals = result['raw_products']
-                        logger.info(f"Retrieved {len(structured_deals)} products from raw_products field")
-                    
-                if not structured_deals:
-                    logger.warning(f"No products returned from agent for query: {query_text}")
-                    return JsonResponse({
-                        "message_id": 0,
-                        "conversation_id": conversation.id,
-                        "response": result.get('response', "I couldn't find any products matching your query. Try being more specific or changing your search terms."),
-                        "deals": []
-                    })
-                
-                # Format deals for frontend - this array will be used directly
-                formatted_deals = []
-                if 'products' in result:
-                    logger.debug(f"Raw products received from agent: {len(result['products'])} items")
-                    for product in result['products']:
-                        try:
-                            # Safely extract price - accept either string or direct numeric value
-                            price = None
-                            if isinstance(product.get('price'), (int, float)):
-                                price = float(product.get('price'))
-                            else:
-                                price_str = str(product.get('price', '')).strip()
-                                if price_str:
-                                    try:
-                                        price = float(re.sub(r'[^\d.]', '', price_str.split()[0]))
-                                    except (ValueError, IndexError):
-                                        logger.debug(f"Could not parse price: {price_str}")
-                                        continue
-                            
-                            if price is None:
-                                logger.debug(f"Skipping product with no price: {product.get('title')}")
-                                continue
-                                
-                            # Handle original price
-                            original_price = None
-                            if isinstance(product.get('original_price'), (int, float)):
-                                original_price = float(product.get('original_price'))
-                            elif 'original_price' in product:
-                                try:
-                                    original_str = str(product['original_price']).strip()
-                                    if original_str:
-                                        original_price = float(re.sub(r'[^\d.]', '', original_str))
-                                except (ValueError, AttributeError):
-                                    pass
-                            
-                            # Format data specifically for the React frontend's expected structure
-                            formatted_deal = {
-                                'id': product.get('product_id', '') or product.get('id', ''),
-                                'name': product.get('title', 'No title'),  # Frontend expects 'name'
-                                'currentPrice': price,  # Frontend uses camelCase
-                                'originalPrice': original_price,  # Frontend uses camelCase
-                                'image_url': product.get('image_url', '') or product.get('thumbnail', ''),  # Try both field names
-                                'productLink': product.get('url', '#'),  # Frontend expects 'productLink'
-                                'retailer': product.get('retailer', 'Online retailer'),
-                                'description': product.get('description', '')
-                            }
-                            
-                            # Calculate savings if possible
-                            if original_price and price and original_price > price:
-                                formatted_deal['savings'] = {
-                                    'amount': original_price - price,
-                                    'percent': int((original_price - price) / original_price * 100)
-                                }
-                                
-                            formatted_deals.append(formatted_deal)
-                            logger.debug(f"Added formatted product: {formatted_deal['name']}")
-                            
-                        except Exception as e:
-                            logger.error(f"Product formatting error: {str(e)}", exc_info=True)
-                            continue
-                
-                # Save user message
-                user_message = ConversationMessage.objects.create(
-                    conversation=conversation,
-                    role='user',
-                    content=query_text
-                )
-                
-                # Create AI response message
-                # The agent response is more structured, so prioritize getting the proper response text
-                ai_response_text = result.get('response', result.get('message', 'Here are some options:'))
-                
-                # Save assistant message with search results
-                assistant_message = ConversationMessage.objects.create(
-                    conversation=conversation,
-                    role='assistant',
-                    content=ai_response_text,
-                    search_results=formatted_deals,  # Use the formatted deals for frontend
-                    has_products=bool(formatted_deals)
-                )
-                
-                # Get follow-up questions if available from the agent
-                followup_questions = result.get('followup_questions', [])
-                
-                # Add debug log to see the final response structure
-                logger.debug(f"Returning {len(formatted_deals)} formatted deals to frontend")
-                for deal in formatted_deals[:2]:  # Log first two deals for debugging
-                    logger.debug(f"  Deal: {deal['name']}, Price: {deal['currentPrice']}")
-                
-                # Add helpful follow-up question suggestions if we have products
-                if formatted_deals and not followup_questions:
-                    followup_questions = [
-                        "Which of these products would you like to know more about?",
-                        "Would you like to see similar products?",
-                        "Would you like to filter these results by price?"
-                    ]
-                    
-                # Add explicit logging to confirm what's being returned to frontend
-                logger.info(f"API response: message_id={assistant_message.id}, conversation_id={conversation.id}, "
-                           f"has_products={bool(formatted_deals)}, product_count={len(formatted_deals)}, "
-                           f"first 50 chars of response: {ai_response_text[:50]}")
-                
-                # Add debug message to assist during development
-                debug_msg = (
-                    f"\n\nIMPORTANT: Debug Info - Products should display as cards.\n"
-                    f"                Product count: {len(formatted_deals)}\n"
-                    f"                First product: {formatted_deals[0]['name'] if formatted_deals else 'No products'}\n\n"
-                    f"                If you don't see product cards above, please refresh the page."
-                )
+            # Phase 1: resolve the conversation in a short transaction
+            conversation = await sync_to_async(_start_user_query)(user, query_text, conversation_id)
+            
+            # Phase 2: the agent's SearchAPI.io and LLM calls, outside any transaction
+            from .agent.api import process_query
+            result = await process_query(
+                query=query_text,
+                conversation_id=str(conversation.id),
+                user_id=str(user.id),
+                endpoint='user_query'
+            )
+            
+            # Process the response from the agent
+            structured_deals = result.get('products', [])
+            is_mock_data = result.get('mock_data', False)
+            
+            # Add extra debug logging
+            logger.info(f"Agent result: products={len(structured_deals)}, is_mock_data={is_mock_data}, result_keys={list(result.keys())}")
+            
+            # If we have no products but response text mentions products, try to extract them from elsewhere
+            if not structured_deals and ('I found' in result.get('response', '') and 'product' in result.get('response', '')):
+                logger.warning(f"Response mentions products but no 'products' in result, trying to find mock data")
                 
-                # Log the actual structure of formatted_deals to debug the issue
-                logger.info(f"FORMATTED DEALS STRUCTURE: {json.dumps([{k: type(v).__name__ for k, v in deal.items()} for deal in formatted_deals[:1]]) if formatted_deals else 'Empty array'}")
+                # See if there's a raw_products field we can use
+                if 'raw_products' in result and isinstance(result['raw_products'], list) and result['raw_products']:
+                    structured_deals = [product_card(product) for product in result['raw_products']]
+                    logger.info(f"Retrieved {len(structured_deals)} products from raw_products field")
                 
-                # The response data to send to frontend
-                response_data = {
-                    "message_id": assistant_message.id,
+            # The agent's products are already the cards the frontend renders
+            formatted_deals = structured_deals
+            
+            # Create AI response message
+            # The agent response is more structured, so prioritize getting the proper response text
+            ai_response_text = result.get('response', result.get('message', 'Here are some options:'))
+            
+            # Phase 3: write the conversation state; the agent saved the messages
+            await sync_to_async(_record_user_query)(conversation, query_text, result)
+            message_id = result.get('message_id') or 0
+            
+            if not structured_deals:
+                logger.warning(f"No products returned from agent for query: {query_text}")
+                return JsonResponse({
+                    "message_id": message_id,
                     "conversation_id": conversation.id,
-                    "response": ai_response_text + "\n\n" + debug_msg,  # Always include debug info for now
-                    "deals": formatted_deals,  # Return the properly formatted deals array
-                    "followup_questions": followup_questions,  # Add follow-up questions if provided by agent
-                    "debug_info": {
-                        "has_products": bool(formatted_deals),
-                        "product_count": len(formatted_deals),
-                        "first_product": formatted_deals[0] if formatted_deals else None,
-                        "source": "mock_data" if result.get('mock_data', False) else "api_data"
-                    }
-                }
-                
-                # Important: The frontend definitely needs these fields at the top level
-                response_data["has_products"] = bool(formatted_deals)
-                
-                # Force log the full response for debugging
-                logger.info(f"FINAL RESPONSE TO FRONTEND: message_id={response_data['message_id']}, "  
-                           f"has_products={response_data['has_products']}, "
-                           f"deals_count={len(response_data['deals'])}")
+                    "response": result.get('response', "I couldn't find any products matching your query. Try being more specific or changing your search terms."),
+                    "deals": []
+                })
+            
+            # Get follow-up questions if available from the agent
+            followup_questions = result.get('followup_questions', [])
+            
+            # Add debug log to see the final response structure
+            logger.debug(f"Returning {len(formatted_deals)} formatted deals to frontend")
+            for deal in formatted_deals[:2]:  # Log first two deals for debugging
+                logger.debug(f"  Deal: {deal['name']}, Price: {deal['currentPrice']}")
+            
+            # Add helpful follow-up question suggestions if we have products
+            if formatted_deals and not followup_questions:
+                followup_questions = [
+                    "Which of these products would you like to know more about?",
+                    "Would you like to see similar products?",
+                    "Would you like to filter these results by price?"
+                ]
                 
-                return JsonResponse(response_data)
+            # Add explicit logging to confirm what's being returned to frontend
+            logger.info(f"API response: message_id={message_id}, conversation_id={conversation.id}, "
+                       f"has_products={bool(formatted_deals)}, product_count={len(formatted_deals)}, "
+                       f"first 50 chars of response: {ai_response_text[:50]}")
+            
+            # Add debug message to assist during development
+            debug_msg = (
+                f"\n\nIMPORTANT: Debug Info - Products should display as cards.\n"
+                f"                Product count: {len(formatted_deals)}\n"
+                f"                First product: {formatted_deals[0]['name'] if formatted_deals else 'No products'}\n\n"
+                f"                If you don't see product cards above, please refresh the page."
+            )
+            
+            # Log the actual structure of formatted_deals to debug the issue
+            logger.info(f"FORMATTED DEALS STRUCTURE: {json.dumps([{k: type(v).__name__ for k, v in deal.items()} for deal in formatted_deals[:1]]) if formatted_deals else 'Empty array'}")
+            
+            # The response data to send to frontend
+            response_data = {
+                "message_id": message_id,
+                "conversation_id": conversation.id,
+                "response": ai_response_text + "\n\n" + debug_msg,  # Always include debug info for now
+                "deals": formatted_deals,  # Return the properly formatted deals array
+                "followup_questions": followup_questions,  # Add follow-up questions if provided by agent
+                "debug_info": {
+                    "has_products": bool(formatted_deals),
+                    "product_count": len(formatted_deals),
+                    "first_product": formatted_deals[0] if formatted_deals else None,
+                    "source": "mock_data" if result.get('mock_data', False) else "api_data"
+                }
+            }
+            
+            # Important: The frontend definitely needs these fields at the top level
+            response_data["has_products"] = bool(formatted_deals)
+            
+            # Force log the full response for debugging
+            logger.info(f"FINAL RESPONSE TO FRONTEND: message_id={response_data['message_id']}, "  
+                       f"has_products={response_data['has_products']}, "
+                       f"deals_count={len(response_data['deals'])}")
+            
+            return JsonResponse(response_data)
         
         except Exception as e:
             logger.exception(f"Error processing query: {str(e)}")
@@ -421,197 +370,84 @@ def user_query_api_view(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_conversations(request):
-    conversations = Conversation.objects.filter(user=request.user).order_by('-updated_at')
+    """
+    One page of the user's conversations, most recently updated first.
+
+    GET parameters:
+    - cursor: (Optional) next_cursor of the previous page
+    - limit: (Optional) Conversations per page
+
+    Answers 304 Not Modified when If-None-Match names the current ETag.
+    """
+    conversations = Conversation.objects.filter(user=request.user)
+    latest = conversations.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+    etag = make_etag('conversations', request.user.id, latest['updated_at'], latest['count'], request.GET.urlencode())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    try:
+        limit = parse_page_size(request.query_params.get('limit'))
+        page, next_cursor = keyset_page(
+            conversations.only('id', 'title', 'created_at', 'updated_at'),
+            request.query_params.get('cursor'), limit, field='updated_at'
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
     data = [{
         'id': conv.id,
         'title': conv.title,
         'created_at': conv.created_at,
         'updated_at': conv.updated_at
-    } for conv in conversations]
-    return Response(data)
+    } for conv in page]
+    return Response({'conversations': data, 'next_cursor': next_cursor, 'has_more': next_cursor is not None},
+                    headers={'ETag': etag})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_conversation_messages(request, conversation_id):
+    """
+    One page of a conversation's messages, newest page first.
+
+    GET parameters:
+    - cursor: (Optional) next_cursor of the previous page
+    - limit: (Optional) Messages per page
+
+    Product payloads are not included; fetch them per message from
+    get_conversation_message_products.
+    """
     try:
         conversation = Conversation.objects.get(id=conversation_id, user=request.user)
-        messages = conversation.messages.all().order_by('created_at')
-        
-        data = []
-        for msg in messages:
-            message_data = {
-                'id': msg.id,
-                'role': msg.role,
-                'content': msg.content,
-                'created_at': msg.created_at,
-                'has_products': msg.has_products
-            }
-            if msg.has_products:
-                message_data['products'] = msg.search_results
-            data.append(message_data)
-            
-        return Response(data)
+        limit = parse_page_size(request.query_params.get('limit'))
+        messages, next_cursor = keyset_page(
+            conversation.messages.defer('search_results'), request.query_params.get('cursor'), limit
+        )
     except Conversation.DoesNotExist:
         return Response({'error': 'Conversation not found'}, status=404)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
 
+    # The page is fetched newest first and shown oldest first
+    data = [{
+        'id': msg.id,
+        'role': msg.role,
+        'content': msg.content,
+        'created_at': msg.created_at,
+        'has_products': msg.has_products
+    } for msg in reversed(messages)]
+    return Response({'messages': data, 'next_cursor': next_cursor, 'has_more': next_cursor is not None})
 
 
-
-
-
-
-
-
-
- 
-
-
-def parse_deals(ai_content):
-    """
-    Parse the AI response into a structured format for deals
-    """
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_conversation_message_products(request, conversation_id, message_id):
     try:
-        if not ai_content or ai_content.lower().startswith("i'm sorry") or ai_content.lower().startswith("i am unable"):
-            return [{
-                "status": "no_deals_found",
-                "message": "No current deals found. Try modifying your search terms or check back later.",
-                "suggested_retailers": ["Amazon", "Best Buy", "Walmart", "Target"],
-                "suggested_actions": [
-                    "Set up price alerts",
-                    "Check during major sale events",
-                    "Consider similar products",
-                    "Monitor deal websites"
-                ]
-            }]
-
-        deals = []
-        # Split content into individual deals using numbered headers
-        deal_sections = ai_content.split('\n---\n')
-        if len(deal_sections) == 1:
-            deal_sections = ai_content.split('\n1. ')
-            if len(deal_sections) > 1:
-                deal_sections = ['1. ' + section for section in deal_sections[1:]]
-            else:
-                deal_sections = [ai_content]
-
-        for section in deal_sections:
-            if not section.strip():
-                continue
-
-            deal = {
-                'name': None,
-                'currentPrice': None,
-                'originalPrice': None,
-                'description': None,
-                'productLink': None,
-                'coupons': [],
-                'cashback': [],
-                'steps': [],
-                'expiration': None,
-                'savings': {
-                    'amount': None,
-                    'percentage': None
-                }
-            }
-
-            # Extract product name
-            name_match = section.split('**')
-            if len(name_match) > 1:
-                deal['name'] = name_match[1].strip()
-
-            # Extract prices
-            price_section = section.split('Base Price Details')[1].split('Additional Savings')[0] if 'Base Price Details' in section else ''
-            if 'Current Price:' in price_section:
-                current_price = price_section.split('Current Price:')[1].split('\n')[0].strip()
-                deal['currentPrice'] = current_price.replace('$', '').replace(',', '').strip()
-            if 'Original Price:' in price_section:
-                original_price = price_section.split('Original Price:')[1].split('\n')[0].strip()
-                deal['originalPrice'] = original_price.replace('$', '').replace(',', '').strip()
-
-            # Extract coupons
-            if 'Available Coupons:' in section:
-                coupon_section = section.split('Available Coupons:')[1].split('Cashback Offers:')[0]
-                coupon_lines = [line.strip() for line in coupon_section.split('\n') if 'Code:' in line]
-                for line in coupon_lines:
-                    if '-' in line:
-                        code, description = line.split('-', 1)
-                        code = code.replace('*', '').replace('Code:', '').strip()
-                        deal['coupons'].append({
-                            'code': code,
-                            'description': description.strip()
-                        })
-
-            # Extract cashback offers
-            if 'Cashback Offers:' in section:
-                cashback_section = section.split('Cashback Offers:')[1].split('Maximum Potential Savings:')[0]
-                cashback_lines = [line.strip() for line in cashback_section.split('\n') if '*' in line and ':' in line]
-                for line in cashback_lines:
-                    if 'No current cashback offers found' not in line:
-                        platform, amount = line.replace('*', '').split(':', 1)
-                        deal['cashback'].append({
-                            'platform': platform.strip(),
-                            'amount': amount.strip()
-                        })
-
-            # Extract product details
-            if 'Product Details:' in section:
-                details_section = section.split('Product Details:')[1].split('How to Get This Deal:')[0]
-                for line in details_section.split('\n'):
-                    line = line.strip()
-                    if 'Description:' in line:
-                        deal['description'] = line.split('Description:')[1].strip()
-                    elif 'Product URL:' in line:
-                        deal['productLink'] = line.split('Product URL:')[1].strip()
-                    elif 'Expiration:' in line:
-                        deal['expiration'] = line.split('Expiration:')[1].strip()
-
-            # Extract steps
-            if 'How to Get This Deal:' in section:
-                steps_section = section.split('How to Get This Deal:')[1].split('\n')
-                deal['steps'] = [step.strip().lstrip('123456789.') for step in steps_section if step.strip() and any(char.isdigit() for char in step)]
-
-            # Calculate savings
-            if deal['originalPrice'] and deal['currentPrice']:
-                try:
-                    original = float(deal['originalPrice'])
-                    current = float(deal['currentPrice'])
-                    if original > current:
-                        savings_amount = original - current
-                        savings_percentage = (savings_amount / original) * 100
-                        deal['savings'] = {
-                            'amount': f"{savings_amount:.2f}",
-                            'percentage': f"{savings_percentage:.1f}"
-                        }
-                except ValueError:
-                    pass
-
-            # Only add deals that have at least a name and price
-            if deal['name'] and (deal['currentPrice'] or deal['originalPrice']):
-                deals.append(deal)
-
-        return deals if deals else [{
-            "status": "no_deals_found",
-            "message": "No valid deals could be parsed from the response."
-        }]
-
-    except Exception as e:
-        logger.exception(f"Error parsing deals: {str(e)}")
-        return [{
-            "status": "error",
-            "message": "Error processing deal information",
-            "error": str(e)
-        }]
-
-def extract_link(link_part):
-    # If the link is in markdown format [text](url)
-    if '[' in link_part and '](' in link_part:
-        return link_part.split('](')[1].rstrip(')')
-    # If the link is just a URL, possibly surrounded by brackets or parentheses
-    else:
-        return link_part.strip('[]() ')
-
-
-
+        message = ConversationMessage.objects.only('search_results').get(
+            id=message_id, conversation_id=conversation_id, conversation__user=request.user
+        )
+    except ConversationMessage.DoesNotExist:
+        return Response({'error': 'Message not found'}, status=404)
+    return Response({'id': message_id, 'products': message.search_results or []})
 
 
 
@@ -623,13 +459,6 @@ def extract_link(link_part):
 
 
  
-
-
-
-
-
-
-
 
 
 # ##### AUTHENTICATION ########
@@ -822,6 +651,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
 class VerifyEmailView(APIView):
     permission_classes = [AllowAny]
+    # Verifying changes the account, so a replayed copy must never be served
+    cache_policy = CachePolicy(no_store=True)
     
     def get(self, request, token):
         logger.info(f"Processing email verification for token: {token}")
@@ -1131,6 +962,7 @@ def handle_order_created(payload):
 
 
 
+@cache_policy()
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_subscription(request):
@@ -0,0 +1,91 @@
+"""
+Product Change Events
+
+A lightweight in-process publish/subscribe bus for price and availability
+changes. ProductStorageService publishes events once the transaction that
+recorded them commits, so subscribers never see changes that were rolled back.
+
+Subscribers are either plain callables, called synchronously with each event,
+or asyncio queues obtained from ``subscribe_queue`` for async consumers.
+Events only reach subscribers in the same process; other workers catch up
+through the cursor API in ``ProductStorageService.get_changes``. The cart
+subscribes in delapp/cart_updates.py.
+"""
+from typing import Any, Callable, Dict, List
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PRICE_CHANGED = 'price'
+AVAILABILITY_CHANGED = 'availability'
+
+
+class ChangeBus:
+    """Fan product change events out to in-process subscribers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[Dict[str, Any]], None]] = []
+        self._queues: List[tuple] = []
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Register a callback. Returns a function that unsubscribes it."""
+        with self._lock:
+            self._callbacks.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return unsubscribe
+
+    def subscribe_queue(self, maxsize: int = 1000) -> asyncio.Queue:
+        """
+        Get an asyncio queue that receives every event. Must be called from
+        within the event loop that will consume it. Events are dropped for a
+        subscriber whose queue is full.
+        """
+        queue = asyncio.Queue(maxsize=maxsize)
+        with self._lock:
+            self._queues.append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe_queue(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._queues = [(loop, q) for loop, q in self._queues if q is not queue]
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        """Deliver events to every subscriber. Subscriber errors are logged, never raised."""
+        if not events:
+            return
+
+        with self._lock:
+            callbacks = list(self._callbacks)
+            queues = list(self._queues)
+
+        for callback in callbacks:
+            for event in events:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logger.error(f"Error in product change subscriber {callback!r}: {str(e)}", exc_info=True)
+
+        for loop, queue in queues:
+            if loop.is_closed():
+                self.unsubscribe_queue(queue)
+                continue
+            for event in events:
+                loop.call_soon_threadsafe(self._put_nowait, queue, event)
+
+    @staticmethod
+    def _put_nowait(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Dropping product change event for a slow subscriber")
+
+
+# Process-wide bus used by ProductStorageService
+change_bus = ChangeBus()
@@ -0,0 +1,186 @@
+"""
+Catalog Export
+
+Streams StoredProduct and PriceHistory rows out of the database as NDJSON or as
+a columnar NPZ archive. Rows are read with server-side cursors
+(``iterator(chunk_size=...)``) and written chunk by chunk, so memory use depends
+on the chunk size only, never on the size of the tables.
+
+NPZ archives hold one array per column per chunk, named
+``<column>.<chunk number>`` (e.g. ``price.00000``). ``load_npz_columns``
+concatenates them back into one array per column.
+
+Under the ASGI server Django consumes a sync iterator handed to
+StreamingHttpResponse with ``sync_to_async(list)``, building the whole export
+in memory before the first byte goes out; views wrap the iterators in
+``aiter_export`` so each chunk is fetched in a worker thread and sent before
+the next one is read.
+"""
+from typing import AsyncIterator, Dict, Iterator, List, Tuple, BinaryIO
+from datetime import datetime
+from decimal import Decimal
+import json
+import zipfile
+
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from .models import StoredProduct, PriceHistory
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# (column, kind) pairs per exportable table. The kind decides the NPZ dtype.
+TABLES: Dict[str, Tuple[object, List[Tuple[str, str]]]] = {
+    'products': (StoredProduct, [
+        ('id', 'int'),
+        ('product_id', 'str'),
+        ('retailer', 'str'),
+        ('title', 'str'),
+        ('price', 'float'),
+        ('original_price', 'float'),
+        ('available', 'bool'),
+        ('rating', 'float'),
+        ('review_count', 'float'),
+        ('condition', 'str'),
+        ('timestamp', 'datetime'),
+        ('last_updated', 'datetime'),
+    ]),
+    'price_history': (PriceHistory, [
+        ('id', 'int'),
+        ('product_id', 'int'),
+        ('price', 'float'),
+        ('timestamp', 'datetime'),
+    ]),
+}
+
+
+def _columns(table: str) -> List[Tuple[str, str]]:
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}'. Choose from: {', '.join(TABLES)}")
+    return TABLES[table][1]
+
+
+def iter_chunks(table: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[tuple]]:
+    """Yield lists of at most chunk_size row tuples, ordered by primary key"""
+    columns = _columns(table)
+    model = TABLES[table][0]
+    rows = model.objects.order_by('id').values_list(*[name for name, _ in columns])
+
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_ndjson(table: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield one NDJSON-encoded block of bytes per chunk of rows"""
+    names = [name for name, _ in _columns(table)]
+    for chunk in iter_chunks(table, chunk_size):
+        yield b''.join(
+            json.dumps(dict(zip(names, map(_json_value, row)))).encode() + b'\n'
+            for row in chunk
+        )
+
+
+def _column_array(kind: str, values: list) -> np.ndarray:
+    if kind == 'int':
+        return np.array(values, dtype=np.int64)
+    if kind == 'float':
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    if kind == 'bool':
+        return np.array(values, dtype=np.bool_)
+    if kind == 'datetime':
+        return np.array(
+            [np.datetime64('NaT') if v is None else np.datetime64(v.replace(tzinfo=None), 'us') for v in values],
+            dtype='datetime64[us]'
+        )
+    return np.array(['' if v is None else str(v) for v in values], dtype=np.str_)
+
+
+def _write_npz_chunks(archive: zipfile.ZipFile, table: str, chunk_size: int) -> Iterator[int]:
+    """Write each chunk of rows into the archive as one array per column, yielding row counts"""
+    columns = _columns(table)
+    for index, chunk in enumerate(iter_chunks(table, chunk_size)):
+        for position, (name, kind) in enumerate(columns):
+            array = _column_array(kind, [row[position] for row in chunk])
+            with archive.open(f"{name}.{index:05d}.npy", mode='w', force_zip64=True) as member:
+                np.lib.format.write_array(member, array, allow_pickle=False)
+        yield len(chunk)
+
+
+def write_npz(fileobj: BinaryIO, table: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Write a table as a columnar NPZ archive.
+
+    The file object does not need to be seekable, so this works for pipes as
+    well as regular files. Datetimes are stored as naive UTC.
+
+    Returns:
+        Number of rows written
+    """
+    with zipfile.ZipFile(fileobj, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        return sum(_write_npz_chunks(archive, table, chunk_size))
+
+
+class _ChunkBuffer:
+    """Write-only, non-seekable sink that hands its contents out on demand"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+
+def iter_npz(table: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield an NPZ archive of the table piece by piece, one chunk of rows at a time"""
+    sink = _ChunkBuffer()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for _ in _write_npz_chunks(archive, table, chunk_size):
+            yield sink.drain()
+    # Central directory is written when the archive closes
+    yield sink.drain()
+
+
+async def aiter_export(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Serve an export iterator asynchronously, reading each chunk in a worker thread"""
+    # The database work stays on one thread, so the cursor and its connection survive between chunks
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def load_npz_columns(path) -> Dict[str, np.ndarray]:
+    """Read an exported NPZ archive back into one concatenated array per column"""
+    with np.load(path, allow_pickle=False) as archive:
+        parts: Dict[str, List[np.ndarray]] = {}
+        for key in sorted(archive.files):
+            column = key.rsplit('.', 1)[0]
+            parts.setdefault(column, []).append(archive[key])
+    return {column: np.concatenate(arrays) for column, arrays in parts.items()}
@@ -0,0 +1,44 @@
+"""
+Export the product catalog or its price history for offline analysis.
+
+Usage:
+    python manage.py export_catalog --table products --format ndjson --output products.ndjson
+    python manage.py export_catalog --table price_history --format npz --output history.npz
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.export import TABLES, DEFAULT_CHUNK_SIZE, iter_ndjson, write_npz
+
+
+class Command(BaseCommand):
+    help = "Stream StoredProduct or PriceHistory rows to an NDJSON or columnar NPZ file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', choices=list(TABLES), default='products')
+        parser.add_argument('--format', choices=['ndjson', 'npz'], default='ndjson')
+        parser.add_argument('--output', default='-', help="Output path, '-' for stdout")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        table = options['table']
+        chunk_size = options['chunk_size']
+        if chunk_size <= 0:
+            raise CommandError("--chunk-size must be positive")
+
+        output = options['output']
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            if options['format'] == 'npz':
+                rows = write_npz(stream, table, chunk_size)
+            else:
+                rows = 0
+                for block in iter_ndjson(table, chunk_size):
+                    stream.write(block)
+                    rows += block.count(b'\n')
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+
+        self.stderr.write(f"Exported {rows} {table} rows")
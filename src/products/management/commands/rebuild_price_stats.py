@@ -0,0 +1,23 @@
+"""
+Recompute the denormalized price statistics on StoredProduct from PriceHistory.
+
+Usage:
+    python manage.py rebuild_price_stats --chunk-size 1000
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from products.services import ProductStorageService
+
+
+class Command(BaseCommand):
+    help = "Rebuild min/max/avg price statistics for every stored product"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be positive")
+
+        updated = ProductStorageService.rebuild_price_stats(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Rebuilt price statistics for {updated} products")
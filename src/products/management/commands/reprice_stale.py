@@ -0,0 +1,39 @@
+"""
+Refresh stale catalog products in the background.
+
+Usage:
+    python manage.py reprice_stale --budget 50 --concurrency 4
+    python manage.py reprice_stale --loop --interval 900
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.repricing import DEFAULT_QUOTA_BUDGET, DEFAULT_CONCURRENCY, run_repricing, freshness_lag
+
+
+class Command(BaseCommand):
+    help = "Re-price the most valuable stale products within a provider quota budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, default=DEFAULT_QUOTA_BUDGET,
+                            help="Maximum provider calls per run")
+        parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+        parser.add_argument('--loop', action='store_true', help="Keep running every --interval seconds")
+        parser.add_argument('--interval', type=int, default=900)
+
+    def handle(self, *args, **options):
+        if options['budget'] <= 0 or options['concurrency'] <= 0:
+            raise CommandError("--budget and --concurrency must be positive")
+
+        while True:
+            report = run_repricing(budget=options['budget'], concurrency=options['concurrency'])
+            self.stdout.write(
+                f"candidates={report.candidates} api_calls={report.api_calls} refreshed={report.refreshed} "
+                f"not_found={report.not_found} failed={report.failed}"
+            )
+            self.stdout.write(f"freshness: {freshness_lag()}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
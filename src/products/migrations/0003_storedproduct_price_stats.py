@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0002_pricehistory_productavailabilitylog_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storedproduct",
+            name="price_avg",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="storedproduct",
+            name="price_max",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="storedproduct",
+            name="price_min",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="storedproduct",
+            name="price_samples",
+            field=models.IntegerField(default=0),
+        ),
+    ]
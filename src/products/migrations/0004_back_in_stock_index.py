@@ -0,0 +1,95 @@
+# Generated by Django 5.1 on 2026-10-19 07:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_back_in_stock(apps, schema_editor):
+    """Index every product whose latest availability change was a restock"""
+    ProductAvailabilityLog = apps.get_model("products", "ProductAvailabilityLog")
+    BackInStockEntry = apps.get_model("products", "BackInStockEntry")
+
+    latest = ProductAvailabilityLog.objects.filter(
+        product=models.OuterRef("product")
+    ).order_by("-id")
+    restocks = ProductAvailabilityLog.objects.filter(
+        id=models.Subquery(latest.values("id")[:1]), available=True
+    )
+    BackInStockEntry.objects.bulk_create(
+        (
+            BackInStockEntry(
+                product_id=log.product_id,
+                availability_log_id=log.id,
+                restocked_at=log.timestamp,
+            )
+            for log in restocks.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0003_storedproduct_price_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackInStockEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("restocked_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="pricehistory",
+            index=models.Index(
+                fields=["product", "id"], name="products_pr_product_9f3553_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productavailabilitylog",
+            index=models.Index(
+                fields=["product", "timestamp"], name="products_pr_product_df94b3_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productavailabilitylog",
+            index=models.Index(
+                fields=["product", "id"], name="products_pr_product_1c7b71_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="backinstockentry",
+            name="availability_log",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="products.productavailabilitylog",
+            ),
+        ),
+        migrations.AddField(
+            model_name="backinstockentry",
+            name="product",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="back_in_stock",
+                to="products.storedproduct",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="backinstockentry",
+            index=models.Index(
+                fields=["-restocked_at", "-id"], name="products_ba_restock_47b697_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_back_in_stock, migrations.RunPython.noop),
+    ]
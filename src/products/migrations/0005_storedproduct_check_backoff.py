@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_back_in_stock_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedproduct',
+            name='missed_checks',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='storedproduct',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-19 12:50
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Avg, Count, Max, Min
+
+
+def backfill_price_stats(apps, schema_editor):
+    """
+    Fill in the price statistics of products stored before 0003 from their
+    price history, so the first price folded in does not reset them.
+    """
+    StoredProduct = apps.get_model("products", "StoredProduct")
+
+    products = StoredProduct.objects.filter(price_samples=0).only(
+        "id", "price", "price_min", "price_max", "price_avg", "price_samples"
+    ).annotate(
+        low=Min("price_history__price"),
+        high=Max("price_history__price"),
+        mean=Avg("price_history__price"),
+        samples=Count("price_history"),
+    ).order_by("id")
+
+    batch = []
+    for product in products.iterator(chunk_size=1000):
+        if product.samples:
+            product.price_min, product.price_max = product.low, product.high
+            product.price_avg = Decimal(str(product.mean)).quantize(Decimal("0.01"))
+            product.price_samples = product.samples
+        elif product.price is not None:
+            product.price_min = product.price_max = product.price_avg = product.price
+            product.price_samples = 1
+        else:
+            continue
+        batch.append(product)
+        if len(batch) >= 1000:
+            StoredProduct.objects.bulk_update(batch, ["price_min", "price_max", "price_avg", "price_samples"])
+            batch = []
+    if batch:
+        StoredProduct.objects.bulk_update(batch, ["price_min", "price_max", "price_avg", "price_samples"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0005_storedproduct_check_backoff"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_price_stats, migrations.RunPython.noop),
+    ]
@@ -3,9 +3,13 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 import json
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 from delapp.models import CustomUser
 
+# Products whose data is older than this are considered stale
+STALE_AFTER = timedelta(hours=24)
+
 class StoredProduct(models.Model):
     """Model for storing products from various retailers"""
     product_id = models.CharField(max_length=255)
@@ -31,6 +35,17 @@ class StoredProduct(models.Model):
     shipping_info = models.TextField(null=True, blank=True)
     discount = models.CharField(max_length=50, null=True, blank=True)
     metadata = models.JSONField(default=dict, blank=True)  # For flexible additional data storage
+
+    # Denormalized price statistics over every recorded price point, kept up to
+    # date by ProductStorageService and rebuilt by `manage.py rebuild_price_stats`
+    price_min = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_avg = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_samples = models.IntegerField(default=0)
+
+    # Re-pricing lookups that could not find the product again, and when to try next
+    missed_checks = models.IntegerField(default=0)
+    next_check_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         indexes = [
@@ -41,8 +56,38 @@ class StoredProduct(models.Model):
     
     @property
     def is_stale(self):
-        """Check if the product data is older than 24 hours"""
-        return datetime.now() - self.last_updated.replace(tzinfo=None) > timedelta(hours=24)
+        """Check if the product data is older than STALE_AFTER (24 hours)"""
+        return datetime.now() - self.last_updated.replace(tzinfo=None) > STALE_AFTER
+
+    def record_price_point(self, price):
+        """Fold a new price point into the running statistics (does not save)"""
+        samples = self.price_samples or 0
+        if samples == 0 or self.price_avg is None:
+            self.price_min = self.price_max = self.price_avg = price
+        else:
+            self.price_min = min(self.price_min, price)
+            self.price_max = max(self.price_max, price)
+            self.price_avg = ((self.price_avg * samples + price) / (samples + 1)).quantize(Decimal('0.01'))
+        self.price_samples = samples + 1
+
+    @property
+    def percent_below_average(self):
+        """How far the current price is below the average price, in percent (negative when above)"""
+        if not self.price_avg or self.price is None:
+            return None
+        return round(float((self.price_avg - self.price) / self.price_avg * 100), 1)
+
+    @property
+    def price_context(self):
+        """Price statistics ready to attach to search results"""
+        return {
+            'current': float(self.price) if self.price is not None else None,
+            'min': float(self.price_min) if self.price_min is not None else None,
+            'max': float(self.price_max) if self.price_max is not None else None,
+            'avg': float(self.price_avg) if self.price_avg is not None else None,
+            'samples': self.price_samples,
+            'percent_below_average': self.percent_below_average,
+        }
 
 class PriceHistory(models.Model):
     """Model for tracking price changes"""
@@ -53,10 +98,35 @@ class PriceHistory(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['product', 'timestamp']),
+            # Per-product reads of the change stream walk ids in order
+            models.Index(fields=['product', 'id']),
         ]
 
 class ProductAvailabilityLog(models.Model):
     """Model for tracking product availability changes"""
     product = models.ForeignKey(StoredProduct, on_delete=models.CASCADE, related_name='availability_logs')
     available = models.BooleanField()
-    timestamp = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'timestamp']),
+            models.Index(fields=['product', 'id']),
+        ]
+
+class BackInStockEntry(models.Model):
+    """
+    Materialized index of products that came back in stock.
+
+    A product gets an entry when its availability flips back to available and
+    loses it as soon as it goes out of stock again, so the table only ever
+    holds products that are currently available.
+    """
+    product = models.OneToOneField(StoredProduct, on_delete=models.CASCADE, related_name='back_in_stock')
+    availability_log = models.ForeignKey(ProductAvailabilityLog, on_delete=models.CASCADE, related_name='+')
+    restocked_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-restocked_at', '-id']),
+        ]
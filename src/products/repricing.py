@@ -0,0 +1,214 @@
+"""
+Background Re-pricing
+
+Keeps the stored catalog fresh without making user requests pay for it.
+Each run picks the most valuable stale products, re-fetches them from
+SearchAPI.io concurrently while staying inside a per-run quota budget, and
+writes the results through ProductStorageService.store_products.
+
+Value is driven by how many carts hold the product and by the popularity
+signals the provider reports (watchers and sold count).
+
+A product the provider no longer returns keeps its old last_updated, so it
+would stay the stalest and be picked first on every run. Each miss instead
+pushes next_check_at back, doubling from STALE_AFTER up to MAX_MISS_BACKOFF,
+and the product is skipped until then; finding it again clears the backoff.
+"""
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from datetime import timedelta
+import asyncio
+import logging
+import math
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from delapp.models import SavedItem
+from .models import StoredProduct, STALE_AFTER
+from .services import ProductStorageService
+
+logger = logging.getLogger(__name__)
+
+# Default number of provider calls one run may spend
+DEFAULT_QUOTA_BUDGET = 50
+DEFAULT_CONCURRENCY = 4
+
+# Weights used to rank stale products
+CART_WEIGHT = 10.0
+WATCHERS_WEIGHT = 1.0
+SOLD_WEIGHT = 0.5
+
+# Longest wait before looking up a product that keeps not being found again
+MAX_MISS_BACKOFF = timedelta(days=30)
+
+
+@dataclass
+class RepricingReport:
+    """Outcome of a single re-pricing run"""
+    candidates: int = 0
+    api_calls: int = 0
+    refreshed: int = 0
+    not_found: int = 0
+    failed: int = 0
+
+
+def _cart_count_subquery():
+    return Subquery(
+        SavedItem.objects.filter(
+            product_id=OuterRef('product_id'),
+            retailer=OuterRef('retailer')
+        ).order_by().values('product_id').annotate(total=Count('id')).values('total')[:1],
+        output_field=IntegerField()
+    )
+
+
+def _as_count(value) -> float:
+    try:
+        return max(float(value or 0), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _score(product: StoredProduct) -> float:
+    metadata = product.metadata or {}
+    return (CART_WEIGHT * product.cart_count
+            + WATCHERS_WEIGHT * math.log1p(_as_count(metadata.get('watchers')))
+            + SOLD_WEIGHT * math.log1p(_as_count(metadata.get('sold_count'))))
+
+
+def select_stale_products(budget: int = DEFAULT_QUOTA_BUDGET, pool_factor: int = 4) -> List[StoredProduct]:
+    """
+    Pick up to `budget` stale products, most valuable first.
+
+    Products in carts are always considered first; the remaining pool is filled
+    with the products that have gone longest without a refresh and then ranked
+    by popularity. Products backing off after a miss are left out.
+    """
+    if budget <= 0:
+        return []
+
+    now = timezone.now()
+    pool = list(
+        StoredProduct.objects.filter(last_updated__lt=now - STALE_AFTER)
+        .filter(Q(next_check_at__isnull=True) | Q(next_check_at__lte=now))
+        .annotate(cart_count=Coalesce(_cart_count_subquery(), Value(0)))
+        .only('id', 'product_id', 'retailer', 'title', 'price', 'available', 'metadata', 'last_updated',
+              'missed_checks')
+        .order_by('-cart_count', 'last_updated')[:budget * pool_factor]
+    )
+    pool.sort(key=lambda product: (-_score(product), product.last_updated))
+    return pool[:budget]
+
+
+def miss_backoff(missed_checks: int) -> timedelta:
+    """How long to wait after the given number of consecutive misses"""
+    return min(STALE_AFTER * 2 ** max(missed_checks - 1, 0), MAX_MISS_BACKOFF)
+
+
+def _record_checks(found: List[StoredProduct], missed: List[StoredProduct]) -> None:
+    """Back off from the products that were not found and clear the backoff of those that were"""
+    now = timezone.now()
+    for product in missed:
+        product.missed_checks += 1
+        product.next_check_at = now + miss_backoff(product.missed_checks)
+    if missed:
+        StoredProduct.objects.bulk_update(missed, ['missed_checks', 'next_check_at'])
+
+    recovered = [product.id for product in found if product.missed_checks]
+    if recovered:
+        StoredProduct.objects.filter(id__in=recovered).update(missed_checks=0, next_check_at=None)
+
+
+async def _fetch_fresh_deals(products: List[StoredProduct], concurrency: int,
+                             report: RepricingReport) -> Tuple[List[object], List[StoredProduct]]:
+    """
+    Look every product up by title and keep the listing with the same product ID.
+
+    Returns:
+        (fresh deals, products the provider did not return)
+    """
+    from delapp.searchapi_io import SearchAPIProvider
+
+    # A fresh provider per run so its in-memory query cache never serves stale prices
+    provider = SearchAPIProvider()
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    missed: List[StoredProduct] = []
+
+    async def refresh(product: StoredProduct):
+        async with semaphore:
+            report.api_calls += 1
+            try:
+                deals = await provider.search_products_async(query=product.title, max_results=10)
+            except Exception as e:
+                logger.warning(f"Re-pricing lookup failed for {product.retailer}:{product.product_id}: {str(e)}")
+                report.failed += 1
+                return None
+
+        for deal in deals:
+            if deal.product_id == product.product_id and deal.retailer == product.retailer:
+                return deal
+        report.not_found += 1
+        missed.append(product)
+        return None
+
+    results = await asyncio.gather(*(refresh(product) for product in products))
+    return [deal for deal in results if deal is not None], missed
+
+
+def run_repricing(budget: int = DEFAULT_QUOTA_BUDGET, concurrency: int = DEFAULT_CONCURRENCY) -> RepricingReport:
+    """Refresh the most valuable stale products. One provider call is spent per product."""
+    report = RepricingReport()
+    products = select_stale_products(budget)
+    report.candidates = len(products)
+    if not products:
+        return report
+
+    deals, missed = asyncio.run(_fetch_fresh_deals(products, concurrency, report))
+    if deals:
+        ProductStorageService.store_products(deals)
+    report.refreshed = len(deals)
+
+    found_keys = {(deal.product_id, deal.retailer) for deal in deals}
+    _record_checks([product for product in products if (product.product_id, product.retailer) in found_keys], missed)
+
+    logger.info(f"Re-pricing run: {report}")
+    return report
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def freshness_lag() -> Dict[str, Optional[float]]:
+    """
+    Report how far behind the catalog is.
+
+    Lag percentiles are computed over products that sit in at least one cart,
+    since those are the ones users look at again. Stale counts cover the
+    whole catalog.
+    """
+    now = timezone.now()
+    cutoff = now - STALE_AFTER
+
+    lags = sorted(
+        (now - last_updated).total_seconds()
+        for last_updated in StoredProduct.objects.filter(
+            product_id__in=SavedItem.objects.values('product_id')
+        ).annotate(
+            in_cart=Coalesce(_cart_count_subquery(), Value(0))
+        ).filter(in_cart__gt=0).values_list('last_updated', flat=True)
+    )
+
+    return {
+        'total_products': StoredProduct.objects.count(),
+        'stale_products': StoredProduct.objects.filter(last_updated__lt=cutoff).count(),
+        'tracked_products': len(lags),
+        'tracked_lag_p50_seconds': _percentile(lags, 0.5),
+        'tracked_lag_p95_seconds': _percentile(lags, 0.95),
+        'tracked_lag_max_seconds': lags[-1] if lags else None,
+    }
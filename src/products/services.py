@@ -1,6 +1,175 @@
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Iterable, Tuple
 from datetime import datetime, timedelta
-from .models import StoredProduct, PriceHistory, ProductAvailabilityLog
+from decimal import Decimal
+from functools import reduce
+import heapq
+import operator
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Min, Max, Avg, Count
+from django.utils import timezone
+from .models import StoredProduct, PriceHistory, ProductAvailabilityLog, BackInStockEntry
+from .events import change_bus, PRICE_CHANGED, AVAILABILITY_CHANGED
+
+
+def product_key(product_id: str, retailer: str) -> str:
+    """Build the string key used to address a product in batch responses"""
+    return f"{retailer}:{product_id}"
+
+
+def _downsample(points: List[Dict], max_points: int) -> List[Dict]:
+    """Pick evenly spaced points, always keeping the first and the latest one"""
+    if max_points <= 0 or len(points) <= max_points:
+        return points
+    if max_points == 1:
+        return [points[-1]]
+    step = (len(points) - 1) / (max_points - 1)
+    return [points[round(i * step)] for i in range(max_points)]
+
+
+# Fields copied from a ProductDeal onto an existing StoredProduct on update
+UPDATE_FIELDS = ['price', 'original_price', 'title', 'description', 'available',
+                 'rating', 'review_count', 'condition', 'shipping_info', 'discount']
+
+# Denormalized statistics columns maintained alongside every price change
+STATS_FIELDS = ['price_min', 'price_max', 'price_avg', 'price_samples']
+
+# How long get_changes waits before handing out a change event. Ids are
+# allocated at insert but become visible at commit, so a row can appear
+# behind a cursor that already moved past it; waiting lets the short
+# transactions that write the logs commit first.
+CHANGE_SETTLE_TIME = timedelta(seconds=5)
+
+
+def _to_price(value) -> Optional[Decimal]:
+    """Convert a provider price to the Decimal stored on StoredProduct"""
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _deal_metadata(product_deal: 'ProductDeal') -> Dict:
+    return {
+        'coupon': product_deal.coupon,
+        'trending': product_deal.trending,
+        'sold_count': product_deal.sold_count,
+        'watchers': product_deal.watchers,
+        'return_policy': product_deal.return_policy,
+        'location': product_deal.location
+    }
+
+
+def _deal_defaults(product_deal: 'ProductDeal') -> Dict:
+    price = _to_price(product_deal.price)
+    return {
+        'title': product_deal.title,
+        'price': price,
+        'price_min': price,
+        'price_max': price,
+        'price_avg': price,
+        'price_samples': 1,
+        'original_price': _to_price(product_deal.original_price),
+        'url': product_deal.url,
+        'image_url': product_deal.image_url,
+        'description': product_deal.description,
+        'available': product_deal.available,
+        'rating': product_deal.rating,
+        'review_count': product_deal.review_count,
+        'condition': product_deal.condition,
+        'shipping_info': product_deal.shipping_info,
+        'discount': product_deal.discount,
+        'metadata': _deal_metadata(product_deal)
+    }
+
+
+def _apply_deal(product: StoredProduct, product_deal: 'ProductDeal') -> Tuple[bool, bool]:
+    """
+    Copy a deal onto an existing product in memory.
+
+    Returns:
+        (price_changed, availability_changed)
+    """
+    new_price = _to_price(product_deal.price)
+    price_changed = product.price != new_price
+    availability_changed = product.available != product_deal.available
+
+    for field in UPDATE_FIELDS:
+        if hasattr(product_deal, field):
+            setattr(product, field, getattr(product_deal, field))
+    product.price = new_price
+    product.original_price = _to_price(product_deal.original_price)
+    product.metadata.update(_deal_metadata(product_deal))
+
+    if price_changed:
+        product.record_price_point(new_price)
+
+    return price_changed, availability_changed
+
+
+def _change_event(kind: str, event_id: int, product_id: str, retailer: str, timestamp, value) -> Dict:
+    """Build the dict shared by the change stream and the in-process bus"""
+    event = {
+        'type': kind,
+        'id': event_id,
+        'product_id': product_id,
+        'retailer': retailer,
+        'timestamp': timestamp.isoformat() if timestamp else None,
+    }
+    if kind == PRICE_CHANGED:
+        event['price'] = float(value) if value is not None else None
+    else:
+        event['available'] = value
+    return event
+
+
+def _record_changes(price_points: List[PriceHistory], availability_logs: List[ProductAvailabilityLog]) -> None:
+    """
+    Keep the back-in-stock index in step with freshly written availability
+    logs and publish every change once the surrounding transaction commits.
+    """
+    gone = [log.product_id for log in availability_logs if not log.available]
+    if gone:
+        BackInStockEntry.objects.filter(product_id__in=gone).delete()
+
+    restocked = [log for log in availability_logs if log.available]
+    if restocked:
+        BackInStockEntry.objects.bulk_create(
+            [BackInStockEntry(product=log.product, availability_log=log, restocked_at=log.timestamp)
+             for log in restocked],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['availability_log', 'restocked_at']
+        )
+
+    events = [
+        _change_event(PRICE_CHANGED, point.id, point.product.product_id, point.product.retailer,
+                      point.timestamp, point.price)
+        for point in price_points
+    ] + [
+        _change_event(AVAILABILITY_CHANGED, log.id, log.product.product_id, log.product.retailer,
+                      log.timestamp, log.available)
+        for log in availability_logs
+    ]
+    if events:
+        transaction.on_commit(lambda: change_bus.publish(events))
+
+
+def encode_cursor(price_id: int, availability_id: int) -> str:
+    """Encode the last seen id of each log table as an opaque cursor"""
+    return f"{price_id}-{availability_id}"
+
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[int, int]:
+    """Inverse of encode_cursor. An empty cursor starts from the beginning."""
+    if not cursor:
+        return 0, 0
+    try:
+        price_id, availability_id = (int(part) for part in cursor.split('-'))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if price_id < 0 or availability_id < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return price_id, availability_id
+
 
 class ProductStorageService:
     """Service for handling product storage operations"""
@@ -8,67 +177,148 @@ class ProductStorageService:
     @staticmethod
     def store_product(product_deal: 'ProductDeal') -> StoredProduct:
         """Store or update a product from a ProductDeal instance"""
-        product, created = StoredProduct.objects.get_or_create(
-            product_id=product_deal.product_id,
-            retailer=product_deal.retailer,
-            defaults={
-                'title': product_deal.title,
-                'price': product_deal.price,
-                'original_price': product_deal.original_price,
-                'url': product_deal.url,
-                'image_url': product_deal.image_url,
-                'description': product_deal.description,
-                'available': product_deal.available,
-                'rating': product_deal.rating,
-                'review_count': product_deal.review_count,
-                'condition': product_deal.condition,
-                'shipping_info': product_deal.shipping_info,
-                'discount': product_deal.discount,
-                'metadata': {
-                    'coupon': product_deal.coupon,
-                    'trending': product_deal.trending,
-                    'sold_count': product_deal.sold_count,
-                    'watchers': product_deal.watchers,
-                    'return_policy': product_deal.return_policy,
-                    'location': product_deal.location
-                }
-            }
-        )
-        
-        if not created:
-            # Update existing product
-            if product.price != product_deal.price:
-                PriceHistory.objects.create(
-                    product=product,
-                    price=product_deal.price
-                )
-            
-            if product.available != product_deal.available:
-                ProductAvailabilityLog.objects.create(
-                    product=product,
-                    available=product_deal.available
-                )
-            
-            # Update the product fields
-            for field in ['price', 'original_price', 'title', 'description', 'available',
-                         'rating', 'review_count', 'condition', 'shipping_info', 'discount']:
-                if hasattr(product_deal, field):
-                    setattr(product, field, getattr(product_deal, field))
+        with transaction.atomic():
+            product, created = StoredProduct.objects.get_or_create(
+                product_id=product_deal.product_id,
+                retailer=product_deal.retailer,
+                defaults=_deal_defaults(product_deal)
+            )
             
-            # Update metadata
-            product.metadata.update({
-                'coupon': product_deal.coupon,
-                'trending': product_deal.trending,
-                'sold_count': product_deal.sold_count,
-                'watchers': product_deal.watchers,
-                'return_policy': product_deal.return_policy,
-                'location': product_deal.location
-            })
-            
-            product.save()
-        
+            price_points, availability_logs = [], []
+            if created:
+                # The first observed price is a history point too, so the
+                # statistics can always be rebuilt from PriceHistory alone
+                price_points.append(PriceHistory.objects.create(product=product, price=product.price))
+            else:
+                # Lock the row, so a concurrent writer's price statistics are not overwritten
+                product = StoredProduct.objects.select_for_update().get(pk=product.pk)
+                price_changed, availability_changed = _apply_deal(product, product_deal)
+
+                if price_changed:
+                    price_points.append(PriceHistory.objects.create(
+                        product=product,
+                        price=product.price
+                    ))
+                
+                if availability_changed:
+                    availability_logs.append(ProductAvailabilityLog.objects.create(
+                        product=product,
+                        available=product.available
+                    ))
+                
+                product.save()
+
+            _record_changes(price_points, availability_logs)
         return product
 
+    @staticmethod
+    def store_products(product_deals: Iterable['ProductDeal']) -> List[StoredProduct]:
+        """
+        Bulk upsert many ProductDeal instances.
+
+        Uses one query to lock and load the existing rows and one bulk statement
+        each for new products, updated products, price history and availability
+        logs. The price statistics are updated from the locked rows, so
+        concurrent writers for the same product apply their prices one after the
+        other. If the same product appears more than once, the last deal wins.
+        When a concurrent writer inserts one of the new products first, the
+        upsert is retried once and updates it instead.
+
+        Each attempt runs in its own transaction, or savepoint when called
+        inside an atomic block, so the retry works there too.
+
+        Returns:
+            The stored products, in the order their keys first appeared
+        """
+        product_deals = list(product_deals)
+        try:
+            with transaction.atomic():
+                return ProductStorageService._store_products(product_deals)
+        except IntegrityError:
+            with transaction.atomic():
+                return ProductStorageService._store_products(product_deals)
+
+    @staticmethod
+    def _store_products(product_deals: List['ProductDeal']) -> List[StoredProduct]:
+        deals = {}
+        for deal in product_deals:
+            deals[(str(deal.product_id), str(deal.retailer))] = deal
+        if not deals:
+            return []
+
+        # Rows are locked in id order, so two batches sharing products cannot deadlock
+        existing = {
+            (product.product_id, product.retailer): product
+            for product in StoredProduct.objects.select_for_update().filter(reduce(operator.or_, (
+                Q(product_id=pid, retailer=retailer) for pid, retailer in deals
+            ))).order_by('pk')
+        }
+
+        now = timezone.now()
+        new_products, updated_products = [], []
+        price_points, availability_logs = [], []
+
+        for key, deal in deals.items():
+            product = existing.get(key)
+            if product is None:
+                new_products.append(StoredProduct(product_id=key[0], retailer=key[1], **_deal_defaults(deal)))
+                continue
+
+            price_changed, availability_changed = _apply_deal(product, deal)
+            # bulk_update bypasses auto_now
+            product.last_updated = now
+            updated_products.append(product)
+
+            if price_changed:
+                price_points.append(PriceHistory(product=product, price=product.price))
+            if availability_changed:
+                availability_logs.append(ProductAvailabilityLog(product=product, available=product.available))
+
+        # New products are inserted in key order too, for the same reason
+        new_products.sort(key=lambda product: (product.product_id, product.retailer))
+        StoredProduct.objects.bulk_create(new_products)
+        price_points.extend(PriceHistory(product=product, price=product.price) for product in new_products)
+        if updated_products:
+            StoredProduct.objects.bulk_update(
+                updated_products, UPDATE_FIELDS + STATS_FIELDS + ['metadata', 'last_updated']
+            )
+        PriceHistory.objects.bulk_create(price_points)
+        ProductAvailabilityLog.objects.bulk_create(availability_logs)
+        _record_changes(price_points, availability_logs)
+
+        stored = {(p.product_id, p.retailer): p for p in new_products + updated_products}
+        return [stored[key] for key in deals]
+
+    @staticmethod
+    def get_price_contexts(product_deals: Iterable['ProductDeal']) -> Dict[str, Dict]:
+        """
+        Catalog price statistics for the deals' products, read in one query.
+
+        Each deal's current price is folded into its product's statistics in
+        memory, as storing the deal would, so a result shows where its price
+        stands. Products the catalog does not know yet get no entry.
+
+        Returns:
+            Dict mapping product_key(product_id, retailer) to StoredProduct.price_context
+        """
+        prices = {(str(deal.product_id), str(deal.retailer)): _to_price(deal.price) for deal in product_deals}
+        if not prices:
+            return {}
+
+        contexts = {}
+        for product in StoredProduct.objects.filter(product_id__in={pid for pid, _ in prices}).only(
+            'product_id', 'retailer', 'price', *STATS_FIELDS
+        ):
+            key = (product.product_id, product.retailer)
+            if key not in prices or not product.price_samples:
+                continue
+            price = prices[key]
+            if price is not None and price != product.price:
+                product.record_price_point(price)
+            product.price = price
+            contexts[product_key(*key)] = product.price_context
+        return contexts
+
     @staticmethod
     def get_product(product_id: str, retailer: str) -> Optional[StoredProduct]:
         """Retrieve a stored product"""
@@ -88,6 +338,185 @@ class ProductStorageService:
             timestamp__gte=since_date
         ).values('price', 'timestamp').order_by('timestamp'))
 
+    @staticmethod
+    def get_price_histories(keys: Iterable[Tuple[str, str]], days: int = 30,
+                            max_points: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """
+        Get price history for many products in a single query.
+
+        Args:
+            keys: (product_id, retailer) pairs
+            days: How far back to look
+            max_points: Optional cap on the number of points returned per product
+
+        Returns:
+            Dict mapping product_key(product_id, retailer) to a list of
+            {'price', 'timestamp'} dicts ordered by timestamp. Every requested
+            key is present, with an empty list for unknown products.
+        """
+        keys = list(dict.fromkeys((str(pid), str(retailer)) for pid, retailer in keys))
+        histories = {product_key(pid, retailer): [] for pid, retailer in keys}
+        if not keys:
+            return histories
+
+        since_date = timezone.now() - timedelta(days=days)
+        product_filter = reduce(operator.or_, (
+            Q(product__product_id=pid, product__retailer=retailer) for pid, retailer in keys
+        ))
+
+        rows = PriceHistory.objects.filter(
+            product_filter,
+            timestamp__gte=since_date
+        ).values_list(
+            'product__product_id', 'product__retailer', 'price', 'timestamp'
+        ).order_by('product_id', 'timestamp')
+
+        for pid, retailer, price, timestamp in rows:
+            histories[product_key(pid, retailer)].append({'price': price, 'timestamp': timestamp})
+
+        if max_points:
+            for key, points in histories.items():
+                histories[key] = _downsample(points, max_points)
+
+        return histories
+
+    @staticmethod
+    def get_price_context(keys: Iterable[Tuple[str, str]]) -> Dict[str, Dict]:
+        """Get precomputed price statistics for many products in one query, keyed by product_key"""
+        keys = list(dict.fromkeys((str(pid), str(retailer)) for pid, retailer in keys))
+        if not keys:
+            return {}
+
+        products = StoredProduct.objects.filter(reduce(operator.or_, (
+            Q(product_id=pid, retailer=retailer) for pid, retailer in keys
+        ))).only('product_id', 'retailer', 'price', *STATS_FIELDS)
+
+        return {product_key(p.product_id, p.retailer): p.price_context for p in products}
+
+    @staticmethod
+    def rebuild_price_stats(chunk_size: int = 1000) -> int:
+        """
+        Recompute the denormalized price statistics from PriceHistory.
+
+        Products without any history fall back to their current price.
+
+        Returns:
+            Number of products updated
+        """
+        products = StoredProduct.objects.only('id', 'price', *STATS_FIELDS).annotate(
+            low=Min('price_history__price'),
+            high=Max('price_history__price'),
+            mean=Avg('price_history__price'),
+            samples=Count('price_history')
+        ).order_by('id')
+
+        updated = 0
+        batch = []
+        for product in products.iterator(chunk_size=chunk_size):
+            if product.samples:
+                product.price_min, product.price_max = product.low, product.high
+                product.price_avg = _to_price(product.mean)
+                product.price_samples = product.samples
+            else:
+                product.price_min = product.price_max = product.price_avg = product.price
+                product.price_samples = 1 if product.price is not None else 0
+            batch.append(product)
+
+            if len(batch) >= chunk_size:
+                StoredProduct.objects.bulk_update(batch, STATS_FIELDS)
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            StoredProduct.objects.bulk_update(batch, STATS_FIELDS)
+            updated += len(batch)
+
+        return updated
+
+    @staticmethod
+    def get_changes(cursor: Optional[str] = None, limit: int = 100,
+                    kinds: Optional[Iterable[str]] = None,
+                    settle: timedelta = CHANGE_SETTLE_TIME) -> Dict:
+        """
+        Read price and availability change events after a cursor.
+
+        Each log table is read in id order from its own position in the
+        cursor, and the two streams are merged by timestamp. The returned
+        cursor resumes exactly after the last event handed out, so consumers
+        can poll with it without repeating events.
+
+        Each stream stops at its first event younger than settle. A row whose
+        transaction was still open when a later id was read would otherwise
+        be skipped for good; holding back recent events closes that gap for
+        every transaction shorter than settle, which the log writes in
+        store_products are. A transaction held open longer can still have
+        its events skipped.
+
+        Args:
+            cursor: Value returned by a previous call, or None to start at the beginning
+            limit: Maximum number of events to return
+            kinds: Optional subset of ('price', 'availability')
+            settle: How old an event must be before it is handed out
+
+        Returns:
+            {'events': [...], 'cursor': str}
+        """
+        price_id, availability_id = parse_cursor(cursor)
+        kinds = set(kinds or (PRICE_CHANGED, AVAILABILITY_CHANGED))
+        settled_before = timezone.now() - settle
+
+        def settled(kind, rows):
+            # Stop rather than skip: the cursor must not pass an unsettled id
+            for row in rows:
+                if row[3] > settled_before:
+                    return
+                yield _change_event(kind, *row)
+
+        streams = []
+        if PRICE_CHANGED in kinds:
+            streams.append(settled(PRICE_CHANGED, PriceHistory.objects.filter(
+                id__gt=price_id
+            ).order_by('id').values_list(
+                'id', 'product__product_id', 'product__retailer', 'timestamp', 'price'
+            )[:limit]))
+        if AVAILABILITY_CHANGED in kinds:
+            streams.append(settled(AVAILABILITY_CHANGED, ProductAvailabilityLog.objects.filter(
+                id__gt=availability_id
+            ).order_by('id').values_list(
+                'id', 'product__product_id', 'product__retailer', 'timestamp', 'available'
+            )[:limit]))
+
+        # heapq.merge only ever consumes the head of each stream, so every
+        # stream is read as an id-ordered prefix and the cursor stays exact
+        events = []
+        for event in heapq.merge(*streams, key=lambda event: event['timestamp']):
+            events.append(event)
+            if event['type'] == PRICE_CHANGED:
+                price_id = event['id']
+            else:
+                availability_id = event['id']
+            if len(events) >= limit:
+                break
+
+        return {'events': events, 'cursor': encode_cursor(price_id, availability_id)}
+
+    @staticmethod
+    def get_back_in_stock(since: Optional[datetime] = None, limit: int = 50) -> List[Dict]:
+        """Get products that are back in stock, most recently restocked first"""
+        entries = BackInStockEntry.objects.select_related('product').order_by('-restocked_at', '-id')
+        if since is not None:
+            entries = entries.filter(restocked_at__gte=since)
+
+        return [{
+            'product_id': entry.product.product_id,
+            'retailer': entry.product.retailer,
+            'title': entry.product.title,
+            'price': float(entry.product.price),
+            'url': entry.product.url,
+            'image_url': entry.product.image_url,
+            'restocked_at': entry.restocked_at.isoformat(),
+        } for entry in entries[:limit]]
+
     @staticmethod
     def cleanup_stale_products(days: int = 30):
         """Remove products that haven't been updated in the specified number of days"""
@@ -1,3 +1,361 @@
 from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from .models import StoredProduct, PriceHistory
+from .services import ProductStorageService, product_key, _downsample
+
+
+def make_product(product_id, retailer='Amazon', price='10.00'):
+    return StoredProduct.objects.create(
+        product_id=product_id,
+        title=f"Product {product_id}",
+        price=Decimal(price),
+        url=f"https://example.com/{product_id}",
+        image_url=f"https://example.com/{product_id}.png",
+        retailer=retailer,
+        description="Test product"
+    )
+
+
+class PriceHistoryBatchTests(TestCase):
+    def setUp(self):
+        self.first = make_product('p1')
+        self.second = make_product('p2', retailer='Walmart')
+        for price in ['10.00', '9.50', '9.00', '8.50', '8.00']:
+            PriceHistory.objects.create(product=self.first, price=Decimal(price))
+        PriceHistory.objects.create(product=self.second, price=Decimal('20.00'))
+
+    def test_histories_grouped_per_product(self):
+        with self.assertNumQueries(1):
+            histories = ProductStorageService.get_price_histories(
+                [('p1', 'Amazon'), ('p2', 'Walmart'), ('missing', 'Amazon')]
+            )
+
+        self.assertEqual(len(histories[product_key('p1', 'Amazon')]), 5)
+        self.assertEqual(histories[product_key('p2', 'Walmart')][0]['price'], Decimal('20.00'))
+        self.assertEqual(histories[product_key('missing', 'Amazon')], [])
+
+    def test_retailer_is_part_of_the_key(self):
+        histories = ProductStorageService.get_price_histories([('p1', 'Walmart')])
+        self.assertEqual(histories, {product_key('p1', 'Walmart'): []})
+
+    def test_downsampling_keeps_endpoints(self):
+        histories = ProductStorageService.get_price_histories([('p1', 'Amazon')], max_points=3)
+        points = histories[product_key('p1', 'Amazon')]
+
+        self.assertEqual([p['price'] for p in points], [Decimal('10.00'), Decimal('9.00'), Decimal('8.00')])
+
+    def test_downsample_short_series_untouched(self):
+        points = [{'price': 1}, {'price': 2}]
+        self.assertIs(_downsample(points, 5), points)
+        self.assertEqual(_downsample(points, 1), [{'price': 2}])
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            product = make_product(f"p{i}", price=f"{10 + i}.00")
+            PriceHistory.objects.create(product=product, price=Decimal('9.99'))
+
+    def test_ndjson_chunks_cover_all_rows(self):
+        import json
+        from .export import iter_ndjson
+
+        blocks = list(iter_ndjson('products', chunk_size=2))
+        rows = [json.loads(line) for block in blocks for line in block.splitlines()]
+
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual([row['product_id'] for row in rows], [f"p{i}" for i in range(5)])
+        self.assertEqual(rows[1]['price'], 11.0)
+
+    def test_streamed_npz_round_trip(self):
+        import io
+        from .export import iter_npz, load_npz_columns
+
+        data = b''.join(iter_npz('price_history', chunk_size=2))
+        columns = load_npz_columns(io.BytesIO(data))
+
+        self.assertEqual(len(columns['id']), 5)
+        self.assertEqual(columns['price'].tolist(), [9.99] * 5)
+        self.assertEqual(str(columns['timestamp'].dtype), 'datetime64[us]')
+
+    async def test_export_view_streams_asynchronously(self):
+        import json
+        from asgiref.sync import sync_to_async
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from delapp.models import CustomUser
+        from .views import catalog_export_view
+
+        admin = await sync_to_async(CustomUser.objects.create_superuser)(email='admin@example.com', password='x')
+        request = APIRequestFactory().get('/api/products/export/', {'table': 'products'})
+        force_authenticate(request, user=admin)
+        response = await sync_to_async(catalog_export_view)(request)
+
+        # A sync iterator would be read to the end by the ASGI handler before sending anything
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual([json.loads(line)['product_id'] for line in lines], [f"p{i}" for i in range(5)])
+
+
+class BulkUpsertAndRepricingTests(TestCase):
+    def make_deal(self, product_id, price, available=True, retailer='Amazon'):
+        from datetime import datetime
+        from delapp.models import ProductDeal
+
+        return ProductDeal(
+            product_id=product_id, title=f"Product {product_id}", price=price,
+            url=f"https://example.com/{product_id}", image_url='', retailer=retailer,
+            description='', available=available, timestamp=datetime.now()
+        )
+
+    def test_store_products_inserts_and_updates_in_bulk(self):
+        make_product('p1', price='10.00')
+
+        stored = ProductStorageService.store_products([
+            self.make_deal('p1', 8.5, available=False),
+            self.make_deal('p2', 20.0),
+        ])
+
+        self.assertEqual([p.product_id for p in stored], ['p1', 'p2'])
+        self.assertEqual(StoredProduct.objects.get(product_id='p1').price, Decimal('8.50'))
+        self.assertEqual(PriceHistory.objects.filter(product__product_id='p1').count(), 1)
+        self.assertEqual(stored[0].availability_logs.count(), 1)
+        self.assertEqual(StoredProduct.objects.count(), 2)
+
+    def test_unchanged_price_records_no_history(self):
+        make_product('p1', price='9.99')
+        ProductStorageService.store_products([self.make_deal('p1', 9.99)])
+        self.assertFalse(PriceHistory.objects.exists())
+
+    def test_stale_products_in_carts_come_first(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from delapp.models import Cart, SavedItem
+        from .repricing import select_stale_products, freshness_lag
+
+        for product_id in ['cold', 'carted', 'fresh']:
+            make_product(product_id)
+        StoredProduct.objects.exclude(product_id='fresh').update(
+            last_updated=timezone.now() - timedelta(days=3)
+        )
+        cart = Cart.objects.create(session_id='s1')
+        SavedItem.objects.create(cart=cart, product_id='carted', retailer='Amazon', title='Carted')
+
+        selected = select_stale_products(budget=5)
+
+        self.assertEqual([p.product_id for p in selected], ['carted', 'cold'])
+        lag = freshness_lag()
+        self.assertEqual(lag['stale_products'], 2)
+        self.assertEqual(lag['tracked_products'], 1)
+        self.assertGreater(lag['tracked_lag_p50_seconds'], 2 * 86400)
+
+    def test_products_not_found_back_off(self):
+        import asyncio
+        from datetime import timedelta
+        from unittest.mock import patch
+        from django.utils import timezone
+        from .repricing import run_repricing, select_stale_products
+
+        for product_id in ['gone', 'listed']:
+            make_product(product_id)
+        StoredProduct.objects.update(last_updated=timezone.now() - timedelta(days=3))
+
+        class Provider:
+            async def search_products_async(provider, query, max_results):
+                return [self.make_deal('listed', 12.0)]
+
+        with patch('delapp.searchapi_io.SearchAPIProvider', Provider):
+            report = run_repricing(budget=5)
+        self.assertEqual((report.refreshed, report.not_found), (1, 1))
+
+        gone = StoredProduct.objects.get(product_id='gone')
+        self.assertEqual(gone.missed_checks, 1)
+        self.assertAlmostEqual((gone.next_check_at - timezone.now()).total_seconds(), 86400, delta=60)
+        self.assertEqual(select_stale_products(budget=5), [])
+
+        # Once the backoff expires the product is tried again, and finding it clears the backoff
+        StoredProduct.objects.update(next_check_at=timezone.now(), last_updated=timezone.now() - timedelta(days=3))
+        self.assertEqual({p.product_id for p in select_stale_products(budget=5)}, {'gone', 'listed'})
+
+        Provider.search_products_async = lambda provider, query, max_results: asyncio.sleep(
+            0, [self.make_deal('gone', 30.0), self.make_deal('listed', 12.0)]
+        )
+        with patch('delapp.searchapi_io.SearchAPIProvider', Provider):
+            run_repricing(budget=5)
+        gone.refresh_from_db()
+        self.assertEqual((gone.missed_checks, gone.next_check_at), (0, None))
+
+    def test_miss_backoff_doubles_up_to_the_cap(self):
+        from datetime import timedelta
+        from .repricing import MAX_MISS_BACKOFF, miss_backoff
+
+        self.assertEqual([miss_backoff(n) for n in (1, 2, 3)], [timedelta(days=1), timedelta(days=2), timedelta(days=4)])
+        self.assertEqual(miss_backoff(20), MAX_MISS_BACKOFF)
+
+
+class PriceStatisticsTests(TestCase):
+    def make_deal(self, price):
+        from datetime import datetime
+        from delapp.models import ProductDeal
+
+        return ProductDeal(
+            product_id='p1', title='Product p1', price=price, url='https://example.com/p1',
+            image_url='', retailer='Amazon', description='', available=True, timestamp=datetime.now()
+        )
+
+    def test_statistics_follow_price_changes(self):
+        for price in [10.0, 6.0, 8.0]:
+            ProductStorageService.store_product(self.make_deal(price))
+
+        product = StoredProduct.objects.get(product_id='p1')
+        self.assertEqual(product.price_min, Decimal('6.00'))
+        self.assertEqual(product.price_max, Decimal('10.00'))
+        self.assertEqual(product.price_avg, Decimal('8.00'))
+        self.assertEqual(product.price_samples, 3)
+        self.assertEqual(product.percent_below_average, 0.0)
+
+    def test_bulk_upsert_keeps_statistics_in_step(self):
+        ProductStorageService.store_products([self.make_deal(10.0)])
+        stored = ProductStorageService.store_products([self.make_deal(5.0)])
+
+        self.assertEqual(stored[0].price_context['avg'], 7.5)
+        self.assertEqual(stored[0].price_context['percent_below_average'], 33.3)
+
+    def test_rebuild_matches_incremental_statistics(self):
+        for price in [10.0, 6.0, 8.0]:
+            ProductStorageService.store_product(self.make_deal(price))
+        make_product('no-history', price='4.00')
+        StoredProduct.objects.update(price_min=None, price_max=None, price_avg=None, price_samples=0)
+
+        self.assertEqual(ProductStorageService.rebuild_price_stats(chunk_size=1), 2)
+
+        product = StoredProduct.objects.get(product_id='p1')
+        self.assertEqual((product.price_min, product.price_max, product.price_avg, product.price_samples),
+                         (Decimal('6.00'), Decimal('10.00'), Decimal('8.00'), 3))
+        self.assertEqual(StoredProduct.objects.get(product_id='no-history').price_samples, 1)
+
+    def test_price_contexts_are_read_in_one_query(self):
+        ProductStorageService.store_products([self.make_deal(10.0)])
+        other = self.make_deal(3.0)
+        other.product_id = 'unknown'
+
+        with self.assertNumQueries(1):
+            contexts = ProductStorageService.get_price_contexts([self.make_deal(5.0), other])
+
+        self.assertEqual(list(contexts), [product_key('p1', 'Amazon')])
+        self.assertEqual((contexts['Amazon:p1']['current'], contexts['Amazon:p1']['avg']), (5.0, 7.5))
+        # Reading folds the price in memory only
+        self.assertEqual(StoredProduct.objects.get(product_id='p1').price_samples, 1)
+
+    def test_concurrent_insert_is_retried_as_an_update(self):
+        from unittest.mock import patch
+        from django.db import IntegrityError
+
+        bulk_create = StoredProduct.objects.bulk_create
+        calls = []
+
+        def racing_bulk_create(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 1:
+                raise IntegrityError('UNIQUE constraint failed: products_storedproduct.product_id')
+            return bulk_create(objs, *args, **kwargs)
+
+        with patch.object(StoredProduct.objects, 'bulk_create', side_effect=racing_bulk_create):
+            stored = ProductStorageService.store_products([self.make_deal(10.0)])
+
+        self.assertEqual((len(calls), stored[0].price_samples), (2, 1))
+        self.assertEqual(StoredProduct.objects.get(product_id='p1').price, Decimal('10.00'))
+
+    def test_retry_works_inside_an_outer_transaction(self):
+        import copy
+        from unittest.mock import patch
+        from django.db import transaction
+
+        bulk_create = StoredProduct.objects.bulk_create
+        calls = []
+
+        def racing_bulk_create(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 1:
+                # A real unique violation, which aborts the enclosing transaction on PostgreSQL
+                return bulk_create(list(objs) + [copy.copy(obj) for obj in objs], *args, **kwargs)
+            return bulk_create(objs, *args, **kwargs)
+
+        with transaction.atomic():
+            with patch.object(StoredProduct.objects, 'bulk_create', side_effect=racing_bulk_create):
+                ProductStorageService.store_products([self.make_deal(10.0)])
+            self.assertEqual(StoredProduct.objects.filter(product_id='p1').count(), 1)
+
+        self.assertEqual(len(calls), 2)
+
+
+class ChangeStreamTests(TestCase):
+    make_deal = BulkUpsertAndRepricingTests.make_deal
+
+    def test_back_in_stock_index_follows_availability(self):
+        make_product('p1')
+        ProductStorageService.store_product(self.make_deal('p1', 10.0, available=False))
+        self.assertEqual(ProductStorageService.get_back_in_stock(), [])
+
+        ProductStorageService.store_products([self.make_deal('p1', 10.0, available=True)])
+        self.assertEqual([p['product_id'] for p in ProductStorageService.get_back_in_stock()], ['p1'])
+
+        ProductStorageService.store_products([self.make_deal('p1', 10.0, available=False)])
+        self.assertEqual(ProductStorageService.get_back_in_stock(), [])
+
+    def test_cursor_pages_through_every_event_once(self):
+        make_product('p1')
+        for price, available in [(9.0, True), (8.0, False), (7.0, True)]:
+            ProductStorageService.store_product(self.make_deal('p1', price, available=available))
+
+        from datetime import timedelta
+
+        seen, cursor = [], None
+        while True:
+            page = ProductStorageService.get_changes(cursor=cursor, limit=2, settle=timedelta(0))
+            if not page['events']:
+                break
+            seen.extend((event['type'], event['id']) for event in page['events'])
+            cursor = page['cursor']
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        self.assertEqual(ProductStorageService.get_changes(cursor=cursor, settle=timedelta(0))['events'], [])
+
+    def test_cursor_stops_before_unsettled_events(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import PriceHistory
+
+        product = make_product('p1')
+        old, recent, older = PriceHistory.objects.bulk_create([
+            PriceHistory(product=product, price=Decimal(price)) for price in ['9.00', '8.00', '7.00']
+        ])
+        # The middle id is younger than the settle time, as if its transaction had just committed
+        PriceHistory.objects.filter(id__in=[old.id, older.id]).update(timestamp=timezone.now() - timedelta(minutes=1))
+
+        page = ProductStorageService.get_changes(kinds=['price'])
+        self.assertEqual([event['id'] for event in page['events']], [old.id])
+
+        PriceHistory.objects.filter(id=recent.id).update(timestamp=timezone.now() - timedelta(minutes=1))
+        page = ProductStorageService.get_changes(cursor=page['cursor'], kinds=['price'])
+        self.assertEqual([event['id'] for event in page['events']], [recent.id, older.id])
+
+    def test_events_are_published_on_commit(self):
+        from .events import change_bus
+
+        received = []
+        unsubscribe = change_bus.subscribe(received.append)
+        try:
+            make_product('p1')
+            with self.captureOnCommitCallbacks(execute=True):
+                ProductStorageService.store_products([self.make_deal('p1', 5.0, available=False)])
+        finally:
+            unsubscribe()
+
+        self.assertEqual(sorted(event['type'] for event in received), ['availability', 'price'])
+        self.assertEqual(received[0]['product_id'], 'p1')
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/products/changes/', {'cursor': 'abc'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,13 @@
+"""
+URL patterns for the products app
+"""
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('api/products/price-history/', views.price_history_batch_view, name='price_history_batch'),
+    path('api/products/export/', views.catalog_export_view, name='catalog_export'),
+    path('api/products/freshness/', views.catalog_freshness_view, name='catalog_freshness'),
+    path('api/products/changes/', views.product_changes_view, name='product_changes'),
+    path('api/products/back-in-stock/', views.back_in_stock_view, name='back_in_stock'),
+]
@@ -1,3 +1,231 @@
-from django.shortcuts import render
+"""
+Product API Views
 
-# Create your views here.
+This module exposes read endpoints over the stored product catalog.
+"""
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework import status
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+import logging
+
+from delapp.http_cache import cache_policy
+from .services import ProductStorageService
+from .export import TABLES, DEFAULT_CHUNK_SIZE, aiter_export, iter_ndjson, iter_npz
+from .repricing import freshness_lag
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds to keep a single batch request cheap
+MAX_BATCH_PRODUCTS = 100
+MAX_HISTORY_DAYS = 365
+MAX_CHANGE_EVENTS = 500
+MAX_BACK_IN_STOCK = 200
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def price_history_batch_view(request):
+    """
+    Get price histories for several products at once
+
+    POST parameters:
+    - products: List of {"product_id": ..., "retailer": ...} objects
+    - days: (Optional) How many days of history to return (default 30)
+    - points: (Optional) Downsample each history to at most this many points
+    """
+    try:
+        data = request.data
+        products = data.get('products', [])
+
+        if not products or not isinstance(products, list):
+            return Response({
+                'success': False,
+                'error': 'No products provided'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(products) > MAX_BATCH_PRODUCTS:
+            return Response({
+                'success': False,
+                'error': f'At most {MAX_BATCH_PRODUCTS} products can be requested at once'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        keys = []
+        for product in products:
+            if not isinstance(product, dict) or not product.get('product_id') or not product.get('retailer'):
+                return Response({
+                    'success': False,
+                    'error': 'Each product needs a product_id and a retailer'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            keys.append((product['product_id'], product['retailer']))
+
+        try:
+            days = min(int(data.get('days', 30)), MAX_HISTORY_DAYS)
+            points = int(data['points']) if data.get('points') else None
+        except (TypeError, ValueError):
+            return Response({
+                'success': False,
+                'error': 'days and points must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        histories = ProductStorageService.get_price_histories(keys, days=days, max_points=points)
+
+        return Response({
+            'success': True,
+            'histories': {
+                key: [
+                    {'price': float(point['price']), 'timestamp': point['timestamp'].isoformat()}
+                    for point in points_list
+                ]
+                for key, points_list in histories.items()
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"Error in price_history_batch_view: {str(e)}", exc_info=True)
+        return Response({
+            'success': False,
+            'error': str(e),
+            'histories': {}
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_export_view(request):
+    """
+    Stream the product catalog or price history for offline analysis
+
+    GET parameters:
+    - table: 'products' (default) or 'price_history'
+    - format: 'ndjson' (default) or 'npz'
+    """
+    table = request.GET.get('table', 'products')
+    export_format = request.GET.get('format', 'ndjson')
+
+    if table not in TABLES or export_format not in ('ndjson', 'npz'):
+        return Response({
+            'success': False,
+            'error': f"table must be one of {', '.join(TABLES)} and format one of ndjson, npz"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if export_format == 'npz':
+        response = StreamingHttpResponse(aiter_export(iter_npz(table, DEFAULT_CHUNK_SIZE)),
+                                         content_type='application/octet-stream')
+    else:
+        response = StreamingHttpResponse(aiter_export(iter_ndjson(table, DEFAULT_CHUNK_SIZE)),
+                                         content_type='application/x-ndjson')
+
+    response['Content-Disposition'] = f'attachment; filename="{table}.{export_format}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_freshness_view(request):
+    """Report how stale the stored catalog is"""
+    return Response({
+        'success': True,
+        'freshness': freshness_lag()
+    })
+
+
+# Not per user, so shared caches may keep it, but the newest page grows with every event
+@cache_policy(private=False, vary=())
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_changes_view(request):
+    """
+    Read the price and availability change stream
+
+    GET parameters:
+    - cursor: (Optional) Cursor returned by the previous call; omit to start at the beginning
+    - limit: (Optional) Maximum number of events to return (default 100)
+    - type: (Optional) 'price' or 'availability' to read only one kind of event
+    """
+    try:
+        try:
+            limit = min(max(int(request.GET.get('limit', 100)), 1), MAX_CHANGE_EVENTS)
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'limit must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        kind = request.GET.get('type')
+        if kind and kind not in ('price', 'availability'):
+            return Response({
+                'success': False,
+                'error': 'type must be price or availability'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            changes = ProductStorageService.get_changes(
+                cursor=request.GET.get('cursor'),
+                limit=limit,
+                kinds=[kind] if kind else None
+            )
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'events': changes['events'],
+            'cursor': changes['cursor']
+        })
+
+    except Exception as e:
+        logger.error(f"Error in product_changes_view: {str(e)}", exc_info=True)
+        return Response({
+            'success': False,
+            'error': str(e),
+            'events': []
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@cache_policy(private=False, max_age=60, vary=())
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def back_in_stock_view(request):
+    """
+    List products that recently came back in stock
+
+    GET parameters:
+    - since: (Optional) ISO 8601 timestamp; only restocks at or after it are returned
+    - limit: (Optional) Maximum number of products to return (default 50)
+    """
+    try:
+        since = None
+        if request.GET.get('since'):
+            since = parse_datetime(request.GET['since'])
+            if since is None:
+                return Response({
+                    'success': False,
+                    'error': 'since must be an ISO 8601 timestamp'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(max(int(request.GET.get('limit', 50)), 1), MAX_BACK_IN_STOCK)
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': 'limit must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'products': ProductStorageService.get_back_in_stock(since=since, limit=limit)
+        })
+
+    except Exception as e:
+        logger.error(f"Error in back_in_stock_view: {str(e)}", exc_info=True)
+        return Response({
+            'success': False,
+            'error': str(e),
+            'products': []
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)